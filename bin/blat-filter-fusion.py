@@ -93,7 +93,6 @@ if __name__ == '__main__':
     # processing
     flag = True
     if os.path.exists(infile) or infile == '-':
-        fid = open(infile,'r')
         while True:
             lines = fid.readlines(10**8)
             if not lines:
@@ -14,5 +14,22 @@ if [[ "$BLATPATH" == "-" ]]; then
 else
   "$BLATPATH/blat" $EXTRA $FILEDB $FILEIN $PIPE &
 fi
-"$SCRIPTPATH/blat-filter-fusion.py" $PIPE $FILEOU
-exit 0
+BLATPID=$!
+"$SCRIPTPATH/blat-filter-fusion.py" $PIPE $FILEOU &
+FILTERPID=$!
+wait -n
+EXITCODE=$?
+if [[ $EXITCODE -ne 0 ]]; then
+  # BLAT or the filter failed maybe before opening the pipe (so the other one would wait forever)
+  kill $BLATPID $FILTERPID 2>/dev/null
+  wait
+  exit $EXITCODE
+fi
+wait $BLATPID
+BLATEXIT=$?
+wait $FILTERPID
+FILTEREXIT=$?
+if [[ $BLATEXIT -ne 0 ]]; then
+  exit $BLATEXIT
+fi
+exit $FILTEREXIT
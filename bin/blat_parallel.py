@@ -52,7 +52,6 @@ import multiprocessing
 import subprocess
 import time
 import tempfile
-import Bio.SeqIO
 import math
 import gc
 import shutil
@@ -66,10 +65,10 @@ def give_me_temp_filename(tmp_dir = None):
     return ft_name
 
 def delete_file(some_file):
-    if os.path.isfile(some_file) or os.path.islink(some_file):
-        os.remove(some_file)
-    elif os.path.isdir(some_file):
+    if os.path.isdir(some_file) and not os.path.islink(some_file):
         shutil.rmtree(some_file)
+    elif os.path.exists(some_file) or os.path.islink(some_file):
+        os.remove(some_file) # also the named pipes
 
 def quote(txt):
     r = txt.strip()
@@ -77,6 +76,57 @@ def quote(txt):
         r = '"%s"' % (txt,)
     return r
 
+def count_records(a_filename):
+    # it counts the sequences from a FASTA file
+    count = 0
+    fin = open(a_filename,'r')
+    while True:
+        lines = fin.readlines(10**8)
+        if not lines:
+            break
+        count = count + len([1 for line in lines if line.startswith('>')])
+    fin.close()
+    return count
+
+def split_fasta(a_filename, size_block, tmp_dir = None):
+    # it splits (lazily) a FASTA file into pieces having SIZE_BLOCK sequences
+    # and it gives the names of the temporary files where the pieces are written
+    fin = open(a_filename,'r')
+    fou = None
+    name = None
+    n = 0
+    for line in fin:
+        if line.startswith('>'):
+            if n == size_block:
+                fou.close()
+                yield name
+                fou = None
+                n = 0
+            if fou is None:
+                name = give_me_temp_filename(tmp_dir)
+                fou = open(name,'w')
+            n = n + 1
+        if fou is not None:
+            fou.write(line)
+    fin.close()
+    if fou is not None:
+        if not line.endswith('\n'):
+            fou.write('\n')
+        fou.close()
+        yield name
+
+def append_file(fod, a_filename):
+    # it appends the content of a file to an already opened file
+    fid = open(a_filename,'r')
+    while True:
+        lines = fid.readlines(10**8)
+        if not lines:
+            break
+        if not lines[-1].endswith('\n'):
+            lines[-1] = lines[-1]+'\n'
+        fod.writelines(lines)
+    fid.close()
+
 #
 #
 #
@@ -91,6 +141,8 @@ if __name__ == '__main__':
         print >>sys.stderr,"The temporary directory where the splitting is done can be specified using the option '--tmp_dir', e.g. '--tmp_dir=/some/temp/dir/'. If it is not specified the OS temporary directory is used."
         print >>sys.stderr,"The blat directory where the blat executable is placed, '--blat_dir', e.g. '--blat_dir=/some/blat/dir/'."
         print >>sys.stderr,"The option '--cpus' specifies the number of  CPUs to be used, e.g. '--cpus=10'. If it is not specified then all the CPUs found will be used."
+        print >>sys.stderr,"The option '--chunks' specifies the number of pieces in which the input file is split, e.g. '--chunks=40'. If it is larger than the number of CPUs then the pieces are given one by one to the BLAT processes as they become free. If it is not specified then it is equal to the number of CPUs."
+        print >>sys.stderr,"The option '--min-chunk-size' specifies the minimum number of sequences in a piece, e.g. '--min-chunk-size=10000', such that the time needed by BLAT for loading the database is small compared to the time needed for aligning a piece. If it is not specified then it is 10000."
         print >>sys.stderr,"The option '--filter-fusion' forces that all the lines in the PSL output are filtered according to finding gene fusions. If it is not specified then no filtering is done."
 
 
@@ -119,6 +171,18 @@ if __name__ == '__main__':
     else:
         cmd_cpus = None
 
+    chunks = [el for el in cmd if el.startswith('--chunks=')]
+    if chunks:
+        chunks = max(1,int(chunks[0][9:]))
+    else:
+        chunks = None
+
+    min_chunk_size = [el for el in cmd if el.startswith('--min-chunk-size=')]
+    if min_chunk_size:
+        min_chunk_size = max(1,int(min_chunk_size[0][17:]))
+    else:
+        min_chunk_size = 10000
+
     filtered = [el for el in cmd if el.startswith('--filter-fusion')]
     if filtered:
         filtered = True
@@ -127,6 +191,8 @@ if __name__ == '__main__':
     # remove the --tmp_dir and --cpus from the commands to be pass to BLAT
     cmd = [el for el in cmd if ((not el.startswith('--tmp_dir=')) and
                                 (not el.startswith('--cpus=')) and
+                                (not el.startswith('--chunks=')) and
+                                (not el.startswith('--min-chunk-size=')) and
                                 (not el.startswith('--blat_dir=')) and
                                 (not el.startswith('--filter-fusion')))]
 
@@ -157,107 +223,98 @@ if __name__ == '__main__':
 
 
     print >>sys.stderr,"Counting the records in the input file..."
-    input_handle = open(input_filename, "rU")
-    input_seq_iterator = Bio.SeqIO.parse(input_handle, "fasta")
-    count = len([1 for r in input_seq_iterator])
-    input_handle.close()
+    count = count_records(input_filename)
     print >>sys.stderr," -",count,"records found in the input file!"
     if count > 0:
-        print >>sys.stderr,"Splitting the input file into",cpus,"pieces..."
-        list_input_temp_files = [give_me_temp_filename(tmp_dir) for i in range(cpus)]
-        list_output_temp_files = [give_me_temp_filename(tmp_dir) for i in range(cpus)]
-        pipes = [give_me_temp_filename(tmp_dir) for i in range(cpus)]
-
-        input_handle = open(input_filename, "rU")
-        input_seq_iterator = Bio.SeqIO.parse(input_handle, "fasta")
-        empty_flag = []
-        size_block = math.ceil(float(count) / float(cpus))
+        cpus = max(1,cpus)
+        if not chunks:
+            chunks = cpus
+        size_block = max(int(math.ceil(float(count) / float(chunks))), min_chunk_size)
         if count <= 5*cpus:
             size_block = count
-        i = -1
-        j = -1
-        seq = []
-        for record in input_seq_iterator:
-            i = i + 1
-            seq.append(record)
-            if ( (i+1) % size_block == 0) or (i + 1 == count):
-                j = j + 1
-                print >>sys.stderr," - writing part",j+1
-                output_handle = open(list_input_temp_files[j], "w")
-                cc = Bio.SeqIO.write(seq, output_handle, "fasta")
-                output_handle.close()
-                print >>sys.stderr,"       wrote",cc,"sequences"
-                if seq:
-                    empty_flag.append(False)
-                else:
-                    empty_flag.append(True)
-                seq = []
-        input_handle.close()
-        if len(empty_flag) != cpus:
-            empty_flag = empty_flag + [True] * (cpus - len(empty_flag))
-
-
-        proc = []
+        print >>sys.stderr,"Splitting the input file into",int(math.ceil(float(count) / float(size_block))),"pieces..."
+        pieces = split_fasta(input_filename, size_block, tmp_dir)
+
         print >>sys.stderr,"Launching BLAT in parallel..."
-        for i in xrange(j+1):
-            if empty_flag[i]:
-                continue
-            parameters = [_BT_+'blat'] + cmd + [quote(database_filename), quote(list_input_temp_files[i]), quote(list_output_temp_files[i])]
-            if filtered:
-                parameters = [os.path.abspath(os.path.dirname(__file__))+'/blat-filter-fusion.sh',
-                              _BT_ if _BT_ else '-',
-                              quote(database_filename),
-                              quote(list_input_temp_files[i]),
-                              quote(pipes[i]),
-                              quote(list_output_temp_files[i])] + cmd
-
-
-            print >>sys.stderr,'-->JOB:'+str(i+1)+'-----------------------------------------------------------------'
-            print >>sys.stderr,' '.join(parameters)
-
-            # original
-            #p = subprocess.Popen(parameters)
-            # fix https://github.com/ndaniel/fusioncatcher/issues/62
-            p = subprocess.Popen(parameters,close_fds=True)
-
-            proc.append(p)
-            time.sleep(1) # seconds
-        print >>sys.stderr,'-------------------------------------------------------------------------'
-        print >>sys.stderr,"Waiting for BLAT to finish running..."
-
-        # original
-        #for p in proc:
-        #    p.communicate()
-        # fix https://github.com/ndaniel/fusioncatcher/issues/62
-        while proc:
-            proc.pop().communicate()
-            
-        print >>sys.stderr,"BLAT finished running."
-        print >>sys.stderr,'-------------------------------------------------------------------------'
-        print >>sys.stderr,"Joining BLAT's output files..."
         fod = open(output_filename,'w')
-        flag = False
-        for i in xrange(j+1):
-            if empty_flag[i] or (not os.path.exists(list_output_temp_files[i])):
-                continue
-            fid = open(list_output_temp_files[i],'r')
-            while True:
-                lines = fid.readlines(10**8)
-                if not lines:
+        running = dict() # index => (process, input, output, pipe)
+        finished = dict() # index => output
+        launched = 0
+        written = 0
+        failed = False
+        more = True
+        while more or running:
+            # feed the next pieces to the free BLAT processes
+            while more and (not failed) and len(running) < cpus:
+                try:
+                    piece = pieces.next()
+                except StopIteration:
+                    more = False
                     break
-                if not lines[-1].endswith('\n'):
-                    lines[-1] = lines[-1]+'\n'
-                fod.writelines(lines)
-                flag = True
-            fid.close()
-        if not flag:
-            fod.write('')
-        fod.close()
+                i = launched
+                launched = launched + 1
+                output_temp = give_me_temp_filename(tmp_dir)
+                pipe = give_me_temp_filename(tmp_dir)
+                parameters = [_BT_+'blat'] + cmd + [quote(database_filename), quote(piece), quote(output_temp)]
+                if filtered:
+                    parameters = [os.path.abspath(os.path.dirname(__file__))+'/blat-filter-fusion.sh',
+                                  _BT_ if _BT_ else '-',
+                                  quote(database_filename),
+                                  quote(piece),
+                                  quote(pipe),
+                                  quote(output_temp)] + cmd
+
+                print >>sys.stderr,'-->JOB:'+str(i+1)+'-----------------------------------------------------------------'
+                print >>sys.stderr,' '.join(parameters)
+
+                # original
+                #p = subprocess.Popen(parameters)
+                # fix https://github.com/ndaniel/fusioncatcher/issues/62
+                p = subprocess.Popen(parameters,close_fds=True)
+
+                running[i] = (p, piece, output_temp, pipe)
+                if launched <= cpus:
+                    time.sleep(1) # seconds (only for the first BLAT processes)
+            if not running:
+                break
 
-        for i in range(cpus):
-            delete_file(list_input_temp_files[i])
-            delete_file(list_output_temp_files[i])
-            delete_file(pipes[i])
+            time.sleep(0.1)
+            for i in running.keys():
+                (p, piece, output_temp, pipe) = running[i]
+                r = p.poll()
+                if r is None:
+                    continue
+                running.pop(i)
+                delete_file(piece)
+                delete_file(pipe)
+                if r != 0:
+                    print >>sys.stderr,'-->JOB:'+str(i+1)+' failed (exit code %d)!' % (r,)
+                    delete_file(output_temp)
+                    if not failed:
+                        # no new pieces are given (the running BLAT processes are let to finish)
+                        failed = True
+                        pieces.close()
+                    continue
+                print >>sys.stderr,'-->JOB:'+str(i+1)+' finished.'
+                finished[i] = output_temp
+
+            # the outputs are written as they are ready (in the order of the pieces)
+            while written in finished:
+                output_temp = finished.pop(written)
+                if os.path.exists(output_temp):
+                    append_file(fod, output_temp)
+                    delete_file(output_temp)
+                written = written + 1
+
+        fod.close()
+        if failed:
+            for output_temp in finished.itervalues():
+                delete_file(output_temp)
+            delete_file(output_filename)
+            print >>sys.stderr,"ERROR: BLAT failed!"
+            sys.exit(1)
+        print >>sys.stderr,"BLAT finished running."
+        print >>sys.stderr,'-------------------------------------------------------------------------'
     print >>sys.stderr,"Done."
 
 
@@ -53,6 +53,7 @@ import datetime
 import tempfile
 import shutil
 import gzip
+import psl_batch
 
 ttable = string.maketrans("ACGTYRSWKMBDHV-","TGCARYSWMKVHDB-")
 
@@ -867,12 +868,11 @@ if __name__ == '__main__':
             elif ev.endswith("/2"):
                 fasta[ev] = dnaReverseComplement(w)
             fastq[ev] = (w,q)
-    # create a ZIP FASTA file where is a file for each candidate fusion gene
-    print "Writing the FASTA/FASTQ files containing the supporting reads...",options.output_zip_fasta_filename
-    archive = zipfile.ZipFile(options.output_zip_fasta_filename, 'w', zipfile.ZIP_STORED, allowZip64 = True)
-    for (gg,vv) in support.items():
-        # for each candidate fusion
 
+    # the supporting reads of each candidate fusion as a FASTA file
+    candidates = support.items()
+    fastas = []
+    for (gg,vv) in candidates:
         # write the junction sequence
         da = []
         if options.junction:
@@ -900,16 +900,31 @@ if __name__ == '__main__':
             else:
                 da.append(">%s_supports_fusion_junction\n"%(v,))
             da.append("%s\n"%(fasta[v],))
+        fastas.append(da)
+
+    # PSL (all candidate fusions are aligned using only one run of BLAT)
+    psls = []
+    if options.input_genome_2bit and fastas:
+        print "Aligning the supporting reads on genome using BLAT..."
+        psl = give_me_psl(psl_batch.join(fastas),
+                          options.input_genome_2bit,
+                          blat_dir = options.blat_directory,
+                          tmp_dir = options.tmp_directory,
+                          align_type = options.psl_search_type)
+        psls = psl_batch.split(psl,len(fastas))
+
+    # create a ZIP FASTA file where is a file for each candidate fusion gene
+    print "Writing the FASTA/FASTQ files containing the supporting reads...",options.output_zip_fasta_filename
+    archive = zipfile.ZipFile(options.output_zip_fasta_filename, 'w', zipfile.ZIP_STORED, allowZip64 = True)
+    for (i,(gg,vv)) in enumerate(candidates):
+        # for each candidate fusion
+
+        da = fastas[i]
         archive.writestr("%s_reads.fa" % (gg,), ''.join(da))
 
         # PSL
         if options.input_genome_2bit:
-            psl = give_me_psl(da,
-                              options.input_genome_2bit,
-                              blat_dir = options.blat_directory,
-                              tmp_dir = options.tmp_directory,
-                              align_type = options.psl_search_type)
-            archive.writestr("%s_reads.psl" % (gg,), ''.join(psl))
+            archive.writestr("%s_reads.psl" % (gg,), ''.join(psls[i]))
         # VELVET
         if options.velvet:
             ase = give_me_assembly(da,
@@ -52,6 +52,7 @@ import datetime
 import tempfile
 import shutil
 import gzip
+import psl_batch
 
 empty_zip_data = 'PK\x05\x06\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
 
@@ -716,15 +717,11 @@ if __name__ == '__main__':
                 fasta[ev] = dnaReverseComplement(w)
             fastq[ev] = (w,q)
 
-    # create a ZIP FASTA file where is a file for each candidate fusion gene
-    print "Writing the FASTA/FASTQ files containing the supporting reads...",options.output_zip_fasta_filename
-    archive = zipfile.ZipFile(options.output_zip_fasta_filename, 'w', zipfile.ZIP_STORED, allowZip64 = True)
+    # the supporting reads of each candidate fusion as a FASTA file
+    fastas = [[]] # the header has no reads
     for i in xrange(len(summary)):
         if i == 0: # skip header
             continue
-        # for each candidate fusion
-        #gg = "%s:%s_%s:%s_%s:%s" % (ggenes_s[i][0],ggenes_s[i][1],ggenes_e[i][0],ggenes_e[i][1],ggenes_p[i][0],ggenes_p[i][1])
-        gg = "%s--%s__%s--%s" % (ggenes_s[i][0],ggenes_s[i][1],ggenes_p[i][0],ggenes_p[i][1])
         gg_e = myorder(ggenes_e[i][0],ggenes_e[i][1])
 
         da = []
@@ -750,15 +747,35 @@ if __name__ == '__main__':
         for v in sorted(pairs[gg_e]):
             da.append(">%s_supports_fusion_pair\n"%(v,))
             da.append("%s\n"%(fasta[v],))
+        fastas.append(da)
+
+    # PSL (all candidate fusions are aligned using only one run of BLAT)
+    psls = []
+    if options.input_genome_2bit and len(fastas) > 1:
+        print "Aligning the supporting reads on genome using BLAT..."
+        psl = give_me_psl(psl_batch.join(fastas),
+                          options.input_genome_2bit,
+                          blat_dir = options.blat_directory,
+                          tmp_dir = options.tmp_directory,
+                          align_type = options.psl_search_type)
+        psls = psl_batch.split(psl,len(fastas))
+
+    # create a ZIP FASTA file where is a file for each candidate fusion gene
+    print "Writing the FASTA/FASTQ files containing the supporting reads...",options.output_zip_fasta_filename
+    archive = zipfile.ZipFile(options.output_zip_fasta_filename, 'w', zipfile.ZIP_STORED, allowZip64 = True)
+    for i in xrange(len(summary)):
+        if i == 0: # skip header
+            continue
+        # for each candidate fusion
+        #gg = "%s:%s_%s:%s_%s:%s" % (ggenes_s[i][0],ggenes_s[i][1],ggenes_e[i][0],ggenes_e[i][1],ggenes_p[i][0],ggenes_p[i][1])
+        gg = "%s--%s__%s--%s" % (ggenes_s[i][0],ggenes_s[i][1],ggenes_p[i][0],ggenes_p[i][1])
+        gg_e = myorder(ggenes_e[i][0],ggenes_e[i][1])
+
+        da = fastas[i]
         archive.writestr("%s_reads.fa" % (gg,), ''.join(da))
         # PSL
         if options.input_genome_2bit:
-            psl = give_me_psl(da,
-                              options.input_genome_2bit,
-                              blat_dir = options.blat_directory,
-                              tmp_dir = options.tmp_directory,
-                              align_type = options.psl_search_type)
-            archive.writestr("%s_reads.psl" % (gg,), ''.join(psl))
+            archive.writestr("%s_reads.psl" % (gg,), ''.join(psls[i]))
         # VELVET
         if options.velvet:
             ase = give_me_assembly(da,
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+It runs the (shell) commands which probe the capabilities and the versions of
+the tools used by FusionCatcher (e.g. 'sort --help', 'bowtie --version') and it
+caches their outputs in a file, such that the next runs of FusionCatcher do
+not need to run them again.
+
+A cached output is used only as long as the tools involved in the command
+have the same paths, sizes and modification times as when the command was run.
+Installing, updating or removing a tool (or changing PATH such that another
+copy of the tool is found) invalidates automatically the cached outputs.
+
+Author: Daniel Nicorici, Daniel.Nicorici@gmail.com
+
+Copyright (c) 2009-2019 Daniel Nicorici
+
+This file is part of FusionCatcher.
+
+FusionCatcher is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FusionCatcher is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with FusionCatcher (see file 'COPYING.txt').  If not, see
+<http://www.gnu.org/licenses/>.
+
+By default, FusionCatcher is running BLAT aligner
+<http://users.soe.ucsc.edu/~kent/src/> but it offers also the option to disable
+all its scripts which make use of BLAT aligner if you choose explicitly to do so.
+BLAT's license does not allow to be used for commercial activities. If BLAT
+license does not allow to be used in your case then you may still use
+FusionCatcher by forcing not use the BLAT aligner by specifying the option
+'--skip-blat'. Fore more information regarding BLAT please see its license.
+
+Please, note that FusionCatcher does not require BLAT in order to find
+candidate fusion genes!
+
+This file is not running/executing/using BLAT.
+"""
+import os
+import sys
+import json
+import signal
+import tempfile
+import subprocess
+
+
+CACHE = 'capabilities.cache'
+
+#########################
+def _default_sigpipe():
+    # the commands should die quietly when the reader stops early (e.g. 'head')
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+#########################
+def which(program):
+    # it gives the full path of a program (given by name or path) or None
+    if os.path.dirname(program):
+        p = os.path.abspath(os.path.expanduser(program))
+        return p if os.path.isfile(p) else None
+    for path in os.environ.get("PATH","").split(os.pathsep):
+        p = os.path.join(path.strip('"'),program)
+        if path and os.access(p,os.X_OK) and os.path.isfile(p):
+            return p
+    return None
+
+#########################
+def stamp(tools):
+    # it identifies the given tools by their paths, sizes and modification times
+    r = []
+    for tool in tools:
+        p = which(tool)
+        if p:
+            p = os.path.realpath(p)
+            s = os.stat(p)
+            r.append([tool, p, s.st_size, int(s.st_mtime)])
+        else:
+            r.append([tool, None, 0, 0])
+    return r
+
+#########################
+def default_filename(directories):
+    # it gives the cache file from the first given directory where it can be
+    # written (or where it exists already)
+    directories = [d for d in directories if d and os.path.isdir(d)]
+    for d in directories:
+        if os.access(d,os.W_OK):
+            return os.path.join(d,CACHE)
+    for d in directories:
+        if os.path.isfile(os.path.join(d,CACHE)):
+            return os.path.join(d,CACHE)
+    return None
+
+#########################
+class cache:
+    """
+    It runs the probing commands and caches their exit codes and outputs
+    (from STDOUT, decoded as latin-1) in FILENAME (if it is None then nothing is cached).
+    """
+    def __init__(self, filename = None):
+        self.filename = filename
+        self.data = dict()
+        self.changed = False
+        if filename and os.path.isfile(filename):
+            try:
+                self.data = json.load(open(filename,'r'))
+            except (IOError, ValueError):
+                self.data = dict()
+
+    def run(self, command, tools = []):
+        # it gives the exit code and the output of the shell COMMAND; the
+        # cached ones are used if the TOOLS (used by COMMAND) did not change
+        s = stamp(tools)
+        r = self.data.get(command,None)
+        if r and r.get('tools') == s:
+            return (r['code'], r['output'])
+        p = subprocess.Popen(command,
+                             shell = True,
+                             stdout = subprocess.PIPE,
+                             preexec_fn = _default_sigpipe)
+        # the output may be in any encoding (e.g. translated messages of the
+        # current locale) and latin-1 keeps all its bytes
+        output = p.communicate()[0].decode('latin-1')
+        code = p.returncode
+        self.data[command] = {'tools': s, 'code': code, 'output': output}
+        self.changed = True
+        return (code, output)
+
+    def save(self):
+        # it writes the cache (it should be called only after the outputs of
+        # the probes have been checked to be valid); a cache which cannot be
+        # written is silently skipped
+        if not (self.filename and self.changed):
+            return
+        t = None
+        try:
+            (fd, t) = tempfile.mkstemp(prefix = '.'+CACHE+'-', dir = os.path.dirname(self.filename))
+            f = os.fdopen(fd,'w')
+            json.dump(self.data, f, indent = 1, sort_keys = True)
+            f.close()
+            os.chmod(t,0644)
+            os.rename(t,self.filename)
+            self.changed = False
+        except (IOError, OSError, ValueError, UnicodeError):
+            if t and os.path.exists(t):
+                os.remove(t)
+#
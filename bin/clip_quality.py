@@ -47,7 +47,12 @@ import gc
 import shutil
 import multiprocessing
 import itertools
-import gzip
+import fastq_io
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 #
 #
@@ -88,63 +93,7 @@ def readfq(fp): # this is a generator function
 #
 #
 def fastq(file_name, size_buffer = 10**8):
-    fid = None
-    if file_name == '-':
-        fid = sys.stdin
-    elif file_name.lower().endswith('.gz'):
-        fid = gzip.open(file_name,'r')
-    else:
-        fid = open(file_name,'r')
-    while True:
-        lines = fid.readlines(10**8)
-        if not lines:
-            break
-        for line in lines:
-            yield line
-    fid.close()
-
-
-#
-#
-#
-class tofastq:
-    #
-    def __init__(self, file_name, size_buffer = 10**8):
-        self.file_name = file_name
-        if file_name:
-            if file_name == '-':
-                self.file_handle = sys.stdout
-            else:
-                if os.path.isfile(file_name) or os.path.islink(file_name):
-                    os.remove(file_name)
-                elif os.path.isdir(file_name):
-                    os.rmtree(file_name)
-                self.file_handle = open(file_name,'w')
-        self.size_buffer = size_buffer
-        self.data = []
-        self.size = 0
-    #
-    def add(self, name, seq, qual):
-        line = "%s\n%s\n+\n%s\n" % (name,seq,qual)
-        self.data.append(line)
-        self.size = self.size + len(line)
-        if self.size > self.size_buffer:
-            self.__write_buffer()
-    #
-    def __write_buffer(self):
-        self.file_handle.writelines(self.data)
-        self.size = 0
-        self.data = []
-    #
-    def close(self):
-        if self.file_name:
-            if self.data:
-                self.__write_buffer()
-            self.file_handle.close()
-            self.file_name = None
-
-    def __del__(self):
-        self.close()
+    return fastq_io.lines(file_name, size_buffer = size_buffer)
 
 
 def low(quality,score,window_length):
@@ -181,6 +130,35 @@ def low(quality,score,window_length):
             break
     return n
 
+def low_batch(qualities, score, window_length):
+    """
+    It is the same as 'low' but for a list of quality strings. Using NumPy
+    the flags of the low quality nucleotides are summed over the sliding
+    windows (as differences of cumulative sums) for all reads at once.
+    """
+    if (not numpy) or (not qualities) or window_length < 1:
+        return [low(quality, score, window_length) for quality in qualities]
+    lengths = numpy.array([len(quality) for quality in qualities])
+    m = lengths.max()
+    if m <= window_length:
+        return [-1] * len(qualities)
+    # padding with the highest score such that it is never low quality
+    q = numpy.frombuffer(''.join([quality.ljust(m,'\xff') for quality in qualities]), dtype = numpy.uint8).reshape((len(qualities),m))
+    flags = q <= ord(score)
+    c = numpy.zeros((len(qualities),m+1), dtype = numpy.int32)
+    numpy.cumsum(flags, axis = 1, out = c[:,1:])
+    # windows starting at 0 .. len(quality)-window_length-1
+    sums = c[:,window_length:m] - c[:,0:m-window_length]
+    starts = numpy.arange(m-window_length)
+    good = (sums >= round(float(window_length)/2)) & (starts[numpy.newaxis,:] < (lengths - window_length)[:,numpy.newaxis])
+    found = good.any(axis = 1)
+    first = good.argmax(axis = 1)
+    # the first low quality nucleotide in the found window
+    k = numpy.arange(m)[numpy.newaxis,:]
+    after = flags & (k >= first[:,numpy.newaxis]) & (k < first[:,numpy.newaxis] + window_length)
+    n = numpy.where(found & after.any(axis = 1), after.argmax(axis = 1), -1)
+    return n.tolist()
+
 def find_n(x):
     n = len(x)
     j = n
@@ -216,6 +194,40 @@ def shred(stuff):
         f = True
     return (name,seq,qual,f)
 
+#
+#
+#
+_para = None
+def set_param(para):
+    global _para
+    _para = para
+
+#
+#
+#
+def shred_block(block):
+    # it clips all the reads from a block of FASTQ text
+    par = _para
+    reads = list(readfq(iter(block.splitlines(True))))
+    cuts = low_batch([aread[2] for aread in reads], par.score, par.window)
+    data = []
+    f = 0
+    for ((name,seq,qual),cut) in itertools.izip(reads,cuts):
+        if seq.endswith('N'):
+            cutn = find_n(seq)
+            if cut != -1:
+                cut = min(cut,cutn)
+            else:
+                cut = cutn
+        if cut != -1:
+            if cut == 0:
+                cut = 1
+            seq = seq[:cut]
+            qual = qual[:cut]
+            f = f + 1
+        data.append("%s\n%s\n+\n%s\n" % (name,seq,qual))
+    return (''.join(data), len(reads), f)
+
 #
 #
 #
@@ -258,35 +270,30 @@ def clip(
     if verbose:
         print >> sys.stderr,"Using",cpus,"process(es)..."
 
-    # in case the pool.imap does not work use itertools.imap instead
-
-    pool = multiprocessing.Pool(processes=cpus)
-    fq = tofastq(file_output)
-#    for (name,seq,qual) in pool.imap(shred, readfq(fastq(file_input)), chunksize=100):
+    fq = fastq_io.lines_to_file(file_output)
     p = 0
     f = 0
     para = param()
     para.window = window_length
     para.score = score
-    for w in pool.imap(shred,
-                       itertools.izip_longest(readfq(fastq(file_input)),
-                                              [],
-                                              fillvalue = para),
-                       chunksize = 100):
-        name = w[0]
-        seq = w[1]
-        qual = w[2]
-        c = w[3]
-
-        p = p + 1
-        if c:
-            f = f + 1
-        fq.add(name,seq,qual)
+    # the reads are sent to the processes in large blocks of FASTQ text
+    pool = None
+    if cpus == 1:
+        set_param(para)
+        results = itertools.imap(shred_block, fastq_io.blocks(file_input))
+    else:
+        pool = multiprocessing.Pool(processes = cpus, initializer = set_param, initargs = (para,))
+        results = pool.imap(shred_block, fastq_io.blocks(file_input))
+    for (text, n, c) in results:
+        p = p + n
+        f = f + c
+        fq.add_block(text)
     fq.close()
-    
-    pool.close()
-    pool.join()
-    
+
+    if pool:
+        pool.close()
+        pool.join()
+
     t = "Empty input file!"
     if p != 0:
         t ="%.5f %% reads clipped due to low quality (less or equal than Q%d) at 3' end (%d out of %d)!" % ((100*float(f)/float(p)),quality_score,f,p)
@@ -325,7 +332,7 @@ Email: Daniel.Nicorici@gmail.com
 
 """
 
-    version = "%prog 0.12 beta"
+    version = "%prog 0.13 beta"
 
     parser = MyOptionParser(usage       = usage,
                             epilog      = epilog,
@@ -4,6 +4,20 @@
 It compresses using lossy compression the ids of all reads from a input FASTQ file (using the read index/count).
 The reads ids have all the ids in alphabetically order.
 
+The new reads ids are generated (in one pass) from a running counter and they
+have all the same width. The width is computed from the total number of reads
+(if it is known, see '--count-reads') or it is estimated from the size of the
+input file (using the first reads read from it).
+
+Optionally, a binary map of the original reads ids is written (see '--map'),
+which allows to translate back the new reads ids into the original ones. It
+contains a header (see HEADER) followed by one record for each read in the
+order of the reads in the output file, that is the length of the original read
+id (see RECORD) followed by the original read id (without '@'). The new read id
+of the read number K (counting from 0) is the number K (or K/2 for interleaved
+reads) written in the base given by the alphabet of the new ids using WIDTH
+digits (see 'read_map').
+
 
 
 Author: Daniel Nicorici, Daniel.Nicorici@gmail.com
@@ -48,29 +62,93 @@ import gzip
 import string
 import math
 import itertools
+import struct
 
-def generate_id(t, lowercase = False, interleaved = True, no12 = False):
+MAGIC = 'FCIDSMAP'
+VERSION = 1
+HEADER = '<8sIBBB' # magic, version, width, lowercase, interleaved
+RECORD = '<H' # length of the original read id
+
+def get_digits(lowercase = False):
     digits = string.digits + string.ascii_uppercase
     if lowercase:
         digits = digits + string.ascii_lowercase
-    l = len(digits)
+    return digits
+
+def get_width(t, lowercase = False, interleaved = True):
+    # number of digits needed for T reads
+    l = len(get_digits(lowercase))
     if interleaved:
         r = int(math.ceil(math.log(float(t+10)/float(2),l)))
+    else:
+        r = int(math.ceil(math.log(float(t+5),l)))
+    return max(1, r)
+
+def generate_id(t, lowercase = False, interleaved = True, no12 = False, width = None):
+    # the ids are generated in alphabetical order (as a counter) and the last
+    # two digits are precomputed such that only the prefixes are joined
+    digits = get_digits(lowercase)
+    r = width if width else get_width(t, lowercase = lowercase, interleaved = interleaved)
+    k = min(r, 2)
+    suffixes = [''.join(el) for el in itertools.product(digits,repeat = k)]
+    if interleaved:
         if no12:
-            for el in itertools.product(digits,repeat = r):
-                x = ''.join(el)
-                yield "@%s\n" % (x,)
-                yield "@%s\n" % (x,)
+            suffixes = ["%s\n" % (el,) for el in suffixes]
+            for el in itertools.product(digits,repeat = r - k):
+                x = '@' + ''.join(el)
+                for y in suffixes:
+                    y = x + y
+                    yield y
+                    yield y
         else:
-            for el in itertools.product(digits,repeat = r):
-                x = ''.join(el)
-                yield "@%s/1\n" % (x,)
-                yield "@%s/2\n" % (x,)
+            for el in itertools.product(digits,repeat = r - k):
+                x = '@' + ''.join(el)
+                for y in suffixes:
+                    yield "%s%s/1\n" % (x,y)
+                    yield "%s%s/2\n" % (x,y)
     else:
-        r = int(math.ceil(math.log(float(t+5),l)))
-        for el in itertools.product(digits,repeat = r):
-            x = ''.join(el)
-            yield "@%s\n" % (x,)
+        suffixes = ["%s\n" % (el,) for el in suffixes]
+        for el in itertools.product(digits,repeat = r - k):
+            x = '@' + ''.join(el)
+            for y in suffixes:
+                yield x + y
+
+def estimate_count(filename, reads, consumed):
+    # it estimates the total number of reads in the input file from the size
+    # of the file and the number of reads found in the first CONSUMED bytes;
+    # a margin of 50% is added such that the width of the ids is not exceeded
+    size = os.path.getsize(filename)
+    if consumed >= size:
+        return reads
+    return int(math.ceil(1.5 * float(size) * float(reads) / float(max(consumed, 1)))) + 1
+
+def read_map(filename):
+    # it gives the pairs (new read id, original read id) from a binary map
+    # written by this script (see '--map')
+    fin = open(filename,'rb')
+    h = fin.read(struct.calcsize(HEADER))
+    (magic, version, width, lowercase, interleaved) = struct.unpack(HEADER, h)
+    if magic != MAGIC or version != VERSION:
+        print >>sys.stderr,"ERROR: '%s' is not a map of reads ids!" % (filename,)
+        sys.exit(1)
+    digits = get_digits(lowercase)
+    l = len(digits)
+    s = struct.calcsize(RECORD)
+    k = 0
+    while True:
+        h = fin.read(s)
+        if not h:
+            break
+        n = struct.unpack(RECORD, h)[0]
+        x = fin.read(n)
+        i = k / 2 if interleaved else k
+        y = []
+        for j in xrange(width):
+            (i, d) = divmod(i, l)
+            y.append(digits[d])
+        yield (''.join(reversed(y)), x)
+        k = k + 1
+    fin.close()
 
 
 
@@ -81,7 +159,7 @@ if __name__ == '__main__':
 
     usage = "%prog [options]"
     description = """It compresses using lossy compression the ids of all reads from a input FASTQ file (using the read index/count). The compressed reads ids have all the ids in alphabetically order."""
-    version = "%prog 0.15 beta"
+    version = "%prog 0.16 beta"
 
     parser = optparse.OptionParser(
                 usage = usage,
@@ -104,7 +182,25 @@ if __name__ == '__main__':
                       action = "store",
                       type = "string",
                       dest = "count",
-                      help="""The total number of reads in the input file. This is used in order to compress the best the reads ids.""")
+                      help="""The total number of reads in the input file. This is used in order to compress the best the reads ids. If it is not given then the total number of reads is estimated from the size of the input file (which should not be given thru STDIN in this case) and the reads ids might be one character longer than needed.""")
+
+    parser.add_option("--map","-m",
+                      action = "store",
+                      type = "string",
+                      dest = "map_filename",
+                      help="""The output binary file where the original reads ids are written (in the order of the reads in the output file) such that the new reads ids can be translated back into the original reads ids.""")
+
+    parser.add_option("--lengths",
+                      action = "store",
+                      type = "string",
+                      dest = "lengths_filename",
+                      help="""The output text file containg the unique lengths of the reads found in the input file (sorted in descending order). This is the same as '--output' of 'lengths_reads.py' and it saves a pass over the input file.""")
+
+    parser.add_option("--counts",
+                      action = "store",
+                      type = "string",
+                      dest = "counts_filename",
+                      help="""The output text file containg the counts of reads found in the input file. This is the same as '--counts' of 'lengths_reads.py'.""")
 
     parser.add_option("--no12","-s",
                       action = "store_true",
@@ -151,33 +247,24 @@ if __name__ == '__main__':
     else:
         fou = open(options.output_filename,'w')
 
+    fmap = None
+    if options.map_filename:
+        fmap = open(options.map_filename,'wb')
+
     n = 0
     if options.count:
         if os.path.isfile(options.count):
             n = sum([int(line.strip()) for line in file(options.count,'r').readlines() if line.strip()])
         else:
             n = int(options.count)
-    if not n:
-        print >>sys.stderr,"Warning: Cannot read/use the '--count-reads' option! Therefore the counting will be done by the script!"
-        # then use the file size as a proxy for the number of reads
-        if options.input_filename != '-':
-            n = 0
-            fid = open(options.input_filename,'r')
-            sb = 10**8
-            while True:
-                gc.disable()
-                lines = fid.readlines(sb)
-                gc.enable()
-                if not lines:
-                    break
-                n = n + len(lines)
-            fid.close()
-            n = n / 4
-        else:
-            print >>sys.stderr,"ERROR: '--count-reads' option is needed to be specified!"
-            sys.exit(1)
+    if not n and options.input_filename == '-':
+        print >>sys.stderr,"ERROR: '--count-reads' option is needed to be specified!"
+        sys.exit(1)
+
+    interleaved = not options.not_interleaved
     i = 0
-    ids = generate_id(n, lowercase = options.lowercase, interleaved = (not options.not_interleaved), no12=options.no12)
+    lengths = set()
+    ids = None
     sb = 10**8
     while True:
         gc.disable()
@@ -185,12 +272,40 @@ if __name__ == '__main__':
         gc.enable()
         if not lines:
             break
+        if ids is None:
+            if not n:
+                # the first lines are used for estimating the number of reads
+                consumed = fin.fileobj.tell() if hasattr(fin,'fileobj') else sum(map(len,lines))
+                n = estimate_count(options.input_filename, (len(lines) + 3) / 4, consumed)
+            width = get_width(n, lowercase = options.lowercase, interleaved = interleaved)
+            ids = generate_id(n, lowercase = options.lowercase, interleaved = interleaved, no12 = options.no12, width = width)
+            if fmap:
+                fmap.write(struct.pack(HEADER, MAGIC, VERSION, width, int(options.lowercase), int(interleaved)))
+        o = (4 - i % 4) % 4 # first line of a read (i.e. read id)
         gc.disable()
-        lines = [ids.next() if (j+i)%4 == 0 else '+\n' if (j+i)%4 == 2 else line for (j,line) in enumerate(lines)]
+        heads = lines[o::4]
+        new = list(itertools.islice(ids, len(heads)))
         gc.enable()
+        if len(new) != len(heads):
+            print >>sys.stderr,"ERROR: Too many reads in the input file (more than estimated)! Please, use '--count-reads' option!"
+            sys.exit(1)
+        if fmap:
+            fmap.write(''.join([struct.pack(RECORD, len(x)) + x for x in [el[1:].rstrip('\r\n') for el in heads]]))
+        lines[o::4] = new
+        k = (o + 2) % 4 # the '+' line
+        lines[k::4] = ['+\n'] * len(lines[k::4])
+        if options.lengths_filename:
+            lengths.update(set(map(len,lines[(o + 1) % 4::4])))
         i = i + len(lines)
         fou.writelines(lines)
     fin.close()
     fou.close()
+    if fmap:
+        fmap.close()
+
+    if options.lengths_filename:
+        file(options.lengths_filename,'w').writelines([str(line-1)+'\n' for line in sorted(list(lengths),reverse=True)])
+    if options.counts_filename:
+        file(options.counts_filename,'w').write("%d" % ((i+1)/4,))
 
     #
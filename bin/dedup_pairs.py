@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+It removes the duplicated pairs of reads (i.e. pairs where both mates have the
+same sequences as the mates of a previous pair) from an interleaved FASTQ file
+(i.e. mate 1 followed by mate 2), in one pass and keeping the order of the
+input. The pairs where one or both reads are shorter than a given threshold are
+removed also (like 'pair8removal.py' does).
+
+For every pair is kept only a 64-bit hash of the sequences of its mates in a
+compact open-addressing table (8 bytes per slot). If the table does not fit
+anymore in the given memory then the rest of the pairs (together with the
+already seen hashes) are split by hash on disk in partitions, which are
+deduplicated one by one, and the kept pairs are merged back in their input
+order.
+
+This replaces 'paste - - - - - - - - | sort -k 2,2 -k 6,6 -u | tr', which
+sorts the entire input just for finding the duplicates.
+
+Author: Daniel Nicorici, Daniel.Nicorici@gmail.com
+
+Copyright (c) 2009-2019 Daniel Nicorici
+
+This file is part of FusionCatcher.
+
+FusionCatcher is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FusionCatcher is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with FusionCatcher (see file 'COPYING.txt').  If not, see
+<http://www.gnu.org/licenses/>.
+
+By default, FusionCatcher is running BLAT aligner
+<http://users.soe.ucsc.edu/~kent/src/> but it offers also the option to disable
+all its scripts which make use of BLAT aligner if you choose explicitly to do so.
+BLAT's license does not allow to be used for commercial activities. If BLAT
+license does not allow to be used in your case then you may still use
+FusionCatcher by forcing not use the BLAT aligner by specifying the option
+'--skip-blat'. Fore more information regarding BLAT please see its license.
+
+Please, note that FusionCatcher does not require BLAT in order to find
+candidate fusion genes!
+
+This file is not running/executing/using BLAT.
+"""
+import sys
+import os
+import gc
+import heapq
+import array
+import struct
+import hashlib
+import optparse
+import tempfile
+import itertools
+
+import fastq_io
+
+MASK = 2**64 - 1
+LOAD = 0.7 # maximum load of the hash table
+ITEM = struct.Struct('<QQI') # hash, index, and size of a pair written in a partition
+KEPT = struct.Struct('<QI') # index and size of a kept pair
+
+HASH = struct.Struct('<Q') # a hash written in a partition of seen hashes
+
+_hash = HASH.unpack_from
+
+#########################
+def _typecode():
+    # the type of array which has unsigned items of 8 bytes (None if there is none)
+    for c in ('Q', 'L'):
+        try:
+            if array.array(c).itemsize == 8:
+                return c
+        except ValueError:
+            pass
+    return None
+TYPECODE = _typecode()
+
+#########################
+def temp_file(prefix, tmp_dir = None):
+    # it creates an empty temporary file and it gives its name
+    (h, filename) = tempfile.mkstemp(prefix = prefix, dir = tmp_dir)
+    os.close(h)
+    return filename
+
+#########################
+def pair_hash(seq1, seq2):
+    # 64-bit hash of the sequences of a pair of reads (0 is used for empty slots)
+    h = _hash(hashlib.md5(seq1 + seq2).digest())[0]
+    return h if h else 1
+
+#########################
+class table:
+    """
+    Open-addressing hash table (linear probing) of 64-bit hashes which grows
+    by doubling up to MAX_SIZE bytes (0 is for no limit).
+    """
+    def __init__(self, max_size = 0, bits = 16):
+        self.max_size = max_size
+        self.count = 0
+        self._alloc(bits)
+
+    def _alloc(self, bits):
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.limit = int(LOAD * (1 << bits))
+        if TYPECODE:
+            self.slots = array.array(TYPECODE, [0]) * (1 << bits)
+        else:
+            # no array with items of 8 bytes => a (larger) list is used
+            self.slots = [0] * (1 << bits)
+
+    def full(self):
+        # True if the table cannot grow anymore
+        return (self.count >= self.limit and
+                self.max_size and
+                8 * (2 << self.bits) > self.max_size)
+
+    def grow(self):
+        old = self.slots
+        self._alloc(self.bits + 1)
+        self.count = 0
+        for h in old:
+            if h:
+                self.add(h)
+
+    def add(self, h):
+        # it adds the hash H and it returns True if it was not in the table
+        slots = self.slots
+        mask = self.mask
+        i = h & mask
+        while True:
+            v = slots[i]
+            if not v:
+                slots[i] = h
+                self.count = self.count + 1
+                if self.count >= self.limit and not self.full():
+                    self.grow()
+                return True
+            elif v == h:
+                return False
+            i = (i + 1) & mask
+
+    def __iter__(self):
+        for h in self.slots:
+            if h:
+                yield h
+
+#########################
+def pairs(input_filename):
+    # it gives the pairs of reads as tuples of 8 lines
+    recs = fastq_io.records(input_filename)
+    for (r1, r2) in itertools.izip(recs, recs):
+        yield r1 + r2
+
+#########################
+def read_items(filename, size_buffer = 2**20):
+    # it gives the (hash, index, pair) from a partition file
+    fin = open(filename, 'rb', size_buffer)
+    n = ITEM.size
+    while True:
+        header = fin.read(n)
+        if not header:
+            break
+        (h, i, s) = ITEM.unpack(header)
+        yield (h, i, fin.read(s))
+    fin.close()
+
+#########################
+def read_kept(filename, size_buffer = 2**20):
+    # it gives the (index, pair) of the kept pairs from a partition
+    fin = open(filename, 'rb', size_buffer)
+    n = KEPT.size
+    while True:
+        header = fin.read(n)
+        if not header:
+            break
+        (i, s) = KEPT.unpack(header)
+        yield (i, fin.read(s))
+    fin.close()
+
+#########################
+def dedup(input_filename,
+          output_filename,
+          length = 0,
+          memory = 1024,
+          partitions = 64,
+          tmp_dir = None,
+          verbose = False):
+    # It removes the duplicated pairs of reads (and the pairs with too short reads).
+    # LENGTH - minimum length of a read
+    # MEMORY - maximum size (in MB) of the hash table before the partitions on disk are used
+    fou = fastq_io.lines_to_file(output_filename)
+
+    ht = table(max_size = memory * 2**20)
+    total = 0
+    kept = 0
+    parts = []
+    seen = []
+    data = pairs(input_filename)
+    try:
+        gc.disable()
+        for pair in data:
+            total = total + 1
+            if len(pair[1]) <= length or len(pair[5]) <= length:
+                continue
+            if ht.add(pair_hash(pair[1], pair[5])):
+                kept = kept + 1
+                fou.add_lines(pair)
+                if ht.full():
+                    break
+        gc.enable()
+
+        if ht.full():
+            # the hash table does not fit in memory => the rest is done on disk
+            if verbose:
+                print >>sys.stderr, "Hash table is full after %d pairs! Partitions on disk are used..." % (total,)
+            parts = [temp_file('dedup-part-', tmp_dir) for i in xrange(partitions)]
+            seen = [temp_file('dedup-seen-', tmp_dir) for i in xrange(partitions)]
+            # the already seen hashes
+            fs = [open(f, 'wb', 2**16) for f in seen]
+            for h in ht:
+                fs[h % partitions].write(HASH.pack(h))
+            for f in fs:
+                f.close()
+            ht = None
+            # the rest of the pairs
+            fp = [open(f, 'wb', 2**20) for f in parts]
+            for pair in data:
+                total = total + 1
+                if len(pair[1]) <= length or len(pair[5]) <= length:
+                    continue
+                h = pair_hash(pair[1], pair[5])
+                text = ''.join(pair)
+                fp[h % partitions].write(ITEM.pack(h, total, len(text)) + text)
+            for f in fp:
+                f.close()
+            # every partition is deduplicated (in its input order)
+            for (p, s) in itertools.izip(parts, seen):
+                ht = table()
+                fs = open(s, 'rb')
+                b = fs.read()
+                fs.close()
+                os.remove(s)
+                for i in xrange(0, len(b), HASH.size):
+                    ht.add(_hash(b, i)[0])
+                b = None
+                fk = open(s, 'wb', 2**20)
+                for (h, i, text) in read_items(p):
+                    if ht.add(h):
+                        fk.write(KEPT.pack(i, len(text)) + text)
+                fk.close()
+                os.remove(p)
+                ht = None
+            # the kept pairs are merged back in their input order
+            for (i, text) in heapq.merge(*[read_kept(f) for f in seen]):
+                kept = kept + 1
+                fou.add_line(text)
+    finally:
+        gc.enable()
+        for f in parts + seen:
+            if os.path.exists(f):
+                os.remove(f)
+    fou.close()
+    if verbose:
+        print >>sys.stderr, "%d pairs of reads read and %d pairs of reads kept." % (total, kept)
+
+
+if __name__ == '__main__':
+
+    #command line parsing
+
+    usage = "%prog [options]"
+    description = """It removes the duplicated pairs of reads (and the pairs which have too short reads) from an interleaved FASTQ file, keeping the order of the reads."""
+    version = "%prog 0.10 beta"
+
+    parser = optparse.OptionParser(usage = usage, description = description, version = version)
+
+    parser.add_option("--input","-i",
+                      action = "store",
+                      type = "string",
+                      dest = "input_filename",
+                      help = """The input FASTQ file containing interleaved pairs of reads (also given thru STDIN or as gzipped file).""")
+
+    parser.add_option("--output","-o",
+                      action = "store",
+                      type = "string",
+                      dest = "output_filename",
+                      help = """The output FASTQ file containing the pairs of reads which are kept (also given thru STDOUT).""")
+
+    parser.add_option("--length","-l",
+                      action = "store",
+                      type = "int",
+                      dest = "length",
+                      default = 0,
+                      help = """The minimum length of a read. The pairs where one of the reads is shorter than this are removed. Default is %default.""")
+
+    parser.add_option("--memory","-m",
+                      action = "store",
+                      type = "int",
+                      dest = "memory",
+                      default = 1024,
+                      help = """The maximum size (in MB) of the hash table. If it is exceeded then the rest of the pairs are deduplicated using partitions on disk. Default is '%default'.""")
+
+    parser.add_option("--partitions",
+                      action = "store",
+                      type = "int",
+                      dest = "partitions",
+                      default = 64,
+                      help = """The number of partitions on disk (used only when the hash table does not fit in memory). Default is '%default'.""")
+
+    parser.add_option("--tmp_dir","-T",
+                      action = "store",
+                      type = "string",
+                      dest = "tmp_dir",
+                      default = None,
+                      help = """The temporary directory where the partitions are written.""")
+
+    parser.add_option("--verbose","-v",
+                      action = "store_true",
+                      dest = "verbose",
+                      default = False,
+                      help = """It prints the number of pairs read and kept.""")
+
+    (options,args) = parser.parse_args()
+
+    # validate options
+    if not (options.input_filename and
+            options.output_filename
+            ):
+        parser.print_help()
+        parser.error("Input and output files should be specified!")
+        sys.exit(1)
+
+    # running
+    dedup(options.input_filename,
+          options.output_filename,
+          length = options.length,
+          memory = options.memory,
+          partitions = options.partitions,
+          tmp_dir = options.tmp_dir,
+          verbose = options.verbose)
+    #
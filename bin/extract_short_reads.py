@@ -45,132 +45,132 @@ import os
 import optparse
 import gc
 import shutil
-import gzip
+import fastq_io
+import array
+import bisect
+import itertools
+try:
+    import numpy
+except ImportError:
+    numpy = None
 #import tempfile
 
 def reads_from_fastq_file(f_name,size_read_buffer=10**8):
-    fid = None
-    if f_name == '-':
-        fid = sys.stdin
-    elif f_name.lower().endswith('.gz'):
-        fid = gzip.open(f_name,'r')
-    else:
-        fid = open(f_name,'r')
-    piece = []
-    i = 0
+    for (r0,r1,r2,r3) in fastq_io.records(f_name,size_read_buffer):
+        yield (r0,r1,r3)
+
+lines_to_file = fastq_io.lines_to_file
+
+##################
+class hashed_ids:
+    """
+    It keeps the reads ids as a sorted array of their 64-bit hashes (which needs
+    much less memory than a set of strings).
+    """
+    def __init__(self, ids):
+        # hash() gives a C long, which is stored as it is in an array('l') but
+        # which may be shorter than the 8 bytes of numpy.int64
+        if numpy:
+            self.data = numpy.unique(numpy.fromiter((hash(el) for el in ids), dtype = numpy.int64))
+        else:
+            self.data = array.array('l', sorted(set(hash(el) for el in ids)))
+        self.n = len(self.data)
+
+    def filter(self, ids):
+        # it gives for each id if it is found or not
+        if not self.n:
+            return [False] * len(ids)
+        if numpy:
+            h = numpy.fromiter((hash(el) for el in ids), dtype = numpy.int64, count = len(ids))
+            i = numpy.searchsorted(self.data, h)
+            i[i == self.n] = self.n - 1
+            return (self.data[i] == h).tolist()
+        r = []
+        for el in ids:
+            h = hash(el)
+            i = bisect.bisect_left(self.data, h)
+            r.append(i < self.n and self.data[i] == h)
+        return r
+
+##################
+def list_ids(f_list, mate = False, size_buffer = 10**8):
+    # it gives the reads ids from the list (and if MATE is True, the ids of
+    # their mates, which are sorted again locally such that a sorted list
+    # stays sorted)
+    group = []
+    key = None
+    for line in fastq_io.lines(f_list, size_buffer = size_buffer):
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        if not mate:
+            yield line
+            continue
+        if group and line[:-1] != key:
+            for el in sorted(group):
+                yield el
+            group = []
+        key = line[:-1]
+        group.append('%s%s' % (line[:-1],'2' if line.endswith('1') else '1'))
+    for el in sorted(group):
+        yield el
+
+##################
+def extract_reads_hashed(reads, f_list, data, mate = False, size_buffer = 10**8, batch = 100000):
+    # one pass thru the reads using the hashes of the ids from the list
+    ids = hashed_ids(list_ids(f_list, mate, size_buffer))
     while True:
-        gc.disable()
-        lines = fid.readlines(size_read_buffer)
-        gc.enable()
-        if not lines:
+        piece = list(itertools.islice(reads, batch))
+        if not piece:
             break
-        for a_line in lines:
-            i = i + 1
-            piece.append(a_line)
-            if i == 4:
-                yield (piece[0],piece[1],piece[3])
-                piece = []
-                i = 0
-    fid.close()
-
-class lines_to_file:
-    def __init__(self,file_name,size_buffer=10**8):
-        self.file_name = file_name
-        if file_name:
-            if file_name == "-":
-                self.file_handle = sys.stdout
-            elif file_name.lower().endswith('.gz'):
-                self.file_handle = gzip.open(file_name,'w')
-            else:
-                self.file_handle = open(file_name,'w')
-        self.size_buffer=size_buffer
-        self.data=[]
-        self.size=0
-    def add_line(self,line):
-        #line = line.rstrip('\r\n')+'\n'
-        gc.disable()
-        self.data.append(line)
-        gc.enable()
-        self.size = self.size + len(line)
-        if self.size>self.size_buffer:
-            self.__write_buffer()
-    def add_lines(self,lines):
-        gc.disable()
-        lines=[line.rstrip('\r\n')+'\n' for line in lines]
-        self.data.extend(lines)
-        self.size=self.size+sum([len(line) for line in lines])
-        gc.enable()
-        if self.size>self.size_buffer:
-            self.__write_buffer()
-    def __write_buffer(self):
-        self.file_handle.writelines(self.data)
-        self.size = 0
-        self.data = []
-    def is_filename_valid(self):
-        if self.file_name:
-            return True
-        else:
+        found = ids.filter([r[0][1:].rstrip('\r\n') for r in piece])
+        for (r, f) in itertools.izip(piece, found):
+            if f:
+                data.add_line("%s%s+\n%s" % (r[0],r[1],r[2]))
+
+##################
+def extract_reads_sorted(reads, f_list, data, mate = False, size_buffer = 10**8):
+    # one pass thru the reads (merge join) when both the reads and the list
+    # are sorted by ids; if the list is not sorted it returns False
+    last = None
+    for el in list_ids(f_list, mate, size_buffer):
+        if last is not None and el < last:
+            print >>sys.stderr,"WARNING: The list '%s' is not sorted! Using hashes of reads ids instead..." % (f_list,)
             return False
-    def close(self):
-        if self.is_filename_valid():
-            if self.data:
-                self.__write_buffer()
-            self.file_handle.close()
-            self.file_name = None
-    def __del__(self):
-        self.close()
+        last = el
+    ids = list_ids(f_list, mate, size_buffer)
+    cur = next(ids, None)
+    last = None
+    for r in reads:
+        if cur is None:
+            break
+        rid = r[0][1:].rstrip('\r\n')
+        if last is not None and rid < last:
+            print >>sys.stderr,"WARNING: The input reads are not sorted! Using hashes of reads ids for the rest of reads..."
+            extract_reads_hashed(itertools.chain([r], reads), f_list, data, mate, size_buffer)
+            break
+        last = rid
+        while cur is not None and cur < rid:
+            cur = next(ids, None)
+        if cur == rid:
+            data.add_line("%s%s+\n%s" % (r[0],r[1],r[2]))
+    return True
 
 ##################
-def extract_reads(f_in, f_list, f_out, mate = False, size_buffer = 2*(10**9)):
+def extract_reads(f_in, f_list, f_out, mate = False, size_buffer = 2*(10**9), sorted_ids = False):
 
     data = lines_to_file(f_out)
 
-    fid = open(f_list,'r')
-    list_reads = frozenset()
-    while True:
-
-        p = fid.tell()
-        err = True
-        sb = size_buffer
-        if sb == 0 :
-            sb = 2*(10**9)
-        while err:
-            gc.disable()
-            try:
-                lines = fid.readlines(sb)
-            except MemoryError:
-                print "Warning: Not enough free memory (it needed %d)!!! Trying again with a smaller buffer, like for example %d (or %d)!" % (sb,int(int(sb)/2),int(int(sb)/4))
-                sb = int(sb / 2)
-                if sb < 10000000:
-                    print "Error: Not enough free memory (it needed %d)!!! Giving up..." % (sb,)
-                    os.system("free -m")
-                    sys.exit(1)
-                err = True
-                fid.seek(p)
-            else:
-                err = False
-            gc.enable()
-
-        if not lines:
-            break
+    sb = size_buffer
+    if sb <= 0 :
+        sb = 2*(10**9)
+    sb = min(sb, 10**8)
 
-        gc.disable()
-        list_reads = [line.rstrip('\r\n') for line in lines]
-        gc.enable()
+    reads = reads_from_fastq_file(f_in)
+    if not (sorted_ids and extract_reads_sorted(reads, f_list, data, mate, sb)):
+        extract_reads_hashed(reads, f_list, data, mate, sb)
 
-        if mate:
-            gc.disable()
-            list_reads = frozenset(['%s%s' % (line[:-1],'2' if line.endswith('1') else '1') for line in list_reads])
-            gc.enable()
-        else:
-            gc.disable()
-            list_reads = frozenset(list_reads)
-            gc.enable()
-        for reads in reads_from_fastq_file(f_in):
-            if reads[0][1:].rstrip('\r\n') in list_reads:
-                data.add_line("%s%s+\n%s" % (reads[0],reads[1],reads[2]))
     data.close()
-    fid.close()
     #
 
 
@@ -180,7 +180,7 @@ if __name__ == '__main__':
 
     usage="%prog [options]"
     description="""Given a list of short read names it extracts them from a FASTQ file."""
-    version="%prog 0.14 beta"
+    version="%prog 0.15 beta"
 
     parser=optparse.OptionParser(usage=usage,description=description,version=version)
 
@@ -213,7 +213,13 @@ if __name__ == '__main__':
                       type = "int",
                       default = 2*(10**9),
                       dest = "bucket",
-                      help="""The size of the buffer used for keeping the list of reads ids (given by --list). Default is %default.""")
+                      help="""The size of the buffer used for reading the list of reads ids (given by --list). The list is kept in memory as 64-bit hashes and the input FASTQ file is read only once. Default is %default.""")
+
+    parser.add_option("--sorted",
+                      action = "store_true",
+                      default = False,
+                      dest = "sorted",
+                      help="""If specified then the input FASTQ file and the list of reads ids are assumed to be sorted by reads ids (e.g. 'LC_ALL=C sort'), such that they are merged in one pass (without keeping the list in memory). If one of them turns out to be not sorted then it falls back to using hashes of reads ids. Default is %default.""")
 
 
 #    parser.add_option("--tmp_dir",
@@ -238,4 +244,5 @@ if __name__ == '__main__':
                   options.input_list_filename,
                   options.output_filename,
                   options.mate,
-                  options.bucket)
+                  options.bucket,
+                  options.sorted)
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+It reads and writes FASTQ files (and in general text files) which might be
+compressed, and it is shared by all the tools which are processing FASTQ files.
+
+The compression is given by the extension of the file name:
+- '.gz' or '.bgz' => GZIP/BGZIP (the decompression/compression is done in a
+  separate process by 'pigz', if it is available, or by 'gzip', or by Python
+  'gzip' module as the last resort),
+- '.zst' => ZSTD (it needs 'zstd'),
+- '.bam' => BAM, only for reading, which is given as SAM text (it needs
+  'samtools'),
+- '-' => the standard input/output,
+- otherwise, the file is not compressed.
+
+
+
+Author: Daniel Nicorici, Daniel.Nicorici@gmail.com
+
+Copyright (c) 2009-2019 Daniel Nicorici
+
+This file is part of FusionCatcher.
+
+FusionCatcher is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FusionCatcher is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with FusionCatcher (see file 'COPYING.txt').  If not, see
+<http://www.gnu.org/licenses/>.
+
+By default, FusionCatcher is running BLAT aligner
+<http://users.soe.ucsc.edu/~kent/src/> but it offers also the option to disable
+all its scripts which make use of BLAT aligner if you choose explicitly to do so.
+BLAT's license does not allow to be used for commercial activities. If BLAT
+license does not allow to be used in your case then you may still use
+FusionCatcher by forcing not use the BLAT aligner by specifying the option
+'--skip-blat'. Fore more information regarding BLAT please see its license.
+
+Please, note that FusionCatcher does not require BLAT in order to find
+candidate fusion genes!
+
+This file is not running/executing/using BLAT.
+"""
+import sys
+import os
+import gc
+import gzip
+import signal
+import subprocess
+import itertools
+
+
+_which = dict()
+def which(program):
+    """
+    It gives the full path of a program found in PATH (or None).
+    """
+    if program not in _which:
+        _which[program] = None
+        for path in os.environ.get("PATH","").split(os.pathsep):
+            p = os.path.join(path.strip('"'),program)
+            if path and os.access(p,os.X_OK) and os.path.isfile(p):
+                _which[program] = p
+                break
+    return _which[program]
+
+
+def _default_sigpipe():
+    # the child should die quietly when the reader stops early
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+class _pipe:
+    """
+    A file handle of an external (de)compressor, which is running in a
+    separate process.
+    """
+    def __init__(self, cmd, file_name, mode):
+        self.cmd = cmd
+        self.file_name = file_name
+        self.mode = mode
+        if mode == 'r':
+            self.process = subprocess.Popen(cmd + [file_name],
+                                            stdout = subprocess.PIPE,
+                                            bufsize = -1,
+                                            close_fds = True,
+                                            preexec_fn = _default_sigpipe)
+            self.handle = self.process.stdout
+        else:
+            self.output = open(file_name,'wb')
+            self.process = subprocess.Popen(cmd,
+                                            stdin = subprocess.PIPE,
+                                            stdout = self.output,
+                                            bufsize = -1,
+                                            close_fds = True,
+                                            preexec_fn = _default_sigpipe)
+            self.handle = self.process.stdin
+        self.readlines = self.handle.readlines
+        self.readline = self.handle.readline
+        self.read = self.handle.read
+        self.write = self.handle.write
+        self.writelines = self.handle.writelines
+
+    def __iter__(self):
+        return iter(self.handle)
+
+    def close(self):
+        if self.handle:
+            self.handle.close()
+            self.handle = None
+            r = self.process.wait()
+            if self.mode != 'r':
+                self.output.close()
+            # a negative code means that the reader stopped early (SIGPIPE)
+            if r > 0:
+                print >>sys.stderr,"ERROR: '%s' failed (exit code %d) for file '%s'!" % (self.cmd[0],r,self.file_name)
+                sys.exit(1)
+
+    def __del__(self):
+        self.close()
+
+
+def _kind(file_name):
+    f = file_name.lower()
+    if f.endswith('.gz') or f.endswith('.bgz'):
+        return 'gz'
+    elif f.endswith('.zst'):
+        return 'zst'
+    elif f.endswith('.bam'):
+        return 'bam'
+    return ''
+
+
+def open_input(file_name):
+    """
+    It opens for reading a (compressed) text file. '-' is the standard input.
+    """
+    kind = _kind(file_name)
+    if file_name == '-':
+        return sys.stdin
+    elif kind == 'gz':
+        if which('pigz'):
+            return _pipe(['pigz','-d','-c'], file_name, 'r')
+        elif which('gzip'):
+            return _pipe(['gzip','-d','-c'], file_name, 'r')
+        return gzip.open(file_name,'r')
+    elif kind == 'zst':
+        if not which('zstd'):
+            print >>sys.stderr,"ERROR: 'zstd' is needed for reading '%s' but it is not found in PATH!" % (file_name,)
+            sys.exit(1)
+        return _pipe(['zstd','-d','-q','-c'], file_name, 'r')
+    elif kind == 'bam':
+        if not which('samtools'):
+            print >>sys.stderr,"ERROR: 'samtools' is needed for reading '%s' but it is not found in PATH!" % (file_name,)
+            sys.exit(1)
+        return _pipe(['samtools','view','-h'], file_name, 'r')
+    return open(file_name,'r')
+
+
+def open_output(file_name, threads = 1):
+    """
+    It opens for writing a (compressed) text file. '-' is the standard output.
+    THREADS is the number of threads used by the compressor (if it supports
+    it).
+    """
+    kind = _kind(file_name)
+    threads = max(1,threads)
+    if file_name == '-':
+        return sys.stdout
+    elif kind == 'gz':
+        if file_name.lower().endswith('.bgz') and which('bgzip'):
+            return _pipe(['bgzip','-@',str(threads),'-c'], file_name, 'w')
+        elif which('pigz'):
+            return _pipe(['pigz','-p',str(threads),'-c'], file_name, 'w')
+        elif which('gzip'):
+            return _pipe(['gzip','-c'], file_name, 'w')
+        return gzip.open(file_name,'w')
+    elif kind == 'zst':
+        if not which('zstd'):
+            print >>sys.stderr,"ERROR: 'zstd' is needed for writing '%s' but it is not found in PATH!" % (file_name,)
+            sys.exit(1)
+        return _pipe(['zstd','-q','-c','-T%d' % (threads,)], file_name, 'w')
+    return open(file_name,'w')
+
+
+def lines(file_name, size_buffer = 10**8):
+    """
+    It gives the lines (together with their ends) of a text file, which are
+    read in blocks of SIZE_BUFFER bytes.
+    """
+    fid = open_input(file_name)
+    while True:
+        gc.disable()
+        block = fid.readlines(size_buffer)
+        gc.enable()
+        if not block:
+            break
+        for line in block:
+            yield line
+    fid.close()
+
+
+def records(file_name, size_buffer = 10**8):
+    """
+    It gives the FASTQ records as tuples of 4 lines (id, sequence, '+', and
+    quality) together with their ends. The records are sliced directly from the
+    blocks which are read (i.e. the lines are not copied). An incomplete last
+    record is skipped.
+    """
+    fid = open_input(file_name)
+    rest = []
+    while True:
+        gc.disable()
+        block = fid.readlines(size_buffer)
+        gc.enable()
+        if not block:
+            break
+        if rest:
+            block = rest + block
+        # the lines of an incomplete record are kept for the next block
+        rest = block[len(block) - len(block) % 4:]
+        it = iter(block)
+        for record in itertools.izip(it,it,it,it):
+            yield record
+    fid.close()
+
+
+def blocks(file_name, size_block = 100000, size_buffer = 10**8):
+    """
+    It gives blocks of SIZE_BLOCK FASTQ records as text (e.g. for being sent
+    to the worker processes in one piece).
+    """
+    it = records(file_name, size_buffer = size_buffer)
+    while True:
+        block = [''.join(record) for record in itertools.islice(it,size_block)]
+        if not block:
+            break
+        yield ''.join(block)
+
+
+class lines_to_file:
+    """
+    It writes lines (which should already have their ends) to a (compressed)
+    text file using a buffer of SIZE_BUFFER bytes.
+    """
+    def __init__(self, file_name, size_buffer = 10**8, threads = 1):
+        self.file_name = file_name
+        if file_name:
+            self.file_handle = open_output(file_name, threads = threads)
+        self.size_buffer = size_buffer
+        self.data = []
+        self.size = 0
+
+    def add_line(self, line):
+        gc.disable()
+        self.data.append(line)
+        gc.enable()
+        self.size = self.size + len(line)
+        if self.size > self.size_buffer:
+            self.write_buffer()
+
+    def add_lines(self, lines):
+        gc.disable()
+        self.data.extend(lines)
+        gc.enable()
+        self.size = self.size + sum([len(line) for line in lines])
+        if self.size > self.size_buffer:
+            self.write_buffer()
+
+    def add_block(self, text):
+        # TEXT contains already whole lines (e.g. a block of FASTQ records)
+        if text:
+            self.data.append(text)
+            self.size = self.size + len(text)
+            if self.size > self.size_buffer:
+                self.write_buffer()
+
+    def write_buffer(self):
+        self.file_handle.writelines(self.data)
+        self.size = 0
+        self.data = []
+
+    def is_filename_valid(self):
+        if self.file_name:
+            return True
+        else:
+            return False
+
+    def close(self):
+        if self.is_filename_valid():
+            if self.data:
+                self.write_buffer()
+            if self.file_handle is sys.stdout:
+                self.file_handle.flush()
+            else:
+                self.file_handle.close()
+            self.file_name = None
+
+    def __del__(self):
+        self.close()
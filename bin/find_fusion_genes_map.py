@@ -58,6 +58,13 @@ import os
 import optparse
 import gc
 import gzip
+import array
+import tempfile
+
+import sort_records
+
+# estimated memory used by one position of the mates kept in memory (in bytes)
+POSITION_SIZE = 100
 
 #########################
 def line_from(a_map_filename):
@@ -83,48 +90,56 @@ def line_from(a_map_filename):
     fin.close()
 
 #########################
-def read_from(a_map_filename):
+class codes:
+    """
+    It interns strings (e.g. gene ids) as integer codes, such that the same
+    string is stored only once.
+    """
+    def __init__(self):
+        self.ids = dict()
+        self.names = []
+
+    def code(self, name):
+        c = self.ids.get(name, None)
+        if c is None:
+            c = len(self.names)
+            self.ids[name] = c
+            self.names.append(name)
+        return c
+
+    def name(self, code):
+        return self.names[code]
+
+#########################
+def pair(a, b):
+    # an integer key for an unordered pair of integer codes
+    return (a << 32) | b if a < b else (b << 32) | a
+
+#########################
+def read_from(a_map_filename, genes, refs):
+    # for each read it gives the hits of its mates as arrays of integers, where
+    # each hit is (code of gene, code of reference sequence, strand, position)
     last_r=''
     chunk=dict()
-#    sequ = dict()
     for line in line_from(a_map_filename):
         rr=line[0].partition('/') # read name with /1 or /2
         r=rr[0] # read name without /1 or /2
         m=rr[2] # /1 or /2
-        p = line[3] # position
+        p = int(line[3]) # position
         if not chunk:
             last_r=r
         if last_r!=r:
-            # line[2] is column no 3 in the BOWTIE MAP file which contains
-            # the "reference sequence name" = "transcript name"
             yield (last_r,chunk)
             last_r = r
             chunk = dict()
-            seq = dict()
+        # line[2] is column no 3 in the BOWTIE MAP file which contains
+        # the "reference sequence name" = "transcript name"
         #tr=ENST00000000233;ge=ENSG00000004059;pn=ENSP00000000233;chr=7;str=+;len=1103
-#        w = line[2].split(';')
-#        g = ''
-#        t = ''
-#        for el in w:
-#            if el.startswith('ge='):
-#                g = el[3:]
-#                if t:
-#                    break
-#            elif el.startswith('tr='):
-#                t = el[3:]
-#                if g:
-#                    break
-#        g=[el[3:] for el in w if el.startswith('ge=')]
-#        t=[el[3:] for el in w if el.startswith('tr=')]
-        w = line[2].partition(';')
-        t = w[0]
-        g = w[2]
-        s=line[1] # strand aligned to
-        #sequ[m] = line[4] # read sequence
-        if chunk.has_key(m):
-            chunk[m].append((g,t,s,p))
-        else:
-            chunk[m]=[(g,t,s,p)]
+        g = line[2].partition(';')[2]
+        s = 1 if line[1] == '+' else 0 # strand aligned to
+        if m not in chunk:
+            chunk[m] = array.array('l')
+        chunk[m].extend((genes.code(g),refs.code(line[2]),s,p))
     if chunk:
         yield (last_r,chunk)
 
@@ -134,7 +149,7 @@ if __name__ == '__main__':
 
     usage="%prog [options]"
     description="""It finds a candidate list of fusion genes."""
-    version="%prog 0.11 beta"
+    version="%prog 0.12 beta"
 
     parser=optparse.OptionParser(usage=usage,description=description,version=version)
 
@@ -200,6 +215,20 @@ if __name__ == '__main__':
                       dest="output_missing_mate_reads_filename",
                       help="""The output text tab-separated file containing the reads which have their mate read not mapped together to the gene name on which they map.""")
 
+    parser.add_option("--tmp_dir",
+                      action="store",
+                      type="string",
+                      dest="tmp_dir",
+                      default=None,
+                      help="""The temporary directory where the positions of the mapped mates are sorted.""")
+
+    parser.add_option("--buffer-size",
+                      action="store",
+                      type="string",
+                      dest="buffer_size",
+                      default="1G",
+                      help="""The memory used for keeping in memory the positions of the mapped mates (given as for 'sort --buffer-size'). If they do not fit then they are written on disk and sorted using this memory. Default is '%default'.""")
+
 
 
     (options,args)=parser.parse_args()
@@ -212,15 +241,23 @@ if __name__ == '__main__':
         parser.print_help()
         sys.exit(1)
 
+    # the genes and the reference sequences (i.e. transcripts) are kept as integer codes
+    genes = codes()
+    refs = codes()
+
     homologs=set()
     if options.input_filter_gene_pairs_filename:
         print "Reading...",options.input_filter_gene_pairs_filename
-        homologs=set([line.rstrip('\r\n') for line in file(options.input_filter_gene_pairs_filename,'r') if line.rstrip('\r\n')])
+        for line in file(options.input_filter_gene_pairs_filename,'r'):
+            line = line.rstrip('\r\n').split('\t')
+            # only the pairs given in alphabetical order are used
+            if len(line) == 2 and line[0] < line[1]:
+                homologs.add(pair(genes.code(line[0]),genes.code(line[1])))
 
     no_proteins=set()
     if options.input_filter_genes_filename:
         print "Reading...",options.input_filter_genes_filename
-        no_proteins=set([line.rstrip('\r\n') for line in file(options.input_filter_genes_filename,'r') if line.rstrip('\r\n')])
+        no_proteins=set([genes.code(line.rstrip('\r\n')) for line in file(options.input_filter_genes_filename,'r') if line.rstrip('\r\n')])
 
 
     print "Reading...",options.input_hugo_filename
@@ -242,97 +279,135 @@ if __name__ == '__main__':
     if options.output_fusion_transcripts_filename:
         flag_transcripts = True
 
+    missing_mates = None
+    if options.output_missing_mate_reads_filename:
+        missing_mates = open(options.output_missing_mate_reads_filename,'w')
+        missing_mates.write('missing_mate_read\tfound_mate_read\tfound_mate_read_maps_on_following_genes\n')
+
     print "Processing and reading...",options.input_map_filename
+    # all the keys are integers (i.e. pairs of codes of genes/transcripts)
     fusion_transcripts=dict()
     fusion_genes=dict()
-    fusion_reads = dict()
+    fusion_reads = dict() # pair of genes => array of indexes in reads
+    reads = [] # names of the supporting reads
     i_paired=0
-    #
-    missing_mates = ['missing_mate_read\tfound_mate_read\tfound_mate_read_maps_on_following_genes\n']
-    #
-    g_a = None
-    t_a = None
-    s_a = None
-    g_b = None
-    t_b = None
-    s_b = None
+    # the positions of the mates (which are needed for counting only once the
+    # paired-end reads mapping on the same positions) are kept in memory and
+    # if they do not fit anymore then they are written on disk and they are
+    # sorted at the end
     unique_positions = set()
-    for (a_read,piece) in read_from(options.input_map_filename):
+    max_positions = max(1,sort_records.parse_size(options.buffer_size) / POSITION_SIZE)
+    positions = None
+    positions_filename = None
+    i_position = 0
+    for (a_read,piece) in read_from(options.input_map_filename,genes,refs):
 
         #
         i_paired = i_paired+1
         if i_paired % 5000000 == 0:
             print '...',i_paired,'paired-end reads processed'
-        flag = False
-        if piece.has_key('1'):
-            a=zip(*piece['1'])
-            g_a=a[0]
-            t_a=a[1]
-            s_a=a[2]
-            p_a = a[3]
-        else:
-            flag = True
-        if piece.has_key('2'):
-            b=zip(*piece['2'])
-            g_b=b[0]
-            t_b=b[1]
-            s_b=b[2]
-            p_b = b[3]
-        else:
-            flag = True
-
-        if flag:
-            if piece.has_key('1'):
-                missing_mates.append("%s/2\t%s/1\t%s\n" % (a_read,a_read,','.join(set(g_a))))
-            elif piece.has_key('2'):
-                missing_mates.append("%s/1\t%s/2\t%s\n" % (a_read,a_read,','.join(set(g_b))))
+        a = piece.get('1',None)
+        b = piece.get('2',None)
+        if a is None or b is None:
+            if missing_mates:
+                if a is not None:
+                    missing_mates.write("%s/2\t%s/1\t%s\n" % (a_read,a_read,','.join(set([genes.name(el) for el in a[0::4]]))))
+                elif b is not None:
+                    missing_mates.write("%s/1\t%s/2\t%s\n" % (a_read,a_read,','.join(set([genes.name(el) for el in b[0::4]]))))
             continue
-        if set(g_a).intersection(set(g_b)): # if there are common genes skip the paired-end read
+        (g_a, t_a, s_a, p_a) = (a[0::4], a[1::4], a[2::4], a[3::4])
+        (g_b, t_b, s_b, p_b) = (b[0::4], b[1::4], b[2::4], b[3::4])
+        if set(g_a).intersection(g_b): # if there are common genes skip the paired-end read
             continue
 
+        read = -1
         unique_genes=set()
         for i in xrange(len(g_a)):
             for j in xrange(len(g_b)):
-                g = '%s\t%s' % (g_a[i],g_b[j]) if g_a[i] < g_b[j] else '%s\t%s' % (g_b[j],g_a[i])
-                z1 = "%s+++%s" % (t_a[i],p_a[i])
-                z2 = "%s+++t%s" % (t_b[j],p_b[j])
-                z = "%s-+-%s" % (z1,z2) if z1 < z2 else "%s-+-%s" % (z2,z1)
-                #g = '\t'.join(sorted([g_a[i],g_b[j]]))
                 if ( s_a[i] == s_b[j] or
-                    (g in homologs) or
                     (g_a[i] in no_proteins) or
                     (g_b[j] in no_proteins)):
                     continue
-                else:
-                    if g not in unique_genes: # local unique gene fusions
-                        if (z not in unique_positions):
+                g = pair(g_a[i],g_b[j])
+                if g in homologs:
+                    continue
+                # position of the mates on the transcripts (the mates are
+                # distinguished by the last bit)
+                z1 = (t_a[i] << 33) | (p_a[i] << 1)
+                z2 = (t_b[j] << 33) | (p_b[j] << 1) | 1
+                z = (z1 << 64) | z2 if z1 < z2 else (z2 << 64) | z1
+                if positions is None:
+                    if z not in unique_positions:
+                        if g not in unique_genes: # local unique gene fusions
                             fusion_genes[g] = fusion_genes.get(g,0)+1
+                        unique_positions.add(z)
+                        if len(unique_positions) > max_positions:
+                            print "Writing the positions of the mates on disk..."
+                            (h,positions_filename) = tempfile.mkstemp(prefix = 'positions-', dir = options.tmp_dir)
+                            positions = os.fdopen(h,'w',2**20)
+                            # the positions seen until now have been counted already (order 0)
+                            for x in unique_positions:
+                                positions.write('%032x\t%016x\t0\t0\n' % (x,0))
+                            unique_positions = None
+                else:
+                    # position, order, if it is counted (when it is seen first), and gene pair
+                    i_position = i_position + 1
+                    positions.write('%032x\t%016x\t%d\t%x\n' % (z,i_position,0 if g in unique_genes else 1,g))
 
-                        if not fusion_reads.has_key(g):
-                            fusion_reads[g] = set()
-                        fusion_reads[g].add(a_read)
-
-                        unique_genes.add(g)
-                    unique_positions.add(z)
+                if g not in unique_genes: # local unique gene fusions
+                    if read == -1:
+                        read = len(reads)
+                        reads.append(a_read)
+                    if g not in fusion_reads:
+                        fusion_reads[g] = array.array('l')
+                    fusion_reads[g].append(read)
 
-                    if flag_transcripts:
+                    unique_genes.add(g)
 
-                        t1 = t_a[i]+'\t'+g_a[i]
-                        t2 = t_b[j]+'\t'+g_b[j]
-                        t = '%s\t%s' % (t1,t2) if t1 < t2 else '%s\t%s' % (t2,t1)
-                        #t='\t'.join(sorted([t_a[i]+'\t'+g_a[i],t_b[j]+'\t'+g_b[j]]))
-                        fusion_transcripts[t] = fusion_transcripts.get(t,0)+1
-#                        if not fusion_reads.has_key(t):
-#                            fusion_reads[g] = list()
-#                       fusion_reads[t].append(a_read)
+                if flag_transcripts:
+                    t = pair(t_a[i],t_b[j])
+                    fusion_transcripts[t] = fusion_transcripts.get(t,0)+1
 
+    if missing_mates:
+        print "Writing...",options.output_missing_mate_reads_filename
+        missing_mates.close()
+    unique_positions = None
+
+    # a paired-end read is counted for a pair of genes only if its positions
+    # have not been seen before (i.e. the first line of each position after
+    # sorting by position and order)
+    if positions is not None:
+        positions.close()
+        print "Counting the paired-end reads mapping on unique positions..."
+        sorted_filename = positions_filename+'.sorted'
+        try:
+            sort_records.sort_file(positions_filename,
+                                   sorted_filename,
+                                   buffer_size = options.buffer_size,
+                                   tmp_dir = options.tmp_dir)
+            os.remove(positions_filename)
+            last = None
+            for line in file(sorted_filename,'r'):
+                z = line[:32]
+                if z != last:
+                    last = z
+                    if line[50] == '1':
+                        g = int(line[52:-1],16)
+                        fusion_genes[g] = fusion_genes.get(g,0)+1
+        finally:
+            for f in (positions_filename,sorted_filename):
+                if os.path.exists(f):
+                    os.remove(f)
+
+    def names(key, decode):
+        # it gives the unordered pair of integer codes as sorted names
+        return sorted([decode(key >> 32),decode(key & 0xFFFFFFFF)])
 
     print "Writing...",options.output_fusion_genes_filename
     fo=open(options.output_fusion_genes_filename,'w')
-    data=['\t'.join(map(str,line)) for line in fusion_genes.items()]
-    data=[line.split('\t') for line in data]
-    data = sorted(data, key=lambda x:(int(x[2]),x[0],x[1]), reverse = True)
-    data=[line+[hugo[line[0]],hugo[line[1]]] for line in data]
+    data=[names(k,genes.name)+[v] for (k,v) in fusion_genes.iteritems()]
+    data = sorted(data, key=lambda x:(x[2],x[0],x[1]), reverse = True)
+    data=[line[0:2]+[str(line[2]),hugo[line[0]],hugo[line[1]]] for line in data]
     data=['\t'.join(line)+'\n' for line in data]
     data.insert(0,'Fusion_gene_1\tFusion_gene_2\tCount_paired-end_reads\tFusion_gene_symbol_1\tFusion_gene_symbol_2\n')
     fo.writelines(data)
@@ -341,7 +416,8 @@ if __name__ == '__main__':
     if flag_transcripts:
         print "Writing...",options.output_fusion_transcripts_filename
         fo=open(options.output_fusion_transcripts_filename,'w')
-        data=['\t'.join(map(str,line))+'\n' for line in sorted(fusion_transcripts.items(), key=lambda x:(int(x[1]),x[0]), reverse = True)]
+        data=[('\t'.join(names(k,lambda x: '\t'.join(refs.name(x).split(';',1)))),v) for (k,v) in fusion_transcripts.iteritems()]
+        data=['%s\t%d\n' % line for line in sorted(data, key=lambda x:(x[1],x[0]), reverse = True)]
         data.insert(0,'Fusion_transcript_1\tFusion_gene_1\tFusion_transcript_2\tFusion_gene_2\tCount_paired-end_reads\n')
         fo.writelines(data)
         fo.close()
@@ -349,7 +425,7 @@ if __name__ == '__main__':
 
     print "Writing...",options.output_fusion_reads_filename
     fo=open(options.output_fusion_reads_filename,'w')
-    data=[line[0].split('\t')+[str(len(line[1])), ','.join(line[1])] for line in fusion_reads.items()]
+    data=[names(k,genes.name)+[str(len(v)), ','.join([reads[el] for el in v])] for (k,v) in fusion_reads.iteritems()]
     data = sorted(data,key=lambda x:(int(x[2]),x[0],x[1]), reverse = True)
     data=[[hugo[line[0]],hugo[line[1]]]+line for line in data]
     data=['\t'.join(line)+'\n' for line in data]
@@ -375,18 +451,14 @@ if __name__ == '__main__':
     if options.output_fusion_reads_simple_filename:
         fo = open(options.output_fusion_reads_simple_filename,'w')
         data = set()
-        for line in fusion_reads.values():
+        for line in fusion_reads.itervalues():
             for l in line:
-                data.add("%s/1\n"% (l,))
-                data.add("%s/2\n"% (l,))
+                data.add("%s/1\n"% (reads[l],))
+                data.add("%s/2\n"% (reads[l],))
         data = sorted(data)
         fo.writelines(data)
         fo.close()
 
-    if options.output_missing_mate_reads_filename:
-        print "Writing...",options.output_missing_mate_reads_filename
-        file(options.output_missing_mate_reads_filename,"w").writelines(missing_mates)
-
 
     print "The end."
     #
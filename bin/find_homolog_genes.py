@@ -81,9 +81,15 @@ import sys
 import os
 import optparse
 import gc
+import gzip
 import multiprocessing
 import itertools
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 #########################
 def line_from3(a_map_filename):
     # it gives chunks from a_map_filename which is assumed to be ordered by the name of transcripts (i.e. column 3)
@@ -243,32 +249,107 @@ def is_overlapping(e1,e2,tolerance = 50):
 
 
 #########################
-#def compute_homology(ar,ge,ex):
-def homology(stuff):
-    # ar = read id
-    # ge = list of gene ids
-    # ex = list of exons coordinates
-
-    ar = stuff[0]
-    ge = stuff[1]
-    ex = stuff[2]
-
-    n = len(ge)
-
-    flag = False
-    hom = []
-    # limit the amount of combinations
-    if n > 100:
-        n = 100
-    for a in xrange(0,n-1):
-        for b in xrange(a+1,n):
-            k = '%s\t%s' % (ge[a],ge[b])
-#            if g[a] > g[b]:
-#                k = '%s\t%s' % (g[b],g[a])
-            hom.append(k)
-            if ex and (not is_overlapping(ex[a],ex[b])):
-                flag = True
-    return (hom, ar if flag else None )
+def numbered(reads, genes, names, known = None, size = 1000):
+    # it gives chunks of reads where the genes are given as numbers (i.e. their
+    # index in NAMES); the new genes are added to GENES and NAMES; KNOWN is the
+    # number of genes which have coordinates (if there are coordinates)
+    chunk = []
+    for (ar,ge,ex) in reads:
+        x = []
+        for g in ge:
+            i = genes.get(g,None)
+            if i is None:
+                if known is not None:
+                    print >>sys.stderr,"ERROR: The gene '%s' is not found in the database of exons!" % (g,)
+                    sys.exit(1)
+                i = len(names)
+                genes[g] = i
+                names.append(g)
+            x.append(i)
+        chunk.append((ar,x))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+#########################
+def merge(keys, counts):
+    # it sums the counts of the same keys (given as NumPy arrays)
+    if len(keys) == 0:
+        return (keys, counts)
+    o = numpy.argsort(keys, kind = 'mergesort')
+    keys = keys[o]
+    counts = counts[o]
+    i = numpy.flatnonzero(numpy.concatenate(([True], keys[1:] != keys[:-1])))
+    return (keys[i], numpy.add.reduceat(counts, i))
+
+#########################
+_para = None
+def set_param(para):
+    global _para
+    _para = para
+
+_triu = dict()
+def triu(n):
+    # the indexes of all pairs (a,b), with a < b, of N genes
+    if n not in _triu:
+        _triu[n] = numpy.triu_indices(n,1)
+    return _triu[n]
+
+#########################
+def homology(chunk):
+    # chunk = list of (read id, list of genes given as numbers)
+    #
+    # a pair of genes (a,b) is packed as one integer, i.e. a * 2**32 + b, and
+    # it returns the counts of the pairs of genes as a sparse map (i.e. keys
+    # and counts) and the ids of the reads which map on genes which do not
+    # overlap each other (only if the coordinates of the genes are given)
+    table = _para
+    offenders = []
+    if numpy:
+        a = []
+        b = []
+        r = []
+        for (i,(ar,ge)) in enumerate(chunk):
+            n = len(ge)
+            # limit the amount of combinations
+            if n > 100:
+                n = 100
+            x = numpy.array(ge[:n], dtype = numpy.int64)
+            (u,v) = triu(n)
+            a.append(x[u])
+            b.append(x[v])
+            if table:
+                r.append(numpy.repeat(i,len(u)))
+        a = numpy.concatenate(a)
+        b = numpy.concatenate(b)
+        (keys, counts) = numpy.unique((a << 32) | b, return_counts = True)
+        if table:
+            (starts, ends, chroms) = table
+            r = numpy.concatenate(r)
+            ov = (chroms[a] == chroms[b]) & (ends[a] - starts[b] > 50) & (ends[b] - starts[a] > 50)
+            offenders = [chunk[i][0] for i in numpy.unique(r[~ov]).tolist()]
+    else:
+        hom = dict()
+        for (ar,ge) in chunk:
+            n = len(ge)
+            # limit the amount of combinations
+            if n > 100:
+                n = 100
+            flag = False
+            for a in xrange(0,n-1):
+                ka = ge[a] << 32
+                for b in xrange(a+1,n):
+                    k = ka | ge[b]
+                    hom[k] = hom.get(k,0) + 1
+                    if table and (not flag) and (not is_overlapping(table[ge[a]],table[ge[b]])):
+                        flag = True
+            if flag:
+                offenders.append(ar)
+        keys = hom.keys()
+        counts = hom.values()
+    return (keys, counts, offenders)
 
 #
 # def shred(stuff):
@@ -283,7 +364,7 @@ if __name__ == '__main__':
 
     usage="%prog [options]"
     description="""It finds a list of genes that might homologous (there is a short read which maps on both genes)."""
-    version="%prog 0.12 beta"
+    version="%prog 0.13 beta"
 
     parser=optparse.OptionParser(usage=usage,description=description,version=version)
 
@@ -437,74 +518,86 @@ if __name__ == '__main__':
 
 
 
+    # the genes are interned as numbers (the genes with coordinates first)
+    # and the coordinates are kept in a table indexed by these numbers
+    names = sorted(database.keys())
+    genes = dict([(g,i) for (i,g) in enumerate(names)])
+    table = None
+    known = None
+    if database:
+        known = len(names)
+        chroms = dict([(c,i) for (i,c) in enumerate(sorted(set([el[2] for el in database.itervalues()])))])
+        table = [(database[g][0],database[g][1],chroms[database[g][2]]) for g in names]
+        if numpy:
+            table = (numpy.array([el[0] for el in table], dtype = numpy.int64),
+                     numpy.array([el[1] for el in table], dtype = numpy.int64),
+                     numpy.array([el[2] for el in table], dtype = numpy.int64))
+    database = None
+
     #print "Finding the homolog genes..."
-    pool = multiprocessing.Pool(processes=cpus)
-    homolog = dict()
-    offenders = list()
     fo = None
     if options.output_offending_pair_reads_filename:
         fo = open(options.output_offending_pair_reads_filename,"w")
-#    for (a_read,genes,exo) in read_from(options.input_map_filename, database = database, filter_gene = filterout):
-#        (h,f) = compute_homology(a_read,genes,exo)
-#
-#        gc.disable()
-#        for k in h:
-#            homolog[k] = homolog.get(k,0) + 1
-#        if f:
-#            offenders.append(a_read)
-#        gc.enable()
 
     my_iter = None
     if options.distance_mismatches_1:
         my_iter = read_from4(
             options.input_map_filename,
-            database = database,
             filter_gene = filterout)
     else:
         my_iter = read_from3(
             options.input_map_filename,
-            database = database,
             filter_gene = filterout)
+    my_iter = numbered(my_iter, genes, names, known = known)
 
-    max_genes_per_read = 0
-    max_genes_per_read_id = ''
+    pool = None
+    if cpus > 1:
+        pool = multiprocessing.Pool(processes = cpus, initializer = set_param, initargs = (table,))
+        results = pool.imap_unordered(homology, my_iter)
+    else:
+        set_param(table)
+        results = itertools.imap(homology, my_iter)
 
-    if fo:
-        for w in pool.imap_unordered(
-            homology,
-            my_iter,
-            chunksize = 100):
-
-            h = w[0] # list of pairs of genes which are homologous to each other
-            f = w[1] # read id if it the genes are NOT overlapping
-
-            z = len(h)
-            if z > max_genes_per_read:
-                max_genes_per_read = z
-                max_genes_per_read_id = f
-
-            for k in h:
-                gc.disable()
-                homolog[k] = homolog.get(k,0) + 1
-                gc.enable()
-            if f:
-                offenders.append(f)
-                if len(offenders) > 100000:
-                    d = list()
-                    for e in offenders:
-                        if e.endswith('/1'):
-                            gc.disable()
-                            d.append(e)
-                            d.append(e[:-1]+'2')
-                            gc.enable()
-                        elif e.endswith('/2'):
-                            gc.disable()
-                            d.append(e[:-1]+'1')
-                            d.append(e)
-                            gc.enable()
-                    fo.writelines([line+'\n' for line in d])
-                    offenders = []
+    # the sparse maps of the counts of the pairs of genes are merged
+    homolog = dict()
+    all_keys = numpy.zeros(0, dtype = numpy.int64) if numpy else None
+    all_counts = numpy.zeros(0, dtype = numpy.int64) if numpy else None
+    pending = []
+    size = 0
+    offenders = list()
+    for (keys, counts, f) in results:
+        if numpy:
+            pending.append((keys, counts))
+            size = size + len(keys)
+            if size > 10**7:
+                (all_keys, all_counts) = merge(numpy.concatenate([all_keys] + [el[0] for el in pending]),
+                                               numpy.concatenate([all_counts] + [el[1] for el in pending]))
+                pending = []
+                size = 0
+        else:
+            gc.disable()
+            for (k,c) in itertools.izip(keys, counts):
+                homolog[k] = homolog.get(k,0) + c
+            gc.enable()
+        if fo and f:
+            offenders.extend(f)
+            if len(offenders) > 100000:
+                d = list()
+                for e in offenders:
+                    if e.endswith('/1'):
+                        gc.disable()
+                        d.append(e)
+                        d.append(e[:-1]+'2')
+                        gc.enable()
+                    elif e.endswith('/2'):
+                        gc.disable()
+                        d.append(e[:-1]+'1')
+                        d.append(e)
+                        gc.enable()
+                fo.writelines([line+'\n' for line in d])
+                offenders = []
 
+    if fo:
         if offenders:
             d = list()
             for e in offenders:
@@ -519,61 +612,26 @@ if __name__ == '__main__':
                     d.append(e)
                     gc.enable()
             fo.writelines([line+'\n' for line in d])
-        if fo:
-            fo.close()
-
+        fo.close()
+
+    if pool:
+        pool.close()
+        pool.join()
+
+    if numpy:
+        (all_keys, all_counts) = merge(numpy.concatenate([all_keys] + [el[0] for el in pending]),
+                                       numpy.concatenate([all_counts] + [el[1] for el in pending]))
+        pending = []
+        f = all_counts >= options.reads
+        homolog = itertools.izip(all_keys[f].tolist(), all_counts[f].tolist())
     else:
+        homolog = [(k,v) for (k,v) in homolog.iteritems() if v >= options.reads]
 
-        for w in pool.imap_unordered(
-            homology,
-            my_iter,
-            chunksize = 100):
-
-
-#        for w in itertools.imap(
-#            shred,
-#            my_iter):
-
-
-
-            h = w[0]
-            #f = w[1]
-
-            z = len(h)
-            if z > max_genes_per_read:
-                max_genes_per_read = z
-                max_genes_per_read_id = w[1]
-
-            for k in h:
-                gc.disable()
-                homolog[k] = homolog.get(k,0) + 1
-                gc.enable()
-
-
-#        g = genes
-#        n = len(genes)
-#        flag = False
-#        for a in xrange(0,n-1):
-#            for b in xrange(a+1,n):
-#                k = '%s\t%s' % (g[a],g[b])
-#                if g[a] > g[b]:
-#                    k = '%s\t%s' % (g[b],g[a])
-#                gc.disable()
-#                homolog[k] = homolog.get(k,0) + 1
-#                gc.enable()
-#                if database and (not is_overlapping(g[a],g[b])):
-#                    flag = True
-#        if flag:
-#            gc.disable()
-#            offenders.add(a_read)
-#            gc.enable()
-
-    pool.close()
-    pool.join()
     #print "Writing...",options.output_filename
-    #homolog = sorted([k+'\t'+str(v)+'\n' for (k,v) in homolog.items() if v >= options.reads])
-    homolog = [k+'\t'+str(v)+'\n' for (k,v) in homolog.items() if v >= options.reads]
-    file(options.output_filename,'w').writelines(homolog)
+    fou = open(options.output_filename,'w')
+    for (k,v) in homolog:
+        fou.write('%s\t%s\t%d\n' % (names[k >> 32], names[k & 0xFFFFFFFF], v))
+    fou.close()
 
     #print >> sys.stderr, "Read '%s' found mapping on %d genes!" % (max_genes_per_read_id,max_genes_per_read)
 
@@ -58,6 +58,176 @@ This file is not running/executing/using BLAT.
 import os
 import sys
 import shutil
+import time
+import subprocess
+import multiprocessing
+
+
+#########################
+def hijack(cmds, names, flag = False):
+    # it takes out from the command line the option given by NAMES and it
+    # gives its value (or True if it is a FLAG) and the new command line
+    value = None
+    new = []
+    i = 0
+    while i < len(cmds):
+        el = cmds[i]
+        if el in names:
+            if flag:
+                value = True
+            elif i + 1 < len(cmds):
+                value = cmds[i+1]
+                i = i + 1
+        elif (not flag) and [1 for n in names if el.startswith(n+'=')]:
+            value = el.split('=',1)[1]
+        else:
+            new.append(el)
+        i = i + 1
+    return (value, new)
+
+#########################
+def outputs(lines, xou, ix = 0):
+    # it gives the input and output paths of the samples given as lines
+    # from a text file (the second column is the sample name)
+    r = []
+    for line in lines:
+        ix = ix + 1
+        pin = os.path.join(line[0])
+        if len(line) >= 2 and line[1]:
+            pou = os.path.join(xou,line[1])
+        else:
+            #pou = os.path.join(xou,os.path.basename(line[0].rstrip(os.sep)))
+            vu = line[0]
+            if vu.find(',') != -1:
+                vu = str(ix) + "_" + os.path.basename(vu.split(",")[0].rstrip(os.sep))
+            else:
+                vu = os.path.basename(vu.rstrip(os.sep))
+            pou = os.path.join(xou,vu)
+        r.append((pin,pou))
+    return r
+
+#########################
+def load_status(a_filename):
+    # it reads the status of the samples analyzed previously
+    status = dict()
+    if os.path.isfile(a_filename):
+        for line in file(a_filename,'r').readlines():
+            line = line.rstrip('\r\n').split('\t')
+            if len(line) >= 2:
+                status[line[0]] = line[1]
+    return status
+
+#########################
+def save_status(a_filename, status):
+    # it writes the status of the analyzed samples
+    file(a_filename,'w').writelines(['%s\t%s\n' % (k,v) for (k,v) in sorted(status.items())])
+
+#########################
+def run_samples(samples, cmds, jobs, status, status_filename, labels = None, collect = None, resume = False):
+    # It runs FusionCatcher for SAMPLES (list of input and output paths) such
+    # that at most JOBS samples are analyzed at the same time.
+    # LABELS  - function which gives the extra command line options for a
+    #           sample (called just before the sample is started)
+    # COLLECT - function called for each sample which finished successfully
+    # RESUME  - if it is True then the samples which have been analyzed
+    #           successfully before (see STATUS) are not analyzed again
+    waiting = list(samples)
+    running = dict() # output path => process
+    while waiting or running:
+        while waiting and len(running) < jobs:
+            (pin,pou) = waiting.pop(0)
+            if resume and status.get(pou,'') == 'ok':
+                print "------------------------------------------"
+                print "Skipping '%s' because it has been analyzed successfully before!" % (pou,)
+                print "------------------------------------------"
+                if collect:
+                    collect(pou)
+                continue
+            t = cmds[:]
+            t.append('--input')
+            t.append(pin)
+            t.append('--output')
+            t.append(pou)
+            if labels:
+                t.extend(labels())
+            t = ' '.join(t)
+            print "------------------------------------------"
+            print t
+            print "------------------------------------------"
+            sys.stdout.flush()
+            status[pou] = 'running'
+            save_status(status_filename, status)
+            if jobs > 1:
+                # the samples are running at the same time => one log per sample
+                d = os.path.dirname(pou.rstrip(os.sep))
+                if d and not os.path.isdir(d):
+                    os.makedirs(d)
+                log = open(pou.rstrip(os.sep)+'.log','w')
+                running[pou] = subprocess.Popen(t, shell = True, stdout = log, stderr = subprocess.STDOUT)
+                log.close()
+            else:
+                running[pou] = subprocess.Popen(t, shell = True)
+        if not running:
+            break
+        time.sleep(1)
+        for pou in running.keys():
+            r = running[pou].poll()
+            if r is None:
+                continue
+            running.pop(pou)
+            status[pou] = 'ok' if r == 0 else 'failed'
+            save_status(status_filename, status)
+            if r != 0:
+                print >>sys.stderr,"ERROR: FusionCatcher failed for '%s' (exit code %d)!" % (pou,r)
+            elif collect:
+                collect(pou)
+    return status
+
+#########################
+class normals:
+    # it keeps the fusion genes found in the matched-normal samples such
+    # that they can be used for labeling the fusion genes found later
+    def __init__(self, xou):
+        self.normaltemp = os.path.join(xou,'preliminary-candidate-fusions-found-in-normal.log')
+        file(self.normaltemp,"w").write('')
+        self.partialnormaltemp = os.path.join(xou,'partial-preliminary-candidate-fusions-found-in-normal.log')
+        file(self.partialnormaltemp,"w").write('')
+        self.first = True
+
+    def labels(self):
+        # the first matched-normal sample is not labeled
+        r = []
+        if self.first:
+            self.first = False
+        else:
+            r = ['--label-title',
+                 'partial-matched-normal,matched-normal',
+                 '--label-file',
+                 self.partialnormaltemp+','+self.normaltemp,
+                 '--label-threshold',
+                 '2,0']
+        return r
+
+    def tumor_labels(self):
+        self.first = False
+        return self.labels()
+
+    def collect(self, pou):
+        # the label files are replaced atomically because they might be read
+        # at the same time by the other samples which are running
+        # (the next matched-normal samples are labeled even if this one has
+        # been skipped by --batch-resume without asking for its labels)
+        self.first = False
+        for (f,c,g) in (('final-list_candidate-fusion-genes.txt','11,12',self.normaltemp),
+                        ('preliminary-list_candidate-fusion-genes.txt','1-3',self.partialnormaltemp)):
+            shutil.copyfile(g,g+'.tmp')
+            t = 'sed "1 d" "%s" | cut -f %s | uniq >> "%s"' % (os.path.join(pou,f),c,g+'.tmp')
+            print "------------------------------------------"
+            print t
+            print "------------------------------------------"
+            r = os.system(t)
+            os.rename(g+'.tmp',g)
+
 
 if __name__ == "__main__":
     #command line parsing
@@ -96,6 +266,19 @@ if __name__ == "__main__":
         cmds = [el for el in cmds if el != '--reverse']
         flag_reverse = True
 
+    # hijack the options for running several samples at the same time
+    (flag_resume, cmds) = hijack(cmds, ('--batch-resume',), flag = True)
+    (jobs, cmds) = hijack(cmds, ('--batch-jobs',))
+    (memory, cmds) = hijack(cmds, ('--batch-memory',))
+    (memory_sample, cmds) = hijack(cmds, ('--batch-memory-sample',))
+    (aligners, cmds) = hijack(cmds, ('--batch-aligners',))
+    jobs = int(jobs) if jobs else 1
+    memory_sample = float(memory_sample) if memory_sample else 32
+    if memory and float(memory) > 0:
+        jobs = min(jobs,max(1,int(float(memory)/memory_sample)))
+    jobs = max(1,jobs)
+    aligners = int(aligners) if aligners else 0
+
     newcmds = cmds[:]
     if xin and xou:
         # new command line options
@@ -111,213 +294,82 @@ if __name__ == "__main__":
                                             el!='--output' and
                                             el!='--normal' and
                                             el!='-o')]
+        threads = None
+        if jobs > 1:
+            # the CPUs are shared between the samples running at the same time
+            (threads, newcmds) = hijack(newcmds, ('--threads','-p'))
+            threads = int(threads) if threads else 0
+            if threads <= 0:
+                threads = multiprocessing.cpu_count()
+            newcmds.append('--threads')
+            newcmds.append(str(max(1,threads/jobs)))
+        if aligners > 0:
+            newcmds.append('--aligners-slots')
+            newcmds.append(str(aligners))
+            newcmds.append('--aligners-slots-dir')
+            newcmds.append(os.path.join(xou,'aligners-slots'))
         if head.endswith('fusioncatcher-batch.py'):
             newcmds.insert(0,head.replace('fusioncatcher-batch.py','fusioncatcher.py --keep-preliminary'))
         else:
             newcmds.insert(0,head.replace('fusioncatcher-batch','fusioncatcher.py --keep-preliminary'))
+
+        samples = []
+        nos = None
         if xin and os.path.isdir(xin):
             # input is a directory and contains subdirectories, one subdirectory is one sample
             dirs = sorted([el for el in os.listdir(xin) if os.path.isdir(os.path.join(xin,el)) and not el.startswith('.')],reverse=flag_reverse)
-            nos = None
+            samples = [(os.path.join(xin,d),os.path.join(xou,d)) for d in dirs]
             if xno and os.path.isdir(xno):
                 nos =  sorted([el for el in os.listdir(xno) if os.path.isdir(os.path.join(xno,el)) and not el.startswith('.')])
-            if nos:
-                if xou and not os.path.isdir(xou):
-                    os.makedirs(xou)
-                normaltemp = os.path.join(xou,'preliminary-candidate-fusions-found-in-normal.log')
-                file(normaltemp,"w").write('')
-                partialnormaltemp = os.path.join(xou,'partial-preliminary-candidate-fusions-found-in-normal.log')
-                file(partialnormaltemp,"w").write('')
-                first = True
-                for d in nos:
-                    t = newcmds[:]
-                    t.append('--input')
-                    t.append(os.path.join(xin,d))
-                    t.append('--output')
-                    t.append(os.path.join(xou,d))
-                    if first:
-                        first = False
-                    else:
-                        t.append('--label-title')
-                        t.append('partial-matched-normal,matched-normal')
-                        t.append('--label-file')
-                        t.append(partialnormaltemp+','+normaltemp)
-                        t.append('--label-threshold')
-                        t.append('2,0')
-                    t = ' '.join(t)
-                    print "------------------------------------------"
-                    print t
-                    print "------------------------------------------"
-                    r = os.system(t)
-                    t = 'sed "1 d" "%s" | cut -f 11,12 | uniq >> "%s"' % (os.path.join(xou,d,'final-list_candidate-fusion-genes.txt'),normaltemp)
-                    print "------------------------------------------"
-                    print t
-                    print "------------------------------------------"
-                    r = os.system(t)
-                    t = 'sed "1 d" "%s" | cut -f 1-3 | uniq >> "%s"' % (os.path.join(xou,d,'preliminary-list_candidate-fusion-genes.txt'),partialnormaltemp)
-                    print "------------------------------------------"
-                    print t
-                    print "------------------------------------------"
-                    r = os.system(t)
-
-                for d in dirs:
-                    t = newcmds[:]
-                    t.append('--input')
-                    t.append(os.path.join(xin,d))
-                    t.append('--output')
-                    t.append(os.path.join(xou,d))
-                    t.append('--label-title')
-                    t.append('partial-matched-normal,matched-normal')
-                    t.append('--label-file')
-                    t.append(partialnormaltemp+','+normaltemp)
-                    t.append('--label-threshold')
-                    t.append('2,0')
-                    t = ' '.join(t)
-                    print "------------------------------------------"
-                    print t
-                    print "------------------------------------------"
-                    r = os.system(t)
-
-                os.remove(normaltemp)
-
-            else:
-                for d in dirs:
-                    t = newcmds[:]
-                    t.append('--input')
-                    t.append(os.path.join(xin,d))
-                    t.append('--output')
-                    t.append(os.path.join(xou,d))
-                    t = ' '.join(t)
-                    print "------------------------------------------"
-                    print t
-                    print "------------------------------------------"
-                    r = os.system(t)
-
+                nos = [(os.path.join(xno,d),os.path.join(xou,d)) for d in nos]
         elif xin and os.path.isfile(xin):
             # the input is text file containing the files/directories which should be given as input to FusionCatcher
             # ignore the lines which are empty of start with #
             # a second column (separated by tab) can contain sample name which will be used for name of output directory
             txt = [line.rstrip('\r\n').split('\t') for line in file(xin,'r').readlines() if line.rstrip("\r\n") and not line.strip().startswith("#")]
-            nos = None
             if xno:
                 nos = [line.rstrip('\r\n').split('\t') for line in file(xno,'r').readlines() if line.rstrip("\r\n") and not line.strip().startswith("#")]
+            ix = 0
+            if nos:
+                nos = outputs(nos, xou)
+                ix = len(nos)
+            samples = outputs(txt, xou, ix)
+
+        if samples or nos:
+            if xou and not os.path.isdir(xou):
+                os.makedirs(xou)
+            status_filename = os.path.join(xou,'fusioncatcher-batch-status.txt')
+            status = load_status(status_filename) if flag_resume else dict()
 
             if nos:
-                if xou and not os.path.isdir(xou):
-                    os.makedirs(xou)
-                normaltemp = os.path.join(xou,'preliminary-candidate-fusions-found-in-normal.log')
-                file(normaltemp,"w").write('')
-                partialnormaltemp = os.path.join(xou,'partial-preliminary-candidate-fusions-found-in-normal.log')
-                file(partialnormaltemp,"w").write('')
-
-                first = True
-                ix = 0
-                for line in nos:
-                    ix = ix + 1
-                    t = newcmds[:]
-                    pin = None
-                    pou = None
-                    pin = os.path.join(line[0])
-                    if len(line) >= 2 and line[1]:
-                        pou = os.path.join(xou,line[1])
-                    else:
-                        #pou = os.path.join(xou,os.path.basename(line[0].rstrip(os.sep)))
-                        vu = line[0]
-                        if vu.find(',') != -1:
-                            vu = str(ix) + "_" + os.path.basename(vu.split(",")[0].rstrip(os.sep))
-                        else:
-                            vu = os.path.basename(vu.rstrip(os.sep))
-                        pou = os.path.join(xou,vu)
-                    t.append('--input')
-                    t.append(pin)
-                    t.append('--output')
-                    t.append(pou)
-                    if first:
-                        first = False
-                    else:
-                        t.append('--label-title')
-                        t.append('partial-matched-normal,matched-normal')
-                        t.append('--label-file')
-                        t.append(partialnormaltemp+','+normaltemp)
-                        t.append('--label-threshold')
-                        t.append('2,0')
-                    t = ' '.join(t)
-                    print "------------------------------------------"
-                    print t
-                    print "------------------------------------------"
-                    r = os.system(t)
-                    t = 'sed "1 d" "%s" | cut -f 11,12 | uniq >> "%s"' % (os.path.join(pou,'final-list_candidate-fusion-genes.txt'),normaltemp)
-                    print "------------------------------------------"
-                    print t
-                    print "------------------------------------------"
-                    r = os.system(t)
-                    t = 'sed "1 d" "%s" | cut -f 1-3 | uniq >> "%s"' % (os.path.join(pou,'preliminary-list_candidate-fusion-genes.txt'),partialnormaltemp)
-                    print "------------------------------------------"
-                    print t
-                    print "------------------------------------------"
-                    r = os.system(t)
-
-                for line in txt:
-                    ix = ix + 1
-                    t = newcmds[:]
-                    pin = None
-                    pou = None
-                    pin = os.path.join(line[0])
-                    if len(line) >= 2 and line[1]:
-                        pou = os.path.join(xou,line[1])
-                    else:
-                        #pou = os.path.join(xou,os.path.basename(line[0].rstrip(os.sep)))
-                        vu = line[0]
-                        if vu.find(',') != -1:
-                            vu = str(ix) + "_" + os.path.basename(vu.split(",")[0].rstrip(os.sep))
-                        else:
-                            vu = os.path.basename(vu.rstrip(os.sep))
-                        pou = os.path.join(xou,vu)
-                    t.append('--input')
-                    t.append(pin)
-                    t.append('--output')
-                    t.append(pou)
-                    t.append('--label-title')
-                    t.append('partial-matched-normal,matched-normal')
-                    t.append('--label-file')
-                    t.append(partialnormaltemp+','+normaltemp)
-                    t.append('--label-threshold')
-                    t.append('2,0')
-                    t = ' '.join(t)
-                    print "------------------------------------------"
-                    print t
-                    print "------------------------------------------"
-                    r = os.system(t)
-                os.remove(normaltemp)
-                os.remove(partialnormaltemp)
+                # the matched-normal samples are analyzed first and one by one
+                # (with all the CPUs) because each of them is labeled using
+                # the fusion genes found in all the previous ones
+                normalcmds = newcmds[:]
+                if threads:
+                    normalcmds[normalcmds.index('--threads')+1] = str(threads)
+                normal = normals(xou)
+                run_samples(nos, normalcmds, 1, status, status_filename,
+                            labels = normal.labels,
+                            collect = normal.collect,
+                            resume = flag_resume)
+                run_samples(samples, newcmds, jobs, status, status_filename,
+                            labels = normal.tumor_labels,
+                            resume = flag_resume)
+                os.remove(normal.normaltemp)
+                os.remove(normal.partialnormaltemp)
             else:
-                ix = 0
-                for line in txt:
-                    ix = ix + 1
-                    t = newcmds[:]
-                    #print t
-                    pin = None
-                    pou = None
-                    pin = os.path.join(line[0])
-                    if len(line) >= 2 and line[1]:
-                        pou = os.path.join(xou,line[1])
-                    else:
-                        #pou = os.path.join(xou,os.path.basename(line[0].rstrip(os.sep)))
-                        vu = line[0]
-                        if vu.find(',') != -1:
-                            vu = str(ix) + "_" + os.path.basename(vu.split(",")[0].rstrip(os.sep))
-                        else:
-                            vu = os.path.basename(vu.rstrip(os.sep))
-                        pou = os.path.join(xou,vu)
-                    t.append('--input')
-                    t.append(pin)
-                    t.append('--output')
-                    t.append(pou)
-                    t = ' '.join(t)
-                    print "------------------------------------------"
-                    print t
-                    print "------------------------------------------"
-                    r = os.system(t)
+                run_samples(samples, newcmds, jobs, status, status_filename,
+                            resume = flag_resume)
+
+            if aligners > 0:
+                shutil.rmtree(os.path.join(xou,'aligners-slots'),ignore_errors = True)
+
+            failed = sorted([k for (k,v) in status.items() if v != 'ok'])
+            if failed:
+                print >>sys.stderr,"ERROR: FusionCatcher failed for the following samples (use '--batch-resume' for analyzing again only these):"
+                print >>sys.stderr,'\n'.join(failed)
+                sys.exit(1)
 
 
     else:
@@ -325,7 +377,7 @@ if __name__ == "__main__":
         #newcmds = ' '.join(newcmds)
         #os.system(newcmds)
         print """
-FUSIONCATCHER-BATCH.PY version 0.12
+FUSIONCATCHER-BATCH.PY version 0.13
 
 Author: Daniel Nicorici, Daniel.Nicorici@gmail.com
 
@@ -346,5 +398,26 @@ be given here)
 or more Fastq files corresponding to one sample (one subdirectory = one sample);
 all found subdirectories will be analyzed one by one by FusionCatcher.
 
+The matched-normal samples (given using --normal) are always analyzed one by
+one before the other samples. Several (not matched-normal) samples may be
+analyzed at the same time using:
+ --batch-jobs N           maximum number of samples analyzed at the same time
+                          (default is 1); the CPUs given by '--threads' (or all
+                          the CPUs found) are divided between them and the log
+                          of each sample is written in the output directory as
+                          '<sample>.log',
+ --batch-memory GB        total memory (in GB) available for the samples which
+                          are analyzed at the same time (it may decrease the
+                          value given by '--batch-jobs'),
+ --batch-memory-sample GB memory (in GB) needed by one sample (default is 32),
+ --batch-aligners N       maximum number of alignment steps (e.g. STAR, Bowtie)
+                          running at the same time over all the samples such
+                          that their indexes stay in the page cache (default is
+                          0, i.e. no limit),
+ --batch-resume           only the samples which have not been analyzed
+                          successfully before (see the file
+                          'fusioncatcher-batch-status.txt' from the output
+                          directory) are analyzed.
+
 """
 #
@@ -259,6 +259,43 @@ if __name__ == '__main__':
                       help = "Number or processes/threads to be used. "+
                              "Default is '%default'.")
 
+    parser.add_option("--parallel-steps",
+                      action = "store_true",
+                      dest = "parallel_steps",
+                      default = False,
+                      help = "If it is specified then the independent steps of the "+
+                             "workflow/pipeline which are marked as such (i.e. "+
+                             "building of the indexes of the aligners) are executed "+
+                             "at the same time using at most the number of threads "+
+                             "given by '--threads' and at most the memory given by "+
+                             "'--memory'. "+
+                             "Default is '%default'.")
+
+    parser.add_option("--memory",
+                      action = "store",
+                      type = "int",
+                      dest = "memory",
+                      default = 0,
+                      help = "Memory (in GB) available for the steps executed at "+
+                             "the same time (see '--parallel-steps'). If it is set "+
+                             "to 0 then there is no limit. "+
+                             "Default is '%default'.")
+
+    parser.add_option("--incremental",
+                      action = "store_true",
+                      dest = "incremental",
+                      default = False,
+                      help = "If it is specified then the build is incremental, i.e. "+
+                             "all the steps are checked and only the steps whose "+
+                             "commands, inputs or outputs have changed since the "+
+                             "previous build in the same output directory (for example "+
+                             "after adding a custom gene with 'add_custom_gene.py' or "+
+                             "after changing a filter list) are executed again. "+
+                             "It implies '--hash crc32' "+
+                             "(if '--hash' is not given) and '--start 1' (if '--start' "+
+                             "is not given) and the temporary files are kept. "+
+                             "Default is '%default'.")
+
     choices = ('cosmic','conjoing','chimerdb2','chimerdb4','ticdb','cgp','cacg')
     parser.add_option("--skip-database",
                       action = "store",
@@ -360,6 +397,13 @@ if __name__ == '__main__':
         os.makedirs(out_dir)
 
 
+    # incremental build (the unchanged steps are skipped using the checksums)
+    if options.incremental:
+        if options.hash == 'no':
+            options.hash = 'crc32'
+        if not options.start_step:
+            options.start_step = 1
+
     # deal with temporary files flag
     temp_flag = 'yes'
     if options.keep_temporary_files or (options.hash != '' and options.hash != 'no'):
@@ -418,6 +462,9 @@ if __name__ == '__main__':
             log_filename       = log_file,
             checksums_filename = options.checksums_filename,
             hash_library       = options.hash,
+            threads            = options.processes,
+            memory             = options.memory,
+            parallel           = options.parallel_steps,
             start_step         = options.start_step)
 
 
@@ -1824,10 +1871,18 @@ if __name__ == '__main__':
     job.add('',outdir('final-list_candidate-fusion-genes.caption.md.txt'),kind='output',command_line='no')
     job.run()
 
+    # the indexes are independent of each other and they are built at the
+    # same time (if '--parallel-steps' is used); the two large ones (i.e.
+    # transcriptome and genome) get half of the threads each such that they
+    # are built at the same time and the small ones use less threads
+    small_threads = max(1,options.processes/4) if options.parallel_steps else options.processes
+    large_threads = max(1,options.processes/2) if options.parallel_steps else options.processes
+
+    job.parallel_start()
 
     job.add(_BE_+'bowtie-build',kind='program')
     if bowtie121:
-        job.add('--threads',options.processes,kind='parameter')    
+        job.add('--threads',small_threads,kind='parameter',checksum='no')
     job.add('-f',kind='parameter')
 #    job.add('--ntoa',kind='parameter')
     job.add('--quiet',kind='parameter')
@@ -1835,11 +1890,11 @@ if __name__ == '__main__':
     job.add('--ftabchars','7',kind='parameter')
     job.add('',outdir('rtrna_hla_mt.fa'),kind='input')
     job.add('',outdir('rtrna_hla_mt_index/'),kind='output')
-    job.run(error_message = bowtie_error)
+    job.run(error_message = bowtie_error, threads = small_threads, memory = 1)
 
     job.add(_BE_+'bowtie-build',kind='program')
     if bowtie121:
-        job.add('--threads',options.processes,kind='parameter')
+        job.add('--threads',small_threads,kind='parameter',checksum='no')
     job.add('-f',kind='parameter')
 #    job.add('--ntoa',kind='parameter')
     job.add('--quiet',kind='parameter')
@@ -1847,13 +1902,13 @@ if __name__ == '__main__':
     job.add('--ftabchars','7',kind='parameter')
     job.add('',outdir('rtrna_mt.fa'),kind='input')
     job.add('',outdir('rtrna_mt_index/'),kind='output')
-    job.run(error_message = bowtie_error)
+    job.run(error_message = bowtie_error, threads = small_threads, memory = 1)
 
 
 
     job.add(_BE_+'bowtie-build',kind='program')
     if bowtie121:
-        job.add('--threads',options.processes,kind='parameter')
+        job.add('--threads',small_threads,kind='parameter',checksum='no')
     job.add('-f',kind='parameter')
 #    job.add('--ntoa',kind='parameter')
     job.add('--quiet',kind='parameter')
@@ -1861,7 +1916,7 @@ if __name__ == '__main__':
     job.add('--ftabchars','7',kind='parameter')
     job.add('',outdir('rtrna.fa'),kind='input')
     job.add('',outdir('rtrna_index/'),kind='output')
-    job.run(error_message = bowtie_error)
+    job.run(error_message = bowtie_error, threads = small_threads, memory = 1)
 
 
 
@@ -1888,7 +1943,7 @@ if __name__ == '__main__':
 
     job.add(_BE_+'bowtie-build',kind='program')
     if bowtie121:
-        job.add('--threads',options.processes,kind='parameter')
+        job.add('--threads',large_threads,kind='parameter',checksum='no')
     job.add('-f',kind='parameter')
     job.add('--quiet',kind='parameter')
 #    job.add('--ntoa',kind='parameter')
@@ -1896,7 +1951,7 @@ if __name__ == '__main__':
     job.add('--ftabchars','7',kind='parameter')
     job.add('',outdir('transcripts.fa'),kind='input')
     job.add('',outdir('transcripts_index/'),kind='output')
-    job.run(error_message = bowtie_error)
+    job.run(error_message = bowtie_error, threads = large_threads, memory = 8)
 
 #    job.add(_BE_+'bowtie-build',kind='program')
 #    if bowtie121:
@@ -1911,33 +1966,33 @@ if __name__ == '__main__':
 
     job.add(_B2_+'bowtie2-build',kind='program')
     job.add('-f',kind='parameter')
-    job.add('--threads',options.processes,kind='parameter')
+    job.add('--threads',large_threads,kind='parameter',checksum='no')
     job.add('--quiet',kind='parameter')
     job.add('--offrate','1',kind='parameter')
     job.add('--ftabchars','7',kind='parameter')
     job.add('',outdir('genome.fa'),kind='input')
     job.add('',outdir('genome_index2/index'),kind='output',command_line='no')
     job.add('',outdir('genome_index2/index'),kind='output',checksum='no')
-    job.run(error_message = bowtie2_error)
+    job.run(error_message = bowtie2_error, threads = large_threads, memory = 16)
 
 
     job.add(_BE_+'bowtie-build',kind='program')
     if bowtie121:
-        job.add('--threads',options.processes,kind='parameter')
+        job.add('--threads',small_threads,kind='parameter',checksum='no')
     job.add('-f',kind='parameter')
     job.add('--quiet',kind='parameter')
     job.add('--offrate','1',kind='parameter')
     job.add('--ftabchars','7',kind='parameter')
     job.add('',outdir('viruses-noblanks.fa'),kind='input')
     job.add('',outdir('viruses_index/'),kind='output')
-    job.run(error_message = bowtie_error)
+    job.run(error_message = bowtie_error, threads = small_threads, memory = 1)
 
     if not options.skip_blat:
         job.add(_FT_+'faToTwoBit',kind='program')
         job.add('',outdir('genome.fa'),kind='input')
         job.add('',outdir('genome.2bit'),kind='output')
         job.add('-noMask',kind='parameter')
-        job.run(error_message = ("Please, check if BLAT (from "+
+        job.run(memory = 4, error_message = ("Please, check if BLAT (from "+
             "<http://users.soe.ucsc.edu/~kent/src/> and "+
             "<http://hgdownload.cse.ucsc.edu/admin/exe/>) is installed correctly and it "+
             "is in the corresponding PATH (or if 'configuration.cfg' file is "+
@@ -1946,33 +2001,72 @@ if __name__ == '__main__':
             "Please, also read its commercial "+
             "license <http://www.kentinformatics.com/> if this applies in your case!"))
 
-    job.clean(outdir('genome.fa'))
-    job.clean(outdir('rtrna_mt.fa'))
-    job.clean(outdir('rtrna.fa'))
-    job.clean(outdir('trna.fa'))
-    job.clean(outdir('rrna.fa'))
-    job.clean(outdir('mtrna.fa'))
-    job.clean(outdir('rrna_unit.fa'))
-    job.clean(outdir('mt.fa'))
-    job.clean(outdir('hla.fa'))
-    job.clean(outdir('hla-noblanks.fa'))
-    job.clean(outdir('hla_2.fa'))
-#    job.clean(outdir('hla_12.fa'))
-    job.clean(outdir('hla_1.txt'))
-    job.clean(outdir('hla_2.txt'))
-    job.clean(outdir('hla_12.txt'))
-    job.clean(outdir('phix174.fa'))
-    job.clean(outdir('viruses.fa'))
-    job.clean(outdir('viruses-noblanks.fa'))
-    job.clean(outdir('ucsc-temp_fully_overlapping_genes.txt'))
-    job.clean(outdir('ucsc-temp_partially_overlapping_genes.txt'))
-    job.clean(outdir('ucsc-temp_same_strand_overlapping_genes.txt'))
-    job.clean(outdir('refseq-temp_fully_overlapping_genes.txt'))
-    job.clean(outdir('refseq-temp_partially_overlapping_genes.txt'))
-    job.clean(outdir('refseq-temp_same_strand_overlapping_genes.txt'))
-    job.clean(outdir('gencode-temp_fully_overlapping_genes.txt'))
-    job.clean(outdir('gencode-temp_partially_overlapping_genes.txt'))
-    job.clean(outdir('gencode-temp_same_strand_overlapping_genes.txt'))
+    # precompiled index of the databases used for labeling the candidate fusion genes
+    label_pairs = [outdir(el) for el in (
+        '1000genomes.txt', '18cancers.txt', 'adjacent_genes.txt', 'banned.txt',
+        'bodymap2.txt', 'cacg.txt', 'celllines.txt', 'cgp.txt', 'chimerdb2.txt',
+        'chimerdb4kb.txt', 'chimerdb4pub.txt', 'chimerdb4seq.txt', 'conjoing.txt',
+        'cortex.txt', 'cosmic.txt', 'dgd.txt', 'gliomas.txt', 'gtex.txt',
+        'healthy.txt', 'hpa.txt', 'known.txt', 'mitelman.txt', 'non-cancer_tissues.txt',
+        'non-tumor_cells.txt', 'oesophagus.txt', 'oncokb.txt', 'pairs_pseudogenes.txt',
+        'pancreases.txt', 'paralogs.txt', 'prostate_cancer.txt', 'rtcircrnas.txt',
+        'tcga.txt', 'tcga2.txt', 'tcga-cancer.txt', 'tcga-normal.txt', 'ticdb.txt',
+        'ensembl_fully_overlapping_genes.txt', 'ensembl_partially_overlapping_genes.txt',
+        'ensembl_same_strand_overlapping_genes.txt',
+        'gencode_fully_overlapping_genes.txt', 'gencode_partially_overlapping_genes.txt',
+        'gencode_same_strand_overlapping_genes.txt',
+        'refseq_fully_overlapping_genes.txt', 'refseq_partially_overlapping_genes.txt',
+        'refseq_same_strand_overlapping_genes.txt',
+        'ucsc_fully_overlapping_genes.txt', 'ucsc_partially_overlapping_genes.txt',
+        'ucsc_same_strand_overlapping_genes.txt')
+        if os.path.isfile(outdir(el))]
+    label_genes = [outdir(el) for el in (
+        '7skrnas.txt', 'cancer_genes.txt', 'hla.txt', 'lncrnas.txt', 'metastasis.txt',
+        'metazoa.txt', 'mirnas.txt', 'mt.txt', 'oncogenes_more.txt', 'pseudogenes.txt',
+        'ribosomal_proteins.txt', 'rnas_y.txt', 'rrnas.txt', 'snornas.txt', 'snrnas.txt',
+        'trnas.txt', 'tumor_genes.txt')
+        if os.path.isfile(outdir(el))]
+    if label_pairs or label_genes:
+        job.add(_FC_+'label_index.py',kind='program')
+        if label_pairs:
+            job.add('--pairs',','.join(label_pairs),kind='parameter')
+        if label_genes:
+            job.add('--genes',','.join(label_genes),kind='parameter')
+        for el in label_pairs + label_genes:
+            job.add('',el,kind='input',command_line='no')
+        job.add('--exons',outdir('exons.txt'),kind='input')
+        job.add('--output',outdir('labels.idx'),kind='output')
+        job.run(memory = 1)
+
+    job.parallel_end()
+
+    job.clean(outdir('genome.fa'),temp_path=temp_flag)
+    job.clean(outdir('rtrna_mt.fa'),temp_path=temp_flag)
+    job.clean(outdir('rtrna.fa'),temp_path=temp_flag)
+    job.clean(outdir('trna.fa'),temp_path=temp_flag)
+    job.clean(outdir('rrna.fa'),temp_path=temp_flag)
+    job.clean(outdir('mtrna.fa'),temp_path=temp_flag)
+    job.clean(outdir('rrna_unit.fa'),temp_path=temp_flag)
+    job.clean(outdir('mt.fa'),temp_path=temp_flag)
+    job.clean(outdir('hla.fa'),temp_path=temp_flag)
+    job.clean(outdir('hla-noblanks.fa'),temp_path=temp_flag)
+    job.clean(outdir('hla_2.fa'),temp_path=temp_flag)
+#    job.clean(outdir('hla_12.fa'),temp_path=temp_flag)
+    job.clean(outdir('hla_1.txt'),temp_path=temp_flag)
+    job.clean(outdir('hla_2.txt'),temp_path=temp_flag)
+    job.clean(outdir('hla_12.txt'),temp_path=temp_flag)
+    job.clean(outdir('phix174.fa'),temp_path=temp_flag)
+    job.clean(outdir('viruses.fa'),temp_path=temp_flag)
+    job.clean(outdir('viruses-noblanks.fa'),temp_path=temp_flag)
+    job.clean(outdir('ucsc-temp_fully_overlapping_genes.txt'),temp_path=temp_flag)
+    job.clean(outdir('ucsc-temp_partially_overlapping_genes.txt'),temp_path=temp_flag)
+    job.clean(outdir('ucsc-temp_same_strand_overlapping_genes.txt'),temp_path=temp_flag)
+    job.clean(outdir('refseq-temp_fully_overlapping_genes.txt'),temp_path=temp_flag)
+    job.clean(outdir('refseq-temp_partially_overlapping_genes.txt'),temp_path=temp_flag)
+    job.clean(outdir('refseq-temp_same_strand_overlapping_genes.txt'),temp_path=temp_flag)
+    job.clean(outdir('gencode-temp_fully_overlapping_genes.txt'),temp_path=temp_flag)
+    job.clean(outdir('gencode-temp_partially_overlapping_genes.txt'),temp_path=temp_flag)
+    job.clean(outdir('gencode-temp_same_strand_overlapping_genes.txt'),temp_path=temp_flag)
 
     job.close()
 
@@ -56,6 +56,7 @@ import socket
 import locale
 import math
 import configuration
+import capabilities
 
 
 
@@ -203,6 +204,29 @@ def info(ajob, fromfile, tofile , top = "\n\n\n", bottom = "\n\n\n" , temp_path
     if fromfile:
         ajob.clean(fromfile,temp_path = temp_path)
 
+#
+#
+#
+def label_fusions(ajob, fin, fout, manifest, labels, temp_path = 'no'):
+    """
+    It labels the candidate fusion genes from FIN in one pass (i.e. using only
+    one run of 'label_fusion_genes.py') with all the LABELS, which is a list of
+    (label, kind, database[, threshold[, temp_path]]), where kind is 'pairs',
+    'genes', or 'distance'. The labels are written in the file MANIFEST.
+    """
+    labels = [list(el) + [0, 'no'][len(el) - 3:] for el in labels]
+    ajob.sink(['\t'.join([label, kind, database, str(threshold)]) for (label, kind, database, threshold, tp) in labels],
+              manifest)
+    ajob.add(_FC_+'label_fusion_genes.py',kind='program')
+    ajob.add('--input',fin,kind='input',temp_path=temp_path)
+    ajob.add('--manifest',manifest,kind='input',temp_path=temp_path)
+    if os.path.isfile(datadir('labels.idx')):
+        ajob.add('--index',datadir('labels.idx'),kind='input')
+    for (label, kind, database, threshold, tp) in labels:
+        ajob.add('',database,kind='input',command_line='no',temp_path=tp)
+    ajob.add('--output_fusion_genes',fout,kind='output')
+    ajob.run()
+
 #
 # command line parsing
 #
@@ -354,6 +378,53 @@ if __name__ == "__main__":
                              "might be usefull in situations where one server is shared between several users and in order to limit FusionCatcher using all the CPUs/resources. "+
                              "Default is '%default'. ")
 
+    parser.add_option("--parallel-steps",
+                      action = "store_true",
+                      dest = "parallel_steps",
+                      default = False,
+                      help = "If it is specified then the independent steps of the "+
+                             "workflow/pipeline which are marked as such (i.e. "+
+                             "parallel regions) are executed at the same time "+
+                             "using at most the number of threads given by '--threads'. "+
+                             "Default is '%default'.")
+
+    parser.add_option("--resident-indexes",
+                      action = "store_true",
+                      dest = "resident_indexes",
+                      default = False,
+                      help = "If it is specified then the Bowtie indexes of the genome "+
+                             "and transcriptome are loaded once in memory and they are kept there "+
+                             "(shared by all the Bowtie steps and also by the other runs "+
+                             "of FusionCatcher on the same computer which use the same "+
+                             "indexes) until the last run which uses them finishes. "+
+                             "Bowtie is run using memory-mapped indexes (i.e. '--mm'). "+
+                             "Default is '%default'.")
+
+    parser.add_option("--aligners-slots",
+                      action = "store",
+                      type = "int",
+                      dest = "aligners_slots",
+                      default = 0,
+                      help = optparse.SUPPRESS_HELP
+#                             "Maximum number of steps running an aligner (i.e. STAR, "+
+#                             "Bowtie, Bowtie2, BWA, BLAT) at the same time over all the "+
+#                             "FusionCatcher runs which share the directory given by "+
+#                             "'--aligners-slots-dir' (used by 'fusioncatcher-batch.py'). "+
+#                             "If it is 0 then there is no limit. "+
+#                             "Default is '%default'."
+                             )
+
+    parser.add_option("--aligners-slots-dir",
+                      action = "store",
+                      type = "string",
+                      dest = "aligners_slots_dir",
+                      default = None,
+                      help = optparse.SUPPRESS_HELP
+#                             "Directory shared by several FusionCatcher runs where the "+
+#                             "locks used by '--aligners-slots' are kept. "+
+#                             "Default is '%default'."
+                             )
+
     parser.add_option("--config",
                       action = "store",
                       type = "string",
@@ -1427,6 +1498,15 @@ if __name__ == "__main__":
                              "Default is '%default' if less than 32GB RAM is "+
                              "installed on computer else is set to 26GB.")
 
+    parser.add_option("--internal-sort",
+                      action = "store_true",
+                      dest = "internal_sort",
+                      default = False,
+                      help = "If it is specified then the FASTQ files are sorted "+
+                             "directly (as records of four lines) using 'sort_records.py' "+
+                             "instead of using pipelines of 'paste', 'sort' and 'tr'. "+
+                             "Default is '%default'.")
+
     parser.add_option("--start",
                       action = "store",
                       type = "int",
@@ -2104,7 +2184,14 @@ if __name__ == "__main__":
             log_filename       = log_file,
             checksums_filename = options.checksums_filename,
             hash_library       = options.hash,
-            start_step         = options.start_step)
+            threads            = options.processes,
+            start_step         = options.start_step,
+            parallel           = options.parallel_steps,
+            stats_filename     = expand(outdir('fusioncatcher-steps.txt')),
+            profile_filename   = expand(outdir('fusioncatcher-profile.txt')),
+            slots_path         = expand(options.aligners_slots_dir) if options.aligners_slots_dir else None,
+            slots              = options.aligners_slots,
+            slots_programs     = ('STAR','bowtie','bowtie2','bwa','blat','blat_parallel.py'))
 
     ##############################################################################
     # SAVE EXTRA INFORMATION
@@ -2132,16 +2219,20 @@ if __name__ == "__main__":
         if not os.path.isdir(tmp_dir) and not islink(tmp_dir):
             os.makedirs(tmp_dir)
 
+    # the outputs of the commands which probe the tools are cached and reused
+    # by the next runs (as long as the tools are not changed)
+    probes = capabilities.cache(capabilities.default_filename([os.path.dirname(os.path.abspath(configfile)) if configfile else '',data_dir]))
+    def lines_with(text, word):
+        return len([line for line in text.splitlines() if line.lower().find(word) != -1])
+
     # check options supported by SORT command
+    (r,sort_help) = probes.run("sort --help",['sort'])
     sort_parallel = False
-    r = os.system("sort --help | grep 'parallel' > "+outdir('sort_help.txt'))
-    if (not r) and (not empty(outdir('sort_help.txt'))) and len(file(outdir('sort_help.txt'),'r').readlines()) == 1:
+    if (not r) and lines_with(sort_help,'parallel') == 1:
         sort_parallel = True
-    delete_file(outdir('sort_help.txt'))
     # check options supported by SORT command
     sort_buffer = None
-    r = os.system("sort --help | grep 'buffer-size' > "+outdir('sort_help.txt'))
-    if (not r) and (not empty(outdir('sort_help.txt'))) and len(file(outdir('sort_help.txt'),'r').readlines()) == 1:
+    if (not r) and lines_with(sort_help,'buffer-size') == 1:
         if not is_optparse_provided(parser,'sort_buffer_size'):
             # here is the automatic setting
             mem = memory(unit="gb")
@@ -2152,23 +2243,16 @@ if __name__ == "__main__":
                 sort_buffer = options.sort_buffer_size #"80%"
         else:
             sort_buffer = options.sort_buffer_size #"80%"
-    delete_file(outdir('sort_help.txt'))
     # check options suppported by SORT command
     sort_lzop_compress = False
-    r = os.system("sort --help | grep 'compress-program' > "+outdir('sort_help.txt')+ " ; lzop --help 2>/dev/null | grep -i 'compress' > " +outdir('lzop_help.txt'))
-    if (not r) and ((not empty(outdir('sort_help.txt'))) and len(file(outdir('sort_help.txt'),'r').readlines()) == 1 and
-        (not empty(outdir('lzop_help.txt'))) and len(file(outdir('lzop_help.txt'),'r').readlines()) >= 1):
+    lzop_help = probes.run("lzop --help 2>/dev/null",['lzop'])[1]
+    if (not r) and lines_with(sort_help,'compress-program') == 1 and lines_with(lzop_help,'compress') >= 1:
         sort_lzop_compress = True
-    delete_file(outdir('sort_help.txt'))
-    delete_file(outdir('lzop_help.txt'))
     # check options suppported by SORT command
     sort_gzip_compress = False
-    r = os.system("sort --help | grep 'compress-program' > "+outdir('sort_help.txt')+ " ; gzip --help 2>/dev/null | grep -i 'compress' > " +outdir('gzip_help.txt'))
-    if (not r) and ((not empty(outdir('sort_help.txt'))) and len(file(outdir('sort_help.txt'),'r').readlines()) == 1 and
-        (not empty(outdir('gzip_help.txt'))) and len(file(outdir('gzip_help.txt'),'r').readlines()) >= 1):
+    gzip_help = probes.run("gzip --help 2>/dev/null",['gzip'])[1]
+    if (not r) and lines_with(sort_help,'compress-program') == 1 and lines_with(gzip_help,'compress') >= 1:
         sort_gzip_compress = True
-    delete_file(outdir('sort_help.txt'))
-    delete_file(outdir('gzip_help.txt'))
 
 
     # disable any compression done by SORT ===> FASTER
@@ -2177,13 +2261,13 @@ if __name__ == "__main__":
 
     # check if PIGZ is installed
     pigz = False
-    r = os.system(_PZ_+"pigz --version 2>/dev/null")
+    r = probes.run(_PZ_+"pigz --version 2>/dev/null",[_PZ_+'pigz'])[0]
     if (not r):
         pigz = True
 
     # check if PXZ is installed
     pxz = False
-    r = os.system("pxz --version 2>/dev/null")
+    r = probes.run("pxz --version 2>/dev/null",['pxz'])[0]
     if (not r):
         pxz = True
 
@@ -2275,8 +2359,10 @@ if __name__ == "__main__":
     job.run()
 
 
-    os.system(_BE_+"bowtie --version | head -1 > '%s'" % (outdir('bowtie_version.txt'),))
-    last_line = file(outdir('bowtie_version.txt'),'r').readline().lower().rstrip("\r\n")
+    # the wrapper 'bowtie' runs the binaries 'bowtie-align-s/l' from its directory
+    bowtie_dir = os.path.dirname(capabilities.which(_BE_+'bowtie') or _BE_+'bowtie')
+    bowtie_tools = [_BE_+'bowtie']+[os.path.join(bowtie_dir,el) for el in ('bowtie-align-s','bowtie-align-l')]
+    last_line = (probes.run(_BE_+"bowtie --version | head -1",bowtie_tools)[1].splitlines() or [''])[0].lower().rstrip("\r\n")
     #correct_versions = set(['bowtie-align version 1.2.1','bowtie-align version 1.2.1.1','bowtie-align version 1.2','bowtie version 1.1.2'])
     correct_versions = set(['version 1.2','version 1.1.2','version 1.2.2','version 1.2.3'])
     bowtie121 = False
@@ -2299,7 +2385,15 @@ if __name__ == "__main__":
         print >>sys.stderr,("\nERROR: or")
         print >>sys.stderr,("\nERROR:    sudo yum install libtbb-devel libtbb2 libc6-devel")
         sys.exit(1)
-    os.remove(outdir('bowtie_version.txt'))
+
+    # keep the Bowtie indexes in memory while they are used
+    resident_indexes = []
+    if options.resident_indexes:
+        import index_keeper
+        resident_indexes = [datadir('genome_index2/') if bowtie123 else datadir('genome_index/'),
+                            datadir('transcripts_index/')]
+        resident_indexes = [el for el in resident_indexes if index_keeper.files(el)]
+        index_keeper.acquire(resident_indexes)
 
     job.add('printf',kind='program')
     job.add('"\nBOWTIE:\n------\n"',kind='parameter')
@@ -2326,8 +2420,7 @@ if __name__ == "__main__":
         "is in the corresponding PATH!"))
 
     # check version
-    os.system(_BP_+"bbmap.sh --version 2>&1 |head -2 |tail -1 > '%s'" % (outdir('bbmap_version.txt'),))
-    last_line = file(outdir('bbmap_version.txt'),'r').readline().lower().rstrip("\r\n")
+    last_line = (probes.run(_BP_+"bbmap.sh --version 2>&1 |head -2 |tail -1",[_BP_+'bbmap.sh',_JA_+'java'])[1].splitlines() or [''])[0].lower().rstrip("\r\n")
     correct_version = ('bbmap version 38.44',)
     if last_line not in correct_version:
         job.close()
@@ -2335,7 +2428,6 @@ if __name__ == "__main__":
         bbmap_path = file(outdir('bbmap_path.txt'),'r').readline().rstrip("\r\n")
         print >>sys.stderr,"\n\n\nERROR: Wrong version of BBMAP found ("+bbmap_path+")! Found '"+last_line+"'. It should be '"+', or'.join(correct_version)+"'. One may specify the path to the correct version in 'fusioncatcher/etc/configuration.cfg'.\n"
         sys.exit(1)
-    os.remove(outdir('bbmap_version.txt'))
 
 
     job.add('printf',kind='program')
@@ -2439,8 +2531,7 @@ if __name__ == "__main__":
     job.add('>>',info_file,kind='output')
     job.run()
     # check version
-    os.system(_SK_+"seqtk 2>&1 |head -3 |tail -1 > '%s'" % (outdir('seqtk_version.txt'),))
-    last_line = file(outdir('seqtk_version.txt'),'r').readline().lower().rstrip("\r\n")
+    last_line = (probes.run(_SK_+"seqtk 2>&1 |head -3 |tail -1",[_SK_+'seqtk'])[1].splitlines() or [''])[0].lower().rstrip("\r\n")
 #    correct_version = ('version: 1.0-r68e-dirty','version: 1.0-r82b-dirty')
     #correct_version = ('version: 1.0-r82b-dirty','version: 1.2-r101b-dirty','version: 1.2-r101c-dirty')
     correct_version = ('version: 1.2-r101c-dirty',)
@@ -2450,7 +2541,6 @@ if __name__ == "__main__":
         seqtk_path = file(outdir('seqtk_path.txt'),'r').readline().rstrip("\r\n")
         print >>sys.stderr,"\n\n\nERROR: Wrong version of SeqTK found ("+seqtk_path+")! Found '"+last_line+"'. It should be '"+', or'.join(correct_version)+"'. One may specify the path to the correct version in 'fusioncatcher/etc/configuration.cfg'.\n"
         sys.exit(1)
-    os.remove(outdir('seqtk_version.txt'))
 
 
 
@@ -2543,8 +2633,7 @@ if __name__ == "__main__":
             "set up correctly)!\n If there is no wish to use STAR aligner then please "+
             "(re)run FusionCatcher using command line option '--skip-star'."))
 
-        os.system(_SR_+"STAR --version > '%s'" % (outdir('star_version.txt'),))
-        last_line = file(outdir('star_version.txt'),'r').readline().lower().rstrip("\r\n")
+        last_line = (probes.run(_SR_+"STAR --version",[_SR_+'STAR'])[1].splitlines() or [''])[0].lower().rstrip("\r\n")
         correct_version = '2.7.2b'
         #correct_version = '2.7.0f'
         #correct_version = 'star_2.5.4b'
@@ -2563,7 +2652,9 @@ if __name__ == "__main__":
             star_path = file(outdir('star_path.txt'),'r').readline().rstrip("\r\n")
             print >>sys.stderr,"\n\n\nERROR: Wrong version of STAR found ("+star_path+")! It should be '"+correct_version+"'. One may specify the path to the correct version in 'fusioncatcher/etc/configuration.cfg'.\n"
             sys.exit(1)
-        os.remove(outdir('star_version.txt'))
+
+    # all the probed tools are fine => their outputs are saved for the next runs
+    probes.save()
 
 
 
@@ -3471,52 +3562,30 @@ if __name__ == "__main__":
         job.link(outdir('orig__.fq'), outdir('orig__x.fq'), temp_path=temp_flag)
 
     if not options.skip_filter_low_entropy:
-        #bbduk.sh in=r.fq out=o.fq entropy=0.1 entropymask=t entropyk=2 entropywindow=40
-        job.add(_BP_+'bbduk.sh',kind='program')
-        job.add('entropy=','0.1',kind='parameter',space='no')
-        job.add('entropymask=','t',kind='parameter',space='no')
-        job.add('entropyk=','2',kind='parameter',space='no')
-        job.add('entropywindow=','40',kind='parameter',space='no')
-        job.add('in=',outdir('orig__x.fq'),kind='input',space='no', temp_path=temp_flag)
-        job.add('out=',outdir('orig.fq'),kind='output',space='no')
+        # mask with Ns the low entropy regions (instead of: bbduk.sh in=r.fq out=o.fq entropy=0.1 entropymask=t entropyk=2 entropywindow=40; see 'entropy_mask' in remove_str.py for how the short reads, the Ns, and the normalization are handled)
+        job.add(_FC_+'remove_str.py',kind='program')
+        job.add('--processes',options.processes,kind='parameter',checksum='no')
+        job.add('--mask-entropy','0.1',kind='parameter')
+        job.add('--kmer','2',kind='parameter')
+        job.add('--length','40',kind='parameter')
+        job.add('--quiet',kind='parameter')
+        job.add('--input',outdir('orig__x.fq'),kind='input', temp_path=temp_flag)
+        job.add('--output',outdir('orig.fq'),kind='output')
         job.run()
     else:
         job.link(outdir('orig__x.fq'), outdir('orig.fq'), temp_path=temp_flag)
 
     if not options.skip_deduplication:
-        job.add('LC_ALL=C',kind='program')
-        job.add('cat',kind='parameter')
-        job.add('',outdir('orig.fq'),kind='input',temp_path=temp_flag)
-        job.add('|',kind='parameter')
-        job.add('LC_ALL=C',kind='parameter')
-        job.add('paste','- - - - - - - -',kind='parameter')
-        job.add('|',kind='parameter')
-        job.add(_FC_+'pair8removal.py',kind='parameter')
+        # the hash table of the pairs gets at most a quarter of the RAM
+        mem = memory(unit="mb")
+        mt = int(mem['total'] / 4) if mem['total'] else 0
+        job.add(_FC_+'dedup_pairs.py',kind='program')
         job.add('-l','30',kind='parameter')
-        job.add('-i','-',kind='parameter')
-        job.add('-o','-',kind='parameter')
-        job.add('|',kind='parameter')
-        job.add('LC_ALL=C',kind='parameter')
-        job.add('sort',kind='parameter')
-        job.add('-k','2,2',kind='parameter')
-        job.add('-k','6,6',kind='parameter')
-        job.add('-u',kind='parameter') # unique
-        job.add('-t',"'\t'",kind='parameter')
-        if sort_buffer:
-            job.add('--buffer-size',sort_buffer,kind='parameter',checksum='no')
-        if sort_parallel:
-            job.add('--parallel',options.processes,kind='parameter',checksum='no')
-        if sort_lzop_compress:
-            job.add('--compress-program','lzop',kind='parameter',checksum='no')
-        elif sort_gzip_compress:
-            job.add('--compress-program','gzip',kind='parameter',checksum='no')
+        if mt > 256:
+            job.add('--memory',mt,kind='parameter',checksum='no')
         job.add('-T',tmp_dir,kind='parameter',checksum='no')
-        job.add('|',kind='parameter')
-        job.add('LC_ALL=C',kind='parameter')
-        job.add('tr',kind='parameter')
-        job.add('"\\t"',kind='parameter')
-        job.add('"\\n"',kind='parameter')
-        job.add('>',outdir('origi.fq'),kind='output')
+        job.add('-i',outdir('orig.fq'),kind='input',temp_path=temp_flag)
+        job.add('-o',outdir('origi.fq'),kind='output')
         job.run()
     else:
         job.link(outdir('orig.fq'), outdir('origi.fq'), temp_path=temp_flag)
@@ -3563,6 +3632,8 @@ if __name__ == "__main__":
             job.add('--un',outdir('ox_1.fq'),kind='output',command_line='no') # unmapped reads
             job.add('--un',outdir('ox_2.fq'),kind='output',command_line='no') # unmapped reads
             job.add('--max',outdir('oxx_multiple.fq'),kind='output',temp_path=temp_flag) # if this is missing then these reads are going to '--un'
+            if options.resident_indexes:
+                job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
             if os.path.isfile(datadir('transcripts_index','.1.ebwtl')):
                 job.add('--large-index',kind='parameter')
             job.add('',datadir('transcripts_index/'),kind='input')
@@ -3591,6 +3662,8 @@ if __name__ == "__main__":
             job.add('--un',outdir('ox_1.fq'),kind='output',command_line='no') # unmapped reads
             job.add('--un',outdir('ox_2.fq'),kind='output',command_line='no') # unmapped reads
             job.add('--max',outdir('ox_multiple.fq'),kind='output',temp_path=temp_flag) # if this is missing then these reads are going to '--un'
+            if options.resident_indexes:
+                job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
             if os.path.isfile(datadir('transcripts_index','.1.ebwtl')):
                 job.add('--large-index',kind='parameter')
             job.add('',datadir('transcripts_index/'),kind='input')
@@ -3621,12 +3694,26 @@ if __name__ == "__main__":
     else:
         job.link(outdir('origi.fq'), outdir('origin.fq'), temp_path=temp_flag)
 
-    # compute the read lengths for the input file
-    job.add(_FC_+'lengths_reads.py',kind='program')
-    job.add('--input',outdir('origin.fq'),kind='input')
-    job.add('--output',outdir('log_lengths_original_reads.txt'),kind='output')
-    job.add('--counts',outdir('log_counts_original_reads.txt'),kind='output')
-    job.run()
+    if shuffled and (not options.skip_compress_ids):
+        # lossy compression of the reads ids (the read lengths and counts are
+        # computed in the same pass and the width of the ids is estimated)
+        job.add(_FC_+'compress-reads-ids.py',kind='program')
+        job.add('--input',outdir('origin.fq'),kind='input',temp_path=temp_flag)
+        job.add('--output',outdir('original.fq'),kind='output')
+        job.add('--lengths',outdir('log_lengths_original_reads.txt'),kind='output')
+        job.add('--counts',outdir('log_counts_original_reads.txt'),kind='output')
+        job.add('--lowercase',kind='parameter')
+        job.run()
+    else:
+        # compute the read lengths for the input file
+        job.add(_FC_+'lengths_reads.py',kind='program')
+        job.add('--input',outdir('origin.fq'),kind='input')
+        job.add('--output',outdir('log_lengths_original_reads.txt'),kind='output')
+        job.add('--counts',outdir('log_counts_original_reads.txt'),kind='output')
+        job.run()
+
+        job.link(outdir('origin.fq'), outdir('original.fq'), temp_path=temp_flag)
+
     #cat snu16/reads_acgt.fq | awk '{if(NR%4==2) print length($1)}' | sort -n | uniq
 
     max_len_reads = 0
@@ -3657,18 +3744,6 @@ if __name__ == "__main__":
 #    job.run()
          
          
-    if shuffled and (not options.skip_compress_ids):
-        # lossy compression of the reads ids
-        job.add(_FC_+'compress-reads-ids.py',kind='program')
-        job.add('--input',outdir('origin.fq'),kind='input',temp_path=temp_flag)
-        job.add('--output',outdir('original.fq'),kind='output')
-        job.add('--count-reads',outdir('log_counts_original_reads.txt'),kind='input')
-        job.add('--lowercase',kind='parameter')
-        job.run()
-    else:
-        job.link(outdir('origin.fq'), outdir('original.fq'), temp_path=temp_flag)
-
-
     info(job,
          fromfile = outdir('log_counts_original_reads.txt'),
          tofile = info_file,
@@ -4280,6 +4355,8 @@ if __name__ == "__main__":
 #    job.add('--suppress','1,2,3,4,5,6,7,8',kind='parameter')
     job.add('--un',outdir('reads-filtered_temp.fq'),kind='output') # here is the result
     job.add('--max',outdir('reads-filtered_temp_multiple.fq'),kind='output',temp_path=temp_flag) # if this is missing then these reads are going to '--un'
+    if options.resident_indexes:
+        job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
     if options.skip_mitochondrion_filtering:
         if os.path.isfile(datadir('rtrna_index','.1.ebwtl')):
             job.add('--large-index',kind='parameter')
@@ -4327,31 +4404,42 @@ if __name__ == "__main__":
     # remove the reads which do not form a pair
     if (not options.all_reads_junction) and (not options.skip_interleave_processing):
         # assumption all reads are not interleaved
-        job.add('LC_ALL=C',kind='program')
-        job.add('cat',kind='parameter')
-        job.add('',outdir('reads-filtered_temp.fq'),kind='input',temp_path=temp_flag)
-        job.add('|',kind='parameter')
-        job.add('LC_ALL=C',kind='parameter')
-        job.add('paste','- - - -',kind='parameter')
-        job.add('|',kind='parameter')
-        job.add('LC_ALL=C',kind='parameter')
-        job.add('sort',kind='parameter')
-        job.add('-k','1,1',kind='parameter')
-        job.add('-t',"'\t'",kind='parameter')
-        if sort_buffer:
-            job.add('--buffer-size',sort_buffer,kind='parameter',checksum='no')
-        if sort_parallel:
+        if options.internal_sort:
+            job.add(_FC_+'sort_records.py',kind='program')
+            job.add('--input',outdir('reads-filtered_temp.fq'),kind='input',temp_path=temp_flag)
+            job.add('--fastq',kind='parameter')
+            job.add('-k','1,1',kind='parameter')
+            if sort_buffer:
+                job.add('--buffer-size',sort_buffer,kind='parameter',checksum='no')
             job.add('--parallel',options.processes,kind='parameter',checksum='no')
-        if sort_lzop_compress:
-            job.add('--compress-program','lzop',kind='parameter',checksum='no')
-        elif sort_gzip_compress:
-            job.add('--compress-program','gzip',kind='parameter',checksum='no')
-        job.add('-T',tmp_dir,kind='parameter',checksum='no')
-        job.add('|',kind='parameter')
-        job.add('LC_ALL=C',kind='parameter')
-        job.add('tr',kind='parameter')
-        job.add('"\\t"',kind='parameter')
-        job.add('"\\n"',kind='parameter')
+            job.add('-T',tmp_dir,kind='parameter',checksum='no')
+            job.add('--output','-',kind='parameter')
+        else:
+            job.add('LC_ALL=C',kind='program')
+            job.add('cat',kind='parameter')
+            job.add('',outdir('reads-filtered_temp.fq'),kind='input',temp_path=temp_flag)
+            job.add('|',kind='parameter')
+            job.add('LC_ALL=C',kind='parameter')
+            job.add('paste','- - - -',kind='parameter')
+            job.add('|',kind='parameter')
+            job.add('LC_ALL=C',kind='parameter')
+            job.add('sort',kind='parameter')
+            job.add('-k','1,1',kind='parameter')
+            job.add('-t',"'\t'",kind='parameter')
+            if sort_buffer:
+                job.add('--buffer-size',sort_buffer,kind='parameter',checksum='no')
+            if sort_parallel:
+                job.add('--parallel',options.processes,kind='parameter',checksum='no')
+            if sort_lzop_compress:
+                job.add('--compress-program','lzop',kind='parameter',checksum='no')
+            elif sort_gzip_compress:
+                job.add('--compress-program','gzip',kind='parameter',checksum='no')
+            job.add('-T',tmp_dir,kind='parameter',checksum='no')
+            job.add('|',kind='parameter')
+            job.add('LC_ALL=C',kind='parameter')
+            job.add('tr',kind='parameter')
+            job.add('"\\t"',kind='parameter')
+            job.add('"\\n"',kind='parameter')
         job.add('|',kind='parameter')
         job.add(_SK_+'seqtk',kind='parameter')
         job.add('dropse',kind='parameter')
@@ -4501,6 +4589,8 @@ if __name__ == "__main__":
         job.add('--chunkmbs',options.chunkmbs,kind='parameter',checksum='no')
         job.add('--un',outdir('reads_filtered_not-mapped-genome.fq'),kind='output')
         job.add('--max',outdir('reads-filtered_multiple-mappings-genome.fq'),kind='output') # if this is missing then these reads are going to '--un'
+        if options.resident_indexes:
+            job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
         if bowtie123:
             job.add('',datadir('genome_index2/index'),kind='input')
         else:
@@ -4570,6 +4660,7 @@ if __name__ == "__main__":
         if not options.split_seqtk_subseq:
             #extract the short reads which mapped on genome
             job.add(_FC_+'extract_short_reads.py',kind='program')
+            job.add('--sorted',kind='parameter')
             job.add('--input',outdir('reads-filtered.fq'),kind='input')
             job.add('--list',outdir('list-names-reads-filtered_genome.txt'),kind='input')
             job.add('--output',outdir('reads_filtered_unique-mapped-genome.fq'),kind='output')
@@ -4645,6 +4736,8 @@ if __name__ == "__main__":
             job.add('--strata',kind='parameter')
             job.add('--un',outdir('reads_filtered_not-mapped-genome_not-mapped-transcriptome.fq'),kind='output') # <== reads which do not map on transcriptome and genome! #######
             job.add('--max',outdir('reads_filtered_genome-transcriptome_multiple.fq'),kind='output',temp_path=temp_flag) # if this is missing then these reads are going to '--un' 
+            if options.resident_indexes:
+                job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
             if os.path.isfile(datadir('transcripts_index','.1.ebwtl')):
                 job.add('--large-index',kind='parameter')
             job.add('',datadir('transcripts_index/'),kind='input')
@@ -4694,6 +4787,8 @@ if __name__ == "__main__":
                     job.add('--strata',kind='parameter')
                     job.add('--un',fqo,kind='output',temp_path=temp_flag) # <== reads which do not map on transcriptome and genome! #######
                     job.add('--max',outdir('reads_filtered_genome-transcriptome_multiple_trim2_3end.fq'),kind='output',temp_path=temp_flag) # if this is missing then these reads are going to '--un'
+                    if options.resident_indexes:
+                        job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
                     if os.path.isfile(datadir('transcripts_index','.1.ebwtl')):
                         job.add('--large-index',kind='parameter')
                     job.add('',datadir('transcripts_index/'),kind='input')
@@ -4752,6 +4847,8 @@ if __name__ == "__main__":
                     job.add('--strata',kind='parameter')
                     job.add('--un',fqo,kind='output',temp_path=temp_flag) # <== reads which do not map on transcriptome and genome! #######
                     job.add('--max',outdir('reads_filtered_genome-transcriptome_multiple_trim2_5end.fq'),kind='output',temp_path=temp_flag) # if this is missing then these reads are going to '--un'
+                    if options.resident_indexes:
+                        job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
                     if os.path.isfile(datadir('transcripts_index','.1.ebwtl')):
                         job.add('--large-index',kind='parameter')
                     job.add('',datadir('transcripts_index/'),kind='input')
@@ -4810,6 +4907,8 @@ if __name__ == "__main__":
                     job.add('--strata',kind='parameter')
                     job.add('--un',fqo,kind='output',temp_path=temp_flag) # <== reads which do not map on transcriptome and genome! #######
                     job.add('--max',outdir('reads_filtered_genome-transcriptome_multiple_trim2_3end-half.fq'),kind='output',temp_path=temp_flag) # if this is missing then these reads are going to '--un'
+                    if options.resident_indexes:
+                        job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
                     if os.path.isfile(datadir('transcripts_index','.1.ebwtl')):
                         job.add('--large-index',kind='parameter')
                     job.add('',datadir('transcripts_index/'),kind='input')
@@ -4868,6 +4967,8 @@ if __name__ == "__main__":
                     job.add('--strata',kind='parameter')
                     job.add('--un',fqo,kind='output',temp_path=temp_flag) # <== reads which do not map on transcriptome and genome! #######
                     job.add('--max',outdir('reads_filtered_genome-transcriptome_multiple_trim2_5end-half.fq'),kind='output',temp_path=temp_flag) # if this is missing then these reads are going to '--un'
+                    if options.resident_indexes:
+                        job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
                     if os.path.isfile(datadir('transcripts_index','.1.ebwtl')):
                         job.add('--large-index',kind='parameter')
                     job.add('',datadir('transcripts_index/'),kind='input')
@@ -5151,6 +5252,7 @@ if __name__ == "__main__":
         if not options.split_seqtk_subseq:
             #extract the short reads which mapped on the transcriptome and do not map on genome
             job.add(_FC_+'extract_short_reads.py',kind='program')
+            job.add('--sorted',kind='parameter')
             job.add('--input',outdir('reads_filtered_not-mapped-genome.fq'),kind='input')
             job.add('--list',outdir('list-names-reads-filtered_not-mapped-genome_mapped-transcriptome.txt'),kind='input')
             job.add('--output',outdir('reads_filtered_not-mapped-genome_mapped-transcriptome.fq'),kind='output')
@@ -5209,6 +5311,8 @@ if __name__ == "__main__":
     job.add('--tryhard',kind='parameter')
     job.add('--strata',kind='parameter')
     job.add('--suppress','5,6,7',kind='parameter')
+    if options.resident_indexes:
+        job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
     if os.path.isfile(datadir('transcripts_index','.1.ebwtl')):
         job.add('--large-index',kind='parameter')
     job.add('',datadir('transcripts_index/'),kind='input')
@@ -5279,6 +5383,7 @@ if __name__ == "__main__":
     if not options.split_seqtk_subseq:
         #extract the short reads which mapped on the transcriptome and do not map on genome
         job.add(_FC_+'extract_short_reads.py',kind='program')
+        job.add('--sorted',kind='parameter')
         job.add('--input',outdir('reads_filtered_unique-mapped-genome.fq'),kind='input')
         job.add('--list',outdir('list-names-reads-filtered_unique-mapped-genome_mapped-transcriptome.txt'),kind='input')
         job.add('--output',outdir('reads_filtered_unique-mapped-genome_mapped-transcriptome.fq'),kind='output')
@@ -5486,6 +5591,8 @@ if __name__ == "__main__":
         else:
             job.add('--suppress','2,4,5,6,7',kind='parameter') # stjude
         job.add('--chunkmbs',options.chunkmbs,kind='parameter',checksum='no')
+        if options.resident_indexes:
+            job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
         if os.path.isfile(datadir('transcripts_index','.1.ebwtl')):
             job.add('--large-index',kind='parameter')
         job.add('',datadir('transcripts_index/'),kind='input')
@@ -5632,6 +5739,8 @@ if __name__ == "__main__":
             else:
                 job.add('--suppress','2,4,5,6,7',kind='parameter')
             job.add('--chunkmbs',options.chunkmbs,kind='parameter',checksum='no')
+            if options.resident_indexes:
+                job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
             if os.path.isfile(datadir('transcripts_index','.1.ebwtl')):
                 job.add('--large-index',kind='parameter')
             job.add('',datadir('transcripts_index/'),kind='input')
@@ -5744,6 +5853,9 @@ if __name__ == "__main__":
         job.add('--input_hugo',datadir('genes_symbols.txt'),kind='input')
         job.add('--output_fusion_genes',outdir('candidate_fusion-genes_no-offending-reads.txt'),kind='output')
         job.add('--output_fusion_reads',outdir('candidate_fusion-genes_no-offending-reads_supporting_paired-reads.txt'),kind='output',temp_path=temp_flag)
+        job.add('--tmp_dir',tmp_dir,kind='parameter',checksum='no')
+        if sort_buffer:
+            job.add('--buffer-size',sort_buffer,kind='parameter',checksum='no')
         job.run()
         
 
@@ -5796,6 +5908,9 @@ if __name__ == "__main__":
         job.add('--output_fusion_reads_split',outdir('pre-fusion'),kind='output')
     #job.add('--output_fusion_reads_simple',outdir('candidate_fusion-genes_no-offending-reads_supporting_paired-reads_only-ids.txt'),kind='output')
     job.add('--output_missing_mate_reads',outdir('candidate_fusion-genes_missing_mates.txt'),kind='output')
+    job.add('--tmp_dir',tmp_dir,kind='parameter',checksum='no')
+    if sort_buffer:
+        job.add('--buffer-size',sort_buffer,kind='parameter',checksum='no')
     job.run()
 
 
@@ -5859,375 +5974,59 @@ if __name__ == "__main__":
         job.clean(outdir('originala-pre-fusion.fq'),temp_path=temp_flag)
 
 
-    # label fusion genes -- known fusions
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','banned',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('banned.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_01.txt'),kind='output')
-    job.run()
-    # label fusion genes -- banned fusions
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_01.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','known',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('known.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_02.txt'),kind='output')
-    job.run()
-    # label fusion genes -- no protein product
-#    job.add(_FC_+'label_fusion_genes.py',kind='program')
-#    job.add('--input',outdir('candidate_fusion-genes_02.txt'),kind='input',temp_path=temp_flag)
-#    job.add('--label','no_protein',kind='parameter')
-#    job.add('--similar_gene_symbols',kind='parameter')
-#    job.add('--filter_genes',datadir('genes_with_no_proteins.txt'),kind='input')
-#    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_02a.txt'),kind='output')
-#    job.run()
-    # label fusion genes -- paralogs
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_02.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','paralogs',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('paralogs.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_02b.txt'),kind='output')
-    job.run()
-    # label fusion genes -- potential readthrough
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_02b.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','adjacent',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('adjacent_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_03.txt'),kind='output')
-    job.run()
-    # label fusion genes -- fully overlapping in Ensembl
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_03.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','ensembl_fully_overlapping',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('ensembl_fully_overlapping_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_04.txt'),kind='output')
-    job.run()
-    # label fusion genes -- partially overlapping in Ensembl
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_04.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','ensembl_partially_overlapping',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('ensembl_partially_overlapping_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_05.txt'),kind='output')
-    job.run()
-    # label fusion genes -- overlapping and on same strand in Ensembl
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_05.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','ensembl_same_strand_overlapping',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('ensembl_same_strand_overlapping_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_06.txt'),kind='output')
-    job.run()
-    # label fusion genes -- similar region
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_06.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','similar_reads',kind='parameter')
-    job.add('--filter_gene_pairs',outdir('list_candidates_ambiguous_homologous_genes.txt'),kind='input',temp_path=temp_flag)
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_07.txt'),kind='output')
-    job.run()
-    # label fusion genes -- minimum distance between genes on the same strand
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_07.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','short_distance',kind='parameter')
-    job.add('--min_dist_gene_gene',options.min_dist,kind='parameter')
-    job.add('--min_dist_gene_gene_database',datadir('exons.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_08.txt'),kind='output')
-    job.run()
-    # label fusion genes -- minimum distance between genes on the same strand
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_08.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','dist1000bp',kind='parameter')
-    job.add('--min_dist_gene_gene','1000',kind='parameter')
-    job.add('--min_dist_gene_gene_database',datadir('exons.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_09.txt'),kind='output')
-    job.run()
-    # label fusion genes -- minimum distance between genes on the same strand
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_09.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','dist10kbp',kind='parameter')
-    job.add('--min_dist_gene_gene','10000',kind='parameter')
-    job.add('--min_dist_gene_gene_database',datadir('exons.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_10.txt'),kind='output')
-    job.run()
-    # label fusion genes -- minimum distance between genes on the same strand
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_10.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','dist100kbp',kind='parameter')
-    job.add('--min_dist_gene_gene','100000',kind='parameter')
-    job.add('--min_dist_gene_gene_database',datadir('exons.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_11.txt'),kind='output')
-    job.run()
-    # label fusion genes -- pseudogenes
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_11.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','pseudogene',kind='parameter')
-    job.add('--filter_genes',datadir('pseudogenes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_12.txt'),kind='output')
-    job.run()
-    # label fusion genes -- rRNA (again)
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_12.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','rrna',kind='parameter')
-    job.add('--filter_genes',datadir('rrnas.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_13.txt'),kind='output')
-    job.run()
-    # label fusion genes -- tRNA
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_13.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','trna',kind='parameter')
-    job.add('--filter_genes',datadir('trnas.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_14.txt'),kind='output')
-    job.run()
-    # label fusion genes -- miRNA
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_14.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','mirna',kind='parameter')
-    job.add('--filter_genes',datadir('mirnas.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_15.txt'),kind='output')
-    job.run()
-    # label fusion genes -- lncRNA
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_15.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','lncrna',kind='parameter')
-    job.add('--filter_genes',datadir('lncrnas.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_16.txt'),kind='output')
-    job.run()
-    # label fusion genes -- MT
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_16.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','mt',kind='parameter')
-    job.add('--filter_genes',datadir('mt.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_17.txt'),kind='output')
-    job.run()
-    # label fusion genes -- snoRNA
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_17.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','snorna',kind='parameter')
-    job.add('--filter_genes',datadir('snornas.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_18.txt'),kind='output')
-    job.run()
-    # label fusion genes -- snRNA
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_18.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','snrna',kind='parameter')
-    job.add('--filter_genes',datadir('snrnas.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_19.txt'),kind='output')
-    job.run()
-    # label fusion genes -- Y RNAs
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_19.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','yrna',kind='parameter')
-    job.add('--filter_genes',datadir('rnas_y.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_20.txt'),kind='output')
-    job.run()
-    # label fusion genes -- 7SK RNAs
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_20.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','7skrna',kind='parameter')
-    job.add('--filter_genes',datadir('7skrnas.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_21.txt'),kind='output')
-    job.run()
-    # label fusion genes -- metastasis
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_21.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','metastasis',kind='parameter')
-    job.add('--filter_genes',datadir('metastasis.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_22.txt'),kind='output')
-    job.run()
-#    # label fusion genes -- antisense
-#    job.add(_FC_+'label_fusion_genes.py',kind='program')
-#    job.add('--input',outdir('candidate_fusion-genes_21.txt'),kind='input',temp_path=temp_flag)
-#    job.add('--label','antisense',kind='parameter')
-#    job.add('--filter_genes',datadir('antisenses.txt'),kind='input')
-#    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_22.txt'),kind='output')
-#    job.run()
-    # label fusion genes -- paralogs
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_22.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','pair_pseudo_genes',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('pairs_pseudogenes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_23.txt'),kind='output')
-    job.run()
-    # label fusion genes -- ribosomal proteins
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_23.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','ribosomal',kind='parameter')
-    job.add('--filter_genes',datadir('ribosomal_proteins.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_24.txt'),kind='output')
-    job.run()
-    # label fusion genes -- oncogenes
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_24.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','oncogene',kind='parameter')
-    job.add('--filter_genes',datadir('oncogenes_more.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_25.txt'),kind='output')
-    job.run()
-    # label fusion genes -- cosmic
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_25.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','cosmic',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('cosmic.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_27.txt'),kind='output')
-    job.run()
-    # label fusion genes -- ChimerDB 2.0
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_27.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','chimer2',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('chimerdb2.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_28.txt'),kind='output')
-    job.run()
-    # label fusion genes -- CGP
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_28.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','cgp',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('cgp.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_29.txt'),kind='output')
-    job.run()
-    # label fusion genes -- ConjoinG
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_29.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','conjoing',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('conjoing.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_30.txt'),kind='output')
-    job.run()
-    # label fusion genes -- TICdb
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_30.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','ticdb',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('ticdb.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_31.txt'),kind='output')
-    job.run()
-#    # label fusion genes -- RP11-... genes
-#    job.add(_FC_+'label_fusion_genes.py',kind='program')
-#    job.add('--input',outdir('candidate_fusion-genes_31.txt'),kind='input',temp_path=temp_flag)
-#    job.add('--label','rp11',kind='parameter')
-#    job.add('--filter_genes',datadir('rp11.txt'),kind='input')
-#    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_32.txt'),kind='output')
-#    job.run()
-#    # label fusion genes -- CTA-... genes
-#    job.add(_FC_+'label_fusion_genes.py',kind='program')
-#    job.add('--input',outdir('candidate_fusion-genes_32.txt'),kind='input',temp_path=temp_flag)
-#    job.add('--label','cta',kind='parameter')
-#    job.add('--filter_genes',datadir('cta.txt'),kind='input')
-#    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_33.txt'),kind='output')
-#    job.run()
-#    # label fusion genes -- CTB-... genes
-#    job.add(_FC_+'label_fusion_genes.py',kind='program')
-#    job.add('--input',outdir('candidate_fusion-genes_33.txt'),kind='input',temp_path=temp_flag)
-#    job.add('--label','ctb',kind='parameter')
-#    job.add('--filter_genes',datadir('ctb.txt'),kind='input')
-#    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_34.txt'),kind='output')
-#    job.run()
-#    # label fusion genes -- CTD-... genes
-#    job.add(_FC_+'label_fusion_genes.py',kind='program')
-#    job.add('--input',outdir('candidate_fusion-genes_34.txt'),kind='input',temp_path=temp_flag)
-#    job.add('--label','ctd',kind='parameter')
-#    job.add('--filter_genes',datadir('ctd.txt'),kind='input')
-#    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_35.txt'),kind='output')
-#    job.run()
-#    # label fusion genes -- CTC-... genes
-#    job.add(_FC_+'label_fusion_genes.py',kind='program')
-#    job.add('--input',outdir('candidate_fusion-genes_35.txt'),kind='input',temp_path=temp_flag)
-#    job.add('--label','ctc',kind='parameter')
-#    job.add('--filter_genes',datadir('ctc.txt'),kind='input')
-#    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_36.txt'),kind='output')
-#    job.run()
-#    # label fusion genes -- RP??-... genes
-#    job.add(_FC_+'label_fusion_genes.py',kind='program')
-#    job.add('--input',outdir('candidate_fusion-genes_36.txt'),kind='input',temp_path=temp_flag)
-#    job.add('--label','rp',kind='parameter')
-#    job.add('--filter_genes',datadir('rp.txt'),kind='input')
-#    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_37.txt'),kind='output')
-#    job.run()
-    # label fusion genes -- found in healthy samples
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_31.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','healthy',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('healthy.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_38.txt'),kind='output')
-    job.run()
-    # label fusion genes -- CACG
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_38.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','cacg',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('cacg.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_39.txt'),kind='output')
-    job.run()
-    # label fusion genes -- fully overlapping in UCSC
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_39.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','ucsc_fully_overlapping',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('ucsc_fully_overlapping_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_40.txt'),kind='output')
-    job.run()
-    # label fusion genes -- partially overlapping in UCSC
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_40.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','ucsc_partially_overlapping',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('ucsc_partially_overlapping_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_41.txt'),kind='output')
-    job.run()
-    # label fusion genes -- overlapping and on same strand in UCSC
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_41.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','ucsc_same_strand_overlapping',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('ucsc_same_strand_overlapping_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_42.txt'),kind='output')
-    job.run()
-    # label fusion genes -- fully overlapping in RefSeq
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_42.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','refseq_fully_overlapping',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('refseq_fully_overlapping_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_43.txt'),kind='output')
-    job.run()
-    # label fusion genes -- partially overlapping in RefSeq
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_43.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','refseq_partially_overlapping',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('refseq_partially_overlapping_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_44.txt'),kind='output')
-    job.run()
-    # label fusion genes -- overlapping and on same strand in RefSeq
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_44.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','refseq_same_strand_overlapping',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('refseq_same_strand_overlapping_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_45.txt'),kind='output')
-    job.run()
-    # label fusion genes -- duplicated genes from DGD database
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_45.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','duplicates',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('dgd.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_46.txt'),kind='output')
-    job.run()
-    # label fusion genes -- TCGA
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_46.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','tcga',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('tcga.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_47.txt'),kind='output')
-    job.run()
-    # label fusion genes -- BodyMap2
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_47.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','bodymap2',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('bodymap2.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_48.txt'),kind='output')
-    job.run()
-    # label fusion genes -- Metazoa
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_48.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','metazoa',kind='parameter')
-    job.add('--filter_genes',datadir('metazoa.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_49.txt'),kind='output')
-    job.run()
-    # label fusion genes -- cell lines
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_49.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','cell_lines',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('celllines.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_50.txt'),kind='output')
-    job.run()
+    # label fusion genes (each batch of labels is applied in one pass)
+    label_fusions(job,
+        fin = outdir('candidate_fusion-genes.txt'),
+        fout = outdir('candidate_fusion-genes_50.txt'),
+        manifest = outdir('candidate_fusion-genes_labels_1.txt'),
+        labels = [
+            ('banned','pairs',datadir('banned.txt')),
+            ('known','pairs',datadir('known.txt')),
+            ('paralogs','pairs',datadir('paralogs.txt')),
+            ('adjacent','pairs',datadir('adjacent_genes.txt')), # potential readthrough
+            ('ensembl_fully_overlapping','pairs',datadir('ensembl_fully_overlapping_genes.txt')),
+            ('ensembl_partially_overlapping','pairs',datadir('ensembl_partially_overlapping_genes.txt')),
+            ('ensembl_same_strand_overlapping','pairs',datadir('ensembl_same_strand_overlapping_genes.txt')),
+            ('similar_reads','pairs',outdir('list_candidates_ambiguous_homologous_genes.txt'),0,temp_flag),
+            # minimum distance between genes on the same strand
+            ('short_distance','distance',datadir('exons.txt'),options.min_dist),
+            ('dist1000bp','distance',datadir('exons.txt'),1000),
+            ('dist10kbp','distance',datadir('exons.txt'),10000),
+            ('dist100kbp','distance',datadir('exons.txt'),100000),
+            ('pseudogene','genes',datadir('pseudogenes.txt')),
+            ('rrna','genes',datadir('rrnas.txt')),
+            ('trna','genes',datadir('trnas.txt')),
+            ('mirna','genes',datadir('mirnas.txt')),
+            ('lncrna','genes',datadir('lncrnas.txt')),
+            ('mt','genes',datadir('mt.txt')),
+            ('snorna','genes',datadir('snornas.txt')),
+            ('snrna','genes',datadir('snrnas.txt')),
+            ('yrna','genes',datadir('rnas_y.txt')),
+            ('7skrna','genes',datadir('7skrnas.txt')),
+            ('metastasis','genes',datadir('metastasis.txt')),
+            ('pair_pseudo_genes','pairs',datadir('pairs_pseudogenes.txt')),
+            ('ribosomal','genes',datadir('ribosomal_proteins.txt')),
+            ('oncogene','genes',datadir('oncogenes_more.txt')),
+            ('cosmic','pairs',datadir('cosmic.txt')),
+            ('chimer2','pairs',datadir('chimerdb2.txt')),
+            ('cgp','pairs',datadir('cgp.txt')),
+            ('conjoing','pairs',datadir('conjoing.txt')),
+            ('ticdb','pairs',datadir('ticdb.txt')),
+            ('healthy','pairs',datadir('healthy.txt')), # found in healthy samples
+            ('cacg','pairs',datadir('cacg.txt')),
+            ('ucsc_fully_overlapping','pairs',datadir('ucsc_fully_overlapping_genes.txt')),
+            ('ucsc_partially_overlapping','pairs',datadir('ucsc_partially_overlapping_genes.txt')),
+            ('ucsc_same_strand_overlapping','pairs',datadir('ucsc_same_strand_overlapping_genes.txt')),
+            ('refseq_fully_overlapping','pairs',datadir('refseq_fully_overlapping_genes.txt')),
+            ('refseq_partially_overlapping','pairs',datadir('refseq_partially_overlapping_genes.txt')),
+            ('refseq_same_strand_overlapping','pairs',datadir('refseq_same_strand_overlapping_genes.txt')),
+            ('duplicates','pairs',datadir('dgd.txt')), # duplicated genes from DGD database
+            ('tcga','pairs',datadir('tcga.txt')),
+            ('bodymap2','pairs',datadir('bodymap2.txt')),
+            ('metazoa','genes',datadir('metazoa.txt')),
+            ('cell_lines','pairs',datadir('celllines.txt'))
+        ],
+        temp_path = temp_flag)
     # label fusion genes -- ambiguous (only if the abguous counts > supporting pairs)
     job.add(_FC_+'label_ambiguous_fusion_genes.py',kind='program')
     job.add('--input',outdir('candidate_fusion-genes_50.txt'),kind='input',temp_path=temp_flag)
@@ -6236,149 +6035,39 @@ if __name__ == "__main__":
     job.add('--input_ambiguous',outdir('all_ambiguous_genes.txt'),kind='input')
     job.add('--output_fusion_genes',outdir('candidate_fusion-genes_51.txt'),kind='output')
     job.run()
-    # label fusion genes -- fully overlapping in RefSeq
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_51.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','gencode_fully_overlapping',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('gencode_fully_overlapping_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_52.txt'),kind='output')
-    job.run()
-    # label fusion genes -- partially overlapping in RefSeq
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_52.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','gencode_partially_overlapping',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('gencode_partially_overlapping_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_53.txt'),kind='output')
-    job.run()
-    # label fusion genes -- overlapping and on same strand in RefSeq
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_53.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','gencode_same_strand_overlapping',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('gencode_same_strand_overlapping_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_54.txt'),kind='output')
-    job.run()
-    # label fusion genes -- overlapping and on same strand in RefSeq
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_54.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','prostate_cancer',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('prostate_cancer.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_55.txt'),kind='output')
-    job.run()
-    # label fusion genes -- non-tumor cell lines
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_55.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','non_tumor_cells',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('non-tumor_cells.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_56.txt'),kind='output')
-    job.run()
+    # label fusion genes
+    labels = [
+        ('gencode_fully_overlapping','pairs',datadir('gencode_fully_overlapping_genes.txt')),
+        ('gencode_partially_overlapping','pairs',datadir('gencode_partially_overlapping_genes.txt')),
+        ('gencode_same_strand_overlapping','pairs',datadir('gencode_same_strand_overlapping_genes.txt')),
+        ('prostate_cancer','pairs',datadir('prostate_cancer.txt')),
+        ('non_tumor_cells','pairs',datadir('non-tumor_cells.txt'))]
     # label with focus the fusions which are given by the user
     if options.focus_fusions and not empty(options.focus_fusions):
-        job.add(_FC_+'label_fusion_genes.py',kind='program')
-        job.add('--input',outdir('candidate_fusion-genes_56.txt'),kind='input',temp_path=temp_flag)
-        job.add('--label','focus',kind='parameter')
-        job.add('--filter_gene_pairs',options.focus_fusions,kind='input')
-        job.add('--output_fusion_genes',outdir('candidate_fusion-genes_57.txt'),kind='output')
-        job.run()
-    else:
-        job.link(outdir('candidate_fusion-genes_56.txt'),outdir('candidate_fusion-genes_57.txt'),temp_path=temp_flag)
+        labels.append(('focus','pairs',options.focus_fusions))
     # label fusion genes -- fragments which fall below the spanning pairs in case of fragmentation
     if fragments_flag:
-        job.add(_FC_+'label_fusion_genes.py',kind='program')
-        job.add('--input',outdir('candidate_fusion-genes_57.txt'),kind='input',temp_path=temp_flag)
-        job.add('--label','fragments',kind='parameter')
-        job.add('--filter_gene_pairs',outdir('candidate_fusion-genes_fragments.txt'),kind='input',temp_path=temp_flag)
-        job.add('--output_fusion_genes',outdir('candidate_fusion-genes_58.txt'),kind='output')
-        job.run()
-    else:
-        job.link(outdir('candidate_fusion-genes_57.txt'),outdir('candidate_fusion-genes_58.txt'),temp_path=temp_flag)
-    # label fusion genes -- non-tumor cell lines
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_58.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','hpa',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('hpa.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_59.txt'),kind='output')
-    job.run()
-    # label fusion genes -- minimum distance between genes on the same strand
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_59.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','dist200kbp',kind='parameter')
-    job.add('--min_dist_gene_gene','200000',kind='parameter')
-    job.add('--min_dist_gene_gene_database',datadir('exons.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_60.txt'),kind='output')
-    job.run()
-    # label fusion genes -- minimum distance between genes on the same strand
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_60.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','gtex',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('gtex.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_61.txt'),kind='output')
-    job.run()
-    # label fusion genes -- non-cancer tissues
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_61.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','non_cancer_tissues',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('non-cancer_tissues.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_62.txt'),kind='output')
-    job.run()
-    # label fusion genes -- hla
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_62.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','hla',kind='parameter')
-    job.add('--filter_genes',datadir('hla.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_63.txt'),kind='output')
-    job.run()
-    # label fusion genes -- 1000 genomes
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_63.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','1000genomes',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('1000genomes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_64.txt'),kind='output')
-    job.run()
-    # label fusion genes -- 18 cancers
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_64.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','18cancers',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('18cancers.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_65.txt'),kind='output')
-    job.run()
-    # label fusion genes -- gliomas
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_65.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','gliomas',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('gliomas.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_66.txt'),kind='output')
-    job.run()
-    # label fusion genes -- ChimerDB 3
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_66.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','chimer4kb',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('chimerdb4kb.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_67.txt'),kind='output')
-    job.run()
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_67.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','chimer4pub',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('chimerdb4pub.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_68.txt'),kind='output')
-    job.run()
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_68.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','chimer4seq',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('chimerdb4seq.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_69.txt'),kind='output')
-    job.run()
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_69.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','cancer',kind='parameter')
-    job.add('--filter_genes',datadir('cancer_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_70.txt'),kind='output')
-    job.run()
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_70.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','tumor',kind='parameter')
-    job.add('--filter_genes',datadir('tumor_genes.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_71.txt'),kind='output')
-    job.run()
+        labels.append(('fragments','pairs',outdir('candidate_fusion-genes_fragments.txt'),0,temp_flag))
+    labels.extend([
+        ('hpa','pairs',datadir('hpa.txt')),
+        ('dist200kbp','distance',datadir('exons.txt'),200000),
+        ('gtex','pairs',datadir('gtex.txt')),
+        ('non_cancer_tissues','pairs',datadir('non-cancer_tissues.txt')),
+        ('hla','genes',datadir('hla.txt')),
+        ('1000genomes','pairs',datadir('1000genomes.txt')),
+        ('18cancers','pairs',datadir('18cancers.txt')),
+        ('gliomas','pairs',datadir('gliomas.txt')),
+        ('chimer4kb','pairs',datadir('chimerdb4kb.txt')),
+        ('chimer4pub','pairs',datadir('chimerdb4pub.txt')),
+        ('chimer4seq','pairs',datadir('chimerdb4seq.txt')),
+        ('cancer','genes',datadir('cancer_genes.txt')),
+        ('tumor','genes',datadir('tumor_genes.txt'))])
+    label_fusions(job,
+        fin = outdir('candidate_fusion-genes_51.txt'),
+        fout = outdir('candidate_fusion-genes_71.txt'),
+        manifest = outdir('candidate_fusion-genes_labels_2.txt'),
+        labels = labels,
+        temp_path = temp_flag)
     # add label multi-mappers
     job.add(_FC_+'label_multi.py',kind='program')
     job.add('--input',outdir('candidate_fusion-genes_71.txt'),kind='input',temp_path=temp_flag)
@@ -6387,62 +6076,22 @@ if __name__ == "__main__":
     job.add('--data',outdir('candidate_fusion-genes_no-offending-reads.txt'),kind='input',temp_path=temp_flag)
     job.add('--output',outdir('candidate_fusion-genes_72.txt'),kind='output')
     job.run()
-    # label fusion genes -- pancreatic
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_72.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','pancreases',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('pancreases.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_73.txt'),kind='output')
-    job.run()
-    # label fusion genes -- tcga-cancer
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_73.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','tcga-cancer',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('tcga-cancer.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_74.txt'),kind='output')
-    job.run()
-    # label fusion genes -- tcga-normal
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_74.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','tcga-normal',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('tcga-normal.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_75.txt'),kind='output')
-    job.run()
-    # label fusion genes -- TCGA2
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_75.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','tcga2',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('tcga2.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_76.txt'),kind='output')
-    job.run()
-    # label fusion genes -- prefrontal cortex
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_76.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','cortex',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('cortex.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_77.txt'),kind='output')
-    job.run()
-    # label rt-circ RNAs
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_77.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','rt_circ_rna',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('rtcircrnas.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_78.txt'),kind='output')
-    job.run()
-    # label OncoKB
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_78.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','oncokb',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('oncokb.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_79.txt'),kind='output')
-    job.run()
-    # label Mitelman
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_79.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','mitelman',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('mitelman.txt'),kind='input')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_80.txt'),kind='output')
-    job.run()
+    # label fusion genes
+    label_fusions(job,
+        fin = outdir('candidate_fusion-genes_72.txt'),
+        fout = outdir('candidate_fusion-genes_80.txt'),
+        manifest = outdir('candidate_fusion-genes_labels_3.txt'),
+        labels = [
+            ('pancreases','pairs',datadir('pancreases.txt')),
+            ('tcga-cancer','pairs',datadir('tcga-cancer.txt')),
+            ('tcga-normal','pairs',datadir('tcga-normal.txt')),
+            ('tcga2','pairs',datadir('tcga2.txt')),
+            ('cortex','pairs',datadir('cortex.txt')), # prefrontal cortex
+            ('rt_circ_rna','pairs',datadir('rtcircrnas.txt')),
+            ('oncokb','pairs',datadir('oncokb.txt')),
+            ('mitelman','pairs',datadir('mitelman.txt'))
+        ],
+        temp_path = temp_flag)
     # label fusions with smaller reads in supporting pair-reads
     job.add(_FC_+'label_fusion_genes_trim2.py',kind='program') # trim2
     job.add('--input',outdir('candidate_fusion-genes_80.txt'),kind='input',temp_path=temp_flag)
@@ -6450,44 +6099,23 @@ if __name__ == "__main__":
     job.add('--smaller_pairs',outdir('reads_not-mapped_trim2_ids.txt'),kind='input',temp_path=temp_flag)
     job.add('--output_fusion_genes',outdir('candidate_fusion-genes_1000.txt'),kind='output')
     job.run()
-    #
-    last_candidate_file = outdir('candidate_fusion-genes_1000.txt')
+    # label fusion genes -- custom labels given by the user and oesophagus
+    labels = []
     if options.label_file:
         title = options.label_title.strip().split(',')
         files = options.label_file.strip().split(',')
         thres = None
         if options.label_threshold:
             thres = options.label_threshold.strip().split(',')
-        ainput = outdir('candidate_fusion-genes_custom___0.txt')
-        job.link(last_candidate_file,
-                 ainput,
-                 temp_path = temp_flag)
-        aout = ainput[:]
         for i in xrange(len(title)):
-            ain = ainput.replace("___0.txt","___%s.txt" % (i,))
-            aout = ainput.replace("___0.txt","___%s.txt" % (i+1,))
-            job.add(_FC_+'label_fusion_genes.py',kind='program')
-            job.add('--input',ain,kind='input',temp_path=temp_flag)
-            job.add('--label',title[i],kind='parameter')
-            if thres and thres != '0':
-                job.add('--filter_gene_pairs_threshold',thres[i],kind='parameter')
-            job.add('--filter_gene_pairs',files[i],kind='output')
-            job.add('--output_fusion_genes',aout,kind='output')
-            job.run()
-        job.link(aout,
-                 outdir('candidate_fusion-genes_custom___last.txt'),
-                 temp_path = temp_flag)
-    else:
-        job.link(last_candidate_file,
-                 outdir('candidate_fusion-genes_custom___last.txt'),
-                 temp_path = temp_flag)
-    # label fusion genes -- banned
-    job.add(_FC_+'label_fusion_genes.py',kind='program')
-    job.add('--input',outdir('candidate_fusion-genes_custom___last.txt'),kind='input',temp_path=temp_flag)
-    job.add('--label','oesophagus',kind='parameter')
-    job.add('--filter_gene_pairs',datadir('oesophagus.txt'),kind='output')
-    job.add('--output_fusion_genes',outdir('candidate_fusion-genes_last.txt'),kind='output')
-    job.run()
+            labels.append((title[i],'pairs',files[i],thres[i] if thres else 0))
+    labels.append(('oesophagus','pairs',datadir('oesophagus.txt')))
+    label_fusions(job,
+        fin = outdir('candidate_fusion-genes_1000.txt'),
+        fout = outdir('candidate_fusion-genes_last.txt'),
+        manifest = outdir('candidate_fusion-genes_labels_4.txt'),
+        labels = labels,
+        temp_path = temp_flag)
 
     ##############################################################################
     # FILTER FUSION GENES
@@ -6641,26 +6269,38 @@ if __name__ == "__main__":
                 id = "#no-candidate-fusion-genes-found-1A#"):
 
         if not options.skip_unmapped_pairs_filtering:
-            job.add('LC_ALL=C',kind='program')
-            job.add('cat',kind='parameter')
-            job.add('',outdir('reads_filtered_not-mapped-genome_not-mapped-transcriptome.fq'),kind='input')
-            job.add('|',kind='parameter')
-            job.add('LC_ALL=C',kind='parameter')
-            job.add('paste','- - - -',kind='parameter')
-            job.add('|',kind='parameter')
-            job.add('LC_ALL=C',kind='parameter')
-            job.add('sort',kind='parameter')
-            job.add('-k','1,1',kind='parameter')
-            job.add('-t',"'\t'",kind='parameter')
-            if sort_buffer:
-                job.add('--buffer-size',sort_buffer,kind='parameter',checksum='no')
-            if sort_parallel:
+            if options.internal_sort:
+                job.add(_FC_+'sort_records.py',kind='program')
+                job.add('--input',outdir('reads_filtered_not-mapped-genome_not-mapped-transcriptome.fq'),kind='input')
+                job.add('--fastq',kind='parameter')
+                job.add('--tab',kind='parameter')
+                job.add('-k','1,1',kind='parameter')
+                if sort_buffer:
+                    job.add('--buffer-size',sort_buffer,kind='parameter',checksum='no')
                 job.add('--parallel',options.processes,kind='parameter',checksum='no')
-            if sort_lzop_compress:
-                job.add('--compress-program','lzop',kind='parameter',checksum='no')
-            elif sort_gzip_compress:
-                job.add('--compress-program','gzip',kind='parameter',checksum='no')
-            job.add('-T',tmp_dir,kind='parameter',checksum='no')
+                job.add('-T',tmp_dir,kind='parameter',checksum='no')
+                job.add('--output','-',kind='parameter')
+            else:
+                job.add('LC_ALL=C',kind='program')
+                job.add('cat',kind='parameter')
+                job.add('',outdir('reads_filtered_not-mapped-genome_not-mapped-transcriptome.fq'),kind='input')
+                job.add('|',kind='parameter')
+                job.add('LC_ALL=C',kind='parameter')
+                job.add('paste','- - - -',kind='parameter')
+                job.add('|',kind='parameter')
+                job.add('LC_ALL=C',kind='parameter')
+                job.add('sort',kind='parameter')
+                job.add('-k','1,1',kind='parameter')
+                job.add('-t',"'\t'",kind='parameter')
+                if sort_buffer:
+                    job.add('--buffer-size',sort_buffer,kind='parameter',checksum='no')
+                if sort_parallel:
+                    job.add('--parallel',options.processes,kind='parameter',checksum='no')
+                if sort_lzop_compress:
+                    job.add('--compress-program','lzop',kind='parameter',checksum='no')
+                elif sort_gzip_compress:
+                    job.add('--compress-program','gzip',kind='parameter',checksum='no')
+                job.add('-T',tmp_dir,kind='parameter',checksum='no')
             job.add('|',kind='parameter')
             job.add(_FC_+'droppe.py',kind='parameter')
             job.add('-i','-',kind='input')
@@ -6706,6 +6346,8 @@ if __name__ == "__main__":
             job.add('--suppress','5,6,7',kind='parameter')
             job.add('--un',outdir('reads_filtered_not-mapped-genome_not-mapped-transcriptome_more.fq'),kind='output') # here is the result
             job.add('--max',outdir('reads_filtered_not-mapped_multiple.fq'),kind='output',temp_path=temp_flag) # if this is missing then these reads are going to '--un'
+            if options.resident_indexes:
+                job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
             if os.path.isfile(datadir('transcripts_index','.1.ebwtl')):
                 job.add('--large-index',kind='parameter')
             job.add('',datadir('transcripts_index/'),kind='input')
@@ -6782,6 +6424,8 @@ if __name__ == "__main__":
     #            job.add('--suppress','1,2,3,4,5,6,7,8',kind='parameter')
                 job.add('--un',outdir('reads_filtered_not-mapped-genome_not-mapped-transcriptome_end.fq'),kind='output') # here is the result
                 job.add('--max',outdir('reads_filtered_not-mapped_multiple_end.fq'),kind='output',temp_path=temp_flag) # if this is missing then these reads are going to '--un'
+                if options.resident_indexes:
+                    job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
                 if bowtie123:
                     job.add('',datadir('genome_index2/index'),kind='input')
                 else:
@@ -6908,6 +6552,8 @@ if __name__ == "__main__":
 #                if len_reads > 40 and options.trim_wiggle:
 #                    job.add('--trim3',options.trim_wiggle,kind='parameter') # trim on the fly 5bp from 3' end
 #                    job.add('--trim5',options.trim_wiggle,kind='parameter') # trim the 5
+                if options.resident_indexes:
+                    job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
                 if os.path.isfile(datadir('viruses_index','.1.ebwtl')):
                     job.add('--large-index',kind='parameter')
                 job.add('',datadir('viruses_index/'),kind='input')
@@ -6969,6 +6615,8 @@ if __name__ == "__main__":
             job.add('--suppress','1,2,4,5,6,7,8',kind='parameter') # originally was: '2,3,4,5,6,7,8'
             job.add('--un',outdir('reads_filtered_not-mapped-genome_not-mapped-transcriptome_end-f5.fq'),kind='output') # here is the result
             job.add('--max',outdir('reads-filtered_temp_multiple-viruses.fq'),kind='output',temp_path=temp_flag) # if this is missing then these reads are going to '--un'
+            if options.resident_indexes:
+                job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
             if os.path.isfile(datadir('viruses_index','.1.ebwtl')):
                 job.add('--large-index',kind='parameter')
             job.add('',datadir('viruses_index/'),kind='input')
@@ -7076,6 +6724,8 @@ if __name__ == "__main__":
     #        job.add('--suppress','1,2,3,4,5,6,7,8',kind='parameter')
             job.add('--un',outdir('reads_filtered_not-mapped-genome_not-mapped-transcriptome_final.fq'),kind='output') # here is the result
             job.add('--max',outdir('reads_filtered_not-mapped_multiple_end2.fq'),kind='output',temp_path=temp_flag) # if this is missing then these reads are going to '--un'
+            if options.resident_indexes:
+                job.add('--mm',kind='parameter',checksum='no') # memory-mapped index shared with the other Bowtie processes
             if bowtie123:
                 job.add('',datadir('genome_index2/index'),kind='input')
             else:
@@ -7234,6 +6884,7 @@ if __name__ == "__main__":
 
         if not options.split_seqtk_subseq:
             job.add(_FC_+'extract_short_reads.py',kind='program')
+            job.add('--sorted',kind='parameter')
             job.add('--buffer-size',options.extract_buffer_size,kind='parameter',checksum='no')
             job.add('--input',outdir('originala.fq.gz'),kind='input')
             job.add('--list',outdir('original_important.txt'),kind='input')
@@ -7409,6 +7060,7 @@ if __name__ == "__main__":
 
         if not options.split_seqtk_subseq:
             job.add(_FC_+'extract_short_reads.py',kind='program')
+            job.add('--sorted',kind='parameter')
             job.add('--buffer-size',options.extract_buffer_size,kind='parameter',checksum='no')
             job.add('--input',outdir('originala.fq.gz'),kind='input')
             job.add('--list',outdir('original_important.txt'),kind='input')
@@ -7503,6 +7155,7 @@ if __name__ == "__main__":
 
             if not options.split_seqtk_subseq:
                 job.add(_FC_+'extract_short_reads.py',kind='program')
+                job.add('--sorted',kind='parameter')
                 job.add('--buffer-size',options.extract_buffer_size,kind='parameter',checksum='no')
                 job.add('--input',outdir('original_important.fq.gz'),kind='input')
                 job.add('--list',outdir('reads_filtered_not-mapped-genome_not-mapped-transcriptome_final.txt'),kind='input')
@@ -7792,6 +7445,7 @@ if __name__ == "__main__":
 
         if not options.split_seqtk_subseq:
             job.add(_FC_+'extract_short_reads.py',kind='program')
+            job.add('--sorted',kind='parameter')
             job.add('--buffer-size',options.extract_buffer_size,kind='parameter',checksum='no')
             job.add('--input',outdir('original_important.fq.gz'),kind='input')
             job.add('--list',outdir('reads_transcriptome22_more.txt'),kind='input',temp_path=temp_flag)
@@ -8316,6 +7970,7 @@ if __name__ == "__main__":
 
             if not options.split_seqtk_subseq:
                 job.add(_FC_+'extract_short_reads.py',kind='program')
+                job.add('--sorted',kind='parameter')
                 job.add('--buffer-size',options.extract_buffer_size,kind='parameter',checksum='no')
                 job.add('--input',outdir('original_important.fq.gz'),kind='input')
                 job.add('--list',outdir('reads_filtered_not-mapped-genome_not-mapped-transcriptome2.txt'),kind='input')
@@ -8496,6 +8151,7 @@ if __name__ == "__main__":
                 # try to trim only the unmapped read (do not trim the paired reads supporting the fusions)
                 if not options.split_seqtk_subseq:
                     job.add(_FC_+'extract_short_reads.py',kind='program')
+                    job.add('--sorted',kind='parameter')
                     job.add('--buffer-size',options.extract_buffer_size,kind='parameter',checksum='no')
                     job.add('--input',input_file,kind='input')
                     job.add('--list',outdir('candidate_fusion-genes_further_paired-reads.txt'),kind='input')
@@ -8525,6 +8181,7 @@ if __name__ == "__main__":
 
                 if not options.split_seqtk_subseq:
                     job.add(_FC_+'extract_short_reads.py',kind='program')
+                    job.add('--sorted',kind='parameter')
                     job.add('--buffer-size',options.extract_buffer_size,kind='parameter',checksum='no')
                     job.add('--input',input_file,kind='input',temp_path=temp_flag)
                     job.add('--list',outdir('reads_filtered_not-mapped-genome_not-mapped-transcriptome_final2.txt'),kind='input')
@@ -8835,6 +8492,7 @@ if __name__ == "__main__":
 
                 if not options.split_seqtk_subseq:
                     job.add(_FC_+'extract_short_reads.py',kind='program')
+                    job.add('--sorted',kind='parameter')
                     job.add('--buffer-size',options.extract_buffer_size,kind='parameter',checksum='no')
                     job.add('--input',outdir('reads_filtered_not-mapped-genome_not-mapped-transcriptome_psl-pp.fq'),kind='input')
                     job.add('--list',outdir('reads_filtered_not-mapped-genome_not-mapped-transcriptome_psl_all_uniq.map'),kind='input')
@@ -9014,6 +8672,7 @@ if __name__ == "__main__":
                         if _BT_:
                             job.add('--blat_dir=',_BT_,kind='parameter',checksum='no',space='no')
                         job.add('--cpus=',options.processes,kind='parameter',checksum='no',space='no') # it takes 5 GB per cpu so for here it means 12 * 5 = 60GB
+                        job.add('--chunks=',4*options.processes,kind='parameter',checksum='no',space='no') # the reads are given in small pieces (of at least 10000 reads, see '--min-chunk-size') to the free BLAT processes
                         job.add('--filter-fusion',kind='parameter',checksum='no') # WARNING: this does a very fast pre-filtering as done in "find_fusion_genes_blat.py"; THIS should be kep in sync with "find_fusion_genes_blat.py"
                         job.add('',part+'.2bit',kind='input',temp_path=temp_flag)
                         job.add('',outdir('reads_gene-gene.fa'),kind='input')
@@ -9066,6 +8725,7 @@ if __name__ == "__main__":
                     job.add('-maxIntron=',outdir('gene-gene_longest.txt'),kind='parameter',space='no',from_file = 'yes') # default is 750000
                     job.add('--tmp_dir=',tmp_dir,kind='parameter',checksum='no',space='no')
                     job.add('--cpus=',options.processes,kind='parameter',checksum='no',space='no') # it takes 5 GB per cpu so for here it means 12 * 5 = 60GB
+                    job.add('--chunks=',4*options.processes,kind='parameter',checksum='no',space='no') # the reads are given in small pieces (of at least 10000 reads, see '--min-chunk-size') to the free BLAT processes
                     job.add('--filter-fusion',kind='parameter',checksum='no') # WARNING: this does a very fast pre-filtering as done in "find_fusion_genes_blat.py"; THIS should be kep in sync with "find_fusion_genes_blat.py"
                     job.add('',outdir('gene-gene.2bit'),kind='input',temp_path=temp_flag)
                     job.add('',outdir('reads_gene-gene.fa'),kind='input',temp_path=temp_flag)
@@ -9304,6 +8964,7 @@ if __name__ == "__main__":
                         job.add("",gdr,kind='input',temp_path=temp_flag,command_line='no')
                         job.add('|',kind='parameter')
                         job.add('sam2psl.py',kind='parameter')
+                        job.add('--processes',options.processes,kind='parameter',checksum='no')
                         job.add('--input','-',kind='parameter')
                         job.add('--output','-',kind='output')
                         #job.add('--output',outdir('gene-gene-star.psl.')+str(i),kind='output',dest_list='genegenestar')
@@ -9720,6 +9381,7 @@ if __name__ == "__main__":
                                 job.run()
 
                                 job.add(_FC_+'sam2psl.py',kind='program')
+                                job.add('--processes',options.processes,kind='parameter',checksum='no')
                                 job.add('--input',outdir('split_gene-gene_star_patch.sam.')+str(i),kind='input',temp_path=temp_flag)
                                 #job.add('--output',outdir('split_gene-gene_star_patch.psl.')+str(i),kind='output')
                                 job.add('--output','-',kind='parameter')
@@ -9968,6 +9630,7 @@ if __name__ == "__main__":
 
 
                                     job.add(_FC_+'sam2psl.py',kind='program')
+                                    job.add('--processes',options.processes,kind='parameter',checksum='no')
                                     if not options.skip_ig_star:
                                         job.add('--replace-read-ids','=',kind='parameter')
                                     job.add('--input',outdir('split_gene-gene_star_unmapped_patch.sam.')+str(i),kind='input',temp_path=temp_flag)
@@ -10139,6 +9802,7 @@ if __name__ == "__main__":
                     job.add("",outdir('gene-gene-star-results/'),kind='input',temp_path=temp_flag,command_line='no')
                     job.add('|',kind='parameter')
                     job.add(_FC_+'sam2psl.py',kind='parameter')
+                    job.add('--processes',options.processes,kind='parameter',checksum='no')
                     job.add('--input','-',kind='parameter')
                     #job.add('--output',outdir('gene-gene-star.psl'),kind='output')
                     #job.run()
@@ -10569,6 +10233,7 @@ if __name__ == "__main__":
                             job.run()
 
                             job.add(_FC_+'sam2psl.py',kind='program')
+                            job.add('--processes',options.processes,kind='parameter',checksum='no')
                             job.add('--input',outdir('split_gene-gene_star_patch.sam'),kind='input',temp_path=temp_flag)
                             #job.add('--output',outdir('split_gene-gene_star_patch.psl'),kind='output')
                             job.add('--output','-',kind='parameter')
@@ -10821,6 +10486,7 @@ if __name__ == "__main__":
                                 job.clean(outdir('gene-gene-star-results-unmapped/'),temp_path=temp_flag)
 
                                 job.add(_FC_+'sam2psl.py',kind='program')
+                                job.add('--processes',options.processes,kind='parameter',checksum='no')
                                 job.add('--input',outdir('split_gene-gene_star_unmapped_patch.sam'),kind='input',temp_path=temp_flag)
                                 if not options.skip_ig_star:
                                     job.add('--replace-read-ids','=',kind='parameter')
@@ -11094,6 +10760,7 @@ if __name__ == "__main__":
                         job.clean(outdir('log_bowtie2_reads-gene-gene.stdout.txt.')+str(i),temp_path=temp_flag)
 
                         job.add(_FC_+'sam2psl.py',kind='program')
+                        job.add('--processes',options.processes,kind='parameter',checksum='no')
                         job.add('--input',outdir('gene-gene-bowtie2.sam.')+str(i),kind='input',temp_path=temp_flag)
                         job.add('--output','-',kind='output')
                         job.add('|',kind='parameter')
@@ -11483,6 +11150,7 @@ if __name__ == "__main__":
                             job.run()
 
                             job.add(_FC_+'sam2psl.py',kind='program')
+                            job.add('--processes',options.processes,kind='parameter',checksum='no')
                             job.add('--input',outdir('split_gene-gene_bowtie2_patch.sam.')+str(i),kind='input',temp_path=temp_flag)
                             #job.add('--output',outdir('split_gene-gene_bowtie2_patch.psl.')+str(i),kind='output')
                             job.add('--output','-',kind='parameter')
@@ -11576,6 +11244,7 @@ if __name__ == "__main__":
                     job.clean(outdir('log_bowtie2_reads-gene-gene.stdout.txt'),temp_path=temp_flag)
 
                     job.add(_FC_+'sam2psl.py',kind='program')
+                    job.add('--processes',options.processes,kind='parameter',checksum='no')
                     job.add('--input',outdir('gene-gene-bowtie2.sam'),kind='input',temp_path=temp_flag)
                     job.add('--output','-',kind='output')
                     job.add('|',kind='parameter')
@@ -11949,6 +11618,7 @@ if __name__ == "__main__":
                         job.run()
 
                         job.add(_FC_+'sam2psl.py',kind='program')
+                        job.add('--processes',options.processes,kind='parameter',checksum='no')
                         job.add('--input',outdir('split_gene-gene_bowtie2_patch.sam'),kind='input',temp_path=temp_flag)
                         #job.add('--output',outdir('split_gene-gene_bowtie2_patch.psl'),kind='output')
                         job.add('--output','-',kind='parameter')
@@ -12162,34 +11832,47 @@ if __name__ == "__main__":
                 job.run()
 
                 # deduplicate
-                job.add('LC_ALL=C',kind='program')
-                job.add('cat',kind='parameter')
-                job.add('',freads[i]+'_merg.fq',kind='input',temp_path=temp_flag)
-                job.add('|',kind='parameter')
-                job.add('LC_ALL=C',kind='parameter')
-                job.add('paste','- - - -',kind='parameter')
-                job.add('|',kind='parameter')
-                job.add('LC_ALL=C',kind='parameter')
-                job.add('sort',kind='parameter')
-                job.add('-k','2,2',kind='parameter')
-                job.add('-u',kind='parameter') # unique
-                job.add('-t',"'\t'",kind='parameter')
-                if sort_buffer:
-                    job.add('--buffer-size',sort_buffer,kind='parameter',checksum='no')
-                if sort_parallel:
+                if options.internal_sort:
+                    job.add(_FC_+'sort_records.py',kind='program')
+                    job.add('--input',freads[i]+'_merg.fq',kind='input',temp_path=temp_flag)
+                    job.add('--fastq',kind='parameter')
+                    job.add('-k','2,2',kind='parameter')
+                    job.add('-u',kind='parameter') # unique
+                    if sort_buffer:
+                        job.add('--buffer-size',sort_buffer,kind='parameter',checksum='no')
                     job.add('--parallel',options.processes,kind='parameter',checksum='no')
-                if sort_lzop_compress:
-                    job.add('--compress-program','lzop',kind='parameter',checksum='no')
-                elif sort_gzip_compress:
-                    job.add('--compress-program','gzip',kind='parameter',checksum='no')
-                job.add('-T',tmp_dir,kind='parameter',checksum='no')
-                job.add('|',kind='parameter')
-                job.add('LC_ALL=C',kind='parameter')
-                job.add('tr',kind='parameter')
-                job.add('"\\t"',kind='parameter')
-                job.add('"\\n"',kind='parameter')
-                job.add('>',freads[i]+'_merged.fq',kind='output')
-                job.run()
+                    job.add('-T',tmp_dir,kind='parameter',checksum='no')
+                    job.add('--output',freads[i]+'_merged.fq',kind='output')
+                    job.run()
+                else:
+                    job.add('LC_ALL=C',kind='program')
+                    job.add('cat',kind='parameter')
+                    job.add('',freads[i]+'_merg.fq',kind='input',temp_path=temp_flag)
+                    job.add('|',kind='parameter')
+                    job.add('LC_ALL=C',kind='parameter')
+                    job.add('paste','- - - -',kind='parameter')
+                    job.add('|',kind='parameter')
+                    job.add('LC_ALL=C',kind='parameter')
+                    job.add('sort',kind='parameter')
+                    job.add('-k','2,2',kind='parameter')
+                    job.add('-u',kind='parameter') # unique
+                    job.add('-t',"'\t'",kind='parameter')
+                    if sort_buffer:
+                        job.add('--buffer-size',sort_buffer,kind='parameter',checksum='no')
+                    if sort_parallel:
+                        job.add('--parallel',options.processes,kind='parameter',checksum='no')
+                    if sort_lzop_compress:
+                        job.add('--compress-program','lzop',kind='parameter',checksum='no')
+                    elif sort_gzip_compress:
+                        job.add('--compress-program','gzip',kind='parameter',checksum='no')
+                    job.add('-T',tmp_dir,kind='parameter',checksum='no')
+                    job.add('|',kind='parameter')
+                    job.add('LC_ALL=C',kind='parameter')
+                    job.add('tr',kind='parameter')
+                    job.add('"\\t"',kind='parameter')
+                    job.add('"\\n"',kind='parameter')
+                    job.add('>',freads[i]+'_merged.fq',kind='output')
+                    job.run()
 
                 job.add('LC_ALL=C',kind='program')
                 job.add('cat',kind='parameter')
@@ -12518,6 +12201,7 @@ if __name__ == "__main__":
 
 
                     job.add('sam2psl.py',kind='program')
+                    job.add('--processes',options.processes,kind='parameter',checksum='no')
                     job.add('--input',outdir('focus.sam.'+str(i)),kind='input',temp_path=temp_flag)
                     job.add('--read-seq',kind='parameter')
                     job.add('--output','-',kind='parameter')
@@ -12696,6 +12380,16 @@ if __name__ == "__main__":
         job.add('--compress-transcripts',kind='parameter')
     job.run()
 
+    job.link(datadir('final-list_candidate-fusion-genes.caption.md.txt'),
+             outdir('final-list_candidate-fusion-genes.caption.md.txt'),
+             temp_path = 'no',
+             kind = 'copy')
+
+    # the final reports are independent of each other (the BLAT/STAR/BOWTIE2
+    # branches above are not run in a parallel region because they choose
+    # their next steps by reading in Python the files given by their previous
+    # steps, and their many IFF/LINK/CLEAN steps would run the queue anyway)
+    job.parallel_start()
 
     job.add('zip',kind='program')
     job.add('-j',kind='parameter')
@@ -12742,11 +12436,6 @@ if __name__ == "__main__":
     job.add('--output',outdir('summary_candidate_fusions.txt'),kind='output')
     job.run()
 
-    job.link(datadir('final-list_candidate-fusion-genes.caption.md.txt'),
-             outdir('final-list_candidate-fusion-genes.caption.md.txt'),
-             temp_path = 'no',
-             kind = 'copy')
-
     job.add('LC_ALL=C',kind='program')
     job.add('awk',kind='parameter')
     job.add("""'(NR==1) || (($3>%d) && ($7=="skipped"))'""" % (spanning_pairs_minimum-1,),outdir('preliminary-list_candidate-fusion-genes.txt'),kind='input')
@@ -12764,6 +12453,7 @@ if __name__ == "__main__":
     job.add('>',outdir('junk-chimeras.txt'),kind='output')
     job.run()
 
+    job.parallel_end()
 
     # save the preliminary candidates to info file
     info(job,
@@ -12899,6 +12589,8 @@ if __name__ == "__main__":
 
     job.clean(tmp_dir,temp_path='yes')
 
+    if resident_indexes:
+        index_keeper.release(resident_indexes)
 
     job.close()
 
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+It keeps the indexes of the aligners (e.g. Bowtie) resident in memory (i.e. in
+the page cache) while they are used by one or more runs of FusionCatcher on the
+same computer, such that the index files are not read again from disk by every
+alignment step.
+
+A user (i.e. a running FusionCatcher, identified by its PID) registers itself
+for an index (see 'acquire') and one keeper process per index maps the index
+files in memory and it touches their pages regularly. The keeper counts the
+users of its index (a user which is not running anymore is removed
+automatically) and it unloads the index when the last user releases it (see
+'release'). Bowtie should be run with '--mm' in order to use the same pages of
+the index files instead of loading its own copy of the index.
+
+
+
+Author: Daniel Nicorici, Daniel.Nicorici@gmail.com
+
+Copyright (c) 2009-2019 Daniel Nicorici
+
+This file is part of FusionCatcher.
+
+FusionCatcher is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FusionCatcher is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with FusionCatcher (see file 'COPYING.txt').  If not, see
+<http://www.gnu.org/licenses/>.
+
+By default, FusionCatcher is running BLAT aligner
+<http://users.soe.ucsc.edu/~kent/src/> but it offers also the option to disable
+all its scripts which make use of BLAT aligner if you choose explicitly to do so.
+BLAT's license does not allow to be used for commercial activities. If BLAT
+license does not allow to be used in your case then you may still use
+FusionCatcher by forcing not use the BLAT aligner by specifying the option
+'--skip-blat'. Fore more information regarding BLAT please see its license.
+
+Please, note that FusionCatcher does not require BLAT in order to find
+candidate fusion genes!
+
+This file is not running/executing/using BLAT.
+"""
+import os
+import sys
+import time
+import mmap
+import errno
+import fcntl
+import glob
+import hashlib
+import tempfile
+import optparse
+import subprocess
+
+
+#########################
+def default_root():
+    # the directory where the users and the keepers of the indexes are registered
+    return os.path.join(tempfile.gettempdir(),'fusioncatcher-indexes-%d' % (os.getuid(),))
+
+#########################
+def _path(index, root = None):
+    # the directory where the users and the keeper of an index are registered
+    if not root:
+        root = default_root()
+    index = os.path.abspath(index)
+    return os.path.join(root,hashlib.md5(index).hexdigest())
+
+#########################
+def _alive(pid):
+    try:
+        os.kill(pid,0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+#########################
+def files(index):
+    # the files of an index given as a directory or as a prefix
+    if os.path.isdir(index):
+        r = [os.path.join(index,f) for f in os.listdir(index)]
+    else:
+        r = glob.glob(index+'*')
+    return sorted([f for f in r if os.path.isfile(f) and os.path.getsize(f) > 0])
+
+#########################
+def users(index, root = None):
+    # it gives the PIDs of the running users of an index (the users which are
+    # not running anymore are removed)
+    d = os.path.join(_path(index,root),'users')
+    r = []
+    if os.path.isdir(d):
+        for f in os.listdir(d):
+            if f.isdigit() and _alive(int(f)):
+                r.append(int(f))
+            else:
+                try:
+                    os.remove(os.path.join(d,f))
+                except OSError:
+                    pass
+    return r
+
+#########################
+def acquire(indexes, pid = None, root = None):
+    # it registers PID (the current process by default) as user of the
+    # INDEXES and it starts their keepers (if they are not running already)
+    if pid is None:
+        pid = os.getpid()
+    if not root:
+        root = default_root()
+    script = os.path.abspath(__file__)
+    if script.endswith('.pyc'):
+        script = script[:-1]
+    devnull = open(os.devnull,'r+')
+    for index in indexes:
+        d = os.path.join(_path(index,root),'users')
+        if not os.path.isdir(d):
+            try:
+                os.makedirs(d)
+            except OSError:
+                if not os.path.isdir(d):
+                    raise
+        file(os.path.join(d,str(pid)),'w').write(os.path.abspath(index)+'\n')
+        # a keeper exits immediately if another one is running for the same index
+        subprocess.Popen([sys.executable,
+                          script,
+                          '--keep',os.path.abspath(index),
+                          '--root',root],
+                         stdin = devnull,
+                         stdout = devnull,
+                         stderr = devnull,
+                         close_fds = True,
+                         preexec_fn = os.setsid)
+    devnull.close()
+
+#########################
+def release(indexes, pid = None, root = None):
+    # it unregisters PID (the current process by default) as user of the
+    # INDEXES; the keeper unloads an index after its last user is gone
+    if pid is None:
+        pid = os.getpid()
+    for index in indexes:
+        f = os.path.join(_path(index,root),'users',str(pid))
+        if os.path.exists(f):
+            os.remove(f)
+
+#########################
+def touch(maps):
+    # it reads one byte from every page such that the pages are (kept) in memory
+    for m in maps:
+        for i in xrange(0,len(m),mmap.PAGESIZE):
+            m[i]
+
+#########################
+def keep(index, root = None, interval = 5, refresh = 300):
+    # it keeps the files of the INDEX in memory as long as there are users
+    base = _path(index,root)
+    lock = open(os.path.join(base,'keeper.lock'),'a')
+    try:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError:
+        lock.close()
+        return False # another keeper is running
+    maps = []
+    for f in files(index):
+        h = open(f,'rb')
+        maps.append(mmap.mmap(h.fileno(),0,access = mmap.ACCESS_READ))
+        h.close()
+    touch(maps)
+    last = time.time()
+    while True:
+        while users(index,root):
+            time.sleep(interval)
+            if time.time() - last > refresh:
+                touch(maps)
+                last = time.time()
+        fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+        # a new user might have been registered just before the lock was
+        # released and its keeper gave up because the lock was still taken
+        # => this keeper continues (unless another keeper took the lock)
+        if not users(index,root):
+            break
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            break
+    for m in maps:
+        m.close()
+    lock.close()
+    return True
+
+#########################
+if __name__ == '__main__':
+
+    #command line parsing
+
+    usage = "%prog [options]"
+    description = """It keeps the indexes of the aligners (e.g. Bowtie) in memory while they are used by one or more runs of FusionCatcher on the same computer."""
+    version = "%prog 0.10 beta"
+
+    parser = optparse.OptionParser(usage = usage, description = description, version = version)
+
+    parser.add_option("--keep",
+                      action = "store",
+                      type = "string",
+                      dest = "keep",
+                      help = """It keeps in memory the given index (directory or prefix) as long as it has users.""")
+
+    parser.add_option("--acquire",
+                      action = "store",
+                      type = "string",
+                      dest = "acquire",
+                      help = """The given indexes (comma separated) are acquired for the process given by '--pid' and they are loaded in memory.""")
+
+    parser.add_option("--release",
+                      action = "store",
+                      type = "string",
+                      dest = "release",
+                      help = """The given indexes (comma separated) are released for the process given by '--pid'.""")
+
+    parser.add_option("--pid",
+                      action = "store",
+                      type = "int",
+                      dest = "pid",
+                      help = """The PID of the process using the indexes. Default is the parent process.""")
+
+    parser.add_option("--root",
+                      action = "store",
+                      type = "string",
+                      dest = "root",
+                      help = """The directory where the users of the indexes are registered. Default is a directory in the temporary directory of the system.""")
+
+    (options,args) = parser.parse_args()
+
+    # validate options
+    if not (options.keep or options.acquire or options.release):
+        parser.print_help()
+        sys.exit(1)
+
+    pid = options.pid if options.pid else os.getppid()
+
+    # running
+    if options.keep:
+        keep(options.keep, options.root)
+    elif options.acquire:
+        acquire(options.acquire.split(','), pid, options.root)
+    elif options.release:
+        release(options.release.split(','), pid, options.root)
+    #
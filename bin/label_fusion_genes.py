@@ -42,6 +42,252 @@ This file is not running/executing/using BLAT.
 import sys
 import os
 import optparse
+import label_index
+
+
+#
+# the databases are read only once even if they are used by several labels
+#
+_cache = dict()
+
+def read_gene_pairs(filename, threshold = 0):
+    """
+    It reads a database of pairs of genes (two columns, tab separated, and no
+    header; the order of genes in a pair is ignored). If THRESHOLD > 0 then
+    only the pairs with a third column >= THRESHOLD are kept.
+    """
+    k = ('pairs', filename, threshold)
+    if k in _cache:
+        return _cache[k]
+    homologs = set()
+    print "Reading...",filename
+    if os.path.isfile(filename) or os.path.islink(filename):
+        if threshold and threshold > 0:
+            homologs = [line.rstrip('\r\n').split('\t')[:3] for line in file(filename,'r') if line.rstrip('\r\n')]
+            homologs = [line[:2] for line in homologs if len(line)>2 and line[2].isdigit() and int(line[2])>=threshold]
+            homologs=set(['\t'.join(sorted(line)) for line in homologs])
+        else:
+            homologs=set(['\t'.join(sorted(line.rstrip('\r\n').split('\t')[:2])) for line in file(filename,'r') if line.rstrip('\r\n')])
+    _cache[k] = homologs
+    return homologs
+
+
+def read_genes(filename):
+    """
+    It reads a database of genes (one gene per line).
+    """
+    k = ('genes', filename)
+    if k in _cache:
+        return _cache[k]
+    print "Reading...",filename
+    no_proteins=set([line.rstrip('\r\n') for line in file(filename,'r') if line.rstrip('\r\n')])
+    _cache[k] = no_proteins
+    return no_proteins
+
+
+def read_genes_positions(filename):
+    """
+    It reads the positions of genes from a database of exons, e.g.
+    'more_exons_ensembl.txt'.
+    """
+    k = ('positions', filename)
+    if k in _cache:
+        return _cache[k]
+    genes = {}
+    print "Processing the exons database...",filename
+    # ensembl_peptide_id             0
+    # ensembl_gene_id                1
+    # ensembl_transcript_id          2
+    # ensembl_exon_id                3
+    # exon_chrom_start               4
+    # exon_chrom_end                 5
+    # rank                           6
+    # start_position                 7
+    # end_position                   8
+    # transcript_start               9
+    # transcript_end                 10
+    # strand                         11
+    # chromosome_name                12
+    # cds_start                      13
+    # cds_end                        14
+    # 5_utr_start                    15
+    # 5_utr_end                      16
+    # 3_utr_start                    17
+    # 3_utr_end                      18
+    # the database is read line by line (only the first exon of each gene is
+    # needed for getting the gene position)
+    for line in file(filename,'r'):
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        line = line.split('\t')
+        gn = line[1]
+        if gn in genes:
+            continue
+        gs = int(line[7])
+        ge = int(line[8])
+        st = int(line[11])
+        ch = line[12]
+        if gs > ge:
+            (gs,ge) = (ge,gs)
+        genes[gn] = {'start':gs,
+                     'end':ge,
+                     'strand':st,
+                     'chrom':ch}
+    _cache[k] = genes
+    return genes
+
+
+def read_manifest(filename):
+    """
+    It reads a manifest of labels which are applied one after another (in the
+    given order). It is a tab-separated text file (no header) with columns:
+    label, kind, database, and threshold (optional). The kind can be:
+    'pairs' (database of pairs of genes, the threshold is the minimum value
+    of its third column), 'genes' (database of genes), or 'distance' (database
+    of exons and the threshold is the maximum distance in bp between genes).
+    """
+    manifest = []
+    for line in file(filename,'r'):
+        line = line.rstrip('\r\n')
+        if (not line) or line.startswith('#'):
+            continue
+        t = line.split('\t')
+        if len(t) < 3 or t[1] not in ('pairs','genes','distance'):
+            print >>sys.stderr,"ERROR: Wrong line in the manifest '%s': '%s'" % (filename,line)
+            sys.exit(1)
+        threshold = int(t[3]) if len(t) > 3 and t[3] else 0
+        manifest.append({'label': t[0],
+                         'kind': t[1],
+                         'database': t[2],
+                         'threshold': threshold,
+                         'similar_gene_symbols': False})
+    return manifest
+
+
+def genes_distances(data, genes):
+    """
+    It computes (only once for all the thresholds) the distance between the
+    genes of each pair of genes which are on the same chromosome and strand.
+    GENES gives the position of a gene (see 'read_genes_positions').
+    """
+    distances = dict()
+    for line in data:
+        a = line[0]
+        b = line[1]
+        if (a, b) in distances:
+            continue
+        d = None
+        if genes.has_key(a) and genes.has_key(b):
+            ga = genes[a]
+            gb = genes[b]
+            if ga["chrom"] == gb["chrom"] and ga["strand"] == gb["strand"]:
+                d = min([abs(ga["start"]-gb["start"]),
+                         abs(ga["start"]-gb["end"]),
+                         abs(ga["end"]-gb["start"]),
+                         abs(ga["end"]-gb["end"])])
+        distances[(a, b)] = d
+    return distances
+
+
+def label_by_distance(data, label_col, label, distances, distance):
+    """
+    It labels the pairs of genes which are on the same strand and at a distance
+    below a given threshold. DISTANCES is given by 'genes_distances'.
+    """
+    temp = []
+    for line in data:
+        d = distances.get((line[0], line[1]), None)
+        if d is not None and d <= distance:
+            if label_col:
+                temp.append(line+[label])
+            else:
+                if line[-1]:
+                    temp.append(line[:-1]+[','.join([line[-1],label])])
+                else:
+                    temp.append(line[:-1]+[label])
+        else:
+            if label_col:
+                temp.append(line+[''])
+            else:
+                temp.append(line)
+    return temp
+
+
+def label_by_filter(data, label_col, label, homologs, no_proteins, similar_gene_symbols = False):
+    """
+    It labels the pairs of genes which are found in the database of pairs of
+    genes (HOMOLOGS) or which contain one gene found in the database of genes
+    (NO_PROTEINS).
+    """
+    temp = []
+    similar = 'similar_symbols'
+    myset = set(['.','-','_'])
+
+    def handle_hyphen(cba,card):
+        cba = cba.lower().strip()
+        for ix in xrange(100,-1,-1):
+            kx = "%s%d" % (card.lower(),ix)
+            if cba.endswith(kx):
+                cba = cba.replace(kx,'')
+                break
+        return cba
+
+    original_label = label
+    for line in data:
+        a=line[0]
+        b=line[1]
+        c = line[3].lower()
+        d = line[4].lower()
+        flag = False
+
+        if (similar_gene_symbols and
+            c and
+            d and
+            (
+            (
+            len(c) > 3 and
+            len(d) > 3 and
+            (
+             (c[:-1] == d[:-1] and c[-1] in myset) or
+             (c[:-2] == d[:-2] and c[-2] in myset) or
+             (c[:-1] == d[:-2] and c[-1] in myset) or
+             (c[:-2] == d[:-1] and c[-2] in myset)
+            )
+            ) or
+            (c == d) or
+            (handle_hyphen(c,'-as') == handle_hyphen(d,'-as')) or
+            (handle_hyphen(c,'-it') == handle_hyphen(d,'-it'))
+            )
+
+            ):
+            label = original_label + ',' + similar
+            flag = True
+        else:
+            label = original_label
+
+        g='\t'.join(sorted([a,b]))
+        if (g in homologs) or (a in no_proteins) or (b in no_proteins):
+            if label_col:
+                temp.append(line+[label])
+            else:
+                if line[-1]:
+                    temp.append(line[:-1]+[','.join([line[-1],label])])
+                else:
+                    temp.append(line[:-1]+[label])
+        else:
+            if label_col:
+                if flag:
+                    temp.append(line+[similar])
+                else:
+                    temp.append(line+[''])
+            else:
+                if flag:
+                    temp.append(line[:-1]+[','.join([line[-1],similar])])
+                else:
+                    temp.append(line)
+    return temp
+
 
 if __name__ == '__main__':
 
@@ -49,7 +295,7 @@ if __name__ == '__main__':
 
     usage="%prog [options]"
     description="""It labels the candidate list of fusion genes generated by 'find_fusion_genes.py'."""
-    version="%prog 0.10 beta"
+    version="%prog 0.11 beta"
 
     parser=optparse.OptionParser(usage=usage,description=description,version=version)
 
@@ -86,6 +332,18 @@ if __name__ == '__main__':
                       dest="label",
                       help="""Label used to mark the candidate fusion genes which are founf in the filter.""")
 
+    parser.add_option("--manifest",
+                      action="store",
+                      type="string",
+                      dest="input_manifest_filename",
+                      help="""A tab-separated text file (no header) containing several labels which are applied one after another in one pass (as if this script would be run once for each label). The columns are: label, kind, database, and threshold (optional), where kind can be 'pairs' (i.e. like '--filter_gene_pairs' and '--filter_gene_pairs_threshold'), 'genes' (i.e. like '--filter_genes'), or 'distance' (i.e. like '--min_dist_gene_gene_database' and '--min_dist_gene_gene'). If this is used then '--label', '--filter_gene_pairs', '--filter_genes', and '--min_dist_gene_gene' are ignored.""")
+
+    parser.add_option("--index",
+                      action="store",
+                      type="string",
+                      dest="input_index_filename",
+                      help="""A precompiled index of the databases of genes, pairs of genes, and positions of genes (see 'label_index.py'). The databases which are found in the index (and which have not been changed since the index has been built) are not read anymore.""")
+
     parser.add_option("--output_fusion_genes",
                       action="store",
                       type="string",
@@ -118,84 +376,46 @@ if __name__ == '__main__':
     # validate options
     if not (options.input_fusion_genes_filename and
             options.output_fusion_genes_filename and
-            options.label
+            (options.label or options.input_manifest_filename)
             ):
         parser.print_help()
         parser.error("One of the options has not been specified.")
         sys.exit(1)
 
-    if not (options.input_filter_gene_pairs_filename or options.input_filter_genes_filename or options.input_min_dist_gene_gene):
-        parser.error("At least one of the options '--filter_gene_pairs' or '--filter_genes' or '--min_dist_gene_gene should be specified.")
-        sys.exit(1)
-
-    if options.input_filter_gene_pairs_filename and options.input_filter_genes_filename:
-        parser.error("Only one if the options '--filter_gene_pairs' or '--filter_genes' should be specified.")
-        sys.exit(1)
-
-    if (((not options.input_min_dist_gene_gene_database_filename) and options.input_min_dist_gene_gene) or
-       (options.input_min_dist_gene_gene_database_filename and (not options.input_min_dist_gene_gene))):
-        parser.error("Both command line parameters are needed to be specified '--min_dist_gene_gene' and '--min_dist_gene_gene_database'.")
-        sys.exit(1)
-
-
-    homologs = set()
-    if options.input_filter_gene_pairs_filename:
-        print "Reading...",options.input_filter_gene_pairs_filename
-        if os.path.isfile(options.input_filter_gene_pairs_filename) or os.path.islink(options.input_filter_gene_pairs_filename):
-            if options.input_filter_gene_pairs_threshold and options.input_filter_gene_pairs_threshold > 0:
-                homologs = [line.rstrip('\r\n').split('\t')[:3] for line in file(options.input_filter_gene_pairs_filename,'r') if line.rstrip('\r\n')]
-                homologs = [line[:2] for line in homologs if len(line)>2 and line[2].isdigit() and int(line[2])>=options.input_filter_gene_pairs_threshold]
-                homologs=set(['\t'.join(sorted(line)) for line in homologs])
-            else:
-                homologs=set(['\t'.join(sorted(line.rstrip('\r\n').split('\t')[:2])) for line in file(options.input_filter_gene_pairs_filename,'r') if line.rstrip('\r\n')])
-
-    no_proteins = set()
-    if options.input_filter_genes_filename:
-        print "Reading...",options.input_filter_genes_filename
-        no_proteins=set([line.rstrip('\r\n') for line in file(options.input_filter_genes_filename,'r') if line.rstrip('\r\n')])
-
-    genes = {}
-    if options.input_min_dist_gene_gene_database_filename:
-        print "Processing the exons database...",options.input_min_dist_gene_gene_database_filename
-        # ensembl_peptide_id             0
-        # ensembl_gene_id                1
-        # ensembl_transcript_id          2
-        # ensembl_exon_id                3
-        # exon_chrom_start               4
-        # exon_chrom_end                 5
-        # rank                           6
-        # start_position                 7
-        # end_position                   8
-        # transcript_start               9
-        # transcript_end                 10
-        # strand                         11
-        # chromosome_name                12
-        # cds_start                      13
-        # cds_end                        14
-        # 5_utr_start                    15
-        # 5_utr_end                      16
-        # 3_utr_start                    17
-        # 3_utr_end                      18
-        exons = [line.rstrip('\r\n').split('\t') for line in file(options.input_min_dist_gene_gene_database_filename,'r').readlines() if line.rstrip('\r\n')]
-        exons = [(line[1], # gene_id              0
-                  line[7], # gene_start           1
-                  line[8], # gene_end             2
-                  line[11],# strand               3
-                  line[12] # chromosome           4
-                  ) for line in exons]
-        for line in exons:
-            gn = line[0]
-            gs = int(line[1])
-            ge = int(line[2])
-            st = int(line[3])
-            ch = line[4]
-            if gs > ge:
-                (gs,ge) = (ge,gs)
-            if gn not in genes:
-                genes[gn] = {'start':gs,
-                             'end':ge,
-                             'strand':st,
-                             'chrom':ch}
+    if options.input_manifest_filename:
+        manifest = read_manifest(options.input_manifest_filename)
+    else:
+        if not (options.input_filter_gene_pairs_filename or options.input_filter_genes_filename or options.input_min_dist_gene_gene):
+            parser.error("At least one of the options '--filter_gene_pairs' or '--filter_genes' or '--min_dist_gene_gene should be specified.")
+            sys.exit(1)
+
+        if options.input_filter_gene_pairs_filename and options.input_filter_genes_filename:
+            parser.error("Only one if the options '--filter_gene_pairs' or '--filter_genes' should be specified.")
+            sys.exit(1)
+
+        if (((not options.input_min_dist_gene_gene_database_filename) and options.input_min_dist_gene_gene) or
+           (options.input_min_dist_gene_gene_database_filename and (not options.input_min_dist_gene_gene))):
+            parser.error("Both command line parameters are needed to be specified '--min_dist_gene_gene' and '--min_dist_gene_gene_database'.")
+            sys.exit(1)
+
+        if options.input_min_dist_gene_gene:
+            manifest = [{'label': options.label,
+                         'kind': 'distance',
+                         'database': options.input_min_dist_gene_gene_database_filename,
+                         'threshold': options.input_min_dist_gene_gene,
+                         'similar_gene_symbols': options.similar_gene_symbols}]
+        elif options.input_filter_gene_pairs_filename:
+            manifest = [{'label': options.label,
+                         'kind': 'pairs',
+                         'database': options.input_filter_gene_pairs_filename,
+                         'threshold': options.input_filter_gene_pairs_threshold,
+                         'similar_gene_symbols': options.similar_gene_symbols}]
+        else:
+            manifest = [{'label': options.label,
+                         'kind': 'genes',
+                         'database': options.input_filter_genes_filename,
+                         'threshold': 0,
+                         'similar_gene_symbols': options.similar_gene_symbols}]
 
 
     print "Reading...",options.input_fusion_genes_filename
@@ -207,114 +427,63 @@ if __name__ == '__main__':
     #...
     data=[line.rstrip('\r\n').split('\t') for line in file(options.input_fusion_genes_filename,'r').readlines() if line.rstrip('\r\n')]
     header=data.pop(0)
-    # add the labels on column no. 6
-    label_col = False
-    if len(header) == 5:
-        label_col = True
-        header.append('Fusion_description')
-    temp = []
-    label = options.label
-
-
-    if options.input_min_dist_gene_gene:
-        # deal with the distance between genes and label accordingly
-        for line in data:
-            a = line[0]
-            b = line[1]
-
-
-            if (genes.has_key(a) and
-                genes.has_key(b) and
-                genes[a]["chrom"] == genes[b]["chrom"] and
-                genes[a]["strand"] == genes[b]["strand"] and
-                min([abs(genes[a]["start"]-genes[b]["start"]),
-                     abs(genes[a]["start"]-genes[b]["end"]),
-                     abs(genes[a]["end"]-genes[b]["start"]),
-                     abs(genes[a]["end"]-genes[b]["end"])]) <= options.input_min_dist_gene_gene
-               ):
-                if label_col:
-                    temp.append(line+[label])
-                else:
-                    if line[-1]:
-                        temp.append(line[:-1]+[','.join([line[-1],label])])
-                    else:
-                        temp.append(line[:-1]+[label])
-            else:
-                if label_col:
-                    temp.append(line+[''])
-                else:
-                    temp.append(line)
-
-
-    else:
-        similar = 'similar_symbols'
-        myset = set(['.','-','_'])
-
-        def handle_hyphen(cba,card):
-            cba = cba.lower().strip()
-            for ix in xrange(100,-1,-1):
-                kx = "%s%d" % (card.lower(),ix)
-                if cba.endswith(kx):
-                    cba = cba.replace(kx,'')
-                    break
-            return cba
-
-        for line in data:
-            a=line[0]
-            b=line[1]
-            c = line[3].lower()
-            d = line[4].lower()
-            flag = False
-
-            if (options.similar_gene_symbols and
-                c and
-                d and
-                (
-                (
-                len(c) > 3 and
-                len(d) > 3 and
-                (
-                 (c[:-1] == d[:-1] and c[-1] in myset) or
-                 (c[:-2] == d[:-2] and c[-2] in myset) or
-                 (c[:-1] == d[:-2] and c[-1] in myset) or
-                 (c[:-2] == d[:-1] and c[-2] in myset)
-                )
-                ) or
-                (c == d) or
-                (handle_hyphen(c,'-as') == handle_hyphen(d,'-as')) or
-                (handle_hyphen(c,'-it') == handle_hyphen(d,'-it'))
-                )
-
-                ):
-                label = options.label + ',' + similar
-                flag = True
-            else:
-                label = options.label
-
-            g='\t'.join(sorted([a,b]))
-            if (g in homologs) or (a in no_proteins) or (b in no_proteins):
-                if label_col:
-                    temp.append(line+[label])
-                else:
-                    if line[-1]:
-                        temp.append(line[:-1]+[','.join([line[-1],label])])
-                    else:
-                        temp.append(line[:-1]+[label])
-            else:
-                if label_col:
-                    if flag:
-                        temp.append(line+[similar])
-                    else:
-                        temp.append(line+[''])
-                else:
-                    if flag:
-                        temp.append(line[:-1]+[','.join([line[-1],similar])])
-                    else:
-                        temp.append(line)
-
-#            print c,d,temp
 
-    data=sorted(temp,key=lambda x: ( (-int(x[2]),x[0],x[1]) ) )
+    index = None
+    if options.input_index_filename and (os.path.isfile(options.input_index_filename) or os.path.islink(options.input_index_filename)):
+        print "Using the index...",options.input_index_filename
+        index = label_index.index(options.input_index_filename)
+
+    for m in manifest:
+        print "Labeling with '%s'..." % (m['label'],)
+        # add the labels on column no. 6
+        label_col = False
+        if len(header) == 5:
+            label_col = True
+            header.append('Fusion_description')
+
+        if m['kind'] == 'distance':
+            k = ('distances', m['database'])
+            if k not in _cache:
+                genes = None
+                if index:
+                    genes = index.positions(m['database'])
+                if genes is None:
+                    genes = read_genes_positions(m['database'])
+                _cache[k] = genes_distances(data, genes)
+            data = label_by_distance(data,
+                                     label_col,
+                                     m['label'],
+                                     _cache[k],
+                                     m['threshold'])
+        elif m['kind'] == 'pairs':
+            homologs = None
+            if index and not m['threshold']:
+                homologs = index.pairs(m['database'])
+            if homologs is None:
+                homologs = read_gene_pairs(m['database'],m['threshold'])
+            data = label_by_filter(data,
+                                   label_col,
+                                   m['label'],
+                                   homologs,
+                                   set(),
+                                   m['similar_gene_symbols'])
+        else:
+            no_proteins = None
+            if index:
+                no_proteins = index.genes(m['database'])
+            if no_proteins is None:
+                no_proteins = read_genes(m['database'])
+            data = label_by_filter(data,
+                                   label_col,
+                                   m['label'],
+                                   set(),
+                                   no_proteins,
+                                   m['similar_gene_symbols'])
+
+    if index:
+        index.close()
+
+    data=sorted(data,key=lambda x: ( (-int(x[2]),x[0],x[1]) ) )
     data.insert(0,header)
     file(options.output_fusion_genes_filename,'w').writelines(['\t'.join(line)+'\n' for line in data])
 
@@ -0,0 +1,420 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+It builds (and reads) a precompiled index of the databases of genes and pairs
+of genes which are used for labeling the candidate fusion genes (e.g. 'known.txt',
+'banned.txt', 'paralogs.txt', 'pseudogenes.txt', etc.), such that these databases
+do not need to be parsed again for every run.
+
+The index is a binary file which is used thru 'mmap' (i.e. it is not parsed) and
+it contains:
+- the list of labels (i.e. the names of the databases together with their size
+  and modification time, which are used to find out if a database has changed
+  after the index has been built),
+- the sorted list of the genes found in the databases (fixed width),
+- a bit flag for each label and each gene,
+- the sorted list of the pairs of genes found in the databases (encoded as
+  64-bit integers, i.e. the indexes of the two genes),
+- a bit flag for each label and each pair of genes, and
+- the positions of genes (i.e. chromosome, start, end, and strand) which are
+  taken from a database of exons (e.g. 'exons.txt'); these are used for
+  labeling the pairs of genes which are close to each other.
+
+
+
+Author: Daniel Nicorici, Daniel.Nicorici@gmail.com
+
+Copyright (c) 2009-2019 Daniel Nicorici
+
+This file is part of FusionCatcher.
+
+FusionCatcher is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FusionCatcher is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with FusionCatcher (see file 'COPYING.txt').  If not, see
+<http://www.gnu.org/licenses/>.
+
+By default, FusionCatcher is running BLAT aligner
+<http://users.soe.ucsc.edu/~kent/src/> but it offers also the option to disable
+all its scripts which make use of BLAT aligner if you choose explicitly to do so.
+BLAT's license does not allow to be used for commercial activities. If BLAT
+license does not allow to be used in your case then you may still use
+FusionCatcher by forcing not use the BLAT aligner by specifying the option
+'--skip-blat'. Fore more information regarding BLAT please see its license.
+
+Please, note that FusionCatcher does not require BLAT in order to find
+candidate fusion genes!
+
+This file is not running/executing/using BLAT.
+"""
+import sys
+import os
+import optparse
+import struct
+import mmap
+
+MAGIC = 'FCLBLIDX'
+VERSION = 2
+HEADER = '<8sIIIIIQ' # magic, version, labels, words, width, genes, pairs
+LABEL = '<cQdH' # kind, size, modification time, length of name
+POSITION = '<iIIb' # chromosome (-1 if not known), start, end, strand
+
+
+def _stamp(filename):
+    """
+    It gives the size and modification time of a file.
+    """
+    st = os.stat(filename)
+    return (st.st_size, st.st_mtime)
+
+
+def build(output_filename, pairs = [], genes = [], exons = None):
+    """
+    It builds the index from the given databases of pairs of genes (PAIRS),
+    databases of genes (GENES), and database of exons (EXONS).
+    """
+    pairs = [el for el in pairs if os.path.isfile(el) or os.path.islink(el)]
+    genes = [el for el in genes if os.path.isfile(el) or os.path.islink(el)]
+    labels = [('p', el) for el in pairs] + [('g', el) for el in genes]
+    if exons and (os.path.isfile(exons) or os.path.islink(exons)):
+        labels.append(('e', exons))
+    words = (len(labels) + 63) // 64
+
+    data_pairs = dict()
+    data_genes = dict()
+    data_positions = dict()
+    for (bit, (kind, filename)) in enumerate(labels):
+        print "Reading...",filename
+        for line in file(filename,'r'):
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            if kind == 'e':
+                # same as 'read_genes_positions' from 'label_fusion_genes.py'
+                t = line.split('\t')
+                if t[1] in data_positions:
+                    continue
+                (gs, ge) = (int(t[7]), int(t[8]))
+                if gs > ge:
+                    (gs, ge) = (ge, gs)
+                data_positions[t[1]] = (t[12], gs, ge, int(t[11]))
+            elif kind == 'p':
+                t = line.split('\t')[:2]
+                if len(t) < 2:
+                    continue
+                k = tuple(sorted(t))
+                data_pairs[k] = data_pairs.get(k, 0) | (1 << bit)
+            else:
+                data_genes[line] = data_genes.get(line, 0) | (1 << bit)
+
+    # all genes are given a number (their position in the sorted list of genes)
+    gene_ids = set(data_genes.keys())
+    gene_ids.update(data_positions.keys())
+    for (a, b) in data_pairs.iterkeys():
+        gene_ids.add(a)
+        gene_ids.add(b)
+    gene_ids = sorted(gene_ids)
+    width = max([len(el) for el in gene_ids]) if gene_ids else 1
+    position = dict([(g, i) for (i, g) in enumerate(gene_ids)])
+    chroms = sorted(set([el[0] for el in data_positions.itervalues()]))
+    chrom_ids = dict([(c, i) for (i, c) in enumerate(chroms)])
+
+    keys = sorted([((position[a] << 32) | position[b], flags) for ((a, b), flags) in data_pairs.iteritems()])
+
+    def split_flags(flags):
+        return [(flags >> (64 * w)) & 0xFFFFFFFFFFFFFFFF for w in xrange(words)]
+
+    print "Writing...",output_filename
+    fout = open(output_filename, 'wb')
+    fout.write(struct.pack(HEADER, MAGIC, VERSION, len(labels), words, width, len(gene_ids), len(keys)))
+    for (kind, filename) in labels:
+        name = os.path.basename(filename)
+        (size, mtime) = _stamp(filename)
+        fout.write(struct.pack(LABEL, kind, size, mtime, len(name)))
+        fout.write(name)
+    for g in gene_ids:
+        fout.write(g.ljust(width, '\0'))
+    for g in gene_ids:
+        fout.write(struct.pack('<%dQ' % (words,), *split_flags(data_genes.get(g, 0))))
+    for (k, flags) in keys:
+        fout.write(struct.pack('<Q', k))
+    for (k, flags) in keys:
+        fout.write(struct.pack('<%dQ' % (words,), *split_flags(flags)))
+    fout.write(struct.pack('<I', len(chroms)))
+    for c in chroms:
+        fout.write(struct.pack('<H', len(c)))
+        fout.write(c)
+    if data_positions:
+        for g in gene_ids:
+            x = data_positions.get(g, None)
+            if x:
+                fout.write(struct.pack(POSITION, chrom_ids[x[0]], x[1], x[2], x[3]))
+            else:
+                fout.write(struct.pack(POSITION, -1, 0, 0, 0))
+    fout.close()
+    print "%d labels, %d genes, %d pairs of genes, and %d positions of genes indexed." % (len(labels), len(gene_ids), len(keys), len(data_positions))
+
+
+class _members:
+    """
+    It gives the genes or the pairs of genes (in the format 'gene1\\tgene2')
+    which have a given label, such that one can use: 'if g in ...'.
+    """
+    def __init__(self, index, bit, kind):
+        self.index = index
+        self.bit = bit
+        self.kind = kind
+
+    def __contains__(self, item):
+        if self.kind == 'p':
+            flags = self.index.pair_flags(item)
+        else:
+            flags = self.index.gene_flags(item)
+        return bool((flags >> self.bit) & 1)
+
+
+class _positions:
+    """
+    It gives the position of a gene as 'read_genes_positions' (from
+    'label_fusion_genes.py') does, i.e. GENES.has_key(g) and GENES[g]['start'].
+    """
+    def __init__(self, index):
+        self.index = index
+
+    def has_key(self, gene):
+        return self.index.gene_position(gene) is not None
+
+    def __contains__(self, gene):
+        return self.has_key(gene)
+
+    def __getitem__(self, gene):
+        x = self.index.gene_position(gene)
+        if x is None:
+            raise KeyError(gene)
+        return x
+
+
+class index:
+    """
+    Reader of the index of labels (it uses 'mmap' and binary search).
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.handle = open(filename, 'rb')
+        self.map = mmap.mmap(self.handle.fileno(), 0, access = mmap.ACCESS_READ)
+        (magic, version, n_labels, self.words, self.width, self.n_genes, self.n_pairs) = struct.unpack_from(HEADER, self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("'%s' is not an index of labels (or it has a different version)!" % (filename,))
+        offset = struct.calcsize(HEADER)
+        self.labels = dict() # name => (bit, kind, size, modification time)
+        for bit in xrange(n_labels):
+            (kind, size, mtime, length) = struct.unpack_from(LABEL, self.map, offset)
+            offset = offset + struct.calcsize(LABEL)
+            name = self.map[offset:offset + length]
+            offset = offset + length
+            self.labels[name] = (bit, kind, size, mtime)
+        self.flags_size = 8 * self.words
+        self.offset_genes = offset
+        self.offset_genes_flags = self.offset_genes + self.n_genes * self.width
+        self.offset_pairs = self.offset_genes_flags + self.n_genes * self.flags_size
+        self.offset_pairs_flags = self.offset_pairs + self.n_pairs * 8
+        offset = self.offset_pairs_flags + self.n_pairs * self.flags_size
+        (n_chroms,) = struct.unpack_from('<I', self.map, offset)
+        offset = offset + 4
+        self.chroms = []
+        for i in xrange(n_chroms):
+            (length,) = struct.unpack_from('<H', self.map, offset)
+            offset = offset + 2
+            self.chroms.append(self.map[offset:offset + length])
+            offset = offset + length
+        self.offset_positions = offset
+        self.position_size = struct.calcsize(POSITION)
+        # the positions are not written if the database of exons is empty
+        self.known_positions = len(self.map) >= self.offset_positions + self.n_genes * self.position_size
+        self.cache_genes = dict()
+        self.cache_pairs = dict()
+        self.cache_positions = dict()
+
+    def __label(self, database, kind):
+        # the database should not have changed after the index has been built
+        r = None
+        x = self.labels.get(os.path.basename(database), None)
+        if x and x[1] == kind and (os.path.isfile(database) or os.path.islink(database)):
+            if (x[2], x[3]) == _stamp(database):
+                r = _members(self, x[0], kind)
+        return r
+
+    def pairs(self, database):
+        """
+        It gives the pairs of genes from the given database or None if the
+        database is not found in the index (or it has changed since).
+        """
+        return self.__label(database, 'p')
+
+    def genes(self, database):
+        """
+        It gives the genes from the given database or None if the database
+        is not found in the index (or it has changed since).
+        """
+        return self.__label(database, 'g')
+
+    def positions(self, database):
+        """
+        It gives the positions of genes from the given database of exons or
+        None if the database is not found in the index (or it has changed since).
+        """
+        r = None
+        if self.__label(database, 'e'):
+            r = _positions(self)
+        return r
+
+    def __flags(self, offset):
+        t = struct.unpack_from('<%dQ' % (self.words,), self.map, offset)
+        flags = 0
+        for (w, v) in enumerate(t):
+            flags = flags | (v << (64 * w))
+        return flags
+
+    def __gene(self, gene):
+        # binary search of the gene in the sorted list of genes
+        if len(gene) > self.width:
+            return -1
+        g = gene.ljust(self.width, '\0')
+        (lo, hi) = (0, self.n_genes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            o = self.offset_genes + mid * self.width
+            v = self.map[o:o + self.width]
+            if v < g:
+                lo = mid + 1
+            elif v > g:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def gene_flags(self, gene):
+        """
+        It gives the labels (bit flags) of a gene.
+        """
+        flags = self.cache_genes.get(gene, None)
+        if flags is None:
+            flags = 0
+            i = self.__gene(gene)
+            if i != -1:
+                flags = self.__flags(self.offset_genes_flags + i * self.flags_size)
+            self.cache_genes[gene] = flags
+        return flags
+
+    def pair_flags(self, pair):
+        """
+        It gives the labels (bit flags) of a pair of genes given as
+        'gene1\\tgene2' (sorted).
+        """
+        flags = self.cache_pairs.get(pair, None)
+        if flags is None:
+            flags = 0
+            t = pair.split('\t')
+            if len(t) == 2:
+                a = self.__gene(t[0])
+                b = self.__gene(t[1])
+                if a != -1 and b != -1:
+                    k = (a << 32) | b
+                    (lo, hi) = (0, self.n_pairs)
+                    while lo < hi:
+                        mid = (lo + hi) // 2
+                        v = struct.unpack_from('<Q', self.map, self.offset_pairs + mid * 8)[0]
+                        if v < k:
+                            lo = mid + 1
+                        elif v > k:
+                            hi = mid
+                        else:
+                            flags = self.__flags(self.offset_pairs_flags + mid * self.flags_size)
+                            break
+            self.cache_pairs[pair] = flags
+        return flags
+
+    def gene_position(self, gene):
+        """
+        It gives the position of a gene as a dictionary (with the keys:
+        'chrom', 'start', 'end', and 'strand') or None if it is not known.
+        """
+        if gene in self.cache_positions:
+            return self.cache_positions[gene]
+        r = None
+        i = self.__gene(gene)
+        if i != -1 and self.known_positions:
+            (c, s, e, st) = struct.unpack_from(POSITION, self.map, self.offset_positions + i * self.position_size)
+            if c != -1:
+                r = {'start': s,
+                     'end': e,
+                     'strand': st,
+                     'chrom': self.chroms[c]}
+        self.cache_positions[gene] = r
+        return r
+
+    def close(self):
+        self.map.close()
+        self.handle.close()
+
+
+if __name__ == '__main__':
+
+    #command line parsing
+
+    usage="%prog [options]"
+    description="""It builds a precompiled index of the databases of genes and pairs of genes used for labeling the candidate fusion genes (see 'label_fusion_genes.py')."""
+    version="%prog 0.10 beta"
+
+    parser=optparse.OptionParser(usage=usage,description=description,version=version)
+
+    parser.add_option("--pairs",
+                      action="store",
+                      type="string",
+                      dest="input_pairs_filenames",
+                      default = "",
+                      help="""The input text files (separated by comma) containing pairs of genes (two columns and no header; the order of genes in the gene pairs is ignored). The files which do not exist are skipped.""")
+
+    parser.add_option("--genes",
+                      action="store",
+                      type="string",
+                      dest="input_genes_filenames",
+                      default = "",
+                      help="""The input text files (separated by comma) containing genes (one gene per line). The files which do not exist are skipped.""")
+
+    parser.add_option("--exons",
+                      action="store",
+                      type="string",
+                      dest="input_exons_filename",
+                      help="""The input database of exons (e.g. 'exons.txt') from where the positions of genes are taken.""")
+
+    parser.add_option("--output",
+                      action="store",
+                      type="string",
+                      dest="output_filename",
+                      help="""The output index.""")
+
+    (options,args) = parser.parse_args()
+
+    # validate options
+    if not (options.output_filename and
+            (options.input_pairs_filenames or options.input_genes_filenames or options.input_exons_filename)
+            ):
+        parser.print_help()
+        parser.error("One of the options has not been specified.")
+        sys.exit(1)
+
+    build(options.output_filename,
+          pairs = [el for el in options.input_pairs_filenames.split(',') if el],
+          genes = [el for el in options.input_genes_filenames.split(',') if el],
+          exons = options.input_exons_filename)
+
+    print "The end."
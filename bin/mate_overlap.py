@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+It finds the overlaps between the two mate reads of paired-end reads, and it
+is shared by the tools which are processing paired-end reads ('overlap.py',
+'merge-reads.py', and 'remove-adapter.py').
+
+A seed (a short region close to the end of one of the reads) is searched in
+its mate read and this gives the alignment of the two mate reads. The
+mismatches in the overlapping region are counted for a whole batch of pairs of
+reads at once (using NumPy if it is available) and the overlap is accepted or
+not based on an error model.
+
+
+
+Author: Daniel Nicorici, Daniel.Nicorici@gmail.com
+
+Copyright (c) 2009-2019 Daniel Nicorici
+
+This file is part of FusionCatcher.
+
+FusionCatcher is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FusionCatcher is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with FusionCatcher (see file 'COPYING.txt').  If not, see
+<http://www.gnu.org/licenses/>.
+
+By default, FusionCatcher is running BLAT aligner
+<http://users.soe.ucsc.edu/~kent/src/> but it offers also the option to disable
+all its scripts which make use of BLAT aligner if you choose explicitly to do so.
+BLAT's license does not allow to be used for commercial activities. If BLAT
+license does not allow to be used in your case then you may still use
+FusionCatcher by forcing not use the BLAT aligner by specifying the option
+'--skip-blat'. Fore more information regarding BLAT please see its license.
+
+Please, note that FusionCatcher does not require BLAT in order to find
+candidate fusion genes!
+
+This file is not running/executing/using BLAT.
+"""
+import sys
+import math
+import itertools
+import collections
+import multiprocessing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+_N = ord('N')
+_DOT = ord('.')
+
+
+def matrix(strings):
+    """
+    It gives the strings as a matrix of uint8 (the shorter strings are padded
+    with zeros) and the number of its columns.
+    """
+    n = max([len(el) for el in strings]) if strings else 0
+    if n == 0:
+        return (numpy.zeros((len(strings),0), dtype = numpy.uint8), 0)
+    m = numpy.frombuffer(''.join([el.ljust(n,'\0') for el in strings]), dtype = numpy.uint8).reshape((len(strings),n))
+    return (m, n)
+
+
+def count_mismatches(pairs, ignore_n = False):
+    """
+    For each pair of aligned sequences (x, y) it counts the mismatches, where
+    N on both sequences is always a mismatch. If IGNORE_N is True then N
+    against another nucleotide is not a mismatch.
+    """
+    if numpy and pairs:
+        (a, n) = matrix([el[0] for el in pairs])
+        (b, n) = matrix([el[1] for el in pairs])
+        an = a == _N
+        bn = b == _N
+        if ignore_n:
+            mis = ((a != b) & ~an & ~bn) | (an & bn)
+        else:
+            mis = (a != b) | (an & bn)
+        return mis.sum(axis = 1).tolist()
+    if ignore_n:
+        return [len([1 for (u,v) in itertools.izip(x,y) if (u != v and u != 'N' and v != 'N') or (u == 'N' and v == 'N')]) for (x,y) in pairs]
+    return [len([1 for (u,v) in itertools.izip(x,y) if u != v or (u == 'N' and v == 'N')]) for (x,y) in pairs]
+
+
+def count_n(pairs):
+    """
+    For each pair of aligned sequences (x, y) it counts the positions where
+    any of them has N.
+    """
+    if numpy and pairs:
+        (a, n) = matrix([el[0] for el in pairs])
+        (b, n) = matrix([el[1] for el in pairs])
+        return ((a == _N) | (b == _N)).sum(axis = 1).tolist()
+    return [len([1 for (u,v) in itertools.izip(x,y) if u == 'N' or v == 'N']) for (x,y) in pairs]
+
+
+def count_adapter_mismatches(pairs):
+    """
+    For each pair (adapter, read) it counts the mismatches between the adapter
+    and the read (N and . from the read are not mismatches).
+    """
+    if numpy and pairs:
+        (a, n) = matrix([el[0] for el in pairs])
+        (b, n) = matrix([el[1] for el in pairs])
+        return ((a != b) & (b != _N) & (b != _DOT)).sum(axis = 1).tolist()
+    return [len([1 for (u,v) in itertools.izip(x,y) if u != v and v != 'N' and v != '.']) for (x,y) in pairs]
+
+
+class error_model:
+    """
+    It decides if an overlap with MIS mismatches over a length of COM
+    nucleotides is rejected. It is rejected if the fraction of mismatches is
+    above MAX_FRACTION, or (if LOG_SLACK is given) if the overlap is longer
+    than 50 and it has more than log2(COM)+LOG_SLACK mismatches.
+    """
+    def __init__(self, max_fraction = 0.3, log_slack = None):
+        self.max_fraction = max_fraction
+        self.log_slack = log_slack
+
+    def reject(self, mis, com):
+        if float(mis) / float(com) > self.max_fraction:
+            return True
+        if self.log_slack is not None and com > 50 and mis - self.log_slack > math.log(com,2):
+            return True
+        return False
+
+
+def seeds(n, overlap):
+    """
+    The positions of the seeds of length OVERLAP for a read of length N.
+    """
+    return ((n - overlap - 1, n - 1),
+            (n - overlap - 10, n - 10),
+            (n - overlap - 20, n - 20),
+            (n - overlap - 30, n - 30))
+
+
+def _seed(sa, sb, positions, wiggle):
+    # it gives the position of the first seed of SA (among POSITIONS) found in SB
+    for (pa,pb) in positions:
+        z = sa[pa:pb]
+        nz = len(z)
+        if (not z) or (pb-pa != nz) or z.find('N') != -1 or z.find('.') != -1 or z[0]*nz == z:
+            continue
+        p = sb.find(z,0,-wiggle)
+        if p != -1:
+            return (pa, p)
+    return None
+
+
+def find_overlaps(pairs, overlap = 13, wiggle = 2, model = None, ends = (5,3)):
+    """
+    For each pair of reads (sa, sb), where sb is already reverse-complemented,
+    it gives (lib, d, mis), where LIB is the length of the fragment (-1 if
+    there is no overlap), D is the shift of SB relative to SA (i.e. sb[j] is
+    aligned on sa[j+d]), and MIS is the number of mismatches in the overlap
+    (-1 if there is no overlap). The seeds are taken first from the 3' end of
+    SA and searched in SB (if 5 is in ENDS) and after that from the 3' end of
+    SB and searched in SA (if 3 is in ENDS).
+    """
+    if model is None:
+        model = error_model()
+    result = [(-1, 0, -1)] * len(pairs)
+    todo = []
+    for (i,(sa,sb)) in enumerate(pairs):
+        if sa == sb:
+            result[i] = (len(sb), 0, 0)
+        else:
+            todo.append(i)
+    for end in ends:
+        if not todo:
+            break
+        found = []
+        for i in todo:
+            (sa, sb) = pairs[i]
+            if end == 5:
+                s = _seed(sa, sb, seeds(len(sa), overlap), wiggle)
+                if s:
+                    found.append((i, s[0] - s[1]))
+            else:
+                s = _seed(sb, sa, seeds(len(sb), overlap), wiggle)
+                if s:
+                    found.append((i, s[1] - s[0]))
+        regions = []
+        for (i,d) in found:
+            (sa, sb) = pairs[i]
+            if d > 0:
+                com = min(len(sa) - d, len(sb))
+                regions.append((sa[d:d+com], sb[0:com]))
+            else:
+                com = min(len(sa), len(sb) + d)
+                regions.append((sa[0:com], sb[-d:com-d]))
+        counts = count_mismatches(regions)
+        missed = set(todo)
+        for ((i,d),(x,y),mis) in itertools.izip(found, regions, counts):
+            if not model.reject(mis, len(x)):
+                result[i] = (d + len(pairs[i][1]), d, mis)
+                missed.discard(i)
+        todo = [i for i in todo if i in missed]
+    return result
+
+
+def aligned(sa, sb, r):
+    """
+    It gives the two reads padded with spaces such that they are aligned, as
+    given by R from 'find_overlaps'.
+    """
+    (lib, d, mis) = r
+    if lib == -1:
+        return (sa, ' ' * len(sa) + sb)
+    elif d > 0:
+        return (sa, ' ' * d + sb)
+    return (' ' * (-d) + sa, sb)
+
+
+_para = None
+def _set_param(para):
+    global _para
+    _para = para
+
+
+def _work(pairs):
+    return find_overlaps(pairs, *_para)
+
+
+def overlaps(items, overlap = 13, wiggle = 2, model = None, ends = (5,3), cpus = 1, size_batch = 10000):
+    """
+    It aligns the mate reads given as ITEMS (tuples which start with the two
+    reads, where the second read is already reverse-complemented) and it
+    gives, in the same order, the tuples (item, (lib, d, mis)) (see
+    'find_overlaps'). The items are done in batches of SIZE_BATCH, using CPUS
+    processes.
+    """
+    para = (overlap, wiggle, model, ends)
+    items = iter(items)
+    batches = collections.deque()
+    def feed():
+        while True:
+            batch = list(itertools.islice(items,size_batch))
+            if not batch:
+                break
+            batches.append(batch)
+            yield [(item[0],item[1]) for item in batch]
+    pool = None
+    if cpus > 1:
+        pool = multiprocessing.Pool(processes = cpus, initializer = _set_param, initargs = (para,))
+        results = pool.imap(_work, feed())
+    else:
+        _set_param(para)
+        results = itertools.imap(_work, feed())
+    for r in results:
+        batch = batches.popleft()
+        for x in itertools.izip(batch, r):
+            yield x
+    if pool:
+        pool.close()
+        pool.join()
@@ -47,7 +47,8 @@ import optparse
 import multiprocessing
 import itertools
 import string
-import gzip
+import fastq_io
+import mate_overlap
 import gc
 import math
 
@@ -73,13 +74,7 @@ def fastq2(file_name, size_read_buffer = 10**8):
         
 
 def fastq(file_name, size_read_buffer = 10**8):
-    fid = None
-    if file_name == '-':
-        fid = sys.stdin
-    elif file_name.lower().endswith('.gz'):
-        fid = gzip.open(file_name,'r')#,buffering=16*1024*1024 + 8)
-    else:
-        fid = open(file_name,'r')#,buffering=16*1024*1024 + 8) # or buffering = (64*1024)+8 => 64KB ; if the 8 bytes are not added, it will cause poor performance
+    fid = fastq_io.open_input(file_name)
     piece = [None,None,None,None]
     i = 0
     j = 1
@@ -167,208 +162,13 @@ def reads_from_paired_fastq_file(file_name_1, file_name_2 = None, size_read_buff
         yield bucket
 
 
-class lines_to_file:
-    #
-    def __init__(self, file_name, size_buffer=10**8):
-        self.file_name = file_name
-        if file_name:
-            self.file_handle = open(file_name,'w')
-        self.size_buffer = size_buffer
-        self.data = []
-        self.size = 0
+class lines_to_file(fastq_io.lines_to_file):
     #
     def add_line(self,line):
-        line = line.rstrip('\r\n')+'\n'
-        gc.disable()
-        self.data.append(line)
-        gc.enable()
-        self.size = self.size + len(line)
-        if self.size > self.size_buffer:
-            self.__write_buffer()
+        fastq_io.lines_to_file.add_line(self,line.rstrip('\r\n')+'\n')
     #
     def add_lines(self,lines):
-        gc.disable()
-        lines = [line.rstrip('\r\n')+'\n' for line in lines]
-        self.data.extend(lines)
-        gc.enable()
-        self.size = self.size + sum([len(line) for line in lines])
-        if self.size > self.size_buffer:
-            self.__write_buffer()
-    def __write_buffer(self):
-        self.file_handle.writelines(self.data)
-        self.size = 0
-        self.data = []
-    def is_filename_valid(self):
-        if self.file_name:
-            return True
-        else:
-            return False
-    def close(self):
-        if self.is_filename_valid():
-            if self.data:
-                self.__write_buffer()
-            self.file_handle.close()
-            self.file_name = None
-    def __del__(self):
-        self.close()
-
-
-
-
-def fast_alignment5(sa, sb, positions, mismatch_percent= 0.1):
-    lib = -1
-    xa = sa # ""
-    lsa = len(sa)
-    xb = ' ' * lsa + sb # ""
-    mis = -1
-    misp = -1
-    wiggle = 1
-    com = -1
-    for (pa,pb) in positions:
-        z = sa[pa:pb]
-        nz = len(z)
-        if (not z) or (pb-pa != nz) or z.find('N') != -1 or z.find('.') != -1 or z[0]*nz == z:
-            continue
-        #p = sb.find(z,wiggle,-wiggle)
-        p = sb.find(z,0,-wiggle)
-        if p != -1:
-            nb = len(sb)
-            if pa > p:
-                lib = pa + nb - p
-                pap = pa - p
-                t = ' ' * pap
-                xa = sa
-                xb = "%s%s" % (t,sb)
-                lxa = len(xa)
-                lxb = len(xb)
-                mm = min(lxb,lxa)
-                mis = len([1 for ix in xrange(pap,mm) if (xa[ix] != xb[ix] or (xa[ix] == 'N' and xb[ix] == 'N'))])
-                com = float(mm-pap)
-                misp = float(mis)/com
-            else:
-                lib = pa + nb - p
-                ppa = p - pa
-                t = ' ' * ppa
-                xa = "%s%s" % (t,sa)
-                xb = sb
-                lxb = len(xb)
-                lxa = len(xa)
-                mm = min(lxb,lxa)
-                mis = len([1 for ix in xrange(ppa,mm) if (xa[ix] != xb[ix] or (xa[ix] == 'N' and xb[ix] == 'N'))])
-                com = float(mm-ppa)
-                misp = float(mis)/com
-
-            #print xa
-            #print xb
-            #print lib, len("%s%s" % (t,sb))
-            #print ""
-            break
-
-    if misp != -1 and ( (misp > mismatch_percent) or (com > 50 and mis - 2 > math.log(com,2))):
-        # too many mismatches not good alignment
-        lib = -1
-        xa = sa # ""
-        xb = ' ' * lsa + sb # ""
-        mis = -1
-
-    return (lib,xa,xb,mis)
-    
-
-def fast_alignment3(sa, sb, positions, mismatch_percent= 0.1):
-    lib = -1
-    xa = sa #""
-    lsa = len(sa)
-    xb = ' '* lsa + sb # ""
-    mis = -1
-    misp = -1
-    wiggle = 1
-    com = -1
-    for (pa,pb) in positions:
-        z = sb[pa:pb]
-        nz = len(z)
-        if (not z) or (pa-pb != nz) or z.find('N') != -1 or z.find('.') != -1 or z[0]*nz == z:
-            continue
-        #p = sa.find(z,wiggle,-wiggle)
-        p = sb.find(z,0,-wiggle)
-        if p != -1:
-            nb = len(sb)
-            if p < pa:
-                lib =  nb - pa + p
-                pap = pa - p
-                t = ' ' * pap
-                xa = "%s%s" % (t,sa)
-                xb = sb
-                lxb = len(xb)
-                lxa = len(xa)
-                mm = min(lxb,lxa)
-                mis = len([1 for ix in xrange(pap,mm) if (xa[ix] != xb[ix] or (xa[ix] == 'N' and xb[ix] == 'N'))])
-                com = float(mm-pap)
-                misp = float(mis)/com
-            else:
-                lib =  nb - pa + p
-                ppa = p - pa
-                t = ' ' * (p - pa)
-                xa = sa
-                xb = "%s%s" % (t,sb)
-                lxa = len(xa)
-                lxb = len(xb)
-                mm = min(lxa,lxb)
-                mis = len([1 for ix in xrange(ppa,mm) if (xa[ix] != xb[ix] or (xa[ix] == 'N' and xb[ix] == 'N'))])
-                com = float(mm-ppa)
-                misp = float(mis)/com
-#            print xa
-#            print xb
-#            print lib, len("%s%s" % (t,sb))
-#            print ""
-            break
-            
-    if misp != -1 and ( (misp > mismatch_percent) or (com > 50 and mis - 2 > math.log(com,2))):
-        # too many mismatches not good alignment
-        lib = -1
-        xa = sa #""
-        xb = ' '* lsa + sb # ""
-        mis = -1
-            
-    return (lib,xa,xb,mis)
-
-
-#
-#
-#
-def compute(stuff):
-#def compute(mate,o,na,nb):
-    mate = stuff[0]
-    o = stuff[1]
-#    na = stuff[1].na
-#    nb = stuff[1].nb
-    a = mate[1]
-    b = dnaReverseComplement(mate[3])
-    na = len(a)
-    nb = len(b)
-    id1 = mate[0]
-    id2 = mate[2]
-    mis = -1
-    q1 = mate[4]
-    q2 = mate[5][::-1]
-
-    if id1 == 'myexit':
-        f = na
-        x = a
-        y = b
-        mis = 0
-    else:
-        f = -1
-        if a == b:
-            f = na
-            x = a
-            y = b
-            mis = 0
-        else:
-            (f,x,y,mis) = fast_alignment5(a, b, ((na - o - 1, na - 1), (na - o - 10, na - 10), (na - o - 20, na - 20), (na - o - 30, na - 30)))
-            if f == -1:
-                (f,x,y,mis) = fast_alignment3(a, b, ((nb - o - 1, nb - 1), (nb - o - 10, nb - 10), (nb - o - 20, nb - 20), (nb - o - 30, nb - 30)))
-
-    return (f,x,y,id1,id2,mis,q1,q2)
+        fastq_io.lines_to_file.add_lines(self,[line.rstrip('\r\n')+'\n' for line in lines])
 
 
 
@@ -384,7 +184,8 @@ def merge_reads(input_1_filename,
                 output_alignment_filename = None,
                 size_overlap = 15,
                 cpus = 0,
-                verbose = False):
+                verbose = False,
+                max_mismatches = 0.1):
 
     o = size_overlap
 #    print >>sys.stderr,"overlap =", o
@@ -423,8 +224,6 @@ def merge_reads(input_1_filename,
         print >>sys.stderr,"Using",cpus,"process(es)..."
         
 
-    pool = multiprocessing.Pool(processes=cpus)
-
     getout = -1
 
     log = None
@@ -444,34 +243,25 @@ def merge_reads(input_1_filename,
     if output_reverse_filename:
         re = lines_to_file(output_reverse_filename)
 
-
-#    for w in map(compute,
-#                                 itertools.izip_longest(
-#                                    reads_from_paired_fastq_file(
-#                                        input_1_filename,
-#                                        input_2_filename),
-#                                    [],
-#                                    fillvalue = o)
-#                                 ):
-
-    for w in pool.imap_unordered(compute,
-                                 itertools.izip_longest(
-                                    reads_from_paired_fastq_file(
+    # the second read is reverse-complemented; only the seeds from the first
+    # read are used
+    mates = ((mate[1], dnaReverseComplement(mate[3]), mate[0], mate[2], mate[4], mate[5][::-1]) for mate in reads_from_paired_fastq_file(
                                         input_1_filename,
-                                        input_2_filename),
-                                    [],
-                                    fillvalue = o),
-                                 chunksize = 100
-                                 ):
-
-        if w[3] == 'myexit':
-            getout = int(x)
+                                        input_2_filename))
+    for (w, r) in mate_overlap.overlaps(mates,
+                                        overlap = o,
+                                        wiggle = 1,
+                                        model = mate_overlap.error_model(max_mismatches, log_slack = 2),
+                                        ends = (5,),
+                                        cpus = cpus):
+
+        if w[2] == 'myexit':
+            getout = int(w[0])
             break
 
-        # (f,x,y,id1,id2,mis,q1,q2)
-        f = w[0]
-        x = w[1]
-        y = w[2]
+        # (seq1,seq2,id1,id2,q1,q2)
+        f = r[0]
+        (x, y) = mate_overlap.aligned(w[0], w[1], r)
 
         # stat
         if f != -1:
@@ -480,25 +270,25 @@ def merge_reads(input_1_filename,
             # merged reads
             if me:
                 a = len(x)
-                a2 = len(w[6])
+                a2 = len(w[4])
                 if a != a2:
                     m = x[a-a2:f]
-                    q = w[6][:f]
+                    q = w[4][:f]
                 else:
                     if a < f:
                         m = x + y[a:]
-                        q = w[6]+ w[7][a-f:]
+                        q = w[4]+ w[5][a-f:]
                     else:
                         m = x
-                        q = w[6]
-                me.add_lines([w[3],m,"+",q])
+                        q = w[4]
+                me.add_lines([w[2],m,"+",q])
         else:
             if fo and re:
-                fo.add_lines([w[3],x.strip(),"+",w[6]])
-                re.add_lines([w[4],dnaReverseComplement(y.strip()),"+",w[7][::-1]])
+                fo.add_lines([w[2],x.strip(),"+",w[4]])
+                re.add_lines([w[3],dnaReverseComplement(y.strip()),"+",w[5][::-1]])
         
         if log:
-            log.add_lines([w[3],x,y,w[4],"mismatches = "+str(w[5]) ,w[6],w[7],"",""]) # read 1 id; read seq 1; read seq 2; read id 2; mismatches
+            log.add_lines([w[2],x,y,w[3],"mismatches = "+str(r[2]) ,w[4],w[5],"",""]) # read 1 id; read seq 1; read seq 2; read id 2; mismatches
         
         i = i + 1
         if verbose and (i % 10000000 == 0):
@@ -548,10 +338,6 @@ def merge_reads(input_1_filename,
 #                print >>sys.stderr,"Reading... %d reads" % (i,)
 #        log.close()
 
-    pool.close()
-    pool.join()
-
-
     if getout != -1:
         sys.exit(getout)
 
@@ -627,7 +413,7 @@ if __name__ == '__main__':
 
     usage = "%prog [options]"
     description = """It merges the overlapping reads which are paired."""
-    version = "%prog 0.10 beta"
+    version = "%prog 0.11 beta"
 
     parser = optparse.OptionParser(usage       = usage,
                                    description = description,
@@ -685,6 +471,13 @@ if __name__ == '__main__':
                       help = """The minimum length of the region which is considered an overlap. Default is %default.""")
 
 
+    parser.add_option("-x","--max-mismatches",
+                      action = "store",
+                      type = "float",
+                      dest = "max_mismatches",
+                      default = 0.1,
+                      help = """The maximum fraction of mismatches allowed in the overlapping region. Default is %default.""")
+
     parser.add_option("-p", "--processes",
                       action = "store",
                       type = "int",
@@ -710,6 +503,7 @@ if __name__ == '__main__':
                 options.output_alignment_filename,
                 size_overlap = options.overlap,
                 cpus = options.processes,
-                verbose = False # verbose
+                verbose = False, # verbose
+                max_mismatches = options.max_mismatches
             )
     #
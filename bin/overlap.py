@@ -47,7 +47,8 @@ import optparse
 import multiprocessing
 import itertools
 import string
-import gzip
+import fastq_io
+import mate_overlap
 import gc
 
 ttable = string.maketrans("ACGTYRSWKMBDHV-.","TGCARYSWMKVHDB-.")
@@ -59,13 +60,7 @@ def dnaReverseComplement(seq):
 
 
 def fastq(file_name, size_read_buffer = 10**8):
-    fid = None
-    if file_name == '-':
-        fid = sys.stdin
-    elif file_name.lower().endswith('.gz'):
-        fid = gzip.open(file_name,'r')#,buffering=16*1024*1024 + 8)
-    else:
-        fid = open(file_name,'r')#,buffering=16*1024*1024 + 8) # or buffering = (64*1024)+8 => 64KB ; if the 8 bytes are not added, it will cause poor performance
+    fid = fastq_io.open_input(file_name)
     piece = [None,None,None,None]
     i = 0
     j = 1
@@ -153,194 +148,17 @@ def reads_from_paired_fastq_file(file_name_1, file_name_2, nn, fail_gracefully =
         yield bucket
 
 
-class lines_to_file:
-    #
-    def __init__(self, file_name, size_buffer=10**8):
-        self.file_name = file_name
-        if file_name:
-            self.file_handle = open(file_name,'w')
-        self.size_buffer = size_buffer
-        self.data = []
-        self.size = 0
+class lines_to_file(fastq_io.lines_to_file):
     #
     def add_line(self,line):
-        line = line.rstrip('\r\n')+'\n'
-        gc.disable()
-        self.data.append(line)
-        gc.enable()
-        self.size = self.size + len(line)
-        if self.size > self.size_buffer:
-            self.__write_buffer()
+        fastq_io.lines_to_file.add_line(self,line.rstrip('\r\n')+'\n')
     #
     def add_lines(self,lines):
-        gc.disable()
-        lines = [line.rstrip('\r\n')+'\n' for line in lines]
-        self.data.extend(lines)
-        gc.enable()
-        self.size = self.size + sum([len(line) for line in lines])
-        if self.size > self.size_buffer:
-            self.__write_buffer()
-    def __write_buffer(self):
-        self.file_handle.writelines(self.data)
-        self.size = 0
-        self.data = []
-    def is_filename_valid(self):
-        if self.file_name:
-            return True
-        else:
-            return False
-    def close(self):
-        if self.is_filename_valid():
-            if self.data:
-                self.__write_buffer()
-            self.file_handle.close()
-            self.file_name = None
-    def __del__(self):
-        self.close()
-
-
-
-
-def fast_alignment5(sa, sb, n, positions, wiggle = 2):
-    lib = -1
-    xa = sa # ""
-    xb = ' '* len(sa) + sb # ""
-    mis = -1
-    misp = -1
-    for (pa,pb) in positions:
-        z = sa[pa:pb]
-        nz = len(z)
-        if (not z) or (pb-pa != nz) or z.find('N') != -1 or z.find('.') != -1 or z[0]*nz == z:
-            continue
-        #p = sb.find(z,wiggle,-wiggle)
-        p = sb.find(z,0,-wiggle)
-        if p != -1:
-            if pa > p:
-                lib = pa + n - p
-                pap = pa - p
-                t = ' ' * pap
-                xa = sa
-                xb = "%s%s" % (t,sb)
-                lxa = len(xa)
-                mis = len([1 for ix in xrange(pap,lxa) if (xa[ix] != xb[ix] or (xa[ix] == 'N' and xb[ix] == 'N'))])
-                misp = float(mis)/float(lxa-pap)
-            else:
-                lib = pa + n - p
-                ppa = p - pa
-                t = ' ' * ppa
-                xa = "%s%s" % (t,sa)
-                xb = sb
-                lxb = len(xb)
-                mis = len([1 for ix in xrange(ppa,lxb) if (xa[ix] != xb[ix] or (xa[ix] == 'N' and xb[ix] == 'N'))])
-                misp = float(mis)/float(lxb-ppa)
-
-            #print xa
-            #print xb
-            #print lib, len("%s%s" % (t,sb))
-            #print ""
-            break
+        fastq_io.lines_to_file.add_lines(self,[line.rstrip('\r\n')+'\n' for line in lines])
 
-    if misp != -1 and misp > 0.3:
-        # too many mismatches not good alignment
-        lib = -1
-        xa = sa # ""
-        xb = ' '* len(sa) + sb # ""
-        mis = -1
-
-    return (lib,xa,xb,mis)
-
-def fast_alignment3(sa, sb, n, positions, wiggle = 2):
-    lib = -1
-    xa = sa #""
-    xb = ' '* len(sa) + sb # ""
-    mis = -1
-    misp = -1
-    for (pa,pb) in positions:
-        z = sb[pa:pb]
-        nz = len(z)
-        if (not z) or (pb-pa != nz) or z.find('N') != -1 or z.find('.') != -1 or z[0]*nz == z:
-            continue
-        #p = sa.find(z,wiggle,-wiggle)
-        p = sa.find(z,0,-wiggle)
-        if p != -1:
-            if p < pa:
-                lib =  n - pa + p
-                pap = pa - p
-                t = ' ' * pap
-                xa = "%s%s" % (t,sa)
-                xb = sb
-                lxb = len(xb)
-                mis = len([1 for ix in xrange(pap,lxb) if (xa[ix] != xb[ix] or (xa[ix] == 'N' and xb[ix] == 'N'))])
-                misp = float(mis)/float(lxb-pap)
-            else:
-                lib =  p + n - pa
-                ppa = p - pa
-                t = ' ' * (p - pa)
-                xa = sa
-                xb = "%s%s" % (t,sb)
-                lxa = len(xa)
-                mis = len([1 for ix in xrange(ppa,lxa) if (xa[ix] != xb[ix] or (xa[ix] == 'N' and xb[ix] == 'N'))])
-                misp = float(mis)/float(lxa-ppa)
-#            print xa
-#            print xb
-#            print lib, len("%s%s" % (t,sb))
-#            print ""
-            break
-            
-    if misp != -1 and misp > 0.3:
-        # too many mismatches not good alignment
-        lib = -1
-        xa = sa #""
-        xb = ' '* len(sa) + sb # ""
-        mis = -1
-            
-    return (lib,xa,xb,mis)
-
-
-#
-#
-#
-def compute(stuff):
-#def compute(mate,o,na,nb):
-    mate = stuff[0]
-    o = stuff[1].o
-    na = stuff[1].na
-    nb = stuff[1].nb
-    a = mate[1]
-    b = dnaReverseComplement(mate[3])
-    id1 = mate[0]
-    id2 = mate[2]
-    mis = -1
-
-    if id1 == 'myexit':
-        f = na
-        x = a
-        y = b
-        mis = 0
-    else:
-        f = -1
-        if a == b:
-            f = na
-            x = a
-            y = b
-            mis = 0
-        else:
-            (f,x,y,mis) = fast_alignment5(a, b, na, [(na - o - 1, na - 1), (na - o - 10, na - 10), (na - o - 20, na - 20), (na - o - 30, na - 30)])
-            if f == -1:
-                (f,x,y,mis) = fast_alignment3(a, b, na, [(nb - o - 1, nb - 1), (nb - o - 10, nb - 10), (nb - o - 20, nb - 20), (nb - o - 30, nb - 30)])
 
-    return (f,x,y,id1,id2,mis)
 
 
-#
-#
-#
-class param:
-    def __init__(self):
-        self.o = None
-        self.na = None
-        self.nb = None
-
 #
 #
 #
@@ -352,7 +170,8 @@ def overlap(input_1_filename,
             size_overlap = 15,
             cpus = 0,
             verbose = True,
-            fail_gracefully = False):
+            fail_gracefully = False,
+            max_mismatches = 0.3):
 			
     o = size_overlap
     print >>sys.stderr,"overlap =", o
@@ -364,10 +183,14 @@ def overlap(input_1_filename,
     k = 0
     i = 0
     # find fast the length of the read
-    d = file(input_1_filename,"r").readlines(50000)
+    fid = fastq_io.open_input(input_1_filename)
+    d = fid.readlines(50000)
+    fid.close()
     nax = set([len(el.rstrip('\r\n')) for i,el in enumerate(d) if i%4 == 1])
     na = nax.pop()
-    d = file(input_2_filename,"r").readlines(50000)
+    fid = fastq_io.open_input(input_2_filename)
+    d = fid.readlines(50000)
+    fid.close()
     nbx = set([len(el.rstrip('\r\n')) for i,el in enumerate(d) if i%4 == 1])
     nb = nbx.pop()
 
@@ -382,10 +205,6 @@ def overlap(input_1_filename,
 
     library = dict()
 
-    para = param()
-    para.o = o
-    para.na = na
-    para.nb = nb
     nn = na
 
     #
@@ -394,76 +213,46 @@ def overlap(input_1_filename,
     if verbose:
         print >>sys.stderr,"Using",cpus,"process(es)..."
 
-    pool = multiprocessing.Pool(processes=cpus)
-
     getout = -1
-    if not output_alignment_filename:
-        for w in pool.imap_unordered(compute,
-                                     itertools.izip_longest(
-                                        reads_from_paired_fastq_file(
-                                            input_1_filename, 
-                                            input_2_filename, 
-                                            nn, 
-                                            fail_gracefully = fail_gracefully),
-                                        [],
-                                        fillvalue = para),
-                                     chunksize = 100
-                                     ):
-            f = w[0]
-            x = w[1]
-            #y = w[2]
-
-
-            if w[3] == 'myexit':
-                getout = int(x)
-                break
-
-            if f != -1:
-                library[f] = library.get(f,0) + 1
-            
-            i = i + 1
-            if i % 10000000 == 0:
-                print >>sys.stderr,"Reading... %d reads" % (i,)
-    else: # flag_log
+    log = None
+    if output_alignment_filename:
         log = lines_to_file(output_alignment_filename)
 
-        for w in pool.imap_unordered(compute,
-                                     itertools.izip_longest(
-                                         reads_from_paired_fastq_file(
-                                            input_1_filename, 
-                                            input_2_filename, 
-                                            nn, 
-                                            fail_gracefully = fail_gracefully),
-                                         [],
-                                         fillvalue = para),
-                                     chunksize = 100
-                                     ):
-            f = w[0]
-            x = w[1]
-            y = w[2]
-
-            if w[3] == 'myexit':
-                getout = int(x)
-                break
+    # the second read is reverse-complemented
+    mates = ((mate[1], dnaReverseComplement(mate[3]), mate[0], mate[2]) for mate in reads_from_paired_fastq_file(
+                                            input_1_filename,
+                                            input_2_filename,
+                                            nn,
+                                            fail_gracefully = fail_gracefully))
+    for (mate, r) in mate_overlap.overlaps(mates,
+                                           overlap = o,
+                                           wiggle = 2,
+                                           model = mate_overlap.error_model(max_mismatches),
+                                           cpus = cpus):
+        if mate[2] == 'myexit':
+            getout = int(mate[0])
+            break
+
+        f = r[0]
+        if f != -1:
+            library[f] = library.get(f,0) + 1
 
-            if f != -1:
-                library[f] = library.get(f,0) + 1
+        if log:
+            (x, y) = mate_overlap.aligned(mate[0], mate[1], r)
             if merged:
-                if w[5] == -1:
+                if r[2] == -1:
                     log.add_lines([";"])
                 else:
-                    log.add_lines(["%s;%s;%s" % (len(x),len(y),str(w[5]))] )
+                    log.add_lines(["%s;%s;%s" % (len(x),len(y),str(r[2]))] )
             else:
-                log.add_lines([w[3],x,y,w[4],"mismatches = "+str(w[5]) ,"",""]) # read 1 id; read seq 1; read seq 2; read id 2; mismatches
+                log.add_lines([mate[2],x,y,mate[3],"mismatches = "+str(r[2]) ,"",""]) # read 1 id; read seq 1; read seq 2; read id 2; mismatches
 
-            i = i + 1
-            if i % 10000000 == 0:
-                print >>sys.stderr,"Reading... %d reads" % (i,)
+        i = i + 1
+        if i % 10000000 == 0:
+            print >>sys.stderr,"Reading... %d reads" % (i,)
+    if log:
         log.close()
 
-    pool.close()
-    pool.join()
-
 
     if getout != -1:
         sys.exit(getout)
@@ -538,7 +327,7 @@ if __name__ == '__main__':
 
     usage = "%prog [options]"
     description = """Gives information regarding the overlap of the mate-reads (i.e. library/fragment size) using two FASTQ files as input."""
-    version = "%prog 0.14 beta"
+    version = "%prog 0.15 beta"
 
     parser = optparse.OptionParser(usage       = usage,
                                    description = description,
@@ -593,6 +382,13 @@ if __name__ == '__main__':
                       default = False,
                       help = """Fail gracefully in case the the input reads have different lengths. Default is %default.""")
 
+    parser.add_option("-x","--max-mismatches",
+                      action = "store",
+                      type = "float",
+                      dest = "max_mismatches",
+                      default = 0.3,
+                      help = """The maximum fraction of mismatches allowed in the overlapping region. Default is %default.""")
+
     parser.add_option("-p", "--processes",
                       action = "store",
                       type = "int",
@@ -619,6 +415,7 @@ if __name__ == '__main__':
             size_overlap = options.overlap,
             cpus = options.processes,
             verbose = True, # verbose
-            fail_gracefully = options.fail_gracefully
+            fail_gracefully = options.fail_gracefully,
+            max_mismatches = options.max_mismatches
             )
     #
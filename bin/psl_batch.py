@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+It aligns the supporting reads of all the candidate fusion genes using only
+one run of BLAT (such that the genome is loaded only once), instead of one
+run of BLAT for each candidate fusion gene. The sequences of all candidate
+fusion genes are joined into one FASTA file, where each sequence is tagged
+with the index of its candidate fusion gene, and the PSL output of BLAT is
+split back by this tag into one PSL output for each candidate fusion gene.
+
+Author: Daniel Nicorici, Daniel.Nicorici@gmail.com
+
+Copyright (c) 2009-2019 Daniel Nicorici
+
+This file is part of FusionCatcher.
+
+FusionCatcher is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FusionCatcher is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with FusionCatcher (see file 'COPYING.txt').  If not, see
+<http://www.gnu.org/licenses/>.
+
+By default, FusionCatcher is running BLAT aligner
+<http://users.soe.ucsc.edu/~kent/src/> but it offers also the option to disable
+all its scripts which make use of BLAT aligner if you choose explicitly to do so.
+BLAT's license does not allow to be used for commercial activities. If BLAT
+license does not allow to be used in your case then you may still use
+FusionCatcher by forcing not use the BLAT aligner by specifying the option
+'--skip-blat'. Fore more information regarding BLAT please see its license.
+
+Please, note that FusionCatcher does not require BLAT in order to find
+candidate fusion genes!
+
+This file is not running/executing/using BLAT.
+"""
+
+
+def join(fastas):
+    # give as input a list of FASTA files (each one as a list of strings) it
+    # returns one FASTA file (as a list of strings) where the name of each
+    # sequence is prefixed by the index of its FASTA file
+    fasta = []
+    for (i,fa) in enumerate(fastas):
+        fasta.extend(['>%d|%s' % (i,line[1:]) if line.startswith('>') else line for line in fa])
+    return fasta
+
+
+def split(psl, count):
+    # give as input the PSL output (as a list of strings) of BLAT for a FASTA
+    # file given by JOIN it returns COUNT PSL outputs (one for each FASTA file
+    # given to JOIN); each of them has the header of the PSL output (also
+    # when it has no alignments) and the tag is removed from the query names
+    header = []
+    data = [[] for i in xrange(count)]
+    flag = True
+    for line in psl:
+        li = line.split('\t')
+        if len(li) > 20 and li[0].isdigit():
+            flag = False
+            (i,li[9]) = li[9].split('|',1)
+            data[int(i)].append('\t'.join(li))
+        elif flag:
+            # the header is given only once (it is the same for all)
+            header.append(line)
+    return [header + el for el in data]
+#
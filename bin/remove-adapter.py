@@ -55,7 +55,13 @@ import re
 import gc
 import shutil
 import errno
-import gzip
+import fastq_io
+import mate_overlap
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 ttable = string.maketrans("ACGTYRSWKMBDHV-.","TGCARYSWMKVHDB-.") # global
 empty_read = ['@N123\n','N\n','+\n','I\n'] # global
@@ -124,46 +130,22 @@ def dnaReverseComplement(seq):
 #
 #
 def read_first_fastq(file_name, first = 2000000, size_buffer = 10**8):
-    fid = None
-    if file_name.lower().endswith('.gz'):
-        fid = gzip.open(file_name,'r')
-    else:
-        fid = open(file_name,'r')
     i = 0
-    while True:
-        gc.disable()
-        lines = fid.readlines(10**8)
-        gc.enable()
-        if (not lines) or i > first:
-            break
-        for line in lines:
-            if line[:-1]:
-                i = i + 1
-                if i > first:
-                    break
-                else:
-                    yield line
-    fid.close()
+    for line in fastq_io.lines(file_name, size_buffer = 10**8):
+        if line[:-1]:
+            i = i + 1
+            if i > first:
+                break
+            else:
+                yield line
 
 #
 #
 #
 def read_fastq(file_name, size_buffer = 10**8):
-    fid = None
-    if file_name.lower().endswith('.gz'):
-        fid = gzip.open(file_name,'r')
-    else:
-        fid = open(file_name,'r')
-    while True:
-        gc.disable()
-        lines = fid.readlines(10**8)
-        gc.enable()
-        if not lines:
-            break
-        for line in lines:
-            if line[:-1]:
-                yield line
-    fid.close()
+    for line in fastq_io.lines(file_name, size_buffer = 10**8):
+        if line[:-1]:
+            yield line
 
 #
 #
@@ -239,58 +221,31 @@ def reads_from_paired_fastq_file(file_name_1, file_name_2, size_read_buffer = 10
 
     if piece and len(piece) != 4:
         print >>sys.stderr,"WARNING: Found unexpected ending of FASTQ files '%s' and '%s' but still continuing..." % (file_name_1,file_name_2)
+
+#
 #
 #
+def blocks_from_paired_fastq_file(file_name_1, file_name_2, size_block = 10000, size_read_buffer = 10**8):
+    # it gives blocks of SIZE_BLOCK pairs of reads (as one flat list of lines,
+    # eight lines for each pair of reads) such that they can be sent cheaply
+    # to the worker processes
+    block = []
+    for mate in reads_from_paired_fastq_file(file_name_1, file_name_2, size_read_buffer = size_read_buffer):
+        block.extend(mate)
+        if len(block) >= 8 * size_block:
+            yield block
+            block = []
+    if block:
+        yield block
 #
-class lines_to_file:
+#
+#
+class lines_to_file(fastq_io.lines_to_file):
     #
     def __init__(self, file_name, size_buffer = 10**8):
-        self.file_name = file_name
         if file_name:
             remove_file(file_name)
-            self.file_handle = open(file_name,'w')
-        self.size_buffer = size_buffer
-        self.data = []
-        self.size = 0
-    #
-    def add_line(self, line):
-#        line = line.rstrip('\n')+'\n'
-        gc.disable()
-        self.data.append(line)
-        gc.enable()
-        self.size = self.size + len(line)
-        if self.size > self.size_buffer:
-            self.__write_buffer()
-    #
-    def add_lines(self,lines):
-#        lines=[line.rstrip('\r\n')+'\n' for line in lines]
-        gc.disable()
-        self.data.extend(lines)
-        gc.enable()
-        self.size = self.size + sum([len(line) for line in lines])
-        if self.size > self.size_buffer:
-            self.__write_buffer()
-    #
-    def __write_buffer(self):
-        self.file_handle.writelines(self.data)
-        self.size = 0
-        self.data = []
-
-    def is_filename_valid(self):
-        if self.file_name:
-            return True
-        else:
-            return False
-
-    def close(self):
-        if self.is_filename_valid():
-            if self.data:
-                self.__write_buffer()
-            self.file_handle.close()
-            self.file_name = None
-
-    def __del__(self):
-        self.close()
+        fastq_io.lines_to_file.__init__(self, file_name, size_buffer = size_buffer)
 
 #
 #
@@ -357,133 +312,177 @@ def find_hard(ss,adp):
 #
 #
 #
-def fast_alignment(sa, sb, overlap = 13, wiggle = 1, adpt5 = "", adpt3 = ""):
-    # align a read on top of its mate read if this is possible
+def count_overlap_mismatches(pairs):
+    # for each pair of overlapping parts (x, y) of two reads it counts the
+    # mismatches (N is not considered a mismatch but N on both is) and the
+    # positions having N
+    return zip(mate_overlap.count_mismatches(pairs, ignore_n = True), mate_overlap.count_n(pairs))
+
+#
+#
+#
+def count_adapter_mismatches(pairs):
+    # for each pair (adapter, read) it counts the mismatches between the adapter
+    # and the read (N and . from the read are not considered mismatches)
+    return mate_overlap.count_adapter_mismatches(pairs)
+
+#
+#
+#
+def alignment_candidates(sa, sb, overlap = 13, wiggle = 1, adpt5 = "", adpt3 = ""):
+    # it gives the state of the alignment of a read on top of its mate read
+    # (after looking directly for the adapters) and the candidate overlaps
+    # (lib, s) in the order in which they should be tried
     na = len(sa)
     nb = len(sb)
-    trim_a = na
-    trim_b = 0
-    len_adpt5 = 0
+    len_adpt3 = len(adpt3) if adpt3 else 0
+    # state = [trim_a, trim_b, common, mis, mis5, mis3, p5, p3]
+    state = [na, 0, 0, -1, -1, -1, -1, -1]
+    candidates = []
+    # first look for adapter
+    p5 = -1
     if adpt5:
-        len_adpt5 = len(adpt5)
-    len_adpt3 = 0
+        p5 = sa.find(adpt5)
+    p3 = -1
     if adpt3:
-        len_adpt3 = len(adpt3)
-    positions = [ (nb - overlap - x, nb - x) for x in range(3,nb/4,7) ]
-    positions.insert(0,[-1,-1]) # this is I need it for allowing first to look for adapter
+        p3 = sb.find(adpt3)
+    found = True
+    if p3 == -1:
+        if p5 == -1:
+            found = False
+        else:
+            state[4] = 0
+            # try harder
+            p3 = find_hard(sb,adpt3)
+            if p3 == -1:
+                found = False
+            else:
+                state[5] = 1
+    elif p5 == -1:
+        state[5] = 0
+        # try harder
+        p5 = find_hard(sa,adpt5)
+        if p5 == -1:
+            found = False
+        else:
+            state[4] = 1
+    state[6] = p5
+    state[7] = p3
+    if found:
+        lib = p5 # position on first read
+        s = p3 + len_adpt3 # position on second read (reverse-complemented)
+        state[0] = lib
+        state[1] = s
+        state[2] = -1
+        candidates.append((lib, s))
     # do not forget! check that the positions are all positive
+    for x in xrange(3,nb/4,7):
+        (pa, pb) = (nb - overlap - x, nb - x)
+        if pb - pa < overlap - 1 or pa < 0 or pb < 0:
+            break
+        p = sa.find(sb[pa:pb], wiggle, -wiggle)
+        if p == -1 or p > pa:
+            continue
+        lib =  p + nb - pa
+        s = pa - p
+        if lib > na:
+            lib = na
+        candidates.append((lib, s))
+    return (state, candidates)
+
+#
+#
+#
+def fast_alignment_batch(pairs, overlap = 13, wiggle = 1, adpt5 = "", adpt3 = ""):
+    # align each read on top of its mate read if this is possible; the
+    # candidate overlaps of all pairs are checked together (the mismatches are
+    # counted for the whole batch at once)
     cut_mis_adapt = 0.3
     cut_mis = 0.3
-    p = -1
-    p5 = -1
-    p3 = -1
-    lib = 0
-    s = -1
-    common = 0
-    mis = -1
-    mis5 = -1
-    mis3 = -1
-    first = True
-    for (pa, pb) in positions:
-        if first:
-            first = False
-            p5 = -1
+    len_adpt5 = len(adpt5) if adpt5 else 0
+    len_adpt3 = len(adpt3) if adpt3 else 0
+    states = []
+    candidates = []
+    for (sa, sb) in pairs:
+        (x, y) = alignment_candidates(sa, sb, overlap, wiggle, adpt5, adpt3)
+        states.append(x)
+        candidates.append(y)
+    k = [0] * len(pairs)
+    active = [i for i in xrange(len(pairs)) if candidates[i]]
+    while active:
+        todo = []
+        for i in active:
+            (sa, sb) = pairs[i]
+            (lib, s) = candidates[i][k[i]]
+            # count the mismatches in the overlap; N is not considered a mismatch in the overlapping part
+            w = min(lib, len(sb) - s) if lib > 0 else 0
+            todo.append((sa[0:w], sb[s:s+w]))
+        counts = count_overlap_mismatches(todo)
+        accepted = []
+        next_active = []
+        for (i, (mis, n_notn)) in itertools.izip(active, counts):
+            (lib, s) = candidates[i][k[i]]
+            na = len(pairs[i][0])
+            if lib > 0 and float(n_notn) / float(lib) > 0.3:
+                mis = mis + n_notn
+            states[i][3] = mis
+            if mis > 0 and lib > 0 and ((mis / float(lib) > cut_mis) or (lib == na and mis / float(lib) > 0.05)):
+                k[i] = k[i] + 1
+                if k[i] < len(candidates[i]):
+                    next_active.append(i)
+            else:
+                accepted.append(i)
+        if accepted:
+            m5 = [-1] * len(accepted)
+            m3 = [-1] * len(accepted)
             if adpt5:
-                p5 = sa.find(adpt5)
-            p3 = -1
+                todo = []
+                for i in accepted:
+                    (sa, sb) = pairs[i]
+                    (lib, s) = candidates[i][k[i]]
+                    w = min(len_adpt5, len(sa) - lib)
+                    todo.append((adpt5[0:w], sa[lib:lib+w]))
+                m5 = count_adapter_mismatches(todo)
             if adpt3:
-                p3 = sb.find(adpt3)
-            if p3 == -1:
-                if p5 == -1:
-                    continue
-                else:
-                    mis5 = 0
-                    # try harder
-                    p3 = find_hard(sb,adpt3)
-                    if p3 == -1:
-                        continue
-                    else:
-                        mis3 = 1
-            elif p5 == -1:
-                mis3 = 0
-                # try harder
-                p5 = find_hard(sa,adpt5)
-                if p5 == -1:
-                    continue
-                else:
-                    mis5 = 1
-            #do
-            lib = p5 # position on first read
-            s = p3 + len_adpt3 # position on second read (reverse-complemented)
-            trim_a = lib
-            trim_b = s
+                todo = []
+                for i in accepted:
+                    (sa, sb) = pairs[i]
+                    (lib, s) = candidates[i][k[i]]
+                    u = max(0, len_adpt3 - s)
+                    todo.append((adpt3[u:], sb[s-len_adpt3+u:s]))
+                m3 = count_adapter_mismatches(todo)
+            for (i, mis5, mis3) in itertools.izip(accepted, m5, m3):
+                (lib, s) = candidates[i][k[i]]
+                state = states[i]
+                state[4] = mis5
+                if adpt5 and float(float(mis5) / float(len_adpt5)) <= float(cut_mis_adapt):
+                    # trim the read
+                    state[0] = lib
+                state[5] = mis3
+                if adpt3 and float(mis3) / float(len_adpt3) <= float(cut_mis_adapt):
+                    # trim the read
+                    state[1] = s
+                state[2] = lib
+        active = next_active
+
+    result = []
+    for (i, (trim_a, trim_b, common, mis, mis5, mis3, p5, p3)) in enumerate(states):
+        na = len(pairs[i][0])
+        if trim_a == na and trim_b == 0 and common != na:
             common = -1
-        elif pb - pa < overlap - 1 or pa < 0 or pb < 0:
-            break
-        else:
-            p = sa.find(sb[pa:pb], wiggle, -wiggle)
-            if p == -1 or p > pa:
-                continue
-            else:
-                lib =  p + nb - pa
-                s = pa - p
-                if lib > na:
-                    lib = na
-
-        #if lib == 0:
-        #    print "lib=0"
-        #print "lib",lib
-        #print sa,p
-        #print sb,s
-        #    t = ' ' * s
-        #    xa = "%s%s" % (t,sa)
-        #    xb = sb
-        #    print xa
-        #    print xb
-        # count the mismatches in the overlap; N is not considered a mismatch in the overlapping part
-        xlib = range(lib)
-        mis = len([1 for ix in xlib if s+ix<nb and ((sa[ix] != sb[s+ix] and sa[ix] != 'N' and sb[s+ix] != 'N') or ( sa[ix] == 'N' and sb[s+ix] == 'N'))])
-        n_notn = len([1 for ix in xlib if s+ix<nb and (sa[ix] == 'N' or sb[s+ix] == 'N')])
-        if lib > 0 and float(n_notn) / float(lib) > 0.3:
-            mis = mis + n_notn
-        if mis > 0 and lib > 0 and ((mis / float(lib) > cut_mis) or (lib == na and mis / float(lib) > 0.05)):
-            continue
+            trim_a = p5
+            trim_b = -1
+            if p3 != -1:
+                trim_b = p3 + len_adpt3
+        result.append((trim_a, trim_b, common, mis, mis5, mis3))
+    return result
 
-
-        mis5 = -1
-        if adpt5:
-            mis5 = len([1 for ix in xrange(len_adpt5) if lib+ix<na and adpt5[ix] != sa[lib+ix] and sa[lib+ix] != 'N' and sa[lib+ix] != '.'])
-            if float(float(mis5) / float(len_adpt5)) <= float(cut_mis_adapt):
-                # trim the read
-                trim_a = lib
-
-        mis3 = -1
-        if adpt3:
-            mis3 = len([1 for ix in xrange(len_adpt3) if s-len_adpt3 + ix>-1 and adpt3[ix] != sb[s-len_adpt3 + ix] and sb[s-len_adpt3 + ix] != 'N' and sb[s-len_adpt3 + ix] != '.'])
-            if float(mis3) / float(len_adpt3) <= float(cut_mis_adapt):
-                # trim the read
-                trim_b = s
-
-        #print xa
-        #print xb
-        #print lib, len("%s%s" % (t,sb)), mis, mis5, mis3
-        #print sa[lib:lib+len_adpt5]
-        #print sb[s-len_adpt3:s] if s-len_adpt3 > -1 else sb[0:s]
-        #print sa[:trim_a]
-        #print sb[trim_b:]
-        #print ""
-        #raw_input()
-        common = lib
-        break
-
-    if trim_a == na and trim_b == 0 and common != na:
-        common = -1
-        trim_a = p5
-        trim_b = -1
-        if p3 != -1:
-            trim_b = p3 + len_adpt3
-    #print ":::",trim_a,trim_b
-    return (trim_a, trim_b, common, mis, mis5, mis3)
+#
+#
+#
+def fast_alignment(sa, sb, overlap = 13, wiggle = 1, adpt5 = "", adpt3 = ""):
+    # align a read on top of its mate read if this is possible
+    return fast_alignment_batch([(sa, sb)], overlap, wiggle, adpt5, adpt3)[0]
 
 #
 #
@@ -491,71 +490,79 @@ def fast_alignment(sa, sb, overlap = 13, wiggle = 1, adpt5 = "", adpt3 = ""):
 def fix_N_in_overlap(ya, ybr, yb, la, lb, shift = -1):
     # replaces N with its corresponding nucleotide from the mate read
     # if the mate read overlaps over N
-    fixed_Ns = 0
-    if shift != -1 and (ya.find('N') != -1 or ybr.find('N') != -1):
-        #print "-----------------------"
-        #print la,lb,shift
-        #print ' '*shift+ya
-        #print ybr
-        e = lb - shift
-        if e > la:
-            e = la
-        f = lb
-        if la + shift < lb:
-            f = la + shift
-        ya1 = ya[0:e]
-        ya2 = ya[e:]
-        yb1 = ybr[0:shift]
-        yb2 = ybr[shift:f]
-        yb3 = ybr[f:lb]
-        c = []
-        #print "before"
-        #print ya1+'-'+ya2
-        #print yb2+'-'+yb3
-        for (ia,ib) in zip(ya1,yb2):
-            if ia == 'N' and ib != 'N':
-                c.append([ib,ib])
-                fixed_Ns = fixed_Ns + 1
-            elif ia != 'N'and ib == 'N':
-                c.append([ia,ia])
-                fixed_Ns = fixed_Ns + 1
-            else:
-                c.append([ia,ib])
-        c = zip(*c)
-        ya1 = ''.join(c[0])
-        yb2 = ''.join(c[1])
-        #print "after"
-        #print ya1
-        #print yb2
-        #print "final"
-        #print ya1 + ya2
-        #print dnaReverseComplement(yb1+yb2+yb3)
-        #print "-----------------------"
-        #
-        return (ya1 + ya2, dnaReverseComplement(yb1 + yb2 + yb3), fixed_Ns)
+    return fix_N_in_overlap_batch([(ya, ybr, yb, la, lb, shift)])[0]
+
+#
+#
+#
+def fix_N_in_overlap_batch(items):
+    # replaces N with its corresponding nucleotide from the mate read
+    # if the mate read overlaps over N (for a batch of pairs of reads given
+    # as (ya, ybr, yb, la, lb, shift))
+    result = [None] * len(items)
+    todo = []
+    for (i, (ya, ybr, yb, la, lb, shift)) in enumerate(items):
+        if shift != -1 and (ya.find('N') != -1 or ybr.find('N') != -1):
+            e = lb - shift
+            if e > la:
+                e = la
+            f = lb
+            if la + shift < lb:
+                f = la + shift
+            ya1 = ya[0:e]
+            yb2 = ybr[shift:f]
+            w = min(len(ya1), len(yb2))
+            if w == 0:
+                raise IndexError("No overlap found for fixing the Ns!")
+            todo.append((i, ya1[:w], yb2[:w], ya[e:], ybr[0:shift], ybr[f:lb]))
+        else:
+            result[i] = (ya, yb, 0)
+    if not todo:
+        return result
+    if numpy:
+        (a, n) = mate_overlap.matrix([el[1] for el in todo])
+        (b, n) = mate_overlap.matrix([el[2] for el in todo])
+        an = a == ord('N')
+        bn = b == ord('N')
+        fa = an & ~bn
+        fb = ~an & bn
+        fixed = (fa | fb).sum(axis = 1).tolist()
+        a2 = numpy.where(fa, b, a).tostring()
+        b2 = numpy.where(fb, a, b).tostring()
+        for (j, (i, ya1, yb2, ya2, yb1, yb3)) in enumerate(todo):
+            w = len(ya1)
+            ya1 = a2[j*n:j*n+w]
+            yb2 = b2[j*n:j*n+w]
+            result[i] = (ya1 + ya2, dnaReverseComplement(yb1 + yb2 + yb3), fixed[j])
     else:
-        return (ya, yb, fixed_Ns)
+        for (i, ya1, yb2, ya2, yb1, yb3) in todo:
+            c = []
+            fixed_Ns = 0
+            for (ia,ib) in itertools.izip(ya1,yb2):
+                if ia == 'N' and ib != 'N':
+                    c.append(ib)
+                    fixed_Ns = fixed_Ns + 1
+                elif ia != 'N'and ib == 'N':
+                    c.append(ia)
+                    fixed_Ns = fixed_Ns + 1
+                else:
+                    c.append(None)
+            ya1 = ''.join([x if x else y for (x,y) in itertools.izip(c,ya1)])
+            yb2 = ''.join([x if x else y for (x,y) in itertools.izip(c,yb2)])
+            result[i] = (ya1 + ya2, dnaReverseComplement(yb1 + yb2 + yb3), fixed_Ns)
+    return result
 
 
 #
 #
 #
-def compute(stuff):
-#def compute(mate, reads_overlap, wiggle, adapter5, adapter3, flag_log):
-    mate = stuff[0]
-    w = stuff[1]
-    reads_overlap = w.reads_overlap
-    wiggle = w.wiggle
-    adapter5 = w.adapter5
-    adapter3 = w.adapter3
-    flag_log = w.flag_log
-
-    a = mate[1]
-    b = dnaReverseComplement(mate[5])
+def compute(mate, a, b, alignment, fixed, flag_log = False):
+    # trims the pair of reads MATE given its ALIGNMENT (from 'fast_alignment')
+    # and the reads with the fixed Ns (from 'fix_N_in_overlap')
     bb = mate[5]
     na = len(a)
     nb = len(b)
-    (qa, qb, com, ml, m5, m3) = fast_alignment(a, b, overlap = reads_overlap, wiggle = wiggle, adpt5 = adapter5, adpt3 = adapter3)
+    (qa, qb, com, ml, m5, m3) = alignment
 
     st1 = -1
     st2 = -1
@@ -567,7 +574,7 @@ def compute(stuff):
     if com > -1:
         if com == na: # full/perfect overlap
             jj = jj + 1
-            (mate[1], mate[5], fixed_Ns) = fix_N_in_overlap(a, b, bb, na, nb, nb - com)
+            (mate[1], mate[5], fixed_Ns) = fixed
             fixedns = fixedns + fixed_Ns
             #mate[5] = 'N' * nb
             #mate[5] = "N" ## orig
@@ -588,7 +595,7 @@ def compute(stuff):
                     st1 = 0
                     st2 = 0
                 else: # qa != na & qa != 0 & qb != 0 => overlap and two adapters
-                    (mate[1], mate[5], fixed_Ns) = fix_N_in_overlap(a, b, bb, na, nb, nb - com)
+                    (mate[1], mate[5], fixed_Ns) = fixed
                     fixedns = fixedns + fixed_Ns
                     mate[1] = mate[1][0:qa]
                     mate[3] = mate[3][0:qa] + '\n'
@@ -601,7 +608,7 @@ def compute(stuff):
                     stn = qa
             else: # qa != na & qb == 0 => overlapping and only one adapter is found (on first read) instead of two adapters
                 jj = jj + 1
-                (mate[1], mate[5], fixed_Ns) = fix_N_in_overlap(a, b, bb, na, nb, nb - com)
+                (mate[1], mate[5], fixed_Ns) = fixed
                 fixedns = fixedns + fixed_Ns
                 mate[1] = mate[1][0:qa] # just trimming. should I set the other read to N?
                 mate[3] = mate[3][0:qa] + '\n'
@@ -610,7 +617,7 @@ def compute(stuff):
                 st1 = qa
         elif qb != 0: # qa == na & qb != 0 => overlapping and only one adapter is found (on second read) instead of two adapters
                 jj = jj + 1
-                (mate[1], mate[5], fixed_Ns) = fix_N_in_overlap(a, b, bb, na, nb, nb - com)
+                (mate[1], mate[5], fixed_Ns) = fixed
                 fixedns = fixedns + fixed_Ns
                 #mate[1] = 'N'
                 #mate[3] = mate[3][0]+'\n'
@@ -684,6 +691,93 @@ def compute(stuff):
     return (mate, st1, st2, stn, jj, x, fixedns)
 
 
+#
+#
+#
+_para = None
+def set_param(para):
+    global _para
+    _para = para
+
+#
+#
+#
+def compute_batch(block):
+    # trims all the pairs of reads from BLOCK (eight lines per pair of reads)
+    # and it gives the trimmed reads, the alignments (for log) and the
+    # statistics for the whole block
+    w = _para
+    mates = [block[k:k+8] for k in xrange(0,len(block),8)]
+    pairs = [(mate[1], dnaReverseComplement(mate[5])) for mate in mates]
+    alignments = fast_alignment_batch(pairs,
+                                      overlap = w.reads_overlap,
+                                      wiggle = w.wiggle,
+                                      adpt5 = w.adapter5,
+                                      adpt3 = w.adapter3)
+    # fix the Ns (in one batch) only for the pairs which need it
+    todo = []
+    for (i, (qa, qb, com, ml, m5, m3)) in enumerate(alignments):
+        (a, b) = pairs[i]
+        na = len(a)
+        if com > -1 and (com == na or qa == na or qa != 0 or qb == 0):
+            todo.append(i)
+    fixes = [None] * len(mates)
+    if todo:
+        r = fix_N_in_overlap_batch([(pairs[i][0], pairs[i][1], mates[i][5], len(pairs[i][0]), len(pairs[i][1]), len(pairs[i][1]) - alignments[i][2]) for i in todo])
+        for (i, x) in itertools.izip(todo, r):
+            fixes[i] = x
+
+    out_1 = []
+    out_2 = []
+    log = []
+    stat = dict()
+    statn = dict()
+    j = 0
+    all_fixed = 0
+    trim_n = w.trim_n
+    shortest_read = w.shortest_read
+    empty = w.empty_read
+    for (mate, (a, b), alignment, fixed) in itertools.izip(mates, pairs, alignments, fixes):
+        (mate, st1, st2, stn, jj, xx, fixedns) = compute(mate, a, b, alignment, fixed, w.flag_log)
+        all_fixed = all_fixed + fixedns
+        if st1 != -1:
+            stat[st1] = stat.get(st1,0) + 1
+        if st2 != -1:
+            stat[st2] = stat.get(st2,0) + 1
+        if stn != -1:
+            statn[stn] = statn.get(stn,0) + 1
+        j = j + jj
+
+        if trim_n:
+            # do N trimming from both ends
+            mm1 = mate[1].rstrip('\r\n')
+            if mm1.startswith('N') or mm1.endswith('N'):
+                mm2 = mate[3].rstrip('\r\n')
+                (mate[1], mate[3]) = trim_tail_n(mm1,mm2,trim_n)
+
+            mm1 = mate[5].rstrip('\r\n')
+            if mm1.startswith('N') or mm1.endswith('N'):
+                mm2 = mate[7].rstrip('\r\n')
+                (mate[5], mate[7]) = trim_tail_n(mm1,mm2,trim_n)
+
+        if len(mate[1]) < shortest_read + 1:
+            out_1.append(mate[0])
+            out_1.extend(empty[1:4])
+        else:
+            out_1.extend(mate[0:4])
+
+        if len(mate[5]) < shortest_read + 1:
+            out_2.append(mate[4])
+            out_2.extend(empty[1:4])
+        else:
+            out_2.extend(mate[4:8])
+
+        if w.flag_log and jj != 0:
+            log.append(xx)
+
+    return (''.join(out_1), ''.join(out_2), ''.join(log), stat, statn, j, all_fixed, len(mates))
+
+
 def norepeats(x, t = 0.30):
     cc = dict()
     tt = float(len(x)-1) * t
@@ -707,6 +801,9 @@ class param:
         self.adapter5 = None
         self.adapter3 = None
         self.flag_log = None
+        self.trim_n = None
+        self.shortest_read = None
+        self.empty_read = None
 
 
 #
@@ -869,157 +966,54 @@ def trim_adapter(input_file_1,
 
         #
 
+        para.trim_n = trim_n
+        para.shortest_read = shortest_read
+        para.empty_read = list(empty_read)
+
         all_fixed = 0
-        give = None
+        pool = None
         if cpus == 1:
-
-            for stuff in itertools.imap(
-                                    compute,
-                                    itertools.izip_longest(
-                                        reads_from_paired_fastq_file(
-                                            input_file_1, 
-                                            input_file_2
-                                        ),
-                                        [],
-                                        fillvalue = para
-                                    )
-                                ):
-
-                i = i + 1
-                mate = stuff[0]
-                st1 = stuff[1]
-                st2 = stuff[2]
-                stn = stuff[3]
-                jj = stuff[4]
-                xx = stuff[5]
-                fixed = stuff[6]
-                all_fixed = all_fixed + fixed
-
-                if st1 != -1:
-                    stat[st1] = stat.get(st1,0) + 1
-                if st2 != -1:
-                    stat[st2] = stat.get(st2,0) + 1
-                if stn != -1:
-                    statn[stn] = statn.get(stn,0) + 1
-                j = j + jj
-
-                if trim_n:
-                    # do N trimming from both ends
-                    mm1 = mate[1].rstrip('\r\n')
-                    if mm1.startswith('N') or mm1.endswith('N'):
-                        mm2 = mate[3].rstrip('\r\n')
-                        (mate[1], mate[3]) = trim_tail_n(mm1,mm2,trim_n)
-
-                    mm1 = mate[5].rstrip('\r\n')
-                    if mm1.startswith('N') or mm1.endswith('N'):
-                        mm2 = mate[7].rstrip('\r\n')
-                        (mate[5], mate[7]) = trim_tail_n(mm1,mm2,trim_n)
-
-
-                if len(mate[1]) < shortest_read + 1:
-                    out_1.add_line(mate[0])
-                    out_1.add_line(empty_read[1])
-                    out_1.add_line(empty_read[2])
-                    out_1.add_line(empty_read[3])
-                else:
-                    out_1.add_lines(mate[0:4])
-
-                if len(mate[5]) < shortest_read + 1:
-                    out_2.add_line(mate[4])
-                    out_2.add_line(empty_read[1])
-                    out_2.add_line(empty_read[2])
-                    out_2.add_line(empty_read[3])
-                else:
-                    out_2.add_lines(mate[4:8])
-
-
-                if flag_log and last_j != j:
-                    log.add_line(xx)
-
-                last_j = j
-                if verbose and i % 1 == 10000000: # 10000000
-                    print >>sys.stderr,"   %d pair-reads [ %d (%f%%) reads trimmed ]" % (i,j,100*float(j)/float(2*i))
-
-            
+            set_param(para)
+            results = itertools.imap(
+                            compute_batch,
+                            blocks_from_paired_fastq_file(
+                                input_file_1,
+                                input_file_2
+                            )
+                        )
         else:
-            pool = multiprocessing.Pool(processes = cpus)
-
-            for stuff in pool.imap_unordered(
-                                            compute,
-                                            itertools.izip_longest(
-                                                reads_from_paired_fastq_file(
-                                                    input_file_1,
-                                                    input_file_2
-                                                ),
-                                                [],
-                                                fillvalue = para
-                                            ),
-                                        chunksize = 100
-                                        ):
-
-                i = i + 1
-                mate = stuff[0]
-                st1 = stuff[1]
-                st2 = stuff[2]
-                stn = stuff[3]
-                jj = stuff[4]
-                xx = stuff[5]
-                fixed = stuff[6]
-                all_fixed = all_fixed + fixed
-
-                if st1 != -1:
-                    stat[st1] = stat.get(st1,0) + 1
-                if st2 != -1:
-                    stat[st2] = stat.get(st2,0) + 1
-                if stn != -1:
-                    statn[stn] = statn.get(stn,0) + 1
-                j = j + jj
-
-                if trim_n:
-                    # do N trimming from both ends
-                    mm1 = mate[1].rstrip('\r\n')
-                    if mm1.startswith('N') or mm1.endswith('N'):
-                        mm2 = mate[3].rstrip('\r\n')
-                        (mate[1], mate[3]) = trim_tail_n(mm1,mm2,trim_n)
-
-                    mm1 = mate[5].rstrip('\r\n')
-                    if mm1.startswith('N') or mm1.endswith('N'):
-                        mm2 = mate[7].rstrip('\r\n')
-                        (mate[5], mate[7]) = trim_tail_n(mm1,mm2,trim_n)
-
-
-                if len(mate[1]) < shortest_read + 1:
-                    out_1.add_line(mate[0])
-                    out_1.add_line(empty_read[1])
-                    out_1.add_line(empty_read[2])
-                    out_1.add_line(empty_read[3])
-                else:
-                    out_1.add_lines(mate[0:4])
-
-                if len(mate[5]) < shortest_read + 1:
-                    out_2.add_line(mate[4])
-                    out_2.add_line(empty_read[1])
-                    out_2.add_line(empty_read[2])
-                    out_2.add_line(empty_read[3])
-                else:
-                    out_2.add_lines(mate[4:8])
-
-
-                if flag_log and last_j != j:
-                    log.add_line(xx)
-
-                last_j = j
-                if verbose and i % 1 == 10000000: # 10000000
-                    print >>sys.stderr,"   %d pair-reads [ %d (%f%%) reads trimmed ]" % (i,j,100*float(j)/float(2*i))
-
-
-            
+            # the workers get the parameters only once and the pairs of reads in
+            # blocks; the order of the reads is kept
+            pool = multiprocessing.Pool(processes = cpus, initializer = set_param, initargs = (para,))
+            results = pool.imap(
+                            compute_batch,
+                            blocks_from_paired_fastq_file(
+                                input_file_1,
+                                input_file_2
+                            )
+                        )
+
+        for (x1, x2, xx, st, stn, jj, fixed, n) in results:
+            i = i + n
+            j = j + jj
+            all_fixed = all_fixed + fixed
+            for (k,v) in st.iteritems():
+                stat[k] = stat.get(k,0) + v
+            for (k,v) in stn.iteritems():
+                statn[k] = statn.get(k,0) + v
+
+            out_1.add_line(x1)
+            out_2.add_line(x2)
+            if flag_log and xx:
+                log.add_line(xx)
+
+            if verbose and i % 10000000 == 0:
+                print >>sys.stderr,"   %d pair-reads [ %d (%f%%) reads trimmed ]" % (i,j,100*float(j)/float(2*i))
+
+        if pool:
             pool.close()
             pool.join()
 
-
-
-
         out_1.close()
         out_2.close()
 
@@ -50,6 +50,13 @@ import math
 import shutil
 import multiprocessing
 import itertools
+import string
+import fastq_io
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 #
 #
 #
@@ -89,60 +96,7 @@ def readfq(fp): # this is a generator function
 #
 #
 def fastq(file_name, size_buffer = 10**8):
-    fid = None
-    if file_name == '-':
-        fid = sys.stdin
-    else:
-        fid = open(file_name,'r')
-    while True:
-        gc.disable()
-        lines = fid.readlines(size_buffer)
-        gc.enable()
-        if not lines:
-            break
-        for line in lines:
-            yield line
-    fid.close()
-
-
-#
-#
-#
-class tofastq:
-    #
-    def __init__(self, file_name, size_buffer = 10**8):
-        self.file_name = file_name
-        if file_name:
-            if os.path.isfile(file_name) or os.path.islink(file_name):
-                os.remove(file_name)
-            elif os.path.isdir(file_name):
-                shutil.rmtree(file_name)
-            self.file_handle = open(file_name,'w')
-        self.size_buffer = size_buffer
-        self.data = []
-        self.size = 0
-    #
-    def add(self, name, seq, qual):
-        line = "%s\n%s\n+\n%s\n" % (name,seq,qual)
-        self.data.append(line)
-        self.size = self.size + len(line)
-        if self.size > self.size_buffer:
-            self.__write_buffer()
-    #
-    def __write_buffer(self):
-        self.file_handle.writelines(self.data)
-        self.size = 0
-        self.data = []
-    #
-    def close(self):
-        if self.file_name:
-            if self.data:
-                self.__write_buffer()
-            self.file_handle.close()
-            self.file_name = None
-
-    def __del__(self):
-        self.close()
+    return fastq_io.lines(file_name, size_buffer = size_buffer)
 
 
 
@@ -190,7 +144,7 @@ def bits(d):
     return v
 
 
-def codelength(s,w=24,o=12,kmer=2):
+def codelength_dict(s,w=24,o=12,kmer=2):
     # w = window length
     # o = window overlap
     # n = nucleotides in kmer
@@ -227,6 +181,263 @@ def codelength(s,w=24,o=12,kmer=2):
         #print "       ",b,sorted(counter(x[i:i+w+1]).items()),"(validate)"
     #x = (stuff[0][0],stuff[0][1],stuff[0][2],m)
     return m
+
+#
+# k-mer engine: the k-mers are integer codes (A=0, C=1, G=2, T=3) and their
+# counts are kept in fixed-size lists/arrays which are updated incrementally
+#
+_ACGT = string.maketrans('ACGT','\x00\x01\x02\x03')
+
+_plogp2 = [0.0]
+_plogp = [0.0]
+def plogp_tables(n):
+    # it gives the tables of e*log2(e) and e*ln(e) for e = 0..n
+    if len(_plogp2) < n + 1:
+        for e in xrange(len(_plogp2),n+1):
+            _plogp2.append(float(e)*math.log(float(e),2))
+            _plogp.append(float(e)*math.log(float(e)))
+    return (_plogp2, _plogp)
+
+def kmer_codes(x, kmer = 2):
+    # it gives the codes of all kmers of X (-1 for the kmers which contain
+    # other letters than A, C, G, or T)
+    m = 4 ** kmer
+    codes = []
+    v = 0
+    bad = kmer # how many letters should still be read for having a valid kmer
+    for (i,c) in enumerate(bytearray(x.translate(_ACGT))):
+        if c > 3:
+            bad = kmer
+            c = 0
+        elif bad > 0:
+            bad = bad - 1
+        v = (v * 4 + c) % m
+        if i >= kmer - 1:
+            codes.append(v if bad == 0 else -1)
+    return codes
+
+def _codes_matrix(x, kmer = 2):
+    # it gives the codes of the kmers as a matrix for a list of sequences
+    # (which have all the same length and contain only A, C, G, and T)
+    n = len(x[0])
+    a = numpy.frombuffer(''.join(x).translate(_ACGT), dtype = numpy.uint8).reshape((len(x),n)).astype(numpy.int64)
+    codes = numpy.zeros((len(x),n-kmer+1), dtype = numpy.int64)
+    for j in xrange(kmer):
+        codes = codes * 4 + a[:,j:n-kmer+1+j]
+    return codes
+
+def _windows(n, w, o):
+    # the starts of the windows as done by 'codelength'
+    len_s = n - w
+    r = [0]
+    if len_s != 0:
+        r = range(0,len_s,w-o)
+    if r and r[-1] != len_s:
+        r.append(len_s)
+    return r
+
+def codelength(s,w=24,o=12,kmer=2):
+    # w = window length
+    # o = window overlap
+    # n = nucleotides in kmer
+    # the minimum codelength of the windows of sequence S, where the counts of
+    # the kmers (and their sum of e*log2(e)) are updated incrementally from
+    # one window to the next one (same as 'codelength_dict')
+    x = s.upper()
+    if x.find('N') !=-1:
+        x = x.replace('N','A')
+    step = w - o
+    if step < 1 or o < kmer - 1 or x.translate(None,'ACGT'):
+        return codelength_dict(s,w,o,kmer)
+    n = len(x)
+    m = len(s)*100000
+    codes = kmer_codes(x,kmer)
+    (t, ignore) = plogp_tables(2*n+2)
+    cnt = [0] * (4 ** kmer)
+    total = 0
+    sp = 0.0
+    for e in codes[0:max(0,min(o,n)-kmer+1)]:
+        c = cnt[e]
+        cnt[e] = c + 1
+        sp = sp + t[c+1] - t[c]
+        total = total + 1
+    c1 = []
+    for i in _windows(n,w,o):
+        for e in codes[i+o-kmer+1:max(0,min(i+w,n)-kmer+1)]:
+            c = cnt[e]
+            cnt[e] = c + 1
+            sp = sp + t[c+1] - t[c]
+            total = total + 1
+        for e in c1:
+            c = cnt[e]
+            if c > 0:
+                cnt[e] = c - 1
+                sp = sp + t[c-1] - t[c]
+                total = total - 1
+        b = 0
+        if total != 0:
+            b = math.log(total,2) - sp / float(total)
+        if b < m:
+            m = b
+        c1 = codes[i:max(i,min(i+step+kmer-1,n)-kmer+1)]
+    return m
+
+def codelength_batch(seqs,w=24,o=12,kmer=2):
+    # it is the same as 'codelength' but for a list of sequences; the sequences
+    # having the same length are done together using NumPy
+    r = [None] * len(seqs)
+    step = w - o
+    groups = dict()
+    for (i,s) in enumerate(seqs):
+        x = s.upper()
+        if x.find('N') !=-1:
+            x = x.replace('N','A')
+        if numpy and step > 0 and o >= kmer - 1 and len(x) >= kmer and (not x.translate(None,'ACGT')):
+            if len(x) not in groups:
+                groups[len(x)] = ([],[])
+            groups[len(x)][0].append(i)
+            groups[len(x)][1].append(x)
+        else:
+            r[i] = codelength(s,w,o,kmer)
+    for (n,(ids,x)) in groups.iteritems():
+        m = numpy.empty(len(ids), dtype = numpy.float64)
+        m.fill(n*100000)
+        r1 = _windows(n,w,o)
+        if r1:
+            codes = _codes_matrix(x,kmer)
+            rows = numpy.arange(len(ids))
+            t = numpy.array(plogp_tables(2*n+2)[0])
+            cnt = numpy.zeros((len(ids),4**kmer), dtype = numpy.int64)
+            for j in xrange(0,max(0,min(o,n)-kmer+1)):
+                cnt[rows,codes[:,j]] += 1
+            c1 = []
+            for i in r1:
+                for j in xrange(i+o-kmer+1,max(0,min(i+w,n)-kmer+1)):
+                    cnt[rows,codes[:,j]] += 1
+                for j in c1:
+                    k = codes[:,j]
+                    cnt[rows,k] = numpy.maximum(cnt[rows,k] - 1, 0)
+                total = cnt.sum(axis = 1)
+                sp = t[cnt].sum(axis = 1)
+                d = numpy.maximum(total,1)
+                b = numpy.where(total != 0, numpy.log2(d) - sp / d, 0)
+                m = numpy.minimum(m,b)
+                c1 = xrange(i,max(i,min(i+step+kmer-1,n)-kmer+1))
+        for (i,v) in itertools.izip(ids,m.tolist()):
+            r[i] = v
+    return r
+
+def entropy_mask(s,w=40,kmer=2,cutoff=0.1):
+    # it masks with Ns the windows of length W which have the entropy of their
+    # kmers less than CUTOFF (similar to 'entropymask=t' of BBDuk), where:
+    # - the reads shorter than W are not masked at all,
+    # - the kmers containing other letters than A, C, G, T (e.g. N) are not
+    #   counted but the frequencies of the kmers are still relative to all the
+    #   W-KMER+1 kmers of the window (so the windows having many Ns are masked
+    #   less often than if only their valid kmers were used),
+    # - the entropy is normalized to [0,1] by the largest entropy which a window
+    #   can have, i.e. log(min(4**KMER,W-KMER+1)).
+    n = len(s)
+    wk = w - kmer + 1
+    if n < w or wk < 2:
+        return s
+    codes = kmer_codes(s.upper(),kmer)
+    (ignore, t) = plogp_tables(wk)
+    norm = float(wk) * math.log(min(4 ** kmer,wk))
+    lwk = math.log(wk)
+    cnt = [0] * (4 ** kmer)
+    total = 0
+    sp = 0.0
+    for e in codes[0:wk]:
+        if e != -1:
+            c = cnt[e]
+            cnt[e] = c + 1
+            sp = sp + t[c+1] - t[c]
+            total = total + 1
+    masked = []
+    for i in xrange(0,n-w+1):
+        if i:
+            e = codes[i-1]
+            if e != -1:
+                c = cnt[e]
+                cnt[e] = c - 1
+                sp = sp + t[c-1] - t[c]
+                total = total - 1
+            e = codes[i+wk-1]
+            if e != -1:
+                c = cnt[e]
+                cnt[e] = c + 1
+                sp = sp + t[c+1] - t[c]
+                total = total + 1
+        if (lwk * total - sp) / norm < cutoff:
+            if masked and masked[-1][1] >= i:
+                masked[-1][1] = i + w
+            else:
+                masked.append([i,i+w])
+    if masked:
+        x = []
+        j = 0
+        for (a,b) in masked:
+            x.append(s[j:a])
+            x.append('N'*(b-a))
+            j = b
+        x.append(s[j:])
+        s = ''.join(x)
+    return s
+
+def entropy_mask_batch(seqs,w=40,kmer=2,cutoff=0.1):
+    # it is the same as 'entropy_mask' but for a list of sequences; the
+    # sequences having the same length are done together using NumPy, where
+    # the counts of the kmers in all windows are given by cumulative sums
+    if not numpy:
+        return [entropy_mask(s,w,kmer,cutoff) for s in seqs]
+    r = list(seqs)
+    wk = w - kmer + 1
+    if wk < 2:
+        return r
+    groups = dict()
+    for (i,s) in enumerate(seqs):
+        if len(s) >= w:
+            if len(s) not in groups:
+                groups[len(s)] = []
+            groups[len(s)].append(i)
+    t = numpy.array(plogp_tables(wk)[1])
+    norm = float(wk) * math.log(min(4 ** kmer,wk))
+    lwk = math.log(wk)
+    for (n,ids) in groups.iteritems():
+        x = [seqs[i] for i in ids]
+        u = [e.upper() for e in x]
+        a = numpy.frombuffer(''.join(u).translate(_ACGT), dtype = numpy.uint8).reshape((len(ids),n))
+        bad = a > 3
+        a = numpy.where(bad, 0, a).astype(numpy.int64)
+        codes = numpy.zeros((len(ids),n-kmer+1), dtype = numpy.int64)
+        valid = numpy.ones((len(ids),n-kmer+1), dtype = bool)
+        for j in xrange(kmer):
+            codes = codes * 4 + a[:,j:n-kmer+1+j]
+            valid = valid & ~bad[:,j:n-kmer+1+j]
+        codes = numpy.where(valid, codes, -1)
+        nw = n - w + 1
+        total = numpy.zeros((len(ids),nw), dtype = numpy.int64)
+        sp = numpy.zeros((len(ids),nw), dtype = numpy.float64)
+        c = numpy.zeros((len(ids),n-kmer+2), dtype = numpy.int64)
+        for k in xrange(4 ** kmer):
+            numpy.cumsum(codes == k, axis = 1, out = c[:,1:])
+            e = c[:,wk:] - c[:,:nw]
+            total += e
+            sp += t[e]
+        low = (lwk * total - sp) / norm < cutoff
+        if not low.any():
+            continue
+        d = numpy.zeros((len(ids),n+1), dtype = numpy.int64)
+        d[:,0:nw] += low
+        d[:,w:w+nw] -= low
+        cover = numpy.cumsum(d[:,0:n], axis = 1) > 0
+        y = numpy.frombuffer(''.join(x), dtype = numpy.uint8).reshape((len(ids),n))
+        y = numpy.where(cover, ord('N'), y).astype(numpy.uint8).tostring()
+        for (j,i) in enumerate(ids):
+            r[i] = y[j*n:(j+1)*n]
+    return r
+
 #def wrap_codelength(stuff):
 #    m = codelength(stuff[0][1],stuff[1].window_length,stuff[1].window_overlap)
 #    return (stuff[0][0],stuff[0][1],stuff[0][2],m)
@@ -253,8 +464,51 @@ def wrap_codelength(stuff):
 #
 class param:
     def __init__(self):
-        self.window = None
-        self.score = None
+        self.window_length = None
+        self.window_overlap = None
+        self.nucleotide = None
+        self.threshold = None
+        self.mask_entropy = None
+
+#
+#
+#
+_para = None
+def set_param(para):
+    global _para
+    _para = para
+
+#
+#
+#
+def filter_block(block):
+    # it filters (or masks) all the reads from a block of FASTQ text
+    par = _para
+    data = []
+    data_str = []
+    f = 0
+    if par.mask_entropy is not None:
+        # the reads are kept as they are (e.g. whole header lines), only the
+        # sequences are masked
+        lines = block.splitlines(True)
+        seqs = [lines[i].rstrip('\r\n') for i in xrange(1,len(lines),4)]
+        masked = entropy_mask_batch(seqs,par.window_length,par.nucleotide,par.mask_entropy)
+        for (i,seq,new_seq) in itertools.izip(xrange(1,len(lines),4),seqs,masked):
+            if new_seq != seq:
+                f = f + 1
+                lines[i] = new_seq + '\n'
+        return (''.join(lines), '', len(seqs), f)
+    else:
+        reads = list(readfq(iter(block.splitlines(True))))
+        seqs = [aread[1] for aread in reads]
+        scores = codelength_batch(seqs,par.window_length,par.window_overlap,par.nucleotide)
+        for ((name,seq,qual),r) in itertools.izip(reads,scores):
+            if r > par.threshold:
+                data.append("%s\n%s\n+\n%s\n" % (name,seq,qual))
+            else:
+                f = f + 1
+                data_str.append("%s\n%s\n+\n%s\n" % (name,seq,qual))
+    return (''.join(data), ''.join(data_str), len(reads), f)
 
 #
 #
@@ -269,9 +523,13 @@ def str_filter(
                kmer = 2,
                threshold = 1.4,
                cpus = 0,
-               verbose = True):
+               verbose = True,
+               mask_entropy = None):
     """
     'Short Tandem Repeat' Filter
+
+    If MASK_ENTROPY is given then the low entropy regions of the reads are
+    masked with Ns (and no read is removed).
     """
 
 
@@ -281,49 +539,46 @@ def str_filter(
     if verbose:
         print >>sys.stderr,"Using",cpus,"process(es)..."
 
-    # in case the pool.imap does not work use itertools.imap instead
-
-    pool = multiprocessing.Pool(processes=cpus)
     p = 0
     f = 0
-    fq = tofastq(file_output)
-    fs = tofastq(file_str) if file_str else None
+    fq = fastq_io.lines_to_file(file_output)
+    fs = fastq_io.lines_to_file(file_str) if file_str and mask_entropy is None else None
 
     para = param()
     para.window_length = window_length
     para.window_overlap = window_overlap
     para.nucleotide = kmer
-    for w in pool.imap_unordered(wrap_codelength,
-                       itertools.izip_longest(readfq(fastq(file_input)),
-                                              [],
-                                              fillvalue = para),
-                       chunksize = 100):
-        if not w:
-            continue
-        name = w[0]
-        seq = w[1]
-        qual = w[2]
-        r = w[3]
-
-        p = p + 1
-        if r > threshold:
-            fq.add(name,seq,qual)
-        else:
-            f = f + 1
-            if fs:
-                fs.add(name,seq,qual)
-            #print seq,r
+    para.threshold = threshold
+    para.mask_entropy = mask_entropy
+    # the reads are sent to the processes in large blocks of FASTQ text
+    pool = None
+    if cpus == 1:
+        set_param(para)
+        results = itertools.imap(filter_block, fastq_io.blocks(file_input))
+    else:
+        pool = multiprocessing.Pool(processes = cpus, initializer = set_param, initargs = (para,))
+        results = pool.imap(filter_block, fastq_io.blocks(file_input))
+    for (text, text_str, n, c) in results:
+        p = p + n
+        f = f + c
+        fq.add_block(text)
+        if fs:
+            fs.add_block(text_str)
     fq.close()
     if fs:
         fs.close()
 
-    pool.close()
-    pool.join()
+    if pool:
+        pool.close()
+        pool.join()
 
 
     t = "Empty input file!"
     if p != 0:
-        t ="%.5f %% reads removed due to STR (short tandem repeats) content (%d out of %d)!" % ((100*float(f)/float(p)),f,p)
+        if mask_entropy is not None:
+            t ="%.5f %% reads masked due to low entropy (%d out of %d)!" % ((100*float(f)/float(p)),f,p)
+        else:
+            t ="%.5f %% reads removed due to STR (short tandem repeats) content (%d out of %d)!" % ((100*float(f)/float(p)),f,p)
     if verbose:
         print >>sys.stderr,t
     if file_log:
@@ -360,7 +615,7 @@ Email: Daniel.Nicorici@gmail.com
 
 """
 
-    version = "%prog 0.12 beta"
+    version = "%prog 0.13 beta"
 
     parser = MyOptionParser(usage       = usage,
                             epilog      = epilog,
@@ -422,6 +677,12 @@ Email: Daniel.Nicorici@gmail.com
                       default = 1.4, # original was 2.2
                       help = """Any window which compresses less this threshold is considered to contain a short tandem repeat and the read will be filtered out. Default is %default.""")
 
+    parser.add_option("-e","--mask-entropy",
+                      action = "store",
+                      type = "float",
+                      dest = "mask_entropy",
+                      help = """If it is specified then no read is removed and instead the low entropy regions of the reads are masked with Ns. A window (its length is given by '--length') is masked if the entropy of its kmers (their length is given by '--kmer'), normalized to [0,1], is less than this threshold (similar to 'entropymask=t' of BBDuk). For example, 0.1. Default is %default.""")
+
     parser.add_option("-a","--author",
                       action = "store",
                       type = "string",
@@ -460,7 +721,8 @@ Email: Daniel.Nicorici@gmail.com
                options.kmer,
                options.codelength_threshold,
                options.processes,
-               options.verbose)
+               options.verbose,
+               options.mask_entropy)
 
 if __name__ == '__main__':
     main()
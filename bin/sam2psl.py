@@ -364,9 +364,14 @@ import os
 import sys
 import optparse
 import gc
+import re
+import itertools
+import multiprocessing
+import fastq_io
 
 
 cigar_set = (['M','I','D','N','S','H','P','=','X'])
+cigar_regex = re.compile(r'(\d+)([MIDNSHP=X])')
 # SAM columns
 sam_QNAME = 0
 sam_FLAG = 1
@@ -404,6 +409,8 @@ psl_blockSizes = 18
 psl_qStarts = 19
 psl_tStarts = 20
 psl_seq = 21
+psl_format = '\t'.join(['%s'] * (psl_tStarts + 1)) + '\n'
+psl_format_seq = '\t'.join(['%s'] * (psl_seq + 1)) + '\n'
 
 #
 psl_empty_line = [
@@ -438,6 +445,26 @@ def parse_cigar(c,toversion="1.3"):
     #          converted into one region of "M") if CIGAR is given as version 1.4
     #          If it is set to "1.4" not conversion to 1.3 is done is done!
     r = []
+    mismatches_x = 0
+    c = c.upper()
+    n = 0
+    for (d,a) in cigar_regex.findall(c):
+        dd = int(d)
+        r.append((a,dd))
+        if a == 'X':
+            mismatches_x = mismatches_x + dd
+        n = n + len(d) + 1
+    if n != len(c):
+        # not a usual CIGAR
+        return parse_cigar_scan(c,toversion)
+    if mismatches_x and toversion == '1.3':
+        r = cigar_13(r)
+    return (r,mismatches_x)
+
+#########################
+def parse_cigar_scan(c,toversion="1.3"):
+    # parse CIGAR string (character by character)
+    r = []
     d = ''
     mismatches_x = 0
     c = c.upper()
@@ -454,27 +481,33 @@ def parse_cigar(c,toversion="1.3"):
             print >>sys.stderr,"ERROR: unknown CIGAR:",c
             sys.exit(1)
     if mismatches_x and toversion == '1.3':
-        rr = []
-        i = -1
-        n = len(r)
-        while True:
-            i = i + 1
-            if i == n:
-                r = rr
-                break
-            elif r[i][0] in ('X', '=', 'M'):
-                b = r[i][1]
-                for j in xrange(i+1,n):
-                    if r[j][0] in ('=','M','X'):
-                        b = b + r[j][1]
-                    else:
-                        i = j - 1
-                        break
-                rr.append(('M',b))
-            else:
-                rr.append(r[i])
+        r = cigar_13(r)
     return (r,mismatches_x)
 
+#########################
+def cigar_13(r):
+    # the neighbours "X", "=" and "M" are joined into one "M"
+    rr = []
+    i = -1
+    n = len(r)
+    while True:
+        i = i + 1
+        if i == n:
+            r = rr
+            break
+        elif r[i][0] in ('X', '=', 'M'):
+            b = r[i][1]
+            for j in xrange(i+1,n):
+                if r[j][0] in ('=','M','X'):
+                    b = b + r[j][1]
+                else:
+                    i = j - 1
+                    break
+            rr.append(('M',b))
+        else:
+            rr.append(r[i])
+    return r
+
 #########################
 def blocks(cigar, ig = 0, use_cigar_13 = True):
     # returns block of matches
@@ -535,8 +568,31 @@ def blocks(cigar, ig = 0, use_cigar_13 = True):
     return (rr,rg,match,mismatch,mismatch_clip,mismatch_x,insert_ref,insert_ref_count,insert_query,insert_query_count,seq_len)
 
 
+#########################
+_blocks = dict()
+def cached_blocks(cigar, ig = 0, use_cigar_13 = True):
+    # same as blocks() but the result is kept for each distinct CIGAR
+    key = (cigar, use_cigar_13)
+    b = _blocks.get(key,None)
+    if b is None:
+        if len(_blocks) > 1000000:
+            _blocks.clear()
+        b = blocks(cigar, 0, use_cigar_13)
+        _blocks[key] = b
+    if ig:
+        b = (b[0], [(e[0]+ig,e[1]+ig) for e in b[1]]) + b[2:]
+    return b
+
 #########################
 def get_psl(sam, lens, use_cigar_13=True , replace_string = '', read_sequence=False):
+    # same as psl_values() but all the values are given as strings
+    psl = psl_values(sam, lens, use_cigar_13, replace_string, read_sequence)
+    if psl:
+        psl = map(str,psl)
+    return psl
+
+#########################
+def psl_values(sam, lens, use_cigar_13=True , replace_string = '', read_sequence=False):
     # USE_CIGAR_13 - If True then the input CIGAR string is in format 1.4 then it will be converted into format 1.3
     #cig, qSize, tSize, tStart, strand):
     # returns PSL coordinates
@@ -571,7 +627,7 @@ def get_psl(sam, lens, use_cigar_13=True , replace_string = '', read_sequence=Fa
             # start position
             psl[psl_tStart] = int(sam[sam_POS])-1
 
-            (interval_query,interval_ref, match, mismatch, mismatch_clip, mismatch_x,insert_ref,insert_ref_count,insert_query,insert_query_count,seq_len) = blocks(sam[sam_CIGAR], ig = psl[psl_tStart], use_cigar_13 = use_cigar_13)
+            (interval_query,interval_ref, match, mismatch, mismatch_clip, mismatch_x,insert_ref,insert_ref_count,insert_query,insert_query_count,seq_len) = cached_blocks(sam[sam_CIGAR], ig = psl[psl_tStart], use_cigar_13 = use_cigar_13)
 
             # read sequence length
             if sam[sam_SEQ] != '*' and sam[sam_CIGAR].find('H') == -1:
@@ -587,10 +643,19 @@ def get_psl(sam, lens, use_cigar_13=True , replace_string = '', read_sequence=Fa
             psl[psl_tBaseInsert] = insert_ref
 
             # extract the mismatches from SAM (using tag NM:i)
-            tag_nm_i = [e.partition("NM:i:")[2] for e in sam[sam_TAG:] if e.startswith('NM:i:')] # NM is mismatches per reads
-            if not tag_nm_i:
-                tag_nm_i = [e.partition("nM:i:")[2] for e in sam[sam_TAG:] if e.startswith('nM:i:')] # nM is not good because but is better than nothing because it is mismatches per fragment and not per read!
-            tag_nm_i = int(tag_nm_i[0]) if tag_nm_i else 0
+            # NM is mismatches per reads
+            # nM is not good because but is better than nothing because it is mismatches per fragment and not per read!
+            tag_nm_i = None
+            tag_nm = None
+            for e in sam[sam_TAG:]:
+                if e.startswith('NM:i:'):
+                    tag_nm_i = e[5:]
+                    break
+                elif tag_nm is None and e.startswith('nM:i:'):
+                    tag_nm = e[5:]
+            if tag_nm_i is None:
+                tag_nm_i = tag_nm
+            tag_nm_i = int(tag_nm_i) if tag_nm_i else 0
             if tag_nm_i > float(0.90)*seq_len:
                 tag_nm_i = 0
             #print >>sys.stderr,"tag NM:i:",tag_nm_i
@@ -633,80 +698,112 @@ def get_psl(sam, lens, use_cigar_13=True , replace_string = '', read_sequence=Fa
                 if len(psl) < psl_seq + 1:
                     psl.append(sam[sam_SEQ])
 
-            psl = map(str,psl)
-
     return psl
 
 #########################
 def getlines(a_filename):
-    # it gives chunks
-    fin = None
-    if a_filename == '-':
-        fin = sys.stdin
-    else:
-        fin = open(a_filename,'r')
+    # it gives first the lengths of the reference sequences and after that
+    # the alignments (split in columns)
+    header = None
+    for chunk in getchunks(a_filename):
+        if header is None:
+            header = chunk
+            yield header
+            continue
+        gc.disable()
+        lines = [line.rstrip('\r').split('\t') for line in chunk.split('\n') if line.rstrip('\r') and not line.startswith('@')]
+        gc.enable()
+        for line in lines:
+            yield line
+
+#########################
+def getchunks(a_filename, size = 10**7):
+    # it gives first the lengths of the reference sequences (from header)
+    # and after that chunks of text (with whole lines) containing the
+    # alignments; the input can be SAM (also compressed) or BAM
+    fin = fastq_io.open_input(a_filename)
     header = dict()
     first = True
     while True:
-        lines = fin.readlines(10**8)
+        lines = fin.readlines(size)
         if not lines:
             break
-        gc.disable()
-        lines = [line.rstrip('\r\n').split('\t') for line in lines if line.rstrip('\r\n')]
-        gc.enable()
-        for line in lines:
-            if line[0].startswith('@'):
-                if line[0].startswith('@SQ') and line[1].startswith('SN:') and line[2].startswith('LN:'):
-                    k = line[1][3:]
-                    v = int(line[2][3:])
-                    header[k] = v
-                else:
-                    pass
-            else:
-                if first:
+        if first:
+            k = 0
+            for line in lines:
+                x = line.rstrip('\r\n')
+                if x.startswith('@'):
+                    x = x.split('\t')
+                    if x[0].startswith('@SQ') and x[1].startswith('SN:') and x[2].startswith('LN:'):
+                        header[x[1][3:]] = int(x[2][3:])
+                elif x:
                     first = False
                     yield header
                     header = None
-                yield line
+                    break
+                k = k + 1
+            if first:
+                continue
+            lines = lines[k:]
+        yield ''.join(lines)
     if first and header:
         yield header
     fin.close()
 
+#########################
+_para = None
+def set_param(para):
+    global _para
+    _para = para
+
+#########################
+def convert(chunk):
+    # it converts a chunk of SAM lines into PSL lines
+    (lengths, use_cigar_13, replace_string, read_sequence) = _para
+    f = psl_format_seq if read_sequence else psl_format
+    psl = []
+    for line in chunk.split('\n'):
+        line = line.rstrip('\r')
+        if (not line) or line.startswith('@'):
+            continue
+        temp = psl_values(line.split('\t'), lengths, use_cigar_13, replace_string, read_sequence)
+        if temp:
+            psl.append(f % tuple(temp))
+    return ''.join(psl)
+
 ############################
-def sam2psl(file_in,file_ou, use_cigar_13 = True,replace_string = '',read_sequence=False):
-    # It converts a SAM file to PSL file
+def sam2psl(file_in,file_ou, use_cigar_13 = True,replace_string = '',read_sequence=False, cpus = 1):
+    # It converts a SAM (or BAM) file to PSL file
     # USE_CIGAR_13 - If True then the input CIGAR string is in format 1.4 then it will be converted into format 1.3
+    # CPUS - number of processes used for conversion (the order of the alignments is kept)
     fou = None
     if file_ou == '-':
         fou = sys.stdout
     else:
         fou = open(file_ou,'w')
 
-    # PSL data
-    psl = []
-    psl_empty_line = ['0']*21
-    # processing
-    i = 0
-    size_lines = 10**6
+    if cpus == 0:
+        cpus = multiprocessing.cpu_count()
+
+    chunks = getchunks(file_in)
     lengths = None
-    for line in getlines(file_in):
-        if i == 0:
-            lengths = line
-            i = i + 1
-            continue
-        i = i + 1
-        temp = get_psl(line,lengths, use_cigar_13, replace_string, read_sequence)
-        # saving
-        if temp:
-            psl.append('\t'.join(temp)+'\n')
-            #print >>sys.stderr, '\t'.join(line)
-            #print >>sys.stderr, '\t'.join(temp)
-            #print >>sys.stderr, "-----------------------------------------------"
-            if i > size_lines:
-                fou.writelines(psl)
-                psl = []
-    if psl:
-        fou.writelines(psl)
+    for lengths in chunks:
+        break
+    if lengths is not None:
+        para = (lengths, use_cigar_13, replace_string, read_sequence)
+        pool = None
+        if cpus > 1:
+            pool = multiprocessing.Pool(processes = cpus, initializer = set_param, initargs = (para,))
+            results = pool.imap(convert, chunks)
+        else:
+            set_param(para)
+            results = itertools.imap(convert, chunks)
+        for psl in results:
+            if psl:
+                fou.write(psl)
+        if pool:
+            pool.close()
+            pool.join()
     fou.close()
 
 
@@ -715,8 +812,8 @@ if __name__ == '__main__':
     #command line parsing
 
     usage = "%prog [options]"
-    description = """It takes as input a file in SAM format and it converts into a PSL format file."""
-    version = "%prog 0.14 beta"
+    description = """It takes as input a file in SAM (or BAM) format and it converts into a PSL format file."""
+    version = "%prog 0.15 beta"
 
     parser = optparse.OptionParser(usage = usage, description = description, version = version)
 
@@ -724,7 +821,7 @@ if __name__ == '__main__':
                       action="store",
                       type="string",
                       dest="input_filename",
-                      help="""The input file in SAM format.""")
+                      help="""The input file in SAM format. If it ends with '.bam' then it is read as BAM format (using 'samtools').""")
 
     parser.add_option("--skip-conversion-cigar-1.3","-4",
                       action = "store_true",
@@ -748,6 +845,13 @@ if __name__ == '__main__':
                       dest = "replace_reads_ids",
                       help = """In the reads ids (also known as query name in PSL) the string specified here will be replaced with '/' (which is used in Solexa for /1 and /2).""")
 
+    parser.add_option("--processes","-p",
+                      action = "store",
+                      type = "int",
+                      dest = "processes",
+                      default = 1,
+                      help = """Number of parallel processes/CPUs to be used for conversion. In case of value 0 then the program will use all the CPUs which are found. The default value is %default.""")
+
     parser.add_option("--output","-o",
                       action="store",
                       type="string",
@@ -773,6 +877,7 @@ if __name__ == '__main__':
         options.output_filename, 
         use_cigar_13 = (not options.skip_conversion_cigar_13),
         replace_string = t,
-        read_sequence = options.read_sequence
+        read_sequence = options.read_sequence,
+        cpus = options.processes
         )
     #
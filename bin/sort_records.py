@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+It sorts (using an external merge sort) the records of a text file, such as
+FASTQ (i.e. records of four lines) or MAP/PSL (i.e. records of one line with
+tab-separated columns), in the same order as 'LC_ALL=C sort' does.
+
+The input is read in chunks of records, which are sorted at the same time by
+several processes, and the sorted chunks (i.e. runs) are spilled on disk as
+compressed blocks. At the end, all the runs are merged (k-way merge) and
+streamed to the output. If the entire input fits in one chunk then nothing is
+spilled on disk.
+
+The records are compared using the given keys (i.e. columns, where the columns
+of a FASTQ record are its four lines) as binary strings (or numbers) and, like
+'sort', if the keys are equal then the entire records are compared (unless the
+unique option is used, in which case only the first record of several records
+with equal keys is kept). The records are not formatted as one line, like in
+'paste - - - - | sort | tr "\\t" "\\n"', and only the needed columns are
+extracted for the keys.
+
+
+
+Author: Daniel Nicorici, Daniel.Nicorici@gmail.com
+
+Copyright (c) 2009-2019 Daniel Nicorici
+
+This file is part of FusionCatcher.
+
+FusionCatcher is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+FusionCatcher is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with FusionCatcher (see file 'COPYING.txt').  If not, see
+<http://www.gnu.org/licenses/>.
+
+By default, FusionCatcher is running BLAT aligner
+<http://users.soe.ucsc.edu/~kent/src/> but it offers also the option to disable
+all its scripts which make use of BLAT aligner if you choose explicitly to do so.
+BLAT's license does not allow to be used for commercial activities. If BLAT
+license does not allow to be used in your case then you may still use
+FusionCatcher by forcing not use the BLAT aligner by specifying the option
+'--skip-blat'. Fore more information regarding BLAT please see its license.
+
+Please, note that FusionCatcher does not require BLAT in order to find
+candidate fusion genes!
+
+This file is not running/executing/using BLAT.
+"""
+import sys
+import os
+import re
+import gc
+import zlib
+import heapq
+import struct
+import optparse
+import tempfile
+import itertools
+import multiprocessing
+
+import fastq_io
+
+BLOCK = 2**20 # size of the uncompressed blocks of the runs
+FANIN = 200 # maximum number of runs merged at once
+
+_number = re.compile(r'^\s*([+-]?(\d+\.?\d*|\.\d+))')
+
+#########################
+def numeric(s):
+    # the leading number of a string (as 'sort -n' does), 0 if there is none
+    try:
+        return int(s)
+    except ValueError:
+        m = _number.match(s)
+        return float(m.group(1)) if m else 0
+
+#########################
+def parse_keys(keys):
+    # from a list like ['10,10', '12,12n'] (see 'sort -k') it gives a list of
+    # (column, numeric) where the columns start from 0
+    r = []
+    for k in keys:
+        n = k.endswith('n')
+        k = k.rstrip('n').split(',')
+        if len(k) == 2 and k[0] != k[1]:
+            print >>sys.stderr,"ERROR: Only keys of one column are supported (e.g. '-k 2,2')!"
+            sys.exit(1)
+        r.append((int(k[0]) - 1, n))
+    return r
+
+#########################
+def parse_size(size):
+    # buffer size given as 'sort --buffer-size', e.g. 80%, 26G, 500M, 100K (default unit is K)
+    size = str(size).strip().upper()
+    if size.endswith('%'):
+        mem = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        return int(mem * float(size[:-1]) / 100)
+    units = {'B':1, 'K':2**10, 'M':2**20, 'G':2**30, 'T':2**40}
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(float(size) * units['K'])
+
+#########################
+def records(text, lines_per_record):
+    # it splits a text (ending with a newline) into records without newlines
+    lines = text.split('\n')
+    lines.pop() # the last one is empty
+    if lines_per_record == 1:
+        return lines
+    return map('\n'.join, itertools.izip(*[lines[i::lines_per_record] for i in xrange(lines_per_record)]))
+
+#########################
+def key_function(keys, lines_per_record):
+    # it gives a function which gives the sorting key of a record
+    sep = '\n' if lines_per_record > 1 else '\t'
+    if not keys:
+        return None
+    m = max([k[0] for k in keys]) + 1
+    if len(keys) == 1:
+        (c, n) = keys[0]
+        def f(r):
+            t = r.split(sep,m)
+            t = t[c] if c < len(t) else ''
+            return numeric(t) if n else t
+        return f
+    def f(r):
+        t = r.split(sep,m)
+        t.extend([''] * (m - len(t) + 1))
+        return tuple([numeric(t[c]) if n else t[c] for (c,n) in keys])
+    return f
+
+#########################
+def decorator(keys, lines_per_record):
+    # it gives a function which gives for a record a string which is sorted
+    # (as string) in the same order as (keys, record), i.e. the string keys
+    # separated by zeros followed by the record; it gives None if the records
+    # themselves are sorted in this order (i.e. no keys or only the first
+    # column as key) and False if there are numeric keys
+    if (not keys) or keys == [(0, False)]:
+        return None
+    if [k for k in keys if k[1]]:
+        return False
+    key = key_function(keys, lines_per_record)
+    if len(keys) == 1:
+        return lambda r: '%s\0%s' % (key(r), r)
+    return lambda r: '%s\0%s' % ('\0'.join(key(r)), r)
+
+#########################
+def sort_records(recs, keys, lines_per_record, unique):
+    # it sorts in memory a list of records
+    key = key_function(keys, lines_per_record)
+    if key is None or (keys == [(0, False)] and not unique):
+        recs.sort()
+        if unique:
+            recs = [r for (r,g) in itertools.groupby(recs)]
+        return recs
+    if unique:
+        # the first record of the records with equal keys is kept (stable)
+        ks = [key(r) for r in recs]
+        o = sorted(xrange(len(recs)), key = ks.__getitem__)
+        r = []
+        last = None
+        for i in o:
+            if ks[i] != last or not r:
+                r.append(recs[i])
+                last = ks[i]
+        return r
+    dec = decorator(keys, lines_per_record)
+    if dec:
+        n = len(keys)
+        d = [dec(r) for r in recs]
+        d.sort()
+        return [el.split('\0',n)[n] for el in d]
+    d = [(key(r), r) for r in recs]
+    d.sort()
+    return [el[1] for el in d]
+
+#########################
+def write_block(fou, block, level):
+    # it writes one (compressed) block of records prefixed by its size
+    block.append('')
+    data = zlib.compress('\n'.join(block), level) if level else '\n'.join(block)
+    fou.write(struct.pack('<I', len(data)))
+    fou.write(data)
+
+#########################
+def write_run(recs, tmp_dir, level):
+    # it writes the sorted records (given by an iterable, which is consumed
+    # as a stream) as compressed blocks in a temporary file
+    (h, filename) = tempfile.mkstemp(prefix = 'sort-run-', suffix = '.bin', dir = tmp_dir)
+    fou = os.fdopen(h, 'wb')
+    try:
+        block = []
+        size = 0
+        for r in recs:
+            block.append(r)
+            size = size + len(r) + 1
+            if size >= BLOCK:
+                write_block(fou, block, level)
+                block = []
+                size = 0
+        if block:
+            write_block(fou, block, level)
+    except:
+        fou.close()
+        os.remove(filename)
+        raise
+    fou.close()
+    return filename
+
+#########################
+def read_run(filename, lines_per_record, level):
+    # it gives the records of a run written by WRITE_RUN
+    fin = open(filename, 'rb')
+    while True:
+        h = fin.read(4)
+        if not h:
+            break
+        data = fin.read(struct.unpack('<I', h)[0])
+        if level:
+            data = zlib.decompress(data)
+        for r in records(data, lines_per_record):
+            yield r
+    fin.close()
+
+#########################
+_para = None
+def set_param(para):
+    global _para
+    _para = para
+
+#########################
+def make_run(text):
+    # it sorts a chunk of text and it writes it on disk as a run
+    (keys, lines_per_record, unique, tmp_dir, level) = _para
+    gc.disable()
+    recs = sort_records(records(text, lines_per_record), keys, lines_per_record, unique)
+    gc.enable()
+    return write_run(recs, tmp_dir, level)
+
+#########################
+def chunks(fin, lines_per_record, size):
+    # it gives chunks of text of about SIZE bytes which contain only entire records
+    rest = []
+    while True:
+        gc.disable()
+        lines = fin.readlines(size)
+        gc.enable()
+        if not lines:
+            break
+        if rest:
+            lines = rest + lines
+        if lines[-1] and not lines[-1].endswith('\n'):
+            lines[-1] = lines[-1] + '\n'
+        k = len(lines) - len(lines) % lines_per_record
+        rest = lines[k:]
+        if k:
+            yield ''.join(lines[:k])
+    if rest:
+        yield ''.join(rest + ['\n'] * (lines_per_record - len(rest)))
+
+#########################
+def merge(runs, keys, lines_per_record, unique, level):
+    # it merges the sorted runs (k-way merge) and it gives the sorted records
+    key = key_function(keys, lines_per_record)
+    dec = decorator(keys, lines_per_record)
+    if key is None or (dec is None and not unique):
+        it = heapq.merge(*[read_run(f, lines_per_record, level) for f in runs])
+        if unique:
+            it = (r for (r,g) in itertools.groupby(it))
+        for r in it:
+            yield r
+    elif dec and not unique:
+        n = len(keys)
+        for el in heapq.merge(*[itertools.imap(dec, read_run(f, lines_per_record, level)) for f in runs]):
+            yield el.split('\0',n)[n]
+    else:
+        def keyed(i, f):
+            for r in read_run(f, lines_per_record, level):
+                yield (key(r), i, r) if unique else (key(r), r)
+        it = heapq.merge(*[keyed(i, f) for (i, f) in enumerate(runs)])
+        if unique:
+            last = None
+            first = True
+            for el in it:
+                if first or el[0] != last:
+                    yield el[2]
+                    last = el[0]
+                    first = False
+        else:
+            for el in it:
+                yield el[1]
+
+#########################
+def sort_file(input_filename,
+              output_filename,
+              keys = [],
+              fastq = False,
+              unique = False,
+              tab = False,
+              buffer_size = '1G',
+              cpus = 1,
+              tmp_dir = None,
+              level = 1):
+    # It sorts the records of the input file (FASTQ or lines with tab-separated columns).
+    # KEYS - list of keys as given to 'sort -k' (e.g. ['1,1', '12,12n'])
+    # TAB - the FASTQ records are written as one line (i.e. as 'paste - - - -' does)
+    # LEVEL - compression level of the runs (0 is for no compression)
+    lines_per_record = 4 if fastq else 1
+    keys = parse_keys(keys)
+    if cpus == 0:
+        cpus = multiprocessing.cpu_count()
+    # the records take in memory several times the size of the text
+    size = max(2**20, parse_size(buffer_size) / (4 * (cpus + 1)))
+
+    fin = fastq_io.open_input(input_filename)
+    fou = sys.stdout if output_filename == '-' else open(output_filename, 'w')
+
+    def write(recs):
+        recs = iter(recs)
+        while True:
+            block = list(itertools.islice(recs, 100000))
+            if not block:
+                break
+            if tab:
+                block = [r.replace('\n', '\t') for r in block]
+            block.append('')
+            fou.write('\n'.join(block))
+
+    data = chunks(fin, lines_per_record, size)
+    first = None
+    for first in data:
+        break
+    second = None
+    for second in data:
+        break
+
+    runs = []
+    try:
+        if second is None:
+            # everything fits in memory
+            if first:
+                gc.disable()
+                recs = sort_records(records(first, lines_per_record), keys, lines_per_record, unique)
+                gc.enable()
+                write(recs)
+        else:
+            para = (keys, lines_per_record, unique, tmp_dir, level)
+            data = itertools.chain([first, second], data)
+            if cpus > 1:
+                # at most CPUS chunks are sorted at the same time (and kept in memory)
+                pool = multiprocessing.Pool(processes = cpus, initializer = set_param, initargs = (para,))
+                pending = []
+                for text in data:
+                    pending.append(pool.apply_async(make_run, (text,)))
+                    text = None
+                    if len(pending) >= cpus:
+                        runs.append(pending.pop(0).get())
+                for p in pending:
+                    runs.append(p.get())
+                pool.close()
+                pool.join()
+            else:
+                set_param(para)
+                for text in data:
+                    runs.append(make_run(text))
+            data = None
+            first = None
+            second = None
+            # too many runs are merged first into larger runs
+            while len(runs) > FANIN:
+                r = []
+                for i in xrange(0, len(runs), FANIN):
+                    group = runs[i:i+FANIN]
+                    if len(group) == 1:
+                        r.append(group[0])
+                        continue
+                    filename = write_run(merge(group, keys, lines_per_record, unique, level), tmp_dir, level)
+                    for f in group:
+                        os.remove(f)
+                    r.append(filename)
+                runs = r
+            write(merge(runs, keys, lines_per_record, unique, level))
+    finally:
+        for f in runs:
+            if os.path.exists(f):
+                os.remove(f)
+    fin.close()
+    fou.close()
+
+
+if __name__ == '__main__':
+
+    #command line parsing
+
+    usage = "%prog [options]"
+    description = """It sorts the records of a text file (e.g. FASTQ, MAP, PSL) in the same order as 'LC_ALL=C sort' (using an external merge sort)."""
+    version = "%prog 0.10 beta"
+
+    parser = optparse.OptionParser(usage = usage, description = description, version = version)
+
+    parser.add_option("--input","-i",
+                      action = "store",
+                      type = "string",
+                      dest = "input_filename",
+                      help = """The input text file (also given thru STDIN or as gzipped file).""")
+
+    parser.add_option("--output","-o",
+                      action = "store",
+                      type = "string",
+                      dest = "output_filename",
+                      help = """The output text file containing the sorted records (also given thru STDOUT).""")
+
+    parser.add_option("--fastq","-q",
+                      action = "store_true",
+                      dest = "fastq",
+                      default = False,
+                      help = """If it is set then the input is a FASTQ file and a record is formed by four lines (which are its columns). By default a record is one line with tab-separated columns.""")
+
+    parser.add_option("--key","-k",
+                      action = "append",
+                      type = "string",
+                      dest = "keys",
+                      default = [],
+                      help = """A key given as a column, e.g. '2,2' or '12,12n' (numeric), like for 'sort -k'. It can be given several times. If it is not given then the entire records are compared.""")
+
+    parser.add_option("--unique","-u",
+                      action = "store_true",
+                      dest = "unique",
+                      default = False,
+                      help = """If it is set then only the first record of several records with equal keys is written.""")
+
+    parser.add_option("--tab",
+                      action = "store_true",
+                      dest = "tab",
+                      default = False,
+                      help = """If it is set then the FASTQ records are written as one line with tab-separated columns (i.e. like 'paste - - - -').""")
+
+    parser.add_option("--buffer-size","-S",
+                      action = "store",
+                      type = "string",
+                      dest = "buffer_size",
+                      default = "1G",
+                      help = """The memory used for sorting (given as for 'sort --buffer-size'). Default is '%default'.""")
+
+    parser.add_option("--parallel","-p",
+                      action = "store",
+                      type = "int",
+                      dest = "processes",
+                      default = 1,
+                      help = """The number of processes used for sorting the chunks of input at the same time. If it is 0 then all the CPUs are used. Default is '%default'.""")
+
+    parser.add_option("--tmp_dir","-T",
+                      action = "store",
+                      type = "string",
+                      dest = "tmp_dir",
+                      default = None,
+                      help = """The temporary directory where the sorted chunks are written.""")
+
+    parser.add_option("--compress-level","-c",
+                      action = "store",
+                      type = "int",
+                      dest = "level",
+                      default = 1,
+                      help = """The compression level (0 to 9) of the sorted chunks written in the temporary directory. If it is 0 then they are not compressed. Default is '%default'.""")
+
+    (options,args) = parser.parse_args()
+
+    # validate options
+    if not (options.input_filename and
+            options.output_filename
+            ):
+        parser.print_help()
+        parser.error("Input and output files should be specified!")
+        sys.exit(1)
+
+    # running
+    sort_file(options.input_filename,
+              options.output_filename,
+              keys = options.keys,
+              fastq = options.fastq,
+              unique = options.unique,
+              tab = options.tab,
+              buffer_size = options.buffer_size,
+              cpus = options.processes,
+              tmp_dir = options.tmp_dir,
+              level = options.level)
+    #
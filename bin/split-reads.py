@@ -46,7 +46,7 @@ import os
 import optparse
 import gc
 import shutil
-import gzip
+import fastq_io
 import string
 #import tempfile
 
@@ -78,76 +78,10 @@ def int2str(x,n=2):
 #
 #
 def reads_from_fastq_file(f_name,size_read_buffer=10**8):
-    fid = None
-    if f_name == '-':
-        fid = sys.stdin
-    elif f_name.lower().endswith('.gz'):
-        fid = gzip.open(f_name,'r')
-    else:
-        fid = open(f_name,'r')
-    piece = []
-    i = 0
-    while True:
-        gc.disable()
-        lines = fid.readlines(size_read_buffer)
-        gc.enable()
-        if not lines:
-            break
-        for a_line in lines:
-            i = i + 1
-            piece.append(a_line)
-            if i == 4:
-                yield (piece[0],piece[1],piece[3])
-                piece = []
-                i = 0
-    fid.close()
+    for (r0,r1,r2,r3) in fastq_io.records(f_name,size_read_buffer):
+        yield (r0,r1,r3)
 
-class lines_to_file:
-    def __init__(self,file_name,size_buffer=10**8):
-        self.file_name = file_name
-        if file_name:
-            if file_name == "-":
-                self.file_handle = sys.stdout
-            elif file_name.lower().endswith('.gz'):
-                self.file_handle = gzip.open(file_name,'w')
-            else:
-                self.file_handle = open(file_name,'w')
-        self.size_buffer=size_buffer
-        self.data=[]
-        self.size=0
-    def add_line(self,line):
-        #line = line.rstrip('\r\n')+'\n'
-        gc.disable()
-        self.data.append(line)
-        gc.enable()
-        self.size = self.size + len(line)
-        if self.size>self.size_buffer:
-            self.__write_buffer()
-    def add_lines(self,lines):
-        gc.disable()
-        lines=[line.rstrip('\r\n')+'\n' for line in lines]
-        self.data.extend(lines)
-        self.size=self.size+sum([len(line) for line in lines])
-        gc.enable()
-        if self.size>self.size_buffer:
-            self.__write_buffer()
-    def __write_buffer(self):
-        self.file_handle.writelines(self.data)
-        self.size = 0
-        self.data = []
-    def is_filename_valid(self):
-        if self.file_name:
-            return True
-        else:
-            return False
-    def close(self):
-        if self.is_filename_valid():
-            if self.data:
-                self.__write_buffer()
-            self.file_handle.close()
-            self.file_name = None
-    def __del__(self):
-        self.close()
+lines_to_file = fastq_io.lines_to_file
 
 ##################################
 def givemeid(rep_solex_id,aread,iii):
@@ -41,87 +41,13 @@ import os
 import sys
 import optparse
 import gc
-import gzip
+import fastq_io
 
 def reads_from_fastq_file(f_name,size_read_buffer=10**8):
-    fid = None
-    if f_name == '-':
-        fid = sys.stdin
-    elif f_name.lower().endswith('.gz'):
-        fid = gzip.open(f_name,'r')
-    else:
-        fid = open(f_name,'r')
-    piece = [None,None,None,None]
-    i = 0
-    while True:
-        gc.disable()
-        lines=fid.readlines(size_read_buffer)
-        gc.enable()
-        if not lines:
-            break
-        for a_line in lines:
-            i = i + 1
-            piece[i-1] = a_line.rstrip('\r\n')
-            #piece.append(a_line[:].rstrip('\r\n'))
-            if i == 4:
-                piece[2] = '+'
-                yield piece
-                piece = [None,None,None,None]
-                i = 0
-    fid.close()
-
-class lines_to_file:
-    def __init__(self,file_name,size_buffer=10**8):
-        self.file_name=file_name
-        if file_name == '-':
-            self.file_handle = sys.stdout
-        elif file_name.lower().endswith('.gz'):
-            self.file_handle = gzip.open(file_name,'w')
-        else:
-            self.file_handle = open(file_name,'w')
-        self.size_buffer=size_buffer
-        self.data=[]
-        self.size=0
-    def add_line(self,line):
-        line=line+'\n'
-        gc.disable()
-        self.data.append(line)
-        gc.enable()
-        self.size=self.size+len(line)
-        if self.size>self.size_buffer:
-            self.__write_buffer()
-    def add_simple_line(self,line):
-        gc.disable()
-        self.data.append(line)
-        gc.enable()
-        self.size=self.size+len(line)
-        if self.size>self.size_buffer:
-            self.__write_buffer()
-    def add_lines(self,lines):
-        gc.disable()
-        lines=[line+'\n' for line in lines]
-        self.data.extend(lines)
-        gc.enable()
-        self.size=self.size+sum([len(line) for line in lines])
-        if self.size>self.size_buffer:
-            self.__write_buffer()
-    def __write_buffer(self):
-        self.file_handle.writelines(self.data)
-        self.size=0
-        self.data=[]
-    def is_filename_valid(self):
-        if self.file_name:
-            return True
-        else:
-            return False
-    def close(self):
-        if self.is_filename_valid():
-            if self.data:
-                self.__write_buffer()
-            self.file_handle.close()
-            self.file_name = None
-    def __del__(self):
-        self.close()
+    for (r0,r1,r2,r3) in fastq_io.records(f_name,size_read_buffer):
+        yield [r0.rstrip('\r\n'),r1.rstrip('\r\n'),'+',r3.rstrip('\r\n')]
+
+lines_to_file = fastq_io.lines_to_file
 
 def trim_poly_5_end(r, q, nucleotide, no_repeats = 9,empty=False):
     n = len(r)
@@ -274,7 +200,7 @@ if __name__ == '__main__':
                 c = c + 1
             else:
                 #data.add_lines([id,ts,'+',tq])
-                data.add_simple_line("%s\n%s\n+\n%s\n" % (id,ts,tq))
+                data.add_line("%s\n%s\n+\n%s\n" % (id,ts,tq))
                 j = j + 1
     else:
         for reads in reads_from_fastq_file(options.input_filename):
@@ -309,7 +235,7 @@ if __name__ == '__main__':
 #                    break
             if options.keep_too_short or len(ts) >= thr:
                 #data.add_lines([id,ts,'+',tq])
-                data.add_simple_line("%s\n%s\n+\n%s\n" % (id,ts,tq))
+                data.add_line("%s\n%s\n+\n%s\n" % (id,ts,tq))
                 j = j + 1
             if h:
                 c = c + 1
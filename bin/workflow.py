@@ -56,6 +56,9 @@ The main goal is to compute checksums for:
   alphabetical order).
 
 The checksums are saved by default in the file 'checksums.txt' in the current path.
+The checksums of the files are also saved in 'checksums.txt.index' together with
+their inode, size, and modification time, such that when the workflow is re-run
+the checksum of a file which has not changed is not computed again.
 This can be changed by changing for example the line
 
 job = pipeline()
@@ -320,6 +323,9 @@ import math
 import errno
 import subprocess
 import tempfile
+import threading
+import collections
+import fcntl
 
 #import multiprocessing
 
@@ -388,12 +394,140 @@ class _adler32:
         return self.crc
 
 
+#############################
+class _process:
+    """
+    It executes a command line using the shell (like os.system does) such that
+    its STDERR is streamed to the STDERR of the workflow and its last lines are
+    kept in memory, and it measures the resources used by the command.
+    """
+    def __init__(self, cmd_line, stderr_lines = 1000):
+        self.cmd_line = cmd_line
+        self.stderr = collections.deque(maxlen = stderr_lines)
+        self.exit_code = None
+        self.usage = None
+        self.start = time.time()
+        self.end = None
+        self.process = subprocess.Popen(cmd_line,
+                                        shell = True,
+                                        stderr = subprocess.PIPE,
+                                        close_fds = True)
+        self.reader = threading.Thread(target = self.__read)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def __read(self):
+        for line in iter(self.process.stderr.readline, ''):
+            sys.stderr.write(line)
+            sys.stderr.flush()
+            self.stderr.append(line)
+        self.process.stderr.close()
+
+    def __wait4(self, options):
+        # os.wait4 is not restarted (in Python 2) when it is interrupted by a signal
+        while True:
+            try:
+                return os.wait4(self.process.pid, options)
+            except OSError as e:
+                if e.errno != errno.EINTR:
+                    raise
+
+    def __done(self, status, usage):
+        self.end = time.time()
+        self.usage = usage
+        if os.WIFSIGNALED(status):
+            self.exit_code = - os.WTERMSIG(status)
+        else:
+            self.exit_code = os.WEXITSTATUS(status)
+        self.process.returncode = self.exit_code
+        self.reader.join()
+
+    def poll(self):
+        """
+        It gives the exit code of the command or None if it is still running.
+        """
+        if self.exit_code is None:
+            (pid, status, usage) = self.__wait4(os.WNOHANG)
+            if pid:
+                self.__done(status, usage)
+        return self.exit_code
+
+    def wait(self):
+        """
+        It waits for the command to finish and it gives its exit code.
+        """
+        if self.exit_code is None:
+            (pid, status, usage) = self.__wait4(0)
+            self.__done(status, usage)
+        return self.exit_code
+
+    def stats(self):
+        """
+        It gives the wall time (seconds), CPU time (seconds), peak RSS (bytes),
+        bytes read and bytes written by the command (and its children).
+        """
+        r = (0.0, 0.0, 0, 0, 0)
+        if self.usage is not None:
+            u = self.usage
+            r = (self.end - self.start,
+                 u.ru_utime + u.ru_stime,
+                 u.ru_maxrss * 1024, # it is in kilobytes on Linux
+                 u.ru_inblock * 512, # blocks of 512 bytes
+                 u.ru_oublock * 512)
+        return r
+
+
+#############################
+class _slots:
+    """
+    It is a counting semaphore which is shared by several processes (e.g.
+    several workflows running at the same time) and it is built from the
+    locks (see FCNTL.FLOCK) of the files found in a given directory. A lock is
+    released automatically also when the process holding it dies.
+    """
+    def __init__(self, path, count):
+        self.path = path
+        self.count = count
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+
+    def acquire(self, wait = True):
+        """
+        It gives a file handle which holds the lock (i.e. the slot) or None if
+        all the slots are taken and WAIT is False.
+        """
+        while True:
+            for i in xrange(self.count):
+                h = open(os.path.join(self.path,'slot.%d' % (i,)),'a')
+                try:
+                    fcntl.flock(h.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError:
+                    h.close()
+                    continue
+                return h
+            if not wait:
+                return None
+            time.sleep(1)
+
+    def release(self, h):
+        """
+        It releases a slot given by ACQUIRE.
+        """
+        if h is not None:
+            fcntl.flock(h.fileno(), fcntl.LOCK_UN)
+            h.close()
+
+
 #############################
 class pipeline:
     """
     Pipeline class
     """
-    __version__ = '0.98.3 beta'
+    __version__ = '0.98.4 beta'
     __author__  = 'Daniel Nicorici'
     __copyright__ = "Copyright (c) 2009-2019 Daniel Nicorici"
     __credits__ = ["Henrikki Almusa"]
@@ -414,8 +548,16 @@ class pipeline:
                  log_filename = 'log_pipeline.txt',
                  checksums_filename = 'checksums.txt',
                  hash_library = 'crc32',
-                 threads = 1, # not in use yet
-                 start_step = 1 # the number of the starting step (in case that one wants to execute again some specific part of the workflow
+                 threads = 1, # used only within parallel regions
+                 memory = 0, # used only within parallel regions
+                 start_step = 1, # the number of the starting step (in case that one wants to execute again some specific part of the workflow
+                 parallel = False,
+                 stats_filename = None,
+                 profile_filename = None,
+                 profile_top = 20,
+                 slots_path = None,
+                 slots = 0,
+                 slots_programs = ()
                  ):
         """
         Initialization.
@@ -425,12 +567,37 @@ class pipeline:
         hash_library       - type of hash library used for computing the checksums, e.g. sha512,
                              sha256, md5, crc32, adler32. If it is set to '' or 'no' then no
                              checksums are used and everything is executed.
-        threads            - number of threads to be used for runnind the job.
+        threads            - number of threads to be used for runnind the job. Within
+                             a parallel region (see PARALLEL_START) this is the maximum
+                             number of threads used by the tasks executed at the same time.
+        memory             - memory (e.g. in GB) available within a parallel region for the
+                             tasks executed at the same time (see MEMORY in RUN). If it is
+                             0 then there is no limit.
         start_step         - the count of the step from where the execution of workflow should
                              start, default is 1 (in case that one wants to execute again some
                              specific part of the workflow). If it is set to 0 then workflow
                              is restarted automatically from the last step where it was previously
                              stopped.
+        parallel           - if it is True then the independent tasks given within
+                             a parallel region (see PARALLEL_START and PARALLEL_END)
+                             are executed at the same time. Default is False, i.e.
+                             all tasks are executed one after another.
+        stats_filename     - name of the file where for each executed step are written
+                             (tab-separated) its wall time, CPU time, peak memory, and
+                             bytes read/written. If it is None then nothing is written.
+        profile_filename   - name of the file where, when the pipeline is closed, are
+                             written the steps (of the current run) which used the most
+                             time, memory, disk space, and I/O. If it is None then
+                             nothing is written.
+        profile_top        - number of steps shown in each ranking of 'profile_filename'.
+        slots_path         - directory (shared with other workflows running at the same
+                             time) which holds the locks used for limiting the number of
+                             steps running the programs given in 'slots_programs'.
+        slots              - maximum number of steps (summed over all the workflows which
+                             share 'slots_path') running at the same time one of the
+                             programs given in 'slots_programs', e.g. aligners which are
+                             sharing the same indexes. If it is 0 then there is no limit.
+        slots_programs     - names of the programs (without path) limited by 'slots'.
         """
 
         self.task = []
@@ -439,7 +606,18 @@ class pipeline:
         self.ifs_steps = dict()
         self.ifs_ids = dict()
         self.iffs = set()
-        self.threads = 1
+        self.threads = threads if threads and threads > 0 else 1
+        self.memory = memory if memory and memory > 0 else 0
+        self.parallel = parallel
+        self.parallel_flag = False # True when inside a parallel region
+        self.parallel_queue = [] # tasks queued within the parallel region
+        self.stats_filename = stats_filename
+        self.profile_filename = profile_filename
+        self.profile_top = profile_top
+        self.slots = _slots(slots_path, slots) if slots_path and slots and slots > 0 else None
+        self.slots_programs = set(slots_programs)
+        self.stats = [] # resources used by the steps executed in this run
+        self.stderr_lines = 1000 # the last lines of STDERR kept for each running task
         self.task_count = 0
         self.checksums_filename = checksums_filename
         self.start_time = datetime.datetime.now()
@@ -463,6 +641,9 @@ class pipeline:
         #             tasks/steps using some Python code
         self.hash_files = dict() # in case the self.hash_type == 'smart'
                                  # then here are saved the files and their checksums
+        self.hash_index = None # checksums of files (indexed by their inode, size,
+                               # and modification time) which are kept between runs
+        self.hash_index_filename = checksums_filename + '.index'
 
 
         if os.path.isfile(log_filename):
@@ -844,7 +1025,9 @@ class pipeline:
             comment = 'no',
             error_message = '',
             successful_exit_status = (0,0),
-            exit_code = 0):
+            exit_code = 0,
+            threads = 1,
+            memory = 0):
         """
         It runs what has been added using method ADD.
 
@@ -855,9 +1038,18 @@ class pipeline:
         error_message - An additional error message to be displayed if the job/task
                         fails to run.
 
+        threads       - number of threads/CPUs used by the job/task. It is used only
+                        within a parallel region (see PARALLEL_START) for deciding how
+                        many tasks can be executed at the same time.
+
+        memory        - memory (e.g. in GB, the same unit as MEMORY of the pipeline)
+                        used by the job/task. It is used only within a parallel region
+                        for deciding how many tasks can be executed at the same time.
+
         It returns:
 
-        True   - if the task has been executed succesfully
+        True   - if the task has been executed succesfully (or it has been queued
+                 for execution within a parallel region)
         False  - if the task has been skipped from execution
 
         """
@@ -885,6 +1077,11 @@ class pipeline:
             if x:
                 empty_program = True
 
+            # a mock step is followed by Python code which might need the
+            # outputs of the queued tasks => execute them first
+            if empty_program and self.parallel_queue:
+                self.__run_queue()
+
             # build the command line and get the program
             captured_error_message = [] # try to find the '2>&1', '2>', '&>'
             hit_redirect = False
@@ -928,73 +1125,51 @@ class pipeline:
             temp = "-" * self.screen_length
             self.write(temp)
             executed = True
+            queued = False
 
             #execute the program with the given command line arguments
             if comment == 'no': # it is not commented out
                 if self.task_count >= self.start_step:
-                    if self.__run_again():
+                    if (not empty_program) and self.parallel_flag:
+                        # the checksums are computed and the outputs are built when
+                        # all the tasks on which this one depends have finished
+                        self.write('+-->QUEUED for parallel execution...')
+                        self.parallel_queue.append({'step': self.task_count,
+                                                    'task': self.task,
+                                                    'cmd_line': cmd_line,
+                                                    'threads': max(1, min(int(threads), self.threads)),
+                                                    'memory': max(0, memory),
+                                                    'error_message': error_message,
+                                                    'successful_exit_status': successful_exit_status,
+                                                    'captured_error_message': captured_error_message,
+                                                    'hit_redirect': hit_redirect})
+                        queued = True
+                    elif self.__run_again():
 
                         # EXECUTE IT!
-                        proc = 0
+                        exit_code = 0
+                        proc = None
                         if not empty_program:
-                           #proc=subprocess.call(cmd_line,shell=True)
+                            slot = None
+                            if self.__slot_needed(self.task):
+                                self.write('+-->WAITING for a free slot...')
+                                slot = self.slots.acquire()
                             self.write('+-->EXECUTING...')
-                            proc = os.system(' '.join(cmd_line))
+                            proc = _process(' '.join(cmd_line), stderr_lines = self.stderr_lines)
+                            exit_code = proc.wait()
+                            if slot:
+                                self.slots.release(slot)
+                            self.__save_stats(self.task_count, proc, self.task)
                         else:
                             self.write('+-->MOCK EXECUTION (i.e. code executed outside of workflow)...')
-                        #print "---------------------->",proc,max(successful_exit_status),min(successful_exit_status)
-                        exit_code = float(proc)/float(256)
                         if exit_code > max(successful_exit_status) or exit_code < min(successful_exit_status):
-                            temp = "\n\nERROR: Workflow execution failed at step %d while executing:\n----------------\n   %s\n----------------\n" % (self.task_count,' \\\n   '.join(cmd_line),)
-                            self.write(temp, stderr = True)
-                            if error_message:
-                                self.write(error_message, stderr = True)
-                            # print the input and output file sizes
-                            for elem in self.task:
-                                if element['command_line'] == 'yes' and ((elem['kind'] == 'path' and elem['io'] in ('input','output')) or elem['from_file'] == 'yes'):
-                                    ap = elem['value']
-                                    temp = "  * Size '%s' = %d bytes" % (ap,self.__path_size(ap))
-                                    self.write(temp, stderr = True)
-
-                            # print the captured error message from '2>&1>' or '2>'
-                            if hit_redirect:
-                                for il in captured_error_message:
-                                    if os.path.isfile(il) or _islink(il):
-                                        temp = []
-                                        try:
-                                            temp = file(il,'r').readlines()
-                                        except:
-                                            pass
-                                        self.write(temp, stderr = True)
-                            else:
-                                #pass
-                                temp = "\n\nExecuting second time the same step/command in order to capture error messages (i.e. STDERR)...\n\n-------------------------------------------"
-                                self.write(temp, stderr = True)
-                                # no redirection was found so then try to execute again the command and capture the STDERR
-                                #p = subprocess.Popen(cmd_line, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, shell = False)
-                                #if p.returncode != 0:
-                                #    self.write(p.communicate()[0].splitlines(), stderr = True)
-                                temp = []
-                                temp_file = self.__give_me_temp_filename()
-                                procx = os.system(' '.join(cmd_line+['2>',temp_file]))
-                                newprocx = float(procx)/float(256)
-                                if newprocx > max(successful_exit_status) or newprocx < min(successful_exit_status):
-                                    if os.path.isfile(temp_file):
-                                        # read error message
-                                        try:
-                                            temp = file(temp_file,'r').readlines()
-                                        except:
-                                            pass
-                                        if temp:
-                                            temp.append("")
-                                            temp.append("")
-                                        self.write(temp, stderr = True)
-                                        os.remove(temp_file)
-                                else:
-                                    temp = "\n\nWARNING: First execution ended with error but second execution did not! Therefore cannot capture the STDERR!\n\n"
-                                    self.write(temp, stderr = True)
-                            self.exit_flag = False
-                            sys.exit(1)
+                            self.__failed(self.task_count,
+                                          self.task,
+                                          cmd_line,
+                                          error_message,
+                                          captured_error_message,
+                                          hit_redirect,
+                                          proc)
                         elif self.hash_library and self.hash_library != 'no': # DON'T EXECUTE IT
                             temp = "==> Saving checksum..."
                             self.write(temp)
@@ -1012,20 +1187,10 @@ class pipeline:
                 self.write(temp)
                 executed = False
 
-            # erase the 'temp_path'
-            if self.task_count >= self.start_step:
-                for task in self.task:
-                    if task['temp_path'] == 'yes':
-                        v = task['value']
-                        if task['from_file'] == 'yes':
-                            if task['kind'] == 'parameter':
-                                self.__delete_path(v)
-                            elif task['kind'] == 'path':
-                                x = [line.rstrip('\r\n') for line in file(v,'r')]
-                                x.append(v)
-                                self.__delete_path(x)
-                        elif task['kind'] == 'path':
-                            self.__delete_path(v)
+            # erase the 'temp_path' (for the queued tasks this is done after
+            # all the tasks from the queue have been executed)
+            if self.task_count >= self.start_step and not queued:
+                self.__delete_temp_paths(self.task)
 
             # time difference
             self.__show_step_header_end()
@@ -1042,40 +1207,383 @@ class pipeline:
 
         return executed # return if the task has been executed or skipped
 
+    ###
+    ### __FAILED
+    ###
+    def __failed(self,
+                 step,
+                 task,
+                 cmd_line,
+                 error_message,
+                 captured_error_message,
+                 hit_redirect,
+                 proc):
+        """
+        It reports the failure of a task (together with the sizes of its
+        inputs/outputs and its captured error messages) and stops the workflow.
+        """
+        temp = "\n\nERROR: Workflow execution failed at step %d while executing:\n----------------\n   %s\n----------------\n" % (step,' \\\n   '.join(cmd_line),)
+        self.write(temp, stderr = True)
+        if error_message:
+            self.write(error_message, stderr = True)
+        # print the input and output file sizes
+        for elem in task:
+            if elem['command_line'] == 'yes' and ((elem['kind'] == 'path' and elem['io'] in ('input','output')) or elem['from_file'] == 'yes'):
+                ap = elem['value']
+                temp = "  * Size '%s' = %d bytes" % (ap,self.__path_size(ap))
+                self.write(temp, stderr = True)
+
+        # print the captured error message from '2>&1>' or '2>'
+        if hit_redirect:
+            for il in captured_error_message:
+                if os.path.isfile(il) or _islink(il):
+                    temp = []
+                    try:
+                        temp = file(il,'r').readlines()
+                    except:
+                        pass
+                    self.write(temp, stderr = True)
+        elif proc is not None:
+            # no redirection was found so then show the STDERR captured while running
+            temp = "\n\nExit code: %d\n\nLast %d line(s) of the captured error messages (i.e. STDERR):\n\n-------------------------------------------" % (proc.exit_code,len(proc.stderr))
+            self.write(temp, stderr = True)
+            temp = list(proc.stderr)
+            if temp:
+                temp.append("")
+                temp.append("")
+            self.write(temp, stderr = True)
+        self.exit_flag = False
+        sys.exit(1)
+
+    ###
+    ### __SAVE_STATS
+    ###
+    def __save_stats(self, step, proc, task):
+        """
+        It writes (tab-separated) the resources used by an executed step in
+        the 'stats_filename'. The disk space used by a step is the size of
+        its outputs right after it has finished.
+        """
+        if not (self.stats_filename or self.profile_filename):
+            return
+        (wall, cpu, rss, bytes_read, bytes_written) = proc.stats()
+        disk = sum([self.__path_size(a) for a in self.__paths(task)[1]])
+        command = ' '.join(proc.cmd_line.split())
+        self.stats.append({'step': step,
+                           'wall': wall,
+                           'cpu': cpu,
+                           'memory': rss,
+                           'disk': disk,
+                           'io': bytes_read + bytes_written,
+                           'command': command})
+        if not self.stats_filename:
+            return
+        data = []
+        if not os.path.isfile(self.stats_filename):
+            data.append('\t'.join(['step',
+                                   'exit_code',
+                                   'wall_time_seconds',
+                                   'cpu_time_seconds',
+                                   'max_memory_bytes',
+                                   'bytes_read',
+                                   'bytes_written',
+                                   'output_bytes',
+                                   'command']) + '\n')
+        data.append('\t'.join([str(step),
+                               str(proc.exit_code),
+                               "%.2f" % (wall,),
+                               "%.2f" % (cpu,),
+                               str(rss),
+                               str(bytes_read),
+                               str(bytes_written),
+                               str(disk),
+                               command]) + '\n')
+        try:
+            file(self.stats_filename,'a').writelines(data)
+        except IOError:
+            print >> sys.stderr,"==> Warning: Cannot write to file: ",self.stats_filename
+
+    ###
+    ### __SAVE_PROFILE
+    ###
+    def __save_profile(self):
+        """
+        It writes in 'profile_filename' the rankings of the steps executed in
+        this run which used the most time, memory, disk space, and I/O.
+        """
+        if not (self.profile_filename and self.stats):
+            return
+        total_wall = sum([e['wall'] for e in self.stats])
+        total_cpu = sum([e['cpu'] for e in self.stats])
+        data = ["Resources used by the %d step(s) executed (wall time = %.0f seconds, CPU time = %.0f seconds):" % (len(self.stats),total_wall,total_cpu),
+                ""]
+        rankings = [('wall', "Top %d slowest steps (wall time)", "%.0f s (%.1f%%)", total_wall),
+                    ('cpu', "Top %d steps using most CPU time", "%.0f s (%.1f%%)", total_cpu),
+                    ('memory', "Top %d steps using most memory (peak RSS)", "%.2f GB", None),
+                    ('disk', "Top %d steps using most disk space (size of outputs)", "%.2f GB", None),
+                    ('io', "Top %d steps doing most I/O (bytes read and written)", "%.2f GB", None)]
+        for (key, title, fmt, total) in rankings:
+            ranked = sorted(self.stats, key = lambda e: e[key], reverse = True)[:self.profile_top]
+            data.append(title % (len(ranked),))
+            data.append("-"*self.screen_length)
+            for e in ranked:
+                if total is None:
+                    value = fmt % (float(e[key]) / float(2**30),)
+                else:
+                    value = fmt % (e[key], 100 * float(e[key]) / total if total else 0)
+                command = e['command'] if len(e['command']) < 200 else e['command'][:197] + '...'
+                data.append("step %-6d %-18s %s" % (e['step'],value,command))
+            data.append("")
+        try:
+            file(self.profile_filename,'w').writelines([line+'\n' for line in data])
+        except IOError:
+            print >> sys.stderr,"==> Warning: Cannot write to file: ",self.profile_filename
+        else:
+            self.write("Profile of the resources used by the steps saved in '%s'." % (self.profile_filename,))
+
+    ###
+    ### __DELETE_TEMP_PATHS
+    ###
+    def __delete_temp_paths(self, task):
+        """
+        It erases the paths of a task which are marked as temporary.
+        """
+        for elem in task:
+            if elem['temp_path'] == 'yes':
+                v = elem['value']
+                if elem['from_file'] == 'yes':
+                    if elem['kind'] == 'parameter':
+                        self.__delete_path(v)
+                    elif elem['kind'] == 'path':
+                        x = [line.rstrip('\r\n') for line in file(v,'r')]
+                        x.append(v)
+                        self.__delete_path(x)
+                elif elem['kind'] == 'path':
+                    self.__delete_path(v)
+
+    ###
+    ### PARALLEL REGION
+    ###
+    def parallel_start(self):
+        """
+        It starts a parallel region. Within a parallel region the tasks given
+        to RUN are not executed immediately but they are queued. The queued
+        tasks are executed at the end of the parallel region (see PARALLEL_END)
+        using a dependency graph built from their input and output paths, such
+        that the independent tasks are executed at the same time using at most
+        THREADS threads/CPUs (and at most MEMORY memory, if it is given).
+
+        The queued tasks are executed also before any other step which might
+        need their outputs, i.e. mock steps (e.g. 'if job.run():'), LINK, SINK,
+        IFF, and CLEAN.
+
+        It does nothing if the pipeline has not been initialized with
+        PARALLEL = True.
+        """
+        if self.parallel:
+            self.parallel_flag = True
+
+    def parallel_end(self):
+        """
+        It ends a parallel region and executes all the tasks queued within it.
+        """
+        self.parallel_flag = False
+        if self.parallel_queue:
+            self.__run_queue()
+
+    ###
+    ### __PATHS
+    ###
+    def __paths(self, task):
+        """
+        It gives the (normalized) input and output paths of a task.
+        """
+        inputs = set()
+        outputs = set()
+        for elem in task:
+            if elem['kind'] != 'path' or not elem['value'] or elem['value'] in self.__devs:
+                continue
+            if elem['from_file'] == 'yes':
+                continue
+            a = elem['value']
+            if a.endswith('*'):
+                a = a[:-1]
+            a = _expand(a)
+            if elem['io'] == 'output':
+                outputs.add(a)
+            else:
+                inputs.add(a)
+        return (inputs, outputs)
+
+    ###
+    ### __RUN_QUEUE
+    ###
+    def __run_queue(self):
+        """
+        It executes the tasks queued within a parallel region. A task depends
+        on a previously queued task if it reads/writes one of its outputs or
+        writes one of its inputs. A task with no input/output paths given
+        depends on all the previous tasks and all the next tasks depend on it.
+        """
+        queue = self.parallel_queue
+        self.parallel_queue = []
+
+        def overlap(x, y):
+            for a in x:
+                for b in y:
+                    if a == b or a.startswith(b + os.sep) or b.startswith(a + os.sep):
+                        return True
+            return False
+
+        # build the dependency graph
+        paths = [self.__paths(q['task']) for q in queue]
+        depends = []
+        for j in xrange(len(queue)):
+            (inj, outj) = paths[j]
+            d = set()
+            for i in xrange(j):
+                (ini, outi) = paths[i]
+                if ((not (inj or outj)) or
+                    (not (ini or outi)) or
+                    overlap(inj | outj, outi) or
+                    overlap(outj, ini)):
+                    d.add(i)
+            depends.append(d)
+
+        self.write(["="*self.screen_length,
+                    "==> Executing in parallel %d queued step(s) [%s] using maximum %d thread(s)..." % (len(queue),', '.join([str(q['step']) for q in queue]),self.threads),
+                    "="*self.screen_length])
+
+        done = set()
+        running = dict() # index => process
+        held = dict() # index => slot
+        used = 0
+        used_memory = 0
+        failed = None
+        waiting = range(len(queue))
+        while waiting or running:
+            # start the tasks which are ready
+            if failed is None:
+                for j in waiting[:]:
+                    if not depends[j].issubset(done):
+                        continue
+                    q = queue[j]
+                    if running and used + q['threads'] > self.threads:
+                        continue
+                    if running and self.memory and used_memory + q['memory'] > self.memory:
+                        continue
+                    if self.__slot_needed(q['task']):
+                        slot = self.slots.acquire(wait = False)
+                        if slot is None:
+                            continue
+                        held[j] = slot
+                    waiting.remove(j)
+                    if not self.__run_again(q['task']):
+                        if j in held:
+                            self.slots.release(held.pop(j))
+                        self.write("|==> SKIPPED step %d because it has not changed since last run." % (q['step'],))
+                        done.add(j)
+                        continue
+                    self.write("+-->EXECUTING step %d (in parallel)..." % (q['step'],))
+                    running[j] = _process(' '.join(q['cmd_line']), stderr_lines = self.stderr_lines)
+                    used = used + q['threads']
+                    used_memory = used_memory + q['memory']
+            if not running:
+                if failed is not None or not waiting:
+                    break
+                time.sleep(1) # waiting for a free slot
+                continue
+            time.sleep(0.1)
+            for j in running.keys():
+                exit_code = running[j].poll()
+                if exit_code is None:
+                    continue
+                q = queue[j]
+                q['process'] = running.pop(j)
+                if j in held:
+                    self.slots.release(held.pop(j))
+                used = used - q['threads']
+                used_memory = used_memory - q['memory']
+                self.__save_stats(q['step'], q['process'], q['task'])
+                minutes, seconds = divmod(int(q['process'].end - q['process'].start), 60)
+                hours, minutes = divmod(minutes, 60)
+                days, hours = divmod(hours, 24)
+                self.write("==> Step %d finished with exit code %d (execution time: %d day(s), %d hour(s), %d minute(s), and %d second(s))" % (q['step'],exit_code,days,hours,minutes,seconds))
+                if exit_code > max(q['successful_exit_status']) or exit_code < min(q['successful_exit_status']):
+                    if failed is None:
+                        failed = j
+                else:
+                    done.add(j)
+                    if self.hash_library and self.hash_library != 'no':
+                        self.write("==> Saving checksum for step %d..." % (q['step'],))
+                        self.__save_checksum(q['task'])
+
+        if failed is not None:
+            q = queue[failed]
+            self.__failed(q['step'],
+                          q['task'],
+                          q['cmd_line'],
+                          q['error_message'],
+                          q['captured_error_message'],
+                          q['hit_redirect'],
+                          q['process'])
+
+        # erase the 'temp_path'
+        for q in queue:
+            self.__delete_temp_paths(q['task'])
+        self.write("="*self.screen_length)
+
+    ###
+    ### __SLOT_NEEDED
+    ###
+    def __slot_needed(self, task):
+        """
+        It tests if a task runs one of the programs limited by SLOTS.
+        """
+        if self.slots:
+            for elem in task:
+                if elem['kind'] in ('program','parameter') and os.path.basename(elem['identifier'].strip()) in self.slots_programs:
+                    return True
+        return False
+
     ###
     ###  __RUN_AGAIN
     ###
-    def __run_again(self):
+    def __run_again(self, task = None):
         """
         It tests if the the task should be run again or not based on checking if the output and input files have changed since last run.
         """
+        if task is None:
+            task = self.task
         flag_run = True
         if self.hash_library and self.hash_library != 'no':
-            checksum_now = self.__compute_checksum()
+            checksum_now = self.__compute_checksum(task)
             checksums_old = set()
             if os.path.isfile(self.checksums_filename):
                 checksums_old = set([line.strip() for line in file(self.checksums_filename,'rt').readlines() if line.strip()])
-            count_outputs = len([0 for elem in self.task if elem['io'] == 'output'])
+            count_outputs = len([0 for elem in task if elem['io'] == 'output'])
             if (checksum_now in checksums_old) and count_outputs > 0:
                 flag_run = False
         if flag_run:
             if (self.hash_library and self.hash_library != 'no'):
-                self.__build_paths(directories = True, files = True)
+                self.__build_paths(task, directories = True, files = True)
             else:
-                self.__build_paths(directories = True, files = False)
+                self.__build_paths(task, directories = True, files = False)
         return flag_run
 
     ###
     ### __COMPUTE_CHECKSUM
     ###
-    def __compute_checksum(self):
+    def __compute_checksum(self, task = None):
         """
         It computes the checksum of the input and output files and command line string.
         """
+        if task is None:
+            task = self.task
         cmd_line = ''
         list_files_to_check = []
         output_files = set()
-        for elem in self.task:
+        for elem in task:
             ident = elem['identifier']
             value = elem['value']
             kind = elem['kind']
@@ -1141,17 +1649,24 @@ class pipeline:
                 if b:
                     self.hash_files[b] = self.hash_files[a]
             else:
-                temp = "===> Computing checksum for: '%s'" % (a_file,)
-                self.write(temp)
-                file_fingerprint = self.__hashlib_init()
-                ff = open(a_file,'rb')
-                while True:
-                    dd = ff.read(length_piece)  # originally was dd=ff.read(8096)
-                    if not dd:
-                        break
-                    file_fingerprint.update(dd)
-                ff.close()
-                dig = file_fingerprint.hexdigest()
+                key = self.__checksum_key(a)
+                dig = self.__checksum_index_get(a, key)
+                if dig is not None:
+                    temp = "===> Checksum found in the index (file has not changed) for: '%s'" % (a_file,)
+                    self.write(temp)
+                else:
+                    temp = "===> Computing checksum for: '%s'" % (a_file,)
+                    self.write(temp)
+                    file_fingerprint = self.__hashlib_init()
+                    ff = open(a_file,'rb')
+                    while True:
+                        dd = ff.read(length_piece)  # originally was dd=ff.read(8096)
+                        if not dd:
+                            break
+                        file_fingerprint.update(dd)
+                    ff.close()
+                    dig = file_fingerprint.hexdigest()
+                    self.__checksum_index_add(a, key, dig)
                 self.hash_files[a] = dig
                 if b:
                     self.hash_files[b] = dig
@@ -1160,6 +1675,89 @@ class pipeline:
 
         return checksum # checksum
 
+    ###
+    ### CHECKSUMS INDEX
+    ###
+    def __checksum_key(self, a_path):
+        """
+        It gives the key (i.e. inode, size, and modification time) used for
+        finding out if a file has changed since its checksum has been computed.
+        """
+        key = None
+        try:
+            st = os.stat(a_path)
+        except OSError:
+            pass
+        else:
+            key = "%d\t%d\t%.6f" % (st.st_ino, st.st_size, st.st_mtime)
+        return key
+
+    def __checksum_index_load(self):
+        """
+        It reads the index of checksums of files, which is saved next to
+        the 'checksums_filename' and it is shared between runs.
+        Each line has: hash library, path, inode, size, modification
+        time, and checksum. The last line found for a path is used.
+        The index is compacted (i.e. rewritten with only the last line of
+        each path which still exists) when it is loaded.
+        """
+        self.hash_index = dict()
+        if os.path.isfile(self.hash_index_filename):
+            lines = 0
+            latest = collections.OrderedDict() # (hash library, path) => line
+            for line in file(self.hash_index_filename,'r'):
+                lines = lines + 1
+                t = line.rstrip('\r\n').split('\t')
+                if len(t) != 6:
+                    continue
+                k = (t[0], t[1])
+                if k in latest:
+                    del latest[k] # it keeps the order of the last lines
+                latest[k] = t
+            data = [t for t in latest.itervalues() if os.path.exists(t[1])]
+            for t in data:
+                if t[0] == self.hash_library.lower():
+                    self.hash_index[t[1]] = ('\t'.join(t[2:5]), t[5])
+            if len(data) != lines:
+                # rewritten atomically because it is shared between runs
+                try:
+                    (h, temp) = tempfile.mkstemp(prefix = os.path.basename(self.hash_index_filename)+'.', dir = os.path.dirname(os.path.abspath(self.hash_index_filename)))
+                    f = os.fdopen(h,'w')
+                    f.writelines(['\t'.join(t)+'\n' for t in data])
+                    f.close()
+                    os.rename(temp,self.hash_index_filename)
+                except (IOError, OSError):
+                    print >> sys.stderr,"==> Warning: Cannot write to file: ",self.hash_index_filename
+
+    def __checksum_index_get(self, a_path, key):
+        """
+        It gives the checksum of a file from the index of checksums if the
+        file has not changed (i.e. same inode, size, and modification time)
+        since the checksum was computed, else it gives None.
+        """
+        if self.hash_index is None:
+            self.__checksum_index_load()
+        dig = None
+        if key is not None:
+            r = self.hash_index.get(a_path, None)
+            if r and r[0] == key:
+                dig = r[1]
+        return dig
+
+    def __checksum_index_add(self, a_path, key, dig):
+        """
+        It adds the checksum of a file to the index of checksums.
+        """
+        if key is None:
+            return
+        if self.hash_index is None:
+            self.__checksum_index_load()
+        self.hash_index[a_path] = (key, dig)
+        try:
+            file(self.hash_index_filename,'a').write('\t'.join([self.hash_library.lower(), a_path, key, dig]) + '\n')
+        except IOError:
+            print >> sys.stderr,"==> Warning: Cannot write to file: ",self.hash_index_filename
+
     ###
     ### __hashlib
     ###
@@ -1188,17 +1786,21 @@ class pipeline:
     ###  __BUILD_PATHS
     ###
     def __build_paths(self,
+                      task = None,
                       directories = True,
                       files = True,
                       links = True):
         """
         It creates empty output files and the output directories when they do not exist
 
+        task        - the task for which the paths are created. Default is the current task.
         directories - If True then directories are created else they are not.
         files       - If True then files are created else they are not.
         links       - If True then links are deleted.
         """
-        for elem in self.task:
+        if task is None:
+            task = self.task
+        for elem in task:
             ident = elem['identifier']
             value = elem['value']
             kind = elem['kind']
@@ -1240,11 +1842,11 @@ class pipeline:
     ###
     ### __SAVE_CHECKSUM
     ###
-    def __save_checksum(self):
+    def __save_checksum(self, task = None):
         """
         It saves the current checksum.
         """
-        checksum = self.__compute_checksum()
+        checksum = self.__compute_checksum(task)
         checksums_old = set([])
         if os.path.isfile(self.checksums_filename):
             checksums_old = set([line.rstrip("\r\n") for line in file(self.checksums_filename,'rt').readlines() if line.rstrip("\r\n")])
@@ -1357,6 +1959,10 @@ class pipeline:
         Close the pipeline.
         """
         if not self.closed:
+            # execute the tasks left in the queue of a parallel region
+            self.parallel_flag = False
+            if self.exit_flag and self.parallel_queue:
+                self.__run_queue()
             # delete the paths and files marked as temporary
             if self.exit_flag: # if there is no error
                 self.__delete_path(self.temp_paths)
@@ -1373,6 +1979,7 @@ class pipeline:
                     "#"*self.screen_length,
                     ]
             self.write(temp)
+            self.__save_profile()
             self.closed = True
 
 
@@ -1459,6 +2066,8 @@ class pipeline:
         False  - if the task has been skipped from execution
 
        """
+        if self.parallel_queue:
+            self.__run_queue()
         self.task_count = self.task_count + 1
         self.__show_step_header_start()
         executed = True
@@ -1584,6 +2193,8 @@ class pipeline:
         False  - if the task has been skipped from execution
 
        """
+        if self.parallel_queue:
+            self.__run_queue()
         self.task_count = self.task_count + 1
         self.__show_step_header_start()
         executed = True
@@ -1629,6 +2240,8 @@ class pipeline:
         False  - if the task has been skipped from execution
 
        """
+        if self.parallel_queue:
+            self.__run_queue()
         self.task_count = self.task_count + 1
         self.__show_step_header_start()
 
@@ -1691,6 +2304,8 @@ class pipeline:
         True   - if the task has been executed succesfully
         False  - if the task has been skipped from execution
         """
+        if self.parallel_queue:
+            self.__run_queue()
         self.task_count = self.task_count + 1
         self.__show_step_header_start()
 